@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure the per-dispatch overhead of flagman for bundles of 1 to 1000 actions.
+
+Every action does nothing, so the time of a dispatch is all overhead. The dispatcher
+that flagman used before dispatch plans is measured next to the current one: it copied
+the bundle and built the list of action names for a debug message on every dispatch.
+
+Run with `python benchmarks/dispatch_overhead.py [--dispatches N]`.
+"""
+import argparse
+import logging
+import signal
+import time
+
+from flagman import core
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed
+from flagman.types import SignalNumber
+
+SIGNUM = signal.SIGUSR1
+SIZES = (1, 10, 100, 1000)
+
+
+class NoopAction(Action):
+    """Do nothing."""
+
+    def run(self) -> None:
+        """Do nothing."""
+
+
+def copying_dispatch(num: SignalNumber) -> None:
+    """Take the actions of a bundle as flagman did before dispatch plans.
+
+    :param num: the number of the raised signal
+    """
+    core.logger.debug(
+        'Taking actions `%s` for signal number `%d`',
+        [action.__class__.__name__ for action in core.ACTION_BUNDLES[num]],
+        num,
+    )
+    siginfo = core.SIGNAL_FLAGS.siginfo(num)
+    for action in core.ACTION_BUNDLES[num].copy():
+        try:
+            core.logger.debug(
+                'Taking action `%s` for signal number `%d`',
+                action.__class__.__name__,
+                num,
+            )
+            action._run(siginfo)
+            core.logger.debug(
+                'Done taking action `%s` for signal number `%d`',
+                action.__class__.__name__,
+                num,
+            )
+        except ActionClosed as e:
+            core._remove_closed_action(num, action, e)
+    core.logger.debug('Lowering flag for signal number `%d`', num)
+    core.SIGNAL_FLAGS.discard(num)
+
+
+def time_dispatch(dispatch_count: int, size: int, plans: bool) -> float:
+    """Dispatch a bundle of no-op actions many times and return the mean time.
+
+    :param dispatch_count: the number of dispatches to time
+    :param size: the number of actions in the bundle
+    :param plans: whether to use the current dispatcher instead of the copying one
+    :returns: the mean time of a dispatch in seconds
+    """
+    bundle = core.ACTION_BUNDLES[SIGNUM]
+    bundle.clear()
+    bundle.extend(NoopAction() for _ in range(size))
+    core.build_dispatch_plans()
+    dispatch = core._dispatch if plans else copying_dispatch
+    start = time.perf_counter()
+    for _ in range(dispatch_count):
+        dispatch(SIGNUM)
+    return (time.perf_counter() - start) / dispatch_count
+
+
+def main() -> None:
+    """Compare both dispatchers for each bundle size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dispatches', type=int, default=200000)
+    args = parser.parse_args()
+    # as in production, where the flagman loggers are at INFO or above
+    logging.basicConfig(level=logging.INFO)
+
+    for size in SIZES:
+        count = max(args.dispatches // size, 100)
+        copying = time_dispatch(count, size, plans=False)
+        planned = time_dispatch(count, size, plans=True)
+        print(
+            'actions={:<5} copying={:10.2f}us  planned={:10.2f}us  '
+            'per action: {:6.1f}ns -> {:6.1f}ns'.format(
+                size,
+                copying * 1e6,
+                planned * 1e6,
+                copying / size * 1e9,
+                planned / size * 1e9,
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
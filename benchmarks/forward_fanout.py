@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure the cost of forwarding a signal to 1 to 500 processes.
+
+N `sleep` processes are started and their PIDs are written to a pidfile. The forward
+action sends them `SIGCONT`, which does nothing to a running process, so the time of a
+run is the cost of checking the pidfile and sending N signals through the cached
+pidfds. For comparison, the same signal is sent by starting one `kill` process with
+every PID, as a shell command in a service's reload hook would.
+
+Run with `python benchmarks/forward_fanout.py [--runs N]`.
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from typing import Tuple
+
+from flagman.actions import ForwardSignalAction
+
+SIZES = (1, 100, 500)
+
+
+def time_runs(run_count: int, size: int, tmpdir: str) -> Tuple[float, float]:
+    """Signal sleeping processes many times both ways and return the mean times.
+
+    :param run_count: the number of runs to time
+    :param size: the number of processes
+    :param tmpdir: the directory to create the pidfile in
+    :returns: the mean times of a forward run and of a `kill` process in seconds
+    """
+    processes = [subprocess.Popen(['sleep', '600']) for _ in range(size)]
+    try:
+        pidfile = os.path.join(tmpdir, '{}.pid'.format(size))
+        with open(pidfile, 'w') as f:
+            f.write('\n'.join(str(process.pid) for process in processes))
+        action = ForwardSignalAction('cont', pidfile)
+        action.run()  # open the pidfds outside of the timed runs
+        start = time.perf_counter()
+        for _ in range(run_count):
+            action.run()
+        forward = (time.perf_counter() - start) / run_count
+        action.tear_down()
+        command = ['kill', '-CONT'] + [str(process.pid) for process in processes]
+        start = time.perf_counter()
+        for _ in range(run_count):
+            subprocess.run(command, check=True)
+        return forward, (time.perf_counter() - start) / run_count
+    finally:
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.wait()
+
+
+def main() -> None:
+    """Time runs for each number of processes."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in SIZES:
+            forward, kill = time_runs(args.runs, size, tmpdir)
+            print(
+                'processes={:<4} forward={:9.1f}us  kill={:9.1f}us'.format(
+                    size, forward * 1e6, kill * 1e6
+                )
+            )
+
+
+if __name__ == '__main__':
+    main()
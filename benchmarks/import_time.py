@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare the time to import flagman and look up one action with an eager scan.
+
+Each measurement runs a fresh interpreter, so the numbers include interpreter startup.
+The eager scan is how flagman used to build `KNOWN_ACTIONS`: iterate over the
+`flagman.action` entry points with pkg_resources and load every one of them.
+
+Run with `python benchmarks/import_time.py [--runs N]`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+SNIPPETS = {
+    'baseline': 'pass',
+    'eager': (
+        'import pkg_resources\n'
+        "actions = {ep.name: ep.load() for ep in pkg_resources.iter_entry_points("
+        "'flagman.action')}\n"
+        "actions['print']"
+    ),
+    'lazy': "import flagman\nflagman.KNOWN_ACTIONS['print']",
+}
+
+
+def time_snippet(code: str, runs: int, env: Optional[Dict[str, str]] = None) -> float:
+    """Run a snippet in fresh interpreters and return the median wall time.
+
+    :param code: the code to run
+    :param runs: the number of interpreters to start
+    :param env: extra environment variables
+    :returns: the median time in seconds
+    """
+    times: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-c', code], check=True, env=dict(os.environ, **(env or {}))
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main() -> None:
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    for name, code in SNIPPETS.items():
+        print('{:<12} {:8.1f}ms'.format(name, time_snippet(code, args.runs) * 1e3))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {'FLAGMAN_ACTION_CACHE': os.path.join(tmp, 'actions.json')}
+        time_snippet(SNIPPETS['lazy'], 1, env)  # build the index
+        cached = time_snippet(SNIPPETS['lazy'], args.runs, env)
+        print('{:<12} {:8.1f}ms'.format('lazy+index', cached * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare signal-to-action latency of the wakeup-fd event loop and a pause() loop.
+
+A sender thread signals this process with SIGUSR1 at random intervals while a
+recording action measures the time from `os.kill` to the start of `Action.run`.
+
+The pause() loop is a copy of the loop flagman used before the wakeup-fd engine.
+A signal that arrives while it is draining the flags is only handled once a later
+signal wakes it, which shows up as a long tail in its latency distribution.
+
+Run with `python benchmarks/loop_latency.py [--signals N]`.
+"""
+import argparse
+import logging
+import os
+import random
+import signal
+import statistics
+import threading
+import time
+from typing import Callable, List
+
+from flagman import core
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed
+
+SIGNUM = signal.SIGUSR1
+SENT: List[float] = []
+LATENCIES: List[float] = []
+
+
+class RecordLatencyAction(Action):
+    """Record the time from each send to the next run and close after all sends."""
+
+    def set_up(self, total: int) -> None:  # type: ignore
+        """Store the number of signals to wait for.
+
+        :param total: the number of signals that will be sent
+        """
+        self._total = total
+
+    def run(self) -> None:
+        """Record the latency of every send since the last run and do some work."""
+        now = time.perf_counter()
+        sent = SENT[len(LATENCIES) :]
+        LATENCIES.extend(now - then for then in sent)
+        # the window in which the pause() loop can miss a wakeup
+        time.sleep(0.0005)
+        if len(LATENCIES) >= self._total:
+            self._close()
+            raise ActionClosed('Done recording')
+
+
+def pause_loop() -> None:
+    """Run the flagman event loop as it was implemented with signal.pause()."""
+    core.build_dispatch_plans()
+    while True:
+        signal.pause()
+        while core.SIGNAL_FLAGS:
+            num = core.SIGNAL_FLAGS.pop()
+            core._dispatch(num)
+            if not any(core.ACTION_BUNDLES.values()):
+                return None
+
+
+def send_signals(total: int, done: threading.Event) -> None:
+    """Send `total` signals to this process at random intervals.
+
+    :param total: the number of signals to send
+    :param done: set when the event loop has exited
+    """
+    # make sure the kernel delivers the signals to the main thread
+    signal.pthread_sigmask(signal.SIG_BLOCK, {SIGNUM})
+    rng = random.Random(0)
+    pid = os.getpid()
+    for _ in range(total):
+        time.sleep(rng.uniform(0, 0.001))
+        SENT.append(time.perf_counter())
+        os.kill(pid, SIGNUM)
+    # keep nudging so that a send swallowed at the very end still gets a run
+    while not done.wait(0.01):
+        os.kill(pid, SIGNUM)
+
+
+def measure(name: str, engine: Callable[[], None], total: int) -> None:
+    """Measure and print the latency distribution for one engine.
+
+    :param name: the name to print for the engine
+    :param engine: a callable that runs the event loop until all actions close
+    :param total: the number of signals to send
+    """
+    SENT.clear()
+    LATENCIES.clear()
+    core.SIGNAL_FLAGS.clear()
+    core.ACTION_BUNDLES[SIGNUM].append(RecordLatencyAction(total))
+    core.set_handlers()
+
+    done = threading.Event()
+    sender = threading.Thread(target=send_signals, args=(total, done))
+    sender.start()
+    engine()
+    done.set()
+    sender.join()
+
+    ordered = sorted(LATENCIES)
+    print(
+        '{:<8} runs={:<6} median={:8.1f}us p99={:10.1f}us max={:10.1f}us'.format(
+            name,
+            len(ordered),
+            statistics.median(ordered) * 1e6,
+            ordered[int(len(ordered) * 0.99)] * 1e6,
+            ordered[-1] * 1e6,
+        )
+    )
+
+
+def main() -> None:
+    """Run the benchmark for both engines."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--signals', type=int, default=2000)
+    args = parser.parse_args()
+    # keep the `ActionClosed` warnings out of the results
+    logging.disable(logging.WARNING)
+
+    measure('pause', pause_loop, args.signals)
+    measure('wakeup', core.run, args.signals)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare signal-to-completion latency of a fan-out bundle with and without threads.
+
+A bundle of independent actions that each sleep for a fixed time is taken once per
+signal, first on the event loop and then on a thread pool with one worker per action.
+On the event loop the latency is the sum of the action times; on the pool it should be
+close to the time of a single action.
+
+Run with `python benchmarks/parallel_bundle.py [--actions N] [--delay SECONDS]`.
+"""
+import argparse
+import logging
+import os
+import signal
+import statistics
+import threading
+import time
+from typing import List
+
+from flagman import core
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed
+from flagman.pending import SignalPolicy
+
+SIGNUM = signal.SIGUSR1
+ROUNDS = 10
+SENT: List[float] = []
+LATENCIES: List[float] = []
+FINISHED: List[Action] = []
+LOCK = threading.Lock()
+
+
+class SleepAction(Action):
+    """Sleep, and record the latency when the last action of the bundle finishes."""
+
+    def set_up(self, delay: float, actions: int) -> None:  # type: ignore
+        """Store the delay and the size of the bundle.
+
+        :param delay: the time to sleep in seconds
+        :param actions: the number of actions in the bundle
+        """
+        self._delay = delay
+        self._actions = actions
+
+    def run(self) -> None:
+        """Sleep and close once all rounds are done."""
+        time.sleep(self._delay)
+        with LOCK:
+            FINISHED.append(self)
+            if len(FINISHED) % self._actions == 0:
+                LATENCIES.append(time.perf_counter() - SENT[-1])
+        if len(SENT) > ROUNDS:
+            self._close()
+            raise ActionClosed('Done')
+
+
+def send_signals(done: threading.Event) -> None:
+    """Send a signal whenever the previous round has finished.
+
+    :param done: set when the event loop has exited
+    """
+    signal.pthread_sigmask(signal.SIG_BLOCK, {SIGNUM})
+    pid = os.getpid()
+    while not done.is_set():
+        SENT.append(time.perf_counter())
+        os.kill(pid, SIGNUM)
+        while len(LATENCIES) < len(SENT) and not done.wait(0.001):
+            pass
+
+
+def measure(name: str, actions: int, delay: float, max_workers: int) -> None:
+    """Measure and print the latency for one way of taking the bundle.
+
+    :param name: the name to print
+    :param actions: the number of sleeping actions in the bundle
+    :param delay: the time each action sleeps in seconds
+    :param max_workers: the size of the thread pool; 0 to take actions on the loop
+    """
+    SENT.clear()
+    LATENCIES.clear()
+    FINISHED.clear()
+    core.ACTION_BUNDLES[SIGNUM].extend(
+        SleepAction(delay, actions) for _ in range(actions)
+    )
+    # a round can be recorded before the executor reports its bundle as finished, so
+    # don't let the coalesce policy drop a signal sent in that window
+    core.SIGNAL_FLAGS.set_policy(SIGNUM, SignalPolicy.EVERY)
+    core.set_handlers()
+
+    done = threading.Event()
+    sender = threading.Thread(target=send_signals, args=(done,))
+    sender.start()
+    core.run(max_workers=max_workers)
+    done.set()
+    sender.join()
+
+    print(
+        '{:<8} actions={:<4} median={:8.1f}ms max={:8.1f}ms'.format(
+            name,
+            actions,
+            statistics.median(LATENCIES) * 1e3,
+            max(LATENCIES) * 1e3,
+        )
+    )
+
+
+def main() -> None:
+    """Run the benchmark on the event loop and on a thread pool."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--actions', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.02)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    measure('serial', args.actions, args.delay, 0)
+    measure('threads', args.actions, args.delay, args.actions)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure the cold start of the flagman CLI and check it against a budget.
+
+Three paths are timed, each in fresh interpreters:
+
+- `help`: `flagman --help`, the cost of building the parser
+- `list`: `flagman --list` with a fresh action index
+- `ready`: `flagman --usr1 print ...` until it sends `READY=1` to the notify socket,
+  which is what a restarted systemd unit waits for
+
+The script exits with code 1 if the median of any path exceeds its budget, so it can be
+run as a check.
+
+Run with `python benchmarks/startup.py [--runs N] [--budget-ms MS]`.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+FLAGMAN = [sys.executable, '-m', 'flagman']
+
+
+def time_command(args: List[str], env: Dict[str, str]) -> float:
+    """Run a command to completion and return its wall time.
+
+    :param args: the command line arguments after `flagman`
+    :param env: the environment of the command
+    :returns: the time in seconds
+    """
+    start = time.perf_counter()
+    subprocess.run(FLAGMAN + args, check=True, env=env, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def time_ready(env: Dict[str, str], notify_path: str) -> float:
+    """Start flagman with one action and return the time until it is ready.
+
+    :param env: the environment of the command, without `NOTIFY_SOCKET`
+    :param notify_path: the path to bind the notify socket to
+    :returns: the time in seconds
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(notify_path)
+        sock.settimeout(10)
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            FLAGMAN + ['--usr1', 'print', 'startup', '--quiet'],
+            env=dict(env, NOTIFY_SOCKET=notify_path),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while b'READY=1' not in sock.recv(4096).split(b'\n'):
+                pass
+            elapsed = time.perf_counter() - start
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+    os.unlink(notify_path)
+    return elapsed
+
+
+def main() -> None:
+    """Time each path and compare the medians against the budget."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument(
+        '--budget-ms',
+        type=float,
+        default=150.0,
+        help='the largest acceptable median for each path',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, FLAGMAN_ACTION_CACHE=os.path.join(tmpdir, 'index.json'))
+        notify_path = os.path.join(tmpdir, 'notify')
+        paths: Dict[str, Callable[[], float]] = {
+            'help': lambda: time_command(['--help'], env),
+            'list': lambda: time_command(['--list'], env),
+            'ready': lambda: time_ready(env, notify_path),
+        }
+        # fill the action index and the bytecode caches
+        for measure in paths.values():
+            measure()
+
+        over_budget = False
+        for name, measure in paths.items():
+            median = statistics.median(measure() for _ in range(args.runs)) * 1e3
+            verdict = 'ok' if median <= args.budget_ms else 'OVER BUDGET'
+            over_budget = over_budget or median > args.budget_ms
+            print('{:<6} median={:7.1f}ms  {}'.format(name, median, verdict))
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
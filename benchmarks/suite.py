@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Run the flagman benchmark suite and write the results as JSON.
+
+Each scenario runs in a fresh interpreter, so flagman's global state and the import
+caches of one scenario don't leak into the next:
+
+- `latency`: the time from `os.kill` to the start of `Action.run`, through
+  `flagman.set_handlers` and `flagman.run`
+- `storm`: sustained throughput while SIGHUP, SIGUSR1 and SIGUSR2 are sent as fast as
+  possible, each from its own process
+- `bundles`: the cost of `flagman.create_action_bundles` with hundreds of actions
+- `startup`: the import time of flagman and the cold start of the CLI
+
+Every result is a flat mapping of metric names to numbers. Metrics ending in `_ms` or
+`_us` are better when lower and metrics ending in `_per_s` are better when higher; the
+rest are context, like counts. With `--compare`, metrics that got worse than a previous
+run by more than the tolerance are reported and the script exits with code 1.
+
+Run with `python benchmarks/suite.py [--only NAME,...] [--output FILE]
+[--compare FILE] [--tolerance FRACTION]`.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from flagman import core
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed
+
+#: Type alias for the metrics of a scenario
+Results = Dict[str, float]
+
+STORM_SIGNALS = (signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2)
+SENT: List[float] = []
+LATENCIES: List[float] = []
+RUNS: Dict[int, int] = {}
+STOP = threading.Event()
+
+#: Sends a signal to a process as fast as possible until killed
+STORM_SENDER = """
+import os, sys
+pid, num = int(sys.argv[1]), int(sys.argv[2])
+while True:
+    os.kill(pid, num)
+"""
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Get a percentile of sorted values.
+
+    :param ordered: the values, sorted
+    :param fraction: the percentile as a fraction, like 0.99
+    :returns: the value
+    """
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class RecordLatencyAction(Action):
+    """Record the time from each send to the next run and close after all sends."""
+
+    def set_up(self, total: int) -> None:  # type: ignore
+        """Store the number of signals to wait for.
+
+        :param total: the number of signals that will be sent
+        """
+        self._total = total
+
+    def run(self) -> None:
+        """Record the latency of every send since the last run."""
+        now = time.perf_counter()
+        sent = SENT[len(LATENCIES) :]
+        LATENCIES.extend(now - then for then in sent)
+        if len(LATENCIES) >= self._total:
+            self._close()
+            raise ActionClosed('Done recording')
+
+
+class CountAction(Action):
+    """Count the runs for a signal and close once the storm is over."""
+
+    def set_up(self, num: int) -> None:  # type: ignore
+        """Store the signal the action counts.
+
+        :param num: the signal number
+        """
+        self._num = num
+
+    def run(self) -> None:
+        """Count the run."""
+        RUNS[self._num] = RUNS.get(self._num, 0) + 1
+        if STOP.is_set():
+            self._close()
+            raise ActionClosed('Storm is over')
+
+
+def run_latency(signals: int) -> Results:
+    """Measure the signal-to-action latency of the event loop.
+
+    :param signals: the number of signals to send
+    :returns: the metrics
+    """
+    num = signal.SIGUSR1
+    core.ACTION_BUNDLES[num].append(RecordLatencyAction(signals))
+    core.set_handlers()
+
+    def send(done: threading.Event) -> None:
+        # make sure the kernel delivers the signals to the main thread
+        signal.pthread_sigmask(signal.SIG_BLOCK, {num})
+        rng = random.Random(0)
+        pid = os.getpid()
+        for _ in range(signals):
+            time.sleep(rng.uniform(0, 0.001))
+            SENT.append(time.perf_counter())
+            os.kill(pid, num)
+        # keep nudging so that a send swallowed at the very end still gets a run
+        while not done.wait(0.01):
+            os.kill(pid, num)
+
+    _run_with_senders([send])
+    ordered = sorted(LATENCIES)
+    return {
+        'signals': len(ordered),
+        'median_us': statistics.median(ordered) * 1e6,
+        'p99_us': percentile(ordered, 0.99) * 1e6,
+        'max_us': ordered[-1] * 1e6,
+    }
+
+
+def run_storm(duration: float) -> Results:
+    """Measure the throughput of the event loop under a storm of signals.
+
+    The storm is sent from other processes, since a sender thread in this process
+    would compete with the event loop for the GIL.
+
+    :param duration: how long to send signals for in seconds
+    :returns: the metrics
+    """
+    for num in STORM_SIGNALS:
+        core.ACTION_BUNDLES[num].append(CountAction(num))
+    core.set_handlers()
+    pid = str(os.getpid())
+    senders = [
+        subprocess.Popen([sys.executable, '-c', STORM_SENDER, pid, str(num)])
+        for num in STORM_SIGNALS
+    ]
+
+    def stop() -> None:
+        STOP.set()
+        for sender in senders:
+            sender.kill()
+            sender.wait()
+
+    def nudge(done: threading.Event) -> None:
+        # the actions close on their first run after the storm
+        signal.pthread_sigmask(signal.SIG_BLOCK, set(STORM_SIGNALS))
+        pid = os.getpid()
+        STOP.wait()
+        while not done.wait(0.01):
+            for num in STORM_SIGNALS:
+                os.kill(pid, num)
+
+    timer = threading.Timer(duration, stop)
+    timer.start()
+    start = time.perf_counter()
+    _run_with_senders([nudge])
+    elapsed = time.perf_counter() - start
+
+    all_stats = [core.SIGNAL_FLAGS.stats(num) for num in STORM_SIGNALS]
+    return {
+        'seconds': elapsed,
+        'delivered_per_s': sum(stats.delivered for stats in all_stats) / elapsed,
+        'runs_per_s': sum(RUNS.values()) / elapsed,
+        'merged': sum(stats.merged for stats in all_stats),
+    }
+
+
+def run_bundles(sizes: List[int], repeats: int) -> Results:
+    """Measure the time to create action bundles of several sizes.
+
+    :param sizes: the numbers of actions to configure
+    :param repeats: the number of times to create each size
+    :returns: the metrics
+    """
+    # look the action up once, as the CLI does while parsing arguments
+    core.KNOWN_ACTIONS['print']
+    results: Results = {}
+    for size in sizes:
+        times: List[float] = []
+        for _ in range(repeats):
+            _clear_bundles()
+            args_dict = {'usr1': [['print', str(idx)] for idx in range(size)]}
+            start = time.perf_counter()
+            core.create_action_bundles(args_dict)
+            times.append(time.perf_counter() - start)
+        results['create_{}_ms'.format(size)] = statistics.median(times) * 1e3
+    _clear_bundles()
+    return results
+
+
+def _clear_bundles() -> None:
+    """Close and remove every configured action."""
+    for bundle in core.ACTION_BUNDLES.values():
+        for action in bundle:
+            action._close()
+        bundle.clear()
+
+
+def run_startup(runs: int) -> Results:
+    """Measure the import time of flagman and the cold start of the CLI.
+
+    :param runs: the number of interpreters to start for each measurement
+    :returns: the metrics
+    """
+    # reuse the measurements of the startup benchmark next to this script
+    from startup import time_command, time_ready
+
+    results: Results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, FLAGMAN_ACTION_CACHE=os.path.join(tmpdir, 'index.json'))
+        notify_path = os.path.join(tmpdir, 'notify')
+        paths: Dict[str, Callable[[], float]] = {
+            'import': lambda: _time_import(env),
+            'help': lambda: time_command(['--help'], env),
+            'list': lambda: time_command(['--list'], env),
+            'ready': lambda: time_ready(env, notify_path),
+        }
+        for name, measure in paths.items():
+            # fill the action index and the bytecode caches
+            measure()
+            median = statistics.median(measure() for _ in range(runs))
+            results['{}_ms'.format(name)] = median * 1e3
+    return results
+
+
+def _time_import(env: Dict[str, str]) -> float:
+    """Import flagman in a fresh interpreter and return the wall time.
+
+    :param env: the environment of the interpreter
+    :returns: the time in seconds
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import flagman'], check=True, env=env)
+    return time.perf_counter() - start
+
+
+def _run_with_senders(senders: List[Callable[[threading.Event], None]]) -> None:
+    """Run the event loop while threads send signals.
+
+    :param senders: the functions run in the sender threads; each gets an event that is
+        set when the event loop has exited
+    """
+    done = threading.Event()
+    threads = [threading.Thread(target=send, args=(done,)) for send in senders]
+    for thread in threads:
+        thread.start()
+    core.run()
+    done.set()
+    for thread in threads:
+        thread.join()
+
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], Results]] = {
+    'latency': lambda args: run_latency(args.signals),
+    'storm': lambda args: run_storm(args.duration),
+    'bundles': lambda args: run_bundles([100, 300, 1000], args.runs),
+    'startup': lambda args: run_startup(args.runs),
+}
+
+
+def run_scenario(name: str, args: argparse.Namespace) -> Results:
+    """Run a scenario in a fresh interpreter.
+
+    :param name: the name of the scenario
+    :param args: the parsed arguments, passed on to the interpreter
+    :returns: the metrics
+    """
+    command = [
+        sys.executable,
+        __file__,
+        '--scenario',
+        name,
+        '--runs',
+        str(args.runs),
+        '--signals',
+        str(args.signals),
+        '--duration',
+        str(args.duration),
+    ]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE).stdout
+    results: Results = json.loads(output)
+    return results
+
+
+def compare(
+    results: Dict[str, Results], baseline: Dict[str, Results], tolerance: float
+) -> List[str]:
+    """Find the metrics that got worse than in a baseline.
+
+    :param results: the metrics of each scenario
+    :param baseline: the metrics of each scenario in a previous run
+    :param tolerance: the fraction a metric may get worse by without being reported
+    :returns: a description of each regression
+    """
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(scenario, {}).get(metric)
+            if not old:
+                continue
+            if metric.endswith(('_ms', '_us')):
+                change = value / old - 1
+            elif metric.endswith('_per_s'):
+                change = old / value - 1 if value else float('inf')
+            else:
+                continue
+            if change > tolerance:
+                regressions.append(
+                    '{}.{}: {:.6g} -> {:.6g} ({:.0%} worse)'.format(
+                        scenario, metric, old, value, change
+                    )
+                )
+    return regressions
+
+
+def main() -> None:
+    """Run the selected scenarios and write and compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--only',
+        type=lambda value: value.split(','),
+        default=list(SCENARIOS),
+        help='the scenarios to run, separated by commas',
+    )
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--signals', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='compare against the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        # keep the `ActionClosed` warnings and the print actions out of the results
+        logging.disable(logging.WARNING)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results = SCENARIOS[args.scenario](args)
+        json.dump(results, sys.stdout)
+        return None
+
+    document = {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'flagman': _flagman_version(),
+        'results': {name: run_scenario(name, args) for name in args.only},
+    }
+    text = json.dumps(document, indent=2, sort_keys=True)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(document['results'], baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+def _flagman_version() -> Optional[str]:
+    """Get the installed version of flagman.
+
+    :returns: the version, or None if flagman is not installed
+    """
+    try:
+        from importlib.metadata import version
+    except ImportError:  # Python < 3.8
+        from importlib_metadata import version  # type: ignore
+    try:
+        return version('flagman')
+    except Exception:
+        return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compare the memory of one flagman hosting N tenants with N separate flagmen.
+
+Each of N services gets a config file with an action for `usr1` and `usr2`. They are
+run two ways, each until every process sent `READY=1` to the notify socket:
+
+- `separate`: one `flagman --config` process per service
+- `tenants`: one `flagman` process with a `--tenant` for each service
+
+The memory of a process is its proportional set size from `/proc/PID/smaps_rollup`,
+which splits pages shared with other processes, like the interpreter's code, between
+them; the resident set size is used where that file does not exist.
+
+Run with `python benchmarks/tenant_memory.py [--tenants N]`.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from typing import List
+
+FLAGMAN = [sys.executable, '-m', 'flagman', '--quiet']
+
+CONFIG = """[usr1]
+actions = [["print", "{name} reloading"]]
+
+[usr2]
+actions = [["print", "{name} rotating logs"]]
+"""
+
+
+def memory_kib(pid: int) -> int:
+    """Get the proportional set size of a process.
+
+    :param pid: the process ID
+    :returns: the size in KiB, or the resident set size if the kernel has no rollup
+    """
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+            field = 'Pss:'
+            lines = f.readlines()
+    except FileNotFoundError:
+        with open('/proc/{}/status'.format(pid)) as f:
+            field = 'VmRSS:'
+            lines = f.readlines()
+    for line in lines:
+        if line.startswith(field):
+            return int(line.split()[1])
+    raise RuntimeError('no {} for process {}'.format(field, pid))
+
+
+def run_ready(commands: List[List[str]], notify_path: str) -> int:
+    """Start the commands, wait until all are ready, and sum their memory.
+
+    :param commands: the command line arguments after `flagman` of each process
+    :param notify_path: the path to bind the notify socket to
+    :returns: the total memory in KiB
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        sock.bind(notify_path)
+        sock.settimeout(30)
+        env = dict(os.environ, NOTIFY_SOCKET=notify_path)
+        processes = [
+            subprocess.Popen(
+                FLAGMAN + args,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            for args in commands
+        ]
+        try:
+            ready = 0
+            while ready < len(processes):
+                ready += sock.recv(4096).split(b'\n').count(b'READY=1')
+            return sum(memory_kib(process.pid) for process in processes)
+        finally:
+            for process in processes:
+                process.send_signal(signal.SIGTERM)
+            for process in processes:
+                process.wait()
+            os.unlink(notify_path)
+
+
+def main() -> None:
+    """Run the services both ways and print their memory."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = {}
+        for i in range(args.tenants):
+            name = 'service{}'.format(i)
+            paths[name] = os.path.join(tmpdir, name + '.toml')
+            with open(paths[name], 'w') as f:
+                f.write(CONFIG.format(name=name))
+        notify_path = os.path.join(tmpdir, 'notify')
+
+        separate = run_ready(
+            [['--config', path] for path in paths.values()], notify_path
+        )
+        tenants = run_ready(
+            [
+                [
+                    arg
+                    for name, path in paths.items()
+                    for arg in ('--tenant', '{}={}'.format(name, path))
+                ]
+            ],
+            notify_path,
+        )
+
+    ratio = tenants / separate
+    print('services: {}'.format(args.tenants))
+    for way, total in (('separate', separate), ('tenants', tenants)):
+        print(
+            '{:<8}  total={:8.1f}MiB  per service={:6.1f}MiB'.format(
+                way, total / 1024, total / 1024 / args.tenants
+            )
+        )
+    print('tenants use {:.1%} of the memory of separate processes'.format(ratio))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Measure the cost of a file change for watchers of 1 to 10000 files.
+
+The files are spread over directories of 100 files each, and every file is watched for
+its own signal. One file is changed at a time and the watcher's events are read, so
+the time of a change is the cost of reading and looking up its events, plus the write
+itself. It should not grow with the number of watched files.
+
+Run with `python benchmarks/watch_events.py [--changes N]`.
+"""
+import argparse
+import logging
+import os
+import signal
+import tempfile
+import time
+
+from flagman.watch import FileWatcher
+
+SIZES = (1, 100, 10000)
+FILES_PER_DIR = 100
+
+
+def time_changes(change_count: int, size: int, tmpdir: str) -> float:
+    """Watch files, change one of them many times, and return the mean time.
+
+    :param change_count: the number of changes to time
+    :param size: the number of files to watch
+    :param tmpdir: the directory to create the files in
+    :returns: the mean time of a change in seconds
+    """
+    watcher = FileWatcher(debounce=0)
+    paths = []
+    for i in range(size):
+        directory = os.path.join(tmpdir, str(size), str(i // FILES_PER_DIR))
+        os.makedirs(directory, exist_ok=True)
+        paths.append(os.path.join(directory, str(i)))
+        watcher.add(paths[-1], signal.SIGRTMIN + i % 8)
+    changed = paths[len(paths) // 2]
+    start = time.perf_counter()
+    for _ in range(change_count):
+        with open(changed, 'w'):
+            pass
+        watcher._read_events()
+    elapsed = time.perf_counter() - start
+    watcher.close()
+    return elapsed / change_count
+
+
+def main() -> None:
+    """Time changes for each number of watched files."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--changes', type=int, default=5000)
+    args = parser.parse_args()
+    # every watch is logged at INFO, which would bury the results
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in SIZES:
+            mean = time_changes(args.changes, size, tmpdir)
+            print('files={:<6} per change={:8.2f}us'.format(size, mean * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,23 @@
 # -*- coding: utf-8 -*-
 """Built-in flagman actions.
 
-These simple actions are probably only useful for debugging.
+The print actions are probably only useful for debugging; the forward action sends a
+signal on to the processes of a service.
 """
 from flagman.actions.action import Action
-from flagman.actions.print import DelayedPrintAction, PrintAction, PrintOnceAction
+from flagman.actions.forward import ForwardSignalAction
+from flagman.actions.print import (
+    DelayedPrintAction,
+    PrintAction,
+    PrintOnceAction,
+    PrintSigInfoAction,
+)
 
-__all__ = ['Action', 'PrintAction', 'DelayedPrintAction', 'PrintOnceAction']
+__all__ = [
+    'Action',
+    'PrintAction',
+    'DelayedPrintAction',
+    'PrintOnceAction',
+    'PrintSigInfoAction',
+    'ForwardSignalAction',
+]
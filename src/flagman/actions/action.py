@@ -1,47 +1,385 @@
 # -*- coding: utf-8 -*-
 """The base Action class for all other Actions to inherit from."""
+import contextlib
+import logging
+import sys
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from typing import (
+    Awaitable,
+    Callable,
+    Generator,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 from flagman.exceptions import ActionClosed
 
+if TYPE_CHECKING:  # pragma: no cover
+    import asyncio  # noqa: F401 (unused import)
+    from flagman.signals import SigInfo  # noqa: F401 (unused import)
+    from flagman.workers import Worker  # noqa: F401 (unused import)
+
+# asyncio is slow to import and only needed for coroutine methods, so it is imported
+# where it is used
+
+logger = logging.getLogger(__name__)
+
+#: Holds the :class:`_SyncLoop` each thread uses to drive coroutine methods when no
+#: event loop is running
+_sync_loops = threading.local()
+#: Close coroutines scheduled on a running event loop, kept alive until they finish
+_pending_closes: 'Set[asyncio.Future[None]]' = set()
+#: Holds whether the actions each thread creates defer their set up
+_deferring = threading.local()
+
+
+@contextlib.contextmanager
+def deferred_set_up() -> Iterator[None]:
+    """Defer the set up of the actions created in the block.
+
+    Such an action is set up by :meth:`Action._start_set_up`, like from a thread pool,
+    or else just before its first run.
+    """
+    previous = getattr(_deferring, 'active', False)
+    _deferring.active = True
+    try:
+        yield
+    finally:
+        _deferring.active = previous
+
+
+class _SyncLoop:
+    """The event loop of a thread, closed when the thread exits and drops it."""
+
+    def __init__(self) -> None:
+        """Create the event loop."""
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+
+    def __del__(self) -> None:
+        """Close the event loop, releasing its selector and self-pipe."""
+        self.loop.close()
+
+
+def _run_sync(awaitable: Awaitable[None]) -> None:
+    """Run an awaitable to completion from synchronous code.
+
+    The event loop is kept for the thread's next call, so objects bound to it outlive
+    the call, and closed when the thread exits.
+
+    :param awaitable: the awaitable, usually a coroutine from an `async def` method
+    """
+    sync_loop: Optional[_SyncLoop] = getattr(_sync_loops, 'loop', None)
+    if sync_loop is None:
+        sync_loop = _sync_loops.loop = _SyncLoop()
+    sync_loop.loop.run_until_complete(awaitable)
+
+
+def _complete(awaitable: Awaitable[None]) -> None:
+    """Finish an awaitable on the running event loop, or synchronously without one.
+
+    :param awaitable: the awaitable
+    """
+    # no event loop can be running if asyncio has not even been imported
+    asyncio = sys.modules.get('asyncio')
+    try:
+        if asyncio is None:
+            raise RuntimeError('no running event loop')
+        asyncio.get_running_loop()
+    except RuntimeError:
+        _run_sync(awaitable)
+    else:
+        future = asyncio.ensure_future(awaitable)
+        _pending_closes.add(future)
+        future.add_done_callback(_pending_closes.discard)
+
+
+class _DeferredSetUp:
+    """Awaitable standing in for the set up of an action until it starts."""
+
+    def __init__(self, action: 'Action') -> None:
+        """Wrap the action whose set up is deferred.
+
+        :param action: the action
+        """
+        self._action = action
+
+    def __await__(self) -> Generator[object, None, None]:
+        """Start the set up and await it if it is a coroutine.
+
+        :returns: an iterator driving the set up
+        """
+        return self._action._run_deferred_set_up().__await__()
+
 
 class Action(metaclass=ABCMeta):
-    """The base Action class."""
+    """The base Action class.
+
+    :meth:`set_up`, :meth:`run`, and :meth:`tear_down` may be defined with `async def`.
+    Under :func:`flagman.aio.run_async` they are awaited on the running event loop;
+    under :func:`flagman.run` they are run to completion one at a time.
+    """
+
+    #: Actions in a bundle that share an ordering group are always taken one after
+    #: another in bundle order, even when the bundle is taken on a thread pool.
+    #: Actions without a group may be taken concurrently with the rest of the bundle.
+    ordering_group: Optional[str] = None
+
+    #: Isolated actions are run in a pre-forked worker process when a
+    #: :class:`~flagman.workers.WorkerPool` is in use.
+    isolated = False
+
+    #: If true, :meth:`run` is called with one argument: the
+    #: :class:`~flagman.signals.SigInfo` of the delivery it was taken for, or None if it
+    #: is not known. The signal is then read from a signalfd to get the payload.
+    wants_siginfo = False
+
+    #: Identical instances of a shareable action, with the same arguments and ordering
+    #: group, are one instance wherever they appear in the action bundles: it is set up
+    #: once and torn down when the last bundle releases it. Set this to False for
+    #: actions that keep state per signal or must not be taken for two signals at once.
+    shareable = True
+
+    #: The time in seconds a run of the action may take before it is stopped, or None
+    #: for no limit. A shorter timeout or deadline of the signal takes precedence; see
+    #: :mod:`flagman.deadlines`.
+    timeout: Optional[float] = None
+
+    #: How often the action may run, like `interval:60` or `bucket:5/60:defer`, or None
+    #: to run it for every trigger; see :mod:`flagman.throttle`. Set it on an instance
+    #: to throttle only that instance.
+    throttle: Optional[str] = None
+
+    #: The worker process that runs this action, if it is isolated
+    _worker: Optional['Worker'] = None
+
+    #: The number of places in the action bundles that hold this action
+    _references = 1
+
+    #: How long :meth:`set_up` took in seconds, or None if it has not finished
+    _set_up_seconds: Optional[float] = None
+
+    #: The arguments of a deferred set up that has not started
+    _set_up_args: Optional[Tuple[str, ...]] = None
 
     def __init__(self, *args: str) -> None:
         """Instantiate the ActionGenerator and run the set up code.
 
+        If :meth:`set_up` is a coroutine function, it is not awaited here but before
+        the first run of the Action. Inside :func:`deferred_set_up`, it is not called
+        here either.
+
         :param args: arguments that will be passed to the set_up method
         """
         self._closed = False
-        self.set_up(*args)
+        self._pending_set_up: Optional[Awaitable[None]] = None
+        if getattr(_deferring, 'active', False):
+            self._set_up_args = args
+            self._set_up_lock = threading.Lock()
+            self._pending_set_up = _DeferredSetUp(self)
+            return None
+        started = time.perf_counter()
+        self._pending_set_up = self.set_up(*args)
+        self._set_up_seconds = time.perf_counter() - started
 
-    def _run(self) -> None:
-        """Run the action if it hasn't been closed."""
-        if not self._closed:
-            self.run()
-        else:
+    def _run(self, siginfo: Optional['SigInfo'] = None) -> None:
+        """Run the action if it hasn't been closed.
+
+        :param siginfo: the details of the delivery the action is taken for
+        """
+        if self._worker is not None:
+            self._worker.run(self, siginfo)
+            return None
+        if self._pending_set_up is not None and not self._closed:
+            try:
+                if isinstance(self._pending_set_up, _DeferredSetUp):
+                    # a set up that is not a coroutine needs no event loop
+                    self._set_up_now()
+                if self._pending_set_up is not None:
+                    _run_sync(self._finish_set_up())
+            except Exception as e:
+                self._fail_set_up(e)
+        # a set up that failed, even on another thread while this one waited, closed it
+        if self._closed:
+            raise ActionClosed
+        result = self._call_run(siginfo)
+        if result is not None:
+            _run_sync(result)
+
+    async def _arun(self, siginfo: Optional['SigInfo'] = None) -> None:
+        """Run the action on the running event loop if it hasn't been closed.
+
+        :param siginfo: the details of the delivery the action is taken for
+        """
+        if self._worker is not None:
+            import asyncio
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._worker.run, self, siginfo)
+            return None
+        if self._pending_set_up is not None and not self._closed:
+            try:
+                await self._finish_set_up()
+            except Exception as e:
+                self._fail_set_up(e)
+        if self._closed:
             raise ActionClosed
+        result = self._call_run(siginfo)
+        if result is not None:
+            await result
+
+    def _call_run(self, siginfo: Optional['SigInfo']) -> Optional[Awaitable[None]]:
+        """Call :meth:`run`, passing the siginfo if the action wants it.
+
+        :param siginfo: the details of the delivery the action is taken for
+        :returns: the result of :meth:`run`
+        """
+        if self.wants_siginfo:
+            run: Callable[[Optional['SigInfo']], Optional[Awaitable[None]]] = getattr(
+                self, 'run'
+            )
+            return run(siginfo)
+        return self.run()
+
+    async def _finish_set_up(self) -> None:
+        """Await the set up code if :meth:`set_up` is a coroutine function."""
+        pending_set_up, self._pending_set_up = self._pending_set_up, None
+        if pending_set_up is None:
+            return None
+        if isinstance(pending_set_up, _DeferredSetUp):
+            await pending_set_up
+            return None
+        started = time.perf_counter()
+        await pending_set_up
+        self._set_up_seconds = (self._set_up_seconds or 0.0) + (
+            time.perf_counter() - started
+        )
+
+    def _fail_set_up(self, exc: Exception) -> None:
+        """Close the action because its set up failed before a run.
+
+        :param exc: the exception the set up raised
+        :raises ActionClosed: always, so the dispatcher removes the action
+        """
+        logger.error(
+            'Set up of action `%s` failed; closing it',
+            self.__class__.__name__,
+            exc_info=exc,
+        )
+        self._closed = True
+        raise ActionClosed('Set up failed') from exc
+
+    def _start_set_up(self) -> Optional[Awaitable[None]]:
+        """Call :meth:`set_up` if it was deferred and has not been called yet.
+
+        Safe to call from any thread; a call while another thread is setting the action
+        up waits for it. An action whose set up raises an exception is closed.
+
+        :returns: the awaitable returned by a :meth:`set_up` coroutine function
+        """
+        if self._set_up_args is None:
+            return None
+        with self._set_up_lock:
+            args = self._set_up_args
+            if args is None:
+                return None
+            started = time.perf_counter()
+            try:
+                return self.set_up(*args)
+            except Exception:
+                self._closed = True
+                raise
+            finally:
+                # cleared only now, so other threads wait on the lock until it is done
+                self._set_up_args = None
+                self._set_up_seconds = time.perf_counter() - started
+
+    def _set_up_now(self) -> None:
+        """Call a deferred :meth:`set_up` now, as if it had not been deferred.
+
+        A coroutine returned by :meth:`set_up` is left to be awaited before the first
+        run of the action, or by :func:`flagman.aio.run_async`.
+        """
+        self._pending_set_up = self._start_set_up()
+
+    async def _run_deferred_set_up(self) -> None:
+        """Start a deferred set up and await it if it is a coroutine."""
+        pending_set_up = self._start_set_up()
+        if pending_set_up is not None:
+            started = time.perf_counter()
+            await pending_set_up
+            self._set_up_seconds = (self._set_up_seconds or 0.0) + (
+                time.perf_counter() - started
+            )
+
+    def _skip_set_up(self) -> bool:
+        """Drop a deferred set up that has not started, since the action is closing.
+
+        :returns: whether the set up was dropped, so there is nothing to tear down
+        """
+        if self._set_up_args is None:
+            return False
+        with self._set_up_lock:
+            if self._set_up_args is None:
+                return False
+            self._set_up_args = None
+            self._pending_set_up = None
+            return True
 
     def _close(self) -> None:
         """Close the action, preventing future runs and executing tear down logic."""
+        if self._worker is not None:
+            self._worker.close(self)
+        elif not self._closed:
+            self._closed = True
+            if self._skip_set_up():
+                return None
+            if self._pending_set_up is not None:
+                _complete(self._tear_down_after_set_up())
+                return
+            result = self.tear_down()
+            if result is not None:
+                _complete(result)
+
+    def _release(self) -> None:
+        """Drop one reference to the action, closing it when the last one is dropped."""
+        self._references -= 1
+        if self._references <= 0:
+            self._close()
+
+    async def _aclose(self) -> None:
+        """Close the action and wait for tear down logic on the running event loop."""
         if not self._closed:
             self._closed = True
-            self.tear_down()
+            if not self._skip_set_up():
+                await self._tear_down_after_set_up()
+
+    async def _tear_down_after_set_up(self) -> None:
+        """Await any unfinished set up code, then the tear down code."""
+        await self._finish_set_up()
+        result = self.tear_down()
+        if result is not None:
+            await result
 
     def __del__(self) -> None:
         """Close the generator at destruction time."""
         self._close()
 
-    def set_up(self, *args: str) -> None:
+    def set_up(self, *args: str) -> Optional[Awaitable[None]]:
         """Perform any required set up for the Action."""
         pass
 
     @abstractmethod
-    def run(self) -> None:
+    def run(self) -> Optional[Awaitable[None]]:
         """Run the Action."""
         pass
 
-    def tear_down(self) -> None:
+    def tear_down(self) -> Optional[Awaitable[None]]:
         """Perform any required clean up for the Action."""
         pass
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""An action that forwards a signal to the processes of a service.
+
+The targets are read from pidfiles, which hold one or more PIDs, or from the
+`cgroup.procs` file of a cgroup, given as the cgroup's directory. A process is signalled
+through a pidfd, a file descriptor that refers to the process itself rather than to its
+PID, so a signal never reaches another process that was given the PID after the target
+exited.
+
+The pidfds are kept between runs. A pidfile is only read again when its inode, size or
+modification time changes, and then the pidfds of all the PIDs it lists are opened
+again. A cgroup's `cgroup.procs` has no reliable modification time, so it is read on
+every run, but only processes that joined the cgroup get new pidfds.
+A run sends the signal to every target in one pass, without starting any processes.
+
+Without pidfd support, which needs Linux 5.3, signals are sent by PID, as `kill` does.
+"""
+import logging
+import os
+import signal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flagman.actions import Action
+from flagman.signals import _libc, parse_signal, signal_name
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+# the system call numbers are the same on every architecture but alpha, ia64 and mips
+_SYS_PIDFD_SEND_SIGNAL = 424
+_SYS_PIDFD_OPEN = 434
+
+#: Type alias for the identity of a pidfile's contents: its inode, size and modification
+#: time
+_FileStamp = Tuple[int, int, int]
+
+
+def _syscall_pidfd_functions() -> Tuple[
+    Callable[[int], int], Callable[[int, SignalNumber], None]
+]:
+    """Get the pidfd functions as system calls, for Python versions without them.
+
+    :returns: functions like :func:`os.pidfd_open` and :func:`signal.pidfd_send_signal`
+    """
+    import ctypes
+
+    libc = _libc()
+
+    def pidfd_open(pid: int) -> int:
+        """Open a pidfd for a process."""
+        fd: int = libc.syscall(_SYS_PIDFD_OPEN, pid, 0)
+        if fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        return fd
+
+    def pidfd_send_signal(fd: int, num: SignalNumber) -> None:
+        """Send a signal to the process of a pidfd."""
+        if libc.syscall(_SYS_PIDFD_SEND_SIGNAL, fd, num, None, 0) < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+
+    return pidfd_open, pidfd_send_signal
+
+
+def _pidfd_functions() -> Optional[
+    Tuple[Callable[[int], int], Callable[[int, SignalNumber], None]]
+]:
+    """Get functions to open a pidfd and send a signal through it, if pidfds work.
+
+    :returns: functions like :func:`os.pidfd_open` and :func:`signal.pidfd_send_signal`,
+        or None if the kernel does not support pidfds
+    """
+    if hasattr(os, 'pidfd_open') and hasattr(signal, 'pidfd_send_signal'):
+        functions: Tuple[Callable[[int], int], Callable[[int, SignalNumber], None]] = (
+            os.pidfd_open,
+            signal.pidfd_send_signal,
+        )
+    else:
+        functions = _syscall_pidfd_functions()
+    try:
+        os.close(functions[0](os.getpid()))
+    except OSError as e:
+        logger.warning('pidfds are not available, signalling by PID: %s', e)
+        return None
+    return functions
+
+
+class _Source:
+    """A pidfile or cgroup with the pidfds of the processes it lists."""
+
+    def __init__(self, path: str) -> None:
+        """Remember the path; nothing is read until the first run.
+
+        :param path: the path of a pidfile or of a cgroup's directory
+        """
+        if os.path.isdir(path):
+            self.path = os.path.join(path, 'cgroup.procs')
+            self.is_cgroup = True
+        else:
+            self.path = path
+            self.is_cgroup = False
+        self._stamp: Optional[_FileStamp] = None
+        #: The PID and pidfd of each target; the pidfd is -1 without pidfd support
+        self.targets: Dict[int, int] = {}
+
+    def refresh(self, pidfd_open: Optional[Callable[[int], int]]) -> None:
+        """Read the PIDs again if the file changed, opening pidfds for them.
+
+        A missing file lists no processes, like the pidfile of a stopped service. A file
+        that is not a list of PIDs, like one caught while it is written, is read again
+        on the next run. PIDs that are not positive are skipped, since `kill` would
+        signal a whole process group with them.
+
+        :param pidfd_open: the function that opens a pidfd, or None to not open any
+        """
+        stamp: Optional[_FileStamp] = None
+        try:
+            if not self.is_cgroup:
+                stat = os.stat(self.path)
+                stamp = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                if stamp == self._stamp:
+                    return None
+            with open(self.path, 'rb') as f:
+                pids = {int(word) for word in f.read().split()}
+        except FileNotFoundError:
+            stamp = None
+            pids = set()
+        except ValueError:
+            logger.warning('Not a list of PIDs: `%s`', self.path)
+            return None
+        for pid in sorted(pid for pid in pids if pid <= 0):
+            logger.warning('Skipping PID %d in `%s`', pid, self.path)
+            pids.discard(pid)
+        if self.is_cgroup:
+            for pid in set(self.targets) - pids:
+                self.drop(pid)
+            pids -= set(self.targets)
+        else:
+            # a rewritten pidfile may list a PID again for a process that replaced the
+            # one the old pidfd is for, so every pidfd is opened again
+            self.close()
+        for pid in pids:
+            self._open(pid, pidfd_open)
+        self._stamp = stamp
+
+    def drop(self, pid: int) -> None:
+        """Forget a target and close its pidfd.
+
+        :param pid: the PID of the target
+        """
+        fd = self.targets.pop(pid)
+        if fd >= 0:
+            os.close(fd)
+
+    def close(self) -> None:
+        """Forget every target and close their pidfds."""
+        for pid in list(self.targets):
+            self.drop(pid)
+        self._stamp = None
+
+    def _open(self, pid: int, pidfd_open: Optional[Callable[[int], int]]) -> None:
+        """Start targeting a process.
+
+        :param pid: the PID of the process
+        :param pidfd_open: the function that opens a pidfd, or None to not open any
+        """
+        if pidfd_open is None:
+            self.targets[pid] = -1
+            return None
+        try:
+            self.targets[pid] = pidfd_open(pid)
+        except ProcessLookupError:
+            logger.debug('Process %d of `%s` already exited', pid, self.path)
+        except OSError as e:
+            logger.warning('Cannot open process %d of `%s`: %s', pid, self.path, e)
+
+
+class ForwardSignalAction(Action):
+    """An Action that sends a signal to the processes listed in pidfiles or cgroups.
+
+    (signal: str, source: str, ...)
+    """
+
+    def set_up(self, name: str, *sources: str) -> None:  # type: ignore
+        """Parse the signal and remember the sources of the targets.
+
+        :param name: the signal to send, like `hup` or `RTMIN+3`
+        :param sources: pidfiles, or the directories of cgroups
+        :raises ValueError: if the signal is unknown or no source is given
+        """
+        # set first, since the Action is torn down even if it fails to set up
+        self._sources = [_Source(source) for source in sources]
+        if not sources:
+            raise ValueError('expected a pidfile or cgroup after the signal')
+        self._signal = parse_signal(name)
+        self._pidfd_open: Optional[Callable[[int], int]] = None
+        self._send: Optional[Callable[[int, SignalNumber], None]] = None
+        functions = _pidfd_functions()
+        if functions is not None:
+            self._pidfd_open, self._send = functions
+
+    def run(self) -> None:
+        """Send the signal to every target.
+
+        :raises OSError: the first error other than a target having exited, once every
+            target was tried
+        """
+        errors: List[OSError] = []
+        sent = 0
+        for source in self._sources:
+            source.refresh(self._pidfd_open)
+            for pid, fd in list(source.targets.items()):
+                try:
+                    self._signal_target(pid, fd)
+                    sent += 1
+                except ProcessLookupError:
+                    logger.debug('Process %d of `%s` exited', pid, source.path)
+                    source.drop(pid)
+                except OSError as e:
+                    errors.append(e)
+        logger.debug('Sent %s to %d processes', signal_name(self._signal), sent)
+        if errors:
+            raise errors[0]
+
+    def tear_down(self) -> None:
+        """Close the pidfds."""
+        for source in self._sources:
+            source.close()
+
+    def _signal_target(self, pid: int, fd: int) -> None:
+        """Send the signal to a target.
+
+        :param pid: the PID of the target
+        :param fd: the pidfd of the target, or -1 to signal it by PID
+        :raises ProcessLookupError: if the target exited
+        :raises OSError: if the signal could not be sent
+        """
+        # a pidfd of an exited process fails with ESRCH like a PID that is not in use
+        if self._send is None or fd < 0:
+            os.kill(pid, self._signal)
+        else:
+            self._send(fd, self._signal)
@@ -4,9 +4,11 @@
 Most likely only useful for debugging.
 """
 from time import sleep
+from typing import Optional
 
 from flagman.actions import Action
 from flagman.exceptions import ActionClosed
+from flagman.signals import SigInfo
 
 
 class PrintAction(Action):
@@ -60,6 +62,9 @@ class PrintOnceAction(PrintAction):
     (message: str)
     """
 
+    # printing once is per bundle the action is in
+    shareable = False
+
     def set_up(self, msg: str) -> None:  # type: ignore
         """Store the message.
 
@@ -72,3 +77,26 @@ class PrintOnceAction(PrintAction):
         super().run()
         self._close()
         raise ActionClosed('Only print once')
+
+
+class PrintSigInfoAction(PrintAction):
+    """An Action that prints a message with the sender and payload of each signal.
+
+    (message: str)
+    """
+
+    wants_siginfo = True
+
+    def run(self, siginfo: Optional[SigInfo] = None) -> None:
+        """Print the message, the sender's PID, and the payload.
+
+        :param siginfo: the details of the delivery, if they are known
+        """
+        if siginfo is None:
+            print('{} (no siginfo)'.format(self._msg))
+        else:
+            print(
+                '{} (from PID {}, value {})'.format(
+                    self._msg, siginfo.pid, siginfo.value
+                )
+            )
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""The asyncio runtime for flagman.
+
+An alternative to :func:`flagman.run` that dispatches signals on an asyncio event loop.
+
+Each raised signal's action bundle runs in its own task, so a slow action only holds up
+the actions after it in its own bundle while other signals are handled right away.
+Actions within a bundle are still taken one at a time in the order they were passed
+on the command line, and a signal's bundle never runs twice at once.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from flagman import core
+from flagman.core import (
+    ACTION_BUNDLES,
+    build_dispatch_plans,
+    DEADLINES,
+    DISPATCH_PLANS,
+    HANDLED_SIGNALS,
+    SIGNAL_FLAGS,
+    _log_signal_stats,
+    _lower_flag,
+    _pop_signal,
+    _record_action,
+    _remove_closed_action,
+)
+from flagman.actions import Action
+from flagman.deadlines import atake_action, bundle_end
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.loop import PeriodicCallback, ReaderCallback
+from flagman.signals import SigInfo, signal_name
+from flagman.throttle import due_runs
+from flagman.types import SignalNumber
+
+if TYPE_CHECKING:  # pragma: no cover
+    from flagman.executors import ActionOutcome  # noqa: F401 (unused import)
+
+logger = logging.getLogger(__name__)
+
+
+async def run_async(
+    periodic: Sequence[Tuple[float, PeriodicCallback]] = (),
+    readers: Sequence[Tuple[int, ReaderCallback]] = (),
+) -> None:
+    """Run the flagman event loop on the running asyncio event loop.
+
+    Awaits the set up of every action that is not deferred, registers signal handlers
+    with :meth:`asyncio.AbstractEventLoop.add_signal_handler`, and dispatches raised
+    signals until no actions remain.
+
+    Signals delivered to handlers registered by :func:`flagman.set_handlers` before this
+    coroutine starts are dispatched as soon as it starts.
+
+    :param periodic: intervals in seconds and callbacks to run at those intervals while
+        dispatching, like :meth:`flagman.loop.EventLoop.call_every`
+    :param readers: file descriptors and callbacks to run when they are readable, like
+        :meth:`flagman.loop.EventLoop.add_reader`
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    # actions whose set up is deferred until their first run are left alone
+    await asyncio.gather(
+        *(
+            action._finish_set_up()
+            for bundle in ACTION_BUNDLES.values()
+            for action in bundle
+            if action._set_up_args is None
+        )
+    )
+
+    build_dispatch_plans()
+    signal_fd = core._signal_fd
+    if signal_fd is not None:
+        loop.add_reader(signal_fd.fileno(), _read_signal_fd, wakeup)
+    for fd, reader in readers:
+        loop.add_reader(fd, _call_and_wake, reader, wakeup)
+    registered: List[SignalNumber] = []
+    for signum in HANDLED_SIGNALS:
+        if signal_fd is not None and signum in signal_fd.signals:
+            continue
+        if len(ACTION_BUNDLES[signum]) > 0 or signum in core._handler_signals:
+            logger.debug(
+                'Adding asyncio signal handler for signal `%s`', signal_name(signum)
+            )
+            loop.add_signal_handler(signum, _handler, signum, wakeup)
+            registered.append(signum)
+
+    running: Dict[SignalNumber, 'asyncio.Task[None]'] = {}
+    timers = [
+        asyncio.ensure_future(_call_every(interval, callback))
+        for interval, callback in periodic
+    ]
+    logger.info('Starting asyncio event loop')
+    try:
+        await _dispatch_forever(wakeup, running)
+    finally:
+        for task in [*running.values(), *timers]:
+            task.cancel()
+        for num in registered:
+            loop.remove_signal_handler(num)
+        if signal_fd is not None:
+            loop.remove_reader(signal_fd.fileno())
+        for fd, _reader in readers:
+            loop.remove_reader(fd)
+        _log_signal_stats()
+
+
+async def _call_every(interval: float, callback: PeriodicCallback) -> None:
+    """Run a callback at a fixed interval until cancelled.
+
+    :param interval: the time between calls in seconds
+    :param callback: a callable taking no arguments
+    """
+    while True:
+        await asyncio.sleep(interval)
+        callback()
+
+
+def _handler(num: SignalNumber, wakeup: asyncio.Event) -> None:
+    """Record a delivered signal and wake the dispatcher.
+
+    :param num: the signal number
+    :param wakeup: the event the dispatcher waits on
+    """
+    SIGNAL_FLAGS.add(num)
+    wakeup.set()
+
+
+def _call_and_wake(reader: ReaderCallback, wakeup: asyncio.Event) -> None:
+    """Run a reader callback and wake the dispatcher, in case it raised a flag.
+
+    :param reader: the callback
+    :param wakeup: the event the dispatcher waits on
+    """
+    reader()
+    wakeup.set()
+
+
+def _read_signal_fd(wakeup: asyncio.Event) -> None:
+    """Record the deliveries waiting in the signalfd and wake the dispatcher.
+
+    :param wakeup: the event the dispatcher waits on
+    """
+    core._read_signal_fd()
+    wakeup.set()
+
+
+async def _dispatch_forever(
+    wakeup: asyncio.Event, running: Dict[SignalNumber, 'asyncio.Task[None]']
+) -> None:
+    """Start a task for each raised signal whose bundle is not already running.
+
+    :param wakeup: the event set by the signal handlers
+    :param running: the running bundle task for each signal; updated in place
+    """
+    waiter: Optional['asyncio.Task[bool]'] = None
+    while True:
+        core._fire_timers()
+        _take_deferred_runs(running)
+        while True:
+            try:
+                num = _pop_signal(busy=running)
+            except KeyError:
+                break
+            logger.debug('Found raised flag for signal number `%d`', num)
+            running[num] = asyncio.ensure_future(_dispatch_async(num))
+
+        if not running and not any(ACTION_BUNDLES.values()):
+            logger.warning('No actions remain active; exiting event loop')
+            return None
+
+        if waiter is None or waiter.done():
+            wakeup.clear()
+            waiter = asyncio.ensure_future(wakeup.wait())
+        await asyncio.wait(
+            [waiter, *running.values()],
+            timeout=core._timeout(running),
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+
+        for num, task in list(running.items()):
+            if task.done():
+                del running[num]
+                # re-raise anything but `ActionClosed`, just like `flagman.run`
+                task.result()
+
+
+def _take_deferred_runs(running: Dict[SignalNumber, 'asyncio.Task[None]']) -> None:
+    """Start a task for the deferred runs of throttled actions that are due.
+
+    The runs due for one signal are taken together, in bundle order, once the signal's
+    bundle is no longer running.
+
+    :param running: the running bundle task for each signal; updated in place
+    """
+    runs: Dict[SignalNumber, Dict[Action, Optional[SigInfo]]] = {}
+    for num, action, siginfo in due_runs(time.monotonic(), running):
+        runs.setdefault(num, {})[action] = siginfo
+    for num, due in runs.items():
+        # the actions may have been closed or removed by a reload in the meantime
+        actions = [action for action in ACTION_BUNDLES.get(num, ()) if action in due]
+        if actions:
+            logger.debug(
+                'Taking deferred runs of actions `%s` for signal number `%d`',
+                [action.__class__.__name__ for action in actions],
+                num,
+            )
+            running[num] = asyncio.ensure_future(
+                _take_deferred_async(num, actions, due[actions[-1]])
+            )
+
+
+async def _dispatch_async(num: SignalNumber) -> None:
+    """Take the actions in the bundle for a signal, removing closed actions.
+
+    :param num: the number of the raised signal
+    """
+    siginfo = SIGNAL_FLAGS.siginfo(num)
+    plan = DISPATCH_PLANS[num]
+    if num in core._throttled_signals:
+        plan = core._admit(num, plan, siginfo)
+    outcomes = await _take_async(num, [action for action, _ in plan], siginfo)
+    _lower_flag(num, outcomes)
+
+
+async def _take_deferred_async(
+    num: SignalNumber, actions: Sequence[Action], siginfo: Optional[SigInfo]
+) -> None:
+    """Take the deferred runs of throttled actions without lowering the signal's flag.
+
+    :param num: the number of the signal the runs were deferred for
+    :param actions: the actions, in bundle order
+    :param siginfo: the details of the latest trigger of the runs
+    """
+    await _take_async(num, actions, siginfo)
+
+
+async def _take_async(
+    num: SignalNumber, actions: Sequence[Action], siginfo: Optional[SigInfo]
+) -> List['ActionOutcome']:
+    """Take actions one at a time, removing closed actions.
+
+    :param num: the number of the raised signal
+    :param actions: the actions, in order
+    :param siginfo: the details of the delivery the actions are taken for
+    :returns: the outcome of each action
+    """
+    deadlines = DEADLINES.get(num)
+    ends = bundle_end(deadlines)
+    outcomes: List['ActionOutcome'] = []
+    for action in actions:
+        logger.debug(
+            'Taking action `%s` for signal number `%d`', action.__class__.__name__, num
+        )
+        start = time.perf_counter()
+        try:
+            await atake_action(action, siginfo, deadlines, ends)
+        except (ActionClosed, ActionTimeout) as e:
+            seconds = time.perf_counter() - start
+            _record_action(num, action, e, seconds)
+            outcomes.append((action, e, seconds))
+            if isinstance(e, ActionClosed):
+                _remove_closed_action(num, action, e)
+            continue
+        except Exception as e:
+            _record_action(num, action, e, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        _record_action(num, action, None, seconds)
+        outcomes.append((action, None, seconds))
+    return outcomes
@@ -16,34 +16,25 @@ problems--the code will get executed twice:
 Also see (1) from http://click.pocoo.org/5/setuptools/#setuptools-integration
 """
 import argparse
+import contextlib
 import logging
 import os
 import signal
 import sys
-import textwrap
+import time
 from types import FrameType
-from typing import Optional, Sequence
-
-try:
-    from colorama import init as colorama_init
-    from colorama import Style
-except ImportError:
-    colorama_init = lambda: None  # noqa: E731
-
-    class AllAttrEmptyString:
-        """Return '' for any attribute."""
-
-        def __getattr__(self, name: str) -> str:
-            """Return '' for any attribute.
-
-            :param name: the attribute name
-            :returns: an empty string
-            """
-            return ''
-
-    Style = AllAttrEmptyString()
-
+from typing import (
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+)
 
+# Only what is needed to parse the arguments is imported here; asyncio, colorama, the
+# worker processes and the action plugins are imported once they are known to be used.
 from flagman import (
     HANDLED_SIGNALS,
     KNOWN_ACTIONS,
@@ -51,7 +42,39 @@ from flagman import (
     run,
     set_handlers,
 )
-from flagman.sd_notify import SystemdNotifier
+from flagman.actions.action import deferred_set_up
+from flagman.core import (
+    ACTION_BUNDLES,
+    add_handled_signal,
+    DEADLINES,
+    option_key,
+    remove_handled_signal,
+    SIGNAL_FLAGS,
+)
+from flagman.deadlines import Deadlines, parse_timeout_policy, TimeoutPolicy
+from flagman.exceptions import ConfigError, JournalError
+from flagman.loop import EventLoop, PeriodicCallback, ReaderCallback
+from flagman.pending import parse_policy, SignalPolicy
+from flagman.signals import parse_signal, signal_name
+from flagman.startup import (
+    deferred_actions,
+    report_set_up,
+    set_up_in_background,
+    set_up_parallel,
+    SetUpMode,
+)
+from flagman.throttle import parse_throttle
+from flagman.timers import parse_timer, set_timers, Timer
+from flagman.types import ActionName, SignalNumber
+
+if TYPE_CHECKING:  # pragma: no cover
+    from flagman.config import ConfigFile  # noqa: F401 (unused import)
+    from flagman.control import ControlServer  # noqa: F401 (unused import)
+    from flagman.journal import Journal  # noqa: F401 (unused import)
+    from flagman.metrics import MetricsExporter  # noqa: F401 (unused import)
+    from flagman.systemd import ServiceMonitor  # noqa: F401 (unused import)
+    from flagman.watch import FileWatcher  # noqa: F401 (unused import)
+    from flagman.workers import WorkerPool  # noqa: F401 (unused import)
 
 logger = logging.getLogger(__name__)
 
@@ -60,7 +83,31 @@ EPILOG_TEXT = """NOTES:
  - When a signal with multiple actions is handled, the actions are guaranteed to
    be taken in the order they were passed on the command line.
  - Calling with no actions set is a critical error and will cause an immediate
-   exit with code 2."""
+   exit with code 2.
+ - Suffix an ACTION with `@GROUP` to put it in an ordering group. With `--workers`,
+   actions in the same group are taken in order and other actions concurrently.
+ - A signal's POLICY is `coalesce` (the default), `every`, or `debounce:SECONDS`.
+   Real-time signals default to `every`.
+ - An action that runs out of time under `--timeout` or `--deadline` is
+   skipped, or handled by the POLICY of `--on-timeout`: `skip` (the default),
+   `retry` or `retry:N` to run it up to N more times, or `close` to remove it.
+   A retry of an action that could not be stopped waits for its run to return.
+ - Signals have priority 0 unless set with `--priority`. Of the waiting signals,
+   the highest priority goes first, and without `--asyncio` or `--workers` a
+   bundle is paused between two actions for a higher priority signal. Waiting
+   raises a priority one level per `--priority-aging` SECONDS, so none starves.
+ - A THROTTLE is `bucket:N/SECONDS` for bursts of up to N runs per SECONDS,
+   `interval:SECONDS` for one run per SECONDS, or `debounce:SECONDS` to run
+   once triggers stop for SECONDS. Triggers over a bucket or interval are
+   dropped, or deferred until allowed if `:defer` is appended.
+ - A TIMER is `every:SECONDS` or `cron:SPEC` with a crontab schedule like
+   `*/5 * * * *`. A tick while the actions are running or waiting is merged into
+   that run, and `every` starts over after each run.
+ - A `--watch` on a file triggers on writes, renames over it, creation and
+   deletion, once no change arrived for `--watch-debounce` SECONDS.
+ - The signals in the config file of a `--tenant` are names within the tenant,
+   each given a free real-time signal, which is logged when the tenant is loaded.
+ - SIGNAL is a signal name or number, like `USR1`, `SIGRTMIN+3`, or `RTMAX-1`."""
 
 
 def _sigterm_handler(signum: int, _frame: FrameType) -> None:
@@ -68,6 +115,161 @@ def _sigterm_handler(signum: int, _frame: FrameType) -> None:
     sys.exit('from sigterm handler')
 
 
+def _signal_policy(value: str) -> Tuple[SignalPolicy, float]:
+    """Parse a delivery policy like `coalesce`, `every`, or `debounce:1.5`.
+
+    :param value: the policy string from the command line
+
+    :returns: the policy and its debounce window in seconds
+    """
+    try:
+        return parse_policy(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def _signal_number(value: str) -> SignalNumber:
+    """Parse a signal name like `usr1` or `RTMIN+3` for the command line.
+
+    :param value: the signal name or number from the command line
+
+    :returns: the signal number
+    """
+    try:
+        num = parse_signal(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    if num == signal.SIGTERM:
+        raise argparse.ArgumentTypeError('SIGTERM is reserved for stopping flagman')
+    return num
+
+
+def _signal_and_policy(value: str) -> Tuple[SignalNumber, Tuple[SignalPolicy, float]]:
+    """Parse a signal and delivery policy like `rtmin+3=debounce:1.5`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number, the policy, and its debounce window in seconds
+    """
+    name, sep, policy = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected SIGNAL=POLICY: {!r}'.format(value))
+    return _signal_number(name), _signal_policy(policy)
+
+
+def _signal_and_priority(value: str) -> Tuple[SignalNumber, int]:
+    """Parse a signal and priority like `hup=-5` or `usr2=10`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number and the priority
+    """
+    name, sep, priority = value.partition('=')
+    try:
+        if not sep:
+            raise ValueError
+        return _signal_number(name), int(priority)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected SIGNAL=PRIORITY: {!r}'.format(value)
+        ) from None
+
+
+def _signal_and_seconds(value: str) -> Tuple[SignalNumber, float]:
+    """Parse a signal and a time limit like `usr1=2.5`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number and the time in seconds
+    """
+    name, sep, seconds = value.partition('=')
+    try:
+        if not sep or float(seconds) <= 0:
+            raise ValueError
+        return _signal_number(name), float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'expected SIGNAL=SECONDS with SECONDS > 0: {!r}'.format(value)
+        ) from None
+
+
+def _signal_and_timeout_policy(
+    value: str,
+) -> Tuple[SignalNumber, Tuple[TimeoutPolicy, int]]:
+    """Parse a signal and timeout policy like `usr1=retry:2`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number, the policy, and the number of retries
+    """
+    name, sep, policy = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected SIGNAL=POLICY: {!r}'.format(value))
+    try:
+        return _signal_number(name), parse_timeout_policy(policy)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def _action_and_throttle(value: str) -> Tuple[ActionName, str]:
+    """Parse an action name and throttle like `print=bucket:5/60:defer`.
+
+    :param value: the string from the command line
+
+    :returns: the action name and the throttle string
+    """
+    name, sep, throttle = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected ACTION=THROTTLE: {!r}'.format(value))
+    try:
+        parse_throttle(throttle)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return name, throttle
+
+
+def _signal_and_timer(value: str) -> Tuple[SignalNumber, Timer]:
+    """Parse a signal and timer like `usr1=every:60` or `hup=cron:0 3 * * *`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number and the timer
+    """
+    name, sep, timer = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected SIGNAL=TIMER: {!r}'.format(value))
+    try:
+        return _signal_number(name), parse_timer(timer)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def _signal_and_path(value: str) -> Tuple[SignalNumber, str]:
+    """Parse a signal and a path like `hup=/etc/app/app.conf`.
+
+    :param value: the string from the command line
+
+    :returns: the signal number and the path
+    """
+    name, sep, path = value.partition('=')
+    if not sep or not path:
+        raise argparse.ArgumentTypeError('expected SIGNAL=PATH: {!r}'.format(value))
+    return _signal_number(name), path
+
+
+def _tenant_and_config(value: str) -> Tuple[str, str]:
+    """Parse a tenant name and config file like `web=/etc/flagman/web.toml`.
+
+    :param value: the string from the command line
+
+    :returns: the tenant name and the path of its config file
+    """
+    name, sep, path = value.partition('=')
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError('expected NAME=PATH: {!r}'.format(value))
+    return name, path
+
+
 def parse_args(argv: Sequence[str]) -> argparse.Namespace:
     """Parse the arguments for the flagman CLI.
 
@@ -85,7 +287,7 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         '--list', '-l', action='store_true', help='list known actions and exit'
     )
     for signum in HANDLED_SIGNALS:
-        name = signum.name
+        name = signal_name(signum)
         parser.add_argument(
             '--{}'.format(name[3:].lower()),
             action='append',
@@ -94,13 +296,219 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
             help='add an action for {}'.format(name),
             metavar=('ACTION', 'ARGUMENT'),
         )
+        parser.add_argument(
+            '--{}-policy'.format(name[3:].lower()),
+            type=_signal_policy,
+            default=(SignalPolicy.COALESCE, 0.0),
+            help='set the delivery policy for {}'.format(name),
+            metavar='POLICY',
+        )
+    parser.add_argument(
+        '--signal',
+        action='append',
+        nargs='+',
+        default=[],
+        help='add an action for any other signal',
+        metavar=('SIGNAL', 'ACTION'),
+    )
+    parser.add_argument(
+        '--policy',
+        action='append',
+        type=_signal_and_policy,
+        default=[],
+        help='set the delivery policy for any signal',
+        metavar='SIGNAL=POLICY',
+    )
+    parser.add_argument(
+        '--priority',
+        action='append',
+        type=_signal_and_priority,
+        default=[],
+        help='set the dispatch priority for any signal; higher goes first',
+        metavar='SIGNAL=N',
+    )
+    parser.add_argument(
+        '--priority-aging',
+        type=float,
+        default=1.0,
+        help='raise a waiting signal one priority level this often (default: 1)',
+        metavar='SECONDS',
+    )
+    parser.add_argument(
+        '--timeout',
+        action='append',
+        type=_signal_and_seconds,
+        default=[],
+        help='stop each action for SIGNAL that runs for longer than SECONDS',
+        metavar='SIGNAL=SECONDS',
+    )
+    parser.add_argument(
+        '--deadline',
+        action='append',
+        type=_signal_and_seconds,
+        default=[],
+        help='stop the actions for SIGNAL once they ran for SECONDS in total',
+        metavar='SIGNAL=SECONDS',
+    )
+    parser.add_argument(
+        '--on-timeout',
+        action='append',
+        type=_signal_and_timeout_policy,
+        default=[],
+        help='what to do with an action for SIGNAL that runs out of time',
+        metavar='SIGNAL=POLICY',
+    )
+    parser.add_argument(
+        '--throttle',
+        action='append',
+        type=_action_and_throttle,
+        default=[],
+        help='limit how often every instance of ACTION runs',
+        metavar='ACTION=THROTTLE',
+    )
+    parser.add_argument(
+        '--timer',
+        action='append',
+        type=_signal_and_timer,
+        default=[],
+        help='also trigger the actions for SIGNAL on the schedule of TIMER',
+        metavar='SIGNAL=TIMER',
+    )
+    parser.add_argument(
+        '--watch',
+        action='append',
+        type=_signal_and_path,
+        default=[],
+        help='also trigger the actions for SIGNAL when PATH changes',
+        metavar='SIGNAL=PATH',
+    )
+    parser.add_argument(
+        '--watch-debounce',
+        type=float,
+        default=0.2,
+        help='wait for SECONDS without changes before triggering (default: 0.2)',
+        metavar='SECONDS',
+    )
+    parser.add_argument(
+        '--config',
+        help='add the actions and policies in a TOML or JSON config file',
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--tenant',
+        action='append',
+        type=_tenant_and_config,
+        default=[],
+        help='host the actions of the config file at PATH as the tenant NAME',
+        metavar='NAME=PATH',
+    )
+    parser.add_argument(
+        '--tenant-socket-dir',
+        help='accept triggers for each tenant on a Unix socket at DIR/NAME.sock',
+        metavar='DIR',
+    )
+    parser.add_argument(
+        '--reload-signal',
+        type=_signal_number,
+        help='reload the config files when SIGNAL is delivered, like `hup`',
+        metavar='SIGNAL',
+    )
     parser.add_argument(
         '--successful-empty',
         action='store_false',
         help='if all actions are removed, exit with 0 instead of the default 1',
     )
     parser.add_argument(
-        '--no-systemd', action='store_false', help='do not notify systemd about status'
+        '--set-up',
+        type=SetUpMode,
+        default=SetUpMode.SERIAL,
+        help='when to set actions up: serial (the default), parallel, or lazy',
+        metavar='MODE',
+    )
+    parser.add_argument(
+        '--set-up-threads',
+        type=int,
+        default=8,
+        help='the size of the thread pool for `--set-up` (default: 8)',
+        metavar='N',
+    )
+    parser.add_argument(
+        '--asyncio',
+        action='store_true',
+        help='run actions on an asyncio event loop so different signals overlap',
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=0,
+        help='take actions on a pool of this many threads',
+        metavar='N',
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=0,
+        help='run isolated actions in this many pre-forked worker processes',
+        metavar='N',
+    )
+    parser.add_argument(
+        '--isolate',
+        action='append',
+        default=[],
+        help='isolate every instance of ACTION in a worker process',
+        metavar='ACTION',
+    )
+    parser.add_argument(
+        '--no-systemd',
+        action='store_false',
+        dest='systemd',
+        help='do not notify systemd about status',
+    )
+    parser.add_argument(
+        '--status-interval',
+        type=float,
+        default=30.0,
+        help='send systemd a status line this often; 0 to disable (default: 30)',
+        metavar='SECONDS',
+    )
+    parser.add_argument(
+        '--control-socket',
+        help='accept triggers for action bundles on a Unix socket at PATH',
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--metrics-socket',
+        help='serve Prometheus metrics over HTTP on a Unix socket at PATH',
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--metrics-file',
+        help='write Prometheus metrics to PATH for the textfile collector',
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=15.0,
+        help='write the metrics file this often (default: 15)',
+        metavar='SECONDS',
+    )
+    parser.add_argument(
+        '--journal',
+        help='record signals and action outcomes in a ring buffer file at PATH',
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--journal-size',
+        type=int,
+        default=16384,
+        help='the number of records the journal holds (default: 16384)',
+        metavar='N',
+    )
+    parser.add_argument(
+        '--read-journal',
+        help='print the records of the journal at PATH and exit',
+        metavar='PATH',
     )
     parser.add_argument(
         '--quiet',
@@ -116,13 +524,72 @@ def parse_args(argv: Sequence[str]) -> argparse.Namespace:
         help='increase the loglevel; pass multiple times for more verbosity',
     )
 
-    return parser.parse_args(argv[1:])
+    args = parser.parse_args(argv[1:])
+    signal_actions = []
+    for signal_call in args.signal:
+        if len(signal_call) < 2:
+            parser.error('argument --signal: expected SIGNAL and ACTION')
+        try:
+            signal_actions.append((_signal_number(signal_call[0]), signal_call[1:]))
+        except argparse.ArgumentTypeError as e:
+            parser.error('argument --signal: {}'.format(e))
+    args.signal = signal_actions
+    _check_args(parser, args)
+    return args
+
+
+def _check_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Check the options that depend on each other or on the installed actions.
+
+    :param parser: the parser, to report errors with
+    :param args: the parsed arguments
+    """
+    if args.reload_signal is not None and args.config is None and not args.tenant:
+        parser.error('argument --reload-signal: needs --config or --tenant')
+    if args.tenant_socket_dir is not None and not args.tenant:
+        parser.error('argument --tenant-socket-dir: needs --tenant')
+    if args.watch_debounce < 0:
+        parser.error('argument --watch-debounce: must not be negative')
+    if args.isolate and args.processes <= 0:
+        parser.error('argument --isolate: needs --processes')
+    for name in args.isolate:
+        if name not in KNOWN_ACTIONS:
+            parser.error('argument --isolate: unknown action: {!r}'.format(name))
+    for name, _ in args.throttle:
+        if name not in KNOWN_ACTIONS:
+            parser.error('argument --throttle: unknown action: {!r}'.format(name))
+
+
+class AllAttrEmptyString:
+    """Return '' for any attribute."""
+
+    def __getattr__(self, name: str) -> str:
+        """Return '' for any attribute.
+
+        :param name: the attribute name
+        :returns: an empty string
+        """
+        return ''
 
 
 def list_actions() -> None:
-    """Pretty-print the list of available actions to stdout."""
+    """Pretty-print the list of available actions to stdout.
+
+    The descriptions come from the action index when it is fresh, so no action module
+    has to be imported.
+    """
+    import textwrap
+
+    try:
+        from colorama import init as colorama_init
+        from colorama import Style
+    except ImportError:
+        colorama_init = lambda: None  # noqa: E731
+        Style = AllAttrEmptyString()
+
     colorama_init()
-    max_action_name_len = max(len(name) for name in KNOWN_ACTIONS.keys())
+    descriptions = KNOWN_ACTIONS.descriptions
+    max_action_name_len = max(len(name) for name in descriptions.keys())
     wrapper = textwrap.TextWrapper(
         width=80 - max_action_name_len - 3,
         subsequent_indent=' ' * (max_action_name_len + 3),
@@ -137,8 +604,8 @@ def list_actions() -> None:
         )
     )
     print('-' * 80)
-    for name, action in KNOWN_ACTIONS.items():
-        wrapped_doc = wrapper.fill(' '.join(str(action.__doc__).split()))
+    for name, description in descriptions.items():
+        wrapped_doc = wrapper.fill(description)
         print(
             '{bright}{name:<{max_action_name_len}} -{normal} {doc}'.format(
                 bright=Style.BRIGHT,
@@ -151,6 +618,403 @@ def list_actions() -> None:
     return None
 
 
+def _set_loglevel(quiet: bool, verbose: int) -> None:
+    """Set the level of the root logger from the `--quiet` and `--verbose` options.
+
+    :param quiet: whether to only log critical messages
+    :param verbose: the number of times `--verbose` was passed
+    """
+    root_logger = logging.getLogger()
+    if quiet:
+        logger.info('Setting loglevel to CRITICAL')
+        root_logger.setLevel(logging.CRITICAL)
+    else:
+        if verbose <= 0:
+            logger.info('Setting loglevel to WARNING')
+            root_logger.setLevel(logging.WARNING)
+        elif verbose == 1:
+            logger.info('Setting loglevel to INFO')
+            root_logger.setLevel(logging.INFO)
+        elif verbose >= 2:
+            logger.info('Setting loglevel to DEBUG')
+            root_logger.setLevel(logging.DEBUG)
+
+
+def _create_actions(args: argparse.Namespace) -> List['ConfigFile']:
+    """Create the actions from the command line and the config files and set them up.
+
+    With `--set-up parallel`, the actions are set up together on a thread pool; with
+    `--set-up lazy`, they are left to be set up once flagman is ready.
+
+    :param args: the parsed arguments
+
+    :returns: the loaded config files: the one of `--config`, then those of the tenants
+    :raises ConfigError: if a config file can't be loaded
+    """
+    started = time.perf_counter()
+    args_dict = vars(args)
+    for num, action_call in args.signal:
+        add_handled_signal(num)
+        args_dict.setdefault(option_key(num), []).append(action_call)
+    deferring: ContextManager[None] = (
+        deferred_set_up()
+        if args.set_up is not SetUpMode.SERIAL
+        else contextlib.nullcontext()
+    )
+    with deferring:
+        create_action_bundles(args_dict)
+        _set_policies(args)
+        _set_deadlines(args)
+        _set_throttles(args.throttle)
+        _set_timers(args.timer)
+        configs = _load_configs(args.config, args.tenant, args.reload_signal)
+    if args.set_up is SetUpMode.PARALLEL:
+        set_up_parallel(deferred_actions(), args.set_up_threads)
+    elif args.set_up is SetUpMode.SERIAL:
+        report_set_up(time.perf_counter() - started)
+    return configs
+
+
+def _set_policies(args: argparse.Namespace) -> None:
+    """Set the delivery policies and priorities passed on the command line.
+
+    :param args: the parsed arguments
+    """
+    for signum in HANDLED_SIGNALS:
+        policy_option = '{}_policy'.format(option_key(signum))
+        if hasattr(args, policy_option):
+            policy, window = getattr(args, policy_option)
+            SIGNAL_FLAGS.set_policy(signum, policy, window)
+    for num, (policy, window) in args.policy:
+        SIGNAL_FLAGS.set_policy(num, policy, window)
+    for num, priority in args.priority:
+        SIGNAL_FLAGS.set_priority(num, priority)
+    SIGNAL_FLAGS.aging = args.priority_aging
+
+
+def _set_deadlines(args: argparse.Namespace) -> None:
+    """Set the time limits passed on the command line.
+
+    :param args: the parsed arguments
+    """
+    for num, seconds in args.timeout:
+        DEADLINES[num] = DEADLINES.get(num, Deadlines())._replace(timeout=seconds)
+    for num, seconds in args.deadline:
+        DEADLINES[num] = DEADLINES.get(num, Deadlines())._replace(deadline=seconds)
+    for num, (policy, retries) in args.on_timeout:
+        DEADLINES[num] = DEADLINES.get(num, Deadlines())._replace(
+            policy=policy, retries=retries
+        )
+
+
+def _set_throttles(throttles: Sequence[Tuple[ActionName, str]]) -> None:
+    """Set the throttles passed on the command line on the actions in the bundles.
+
+    :param throttles: action names and the throttle for every instance of the action
+    """
+    for name, throttle in throttles:
+        action_class = KNOWN_ACTIONS[name]
+        for bundle in ACTION_BUNDLES.values():
+            for action in bundle:
+                if type(action) is action_class:
+                    action.throttle = throttle
+
+
+def _set_timers(timers: Sequence[Tuple[SignalNumber, Timer]]) -> None:
+    """Set the timers passed on the command line.
+
+    :param timers: signal numbers and a timer for the signal
+    """
+    by_signal: Dict[SignalNumber, List[Timer]] = {}
+    for num, timer in timers:
+        by_signal.setdefault(num, []).append(timer)
+    for num, signal_timers in by_signal.items():
+        set_timers(num, signal_timers)
+
+
+def _check_signal_options(
+    args: argparse.Namespace, configs: Sequence['ConfigFile']
+) -> None:
+    """Check that the signals the per-signal options are for have actions.
+
+    With a config file, a signal that is handled without actions is allowed too, since
+    reloading the file may add them.
+
+    :param args: the parsed arguments
+    :param configs: the loaded config files
+    :raises ConfigError: if an option is for a signal that can't have actions
+    """
+    options = (
+        ('--policy', args.policy),
+        ('--priority', args.priority),
+        ('--timeout', args.timeout),
+        ('--deadline', args.deadline),
+        ('--on-timeout', args.on_timeout),
+        ('--timer', args.timer),
+        ('--watch', args.watch),
+    )
+    for option, values in options:
+        for num, _ in values:
+            if ACTION_BUNDLES.get(num) or (configs and num in HANDLED_SIGNALS):
+                continue
+            raise ConfigError(
+                'argument {}: no actions for {}'.format(option, signal_name(num))
+            )
+
+
+def _start_workers(
+    processes: int, isolate: Sequence[ActionName]
+) -> Optional['WorkerPool']:
+    """Fork worker processes for the isolated actions, if any.
+
+    :param processes: the number of worker processes; 0 to not fork any
+    :param isolate: names of actions to isolate in addition to isolated action classes
+
+    :returns: the started worker pool, or None if no workers were forked
+    """
+    if processes <= 0:
+        return None
+    from flagman.workers import WorkerPool
+
+    isolated_classes = tuple(KNOWN_ACTIONS[name] for name in isolate)
+    actions = [action for bundle in ACTION_BUNDLES.values() for action in bundle]
+    for action in actions:
+        if type(action) in isolated_classes:
+            action.isolated = True
+
+    worker_pool = WorkerPool(processes)
+    if worker_pool.start(actions) == 0:
+        logger.warning('No isolated actions; not forking worker processes')
+        return None
+    return worker_pool
+
+
+def _connect_systemd(status_interval: float) -> 'ServiceMonitor':
+    """Set up the notifier for flagman and its actions and the service monitor.
+
+    :param status_interval: the time between status lines in seconds; 0 to not send any
+
+    :returns: the service monitor
+    """
+    from flagman import systemd
+    from flagman.sd_notify import SystemdNotifier, watchdog_usec
+
+    notifier = systemd.NOTIFIER = SystemdNotifier()
+    usec = watchdog_usec()
+    if usec is not None:
+        logger.info('Sending watchdog keepalives every %.1f seconds', usec / 2e6)
+    return systemd.ServiceMonitor(
+        notifier,
+        watchdog_timeout=usec / 1e6 if usec is not None else None,
+        status_interval=status_interval if status_interval > 0 else None,
+    )
+
+
+def _load_configs(
+    path: Optional[str],
+    tenants: Sequence[Tuple[str, str]],
+    reload_signal: Optional[SignalNumber],
+) -> List['ConfigFile']:
+    """Add the actions in the config file and those of the tenants, if any are given.
+
+    :param path: the path of the config file, if any
+    :param tenants: the name and config file of each tenant
+    :param reload_signal: the signal to reload the files on, if any
+
+    :returns: the loaded config files
+    :raises ConfigError: if a file is not a valid configuration, or the reload signal
+        has actions
+    """
+    configs: List['ConfigFile'] = []
+    if path is not None:
+        from flagman.config import ConfigFile
+
+        config = ConfigFile(path)
+        logger.info('Loaded %d actions from `%s`', config.load(), path)
+        configs.append(config)
+    if tenants:
+        from flagman.tenants import add_tenant
+
+        reserved = () if reload_signal is None else (reload_signal,)
+        for name, tenant_path in tenants:
+            configs.append(add_tenant(name, tenant_path, reserved).config)
+    if configs and reload_signal is not None:
+        try:
+            remove_handled_signal(reload_signal)
+        except ValueError as e:
+            raise ConfigError('cannot reload on a signal with actions: {}'.format(e))
+        for config in configs:
+            config.watch_signal(reload_signal)
+    return configs
+
+
+def _start_metrics(
+    socket_path: Optional[str], textfile: Optional[str], interval: float
+) -> Optional['MetricsExporter']:
+    """Start recording metrics if they are exported.
+
+    :param socket_path: the path of the Unix socket to serve metrics on, if any
+    :param textfile: the path of the file to write metrics to, if any
+    :param interval: the time between writes of the file in seconds
+
+    :returns: the exporter, or None if metrics are not exported
+    """
+    if socket_path is None and textfile is None:
+        return None
+    from flagman import core
+    from flagman.metrics import Metrics, MetricsExporter
+
+    metrics = core.METRICS = Metrics()
+    return MetricsExporter(metrics, socket_path, textfile, interval)
+
+
+def _start_journal(path: Optional[str], capacity: int) -> Optional['Journal']:
+    """Start writing the journal, if one is given.
+
+    :param path: the path of the journal file, if any
+    :param capacity: the number of records the journal holds
+
+    :returns: the journal, or None if there is no journal
+    :raises JournalError: if the journal can't be opened
+    """
+    if path is None:
+        return None
+    from flagman import core
+    from flagman.journal import Journal
+
+    journal = core.JOURNAL = Journal(path, capacity)
+    return journal
+
+
+def _start_watcher(
+    watches: Sequence[Tuple[SignalNumber, str]], debounce: float
+) -> Optional['FileWatcher']:
+    """Start watching the files passed on the command line, if any.
+
+    :param watches: signal numbers and a path to trigger the signal on changes of
+    :param debounce: the time without changes to wait for before triggering
+
+    :returns: the file watcher, or None if there are no watches
+    :raises ConfigError: if inotify is not available or a path can't be watched
+    """
+    if not watches:
+        return None
+    from flagman.watch import FileWatcher
+
+    try:
+        watcher = FileWatcher(debounce)
+        for num, path in watches:
+            watcher.add(path, num)
+    except OSError as e:
+        raise ConfigError('cannot watch files: {}'.format(e))
+    return watcher
+
+
+def _print_journal(path: str) -> Optional[int]:
+    """Print the records of a journal, oldest first.
+
+    :param path: the path of the journal file
+
+    :returns: 2 if the journal can't be read, otherwise None
+    """
+    from flagman.journal import format_record, read_journal
+
+    try:
+        records = read_journal(path)
+    except JournalError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for record in records:
+        print(format_record(record))
+    return None
+
+
+def _start_controls(
+    path: Optional[str], tenant_dir: Optional[str]
+) -> List['ControlServer']:
+    """Start accepting triggers on the control sockets, if any are given.
+
+    :param path: the path of the control socket, if any
+    :param tenant_dir: the directory of the control sockets of the tenants, if any
+
+    :returns: the control servers
+    """
+    controls: List['ControlServer'] = []
+    if path is not None:
+        from flagman.control import ControlServer
+
+        controls.append(ControlServer(path))
+    if tenant_dir is not None:
+        from flagman.tenants import TENANTS
+
+        for name, tenant in TENANTS.items():
+            tenant.start_control(os.path.join(tenant_dir, name + '.sock'))
+            if tenant.control is not None:
+                controls.append(tenant.control)
+    return controls
+
+
+def _loop_callbacks(
+    monitor: Optional['ServiceMonitor'],
+    exporter: Optional['MetricsExporter'],
+    controls: Sequence['ControlServer'],
+    configs: Sequence['ConfigFile'],
+    watcher: Optional['FileWatcher'],
+) -> Tuple[List[Tuple[float, PeriodicCallback]], List[Tuple[int, ReaderCallback]]]:
+    """Collect the callbacks the event loop runs for the optional services.
+
+    :param monitor: the systemd service monitor, if any
+    :param exporter: the metrics exporter, if any
+    :param controls: the control servers
+    :param configs: the config files
+    :param watcher: the file watcher, if any
+
+    :returns: the periodic callbacks with their intervals and the readers with their
+        file descriptors
+    """
+    periodic: List[Tuple[float, PeriodicCallback]] = []
+    readers: List[Tuple[int, ReaderCallback]] = []
+    if monitor is not None:
+        periodic.extend(monitor.periodic())
+    if exporter is not None:
+        periodic.extend(exporter.periodic())
+        readers.extend(exporter.readers())
+    for control in controls:
+        readers.extend(control.readers())
+    for config in configs:
+        readers.extend(config.readers())
+    if watcher is not None:
+        readers.extend(watcher.readers())
+    return periodic, readers
+
+
+def _run(
+    use_asyncio: bool,
+    workers: int,
+    periodic: Sequence[Tuple[float, PeriodicCallback]],
+    readers: Sequence[Tuple[int, ReaderCallback]],
+) -> None:
+    """Run the event loop selected on the command line until no actions remain.
+
+    :param use_asyncio: whether to run on an asyncio event loop
+    :param workers: the size of the thread pool; 0 to take actions on the loop
+    :param periodic: intervals in seconds and callbacks to run at those intervals
+    :param readers: file descriptors and callbacks to run when they are readable
+    """
+    if use_asyncio:
+        import asyncio
+        from flagman.aio import run_async
+
+        asyncio.run(run_async(periodic, readers))
+    else:
+        loop = EventLoop()
+        for interval, callback in periodic:
+            loop.call_every(interval, callback)
+        for fd, reader in readers:
+            loop.add_reader(fd, reader)
+        run(loop, max_workers=workers)
+
+
 def main() -> Optional[int]:  # noqa: D401 (First line should be in imperative mood)
     """The main function of the flagman CLI.
 
@@ -162,39 +1026,61 @@ def main() -> Optional[int]:  # noqa: D401 (First line should be in imperative m
     if args.list:
         list_actions()
         return None
+    if args.read_journal is not None:
+        return _print_journal(args.read_journal)
 
     logging.basicConfig(level=logging.INFO)
     logger.info('PID: %d', os.getpid())
 
-    root_logger = logging.getLogger()
-    if args.quiet:
-        logger.info('Setting loglevel to CRITICAL')
-        root_logger.setLevel(logging.CRITICAL)
-    else:
-        if args.verbose <= 0:
-            logger.info('Setting loglevel to WARNING')
-            root_logger.setLevel(logging.WARNING)
-        elif args.verbose == 1:
-            logger.info('Setting loglevel to INFO')
-            root_logger.setLevel(logging.INFO)
-        elif args.verbose >= 2:
-            logger.info('Setting loglevel to DEBUG')
-            root_logger.setLevel(logging.DEBUG)
+    _set_loglevel(args.quiet, args.verbose)
 
-    args_dict = vars(args)
-    num_actions = create_action_bundles(args_dict)
-    if num_actions == 0:
+    # actions may store file descriptors with systemd while they are set up
+    monitor = _connect_systemd(args.status_interval) if args.systemd else None
+
+    try:
+        configs = _create_actions(args)
+        _check_signal_options(args, configs)
+        journal = _start_journal(args.journal, args.journal_size)
+        watcher = _start_watcher(args.watch, args.watch_debounce)
+    except (ConfigError, JournalError) as e:
+        logger.critical('%s; exiting', e)
+        return 2
+    if not any(ACTION_BUNDLES.values()):
         logger.critical('No actions configured; exiting')
         return 2
 
+    worker_pool = _start_workers(args.processes, args.isolate)
+    exporter = _start_metrics(
+        args.metrics_socket, args.metrics_file, args.metrics_interval
+    )
+    controls = _start_controls(args.control_socket, args.tenant_socket_dir)
+    periodic, readers = _loop_callbacks(monitor, exporter, controls, configs, watcher)
+
     logger.debug('Registering SIGTERM handler')
     signal.signal(signal.SIGTERM, _sigterm_handler)
-    set_handlers()
-    if not args.no_systemd:
-        notifier = SystemdNotifier()
-        notifier.notify('READY=1')
+    set_handlers(keep_empty=bool(configs))
+    if monitor is not None:
+        monitor.notify('READY=1\nSTATUS=Waiting for signals')
+    if args.set_up is SetUpMode.LAZY:
+        set_up_in_background(deferred_actions(), args.set_up_threads)
 
-    run()
+    try:
+        _run(args.asyncio, args.workers, periodic, readers)
+    finally:
+        if monitor is not None:
+            monitor.notify('STOPPING=1')
+        if exporter is not None:
+            exporter.close()
+        for control in controls:
+            control.close()
+        for config in configs:
+            config.close()
+        if worker_pool is not None:
+            worker_pool.shutdown()
+        if journal is not None:
+            journal.close()
+        if watcher is not None:
+            watcher.close()
 
     # if we got here, run() exited because there were no actions left
     assert isinstance(args.successful_empty, bool)  # noqa: S101 (assert)
@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+"""Action bundles configured in a file that can be reloaded while flagman runs.
+
+A config file maps signal names to the actions, the delivery policy, the priority, the
+time limits and the timers of each signal.
+It is read as TOML, unless its name ends with `.json`::
+
+    [usr1]
+    actions = [["print", "reloading"], ["delay_print@slow", "done", "2"]]
+    policy = "every"
+    priority = 10
+    timeout = 5.0
+    deadline = 30.0
+    on_timeout = "retry:2"
+
+    ["rtmin+2"]
+    actions = [["print", "flushing"]]
+    timer = ["every:60", "cron:0 3 * * *"]
+
+    ["rtmin+3"]
+    actions = [["print_siginfo", "queued"]]
+
+An action is written like on the command line: its name, optionally suffixed with
+`@GROUP`, followed by its arguments. Everything but the actions is optional, like the
+actions; see :mod:`flagman.deadlines` for the time limits and :mod:`flagman.timers`
+for the timers, of which a signal may have one or a list.
+
+A reload diffs the file against the live :data:`~flagman.core.ACTION_BUNDLES`. An action
+whose class, arguments and ordering group did not change keeps its instance, along with
+whatever its set up warmed; only new and changed actions are set up, unless an identical
+action elsewhere has an instance to share, and actions that are no longer in the file
+are released once their signal's bundle is not running. Actions from the command line
+are left alone. A reload is all or nothing: if the file can't be read
+or an action fails to set up, the running actions stay as they were.
+
+Only signals flagman registered a handler for when it started can get actions on a
+reload, which is every signal named in the file or on the command line. Actions that
+want siginfo only get it on reload for signals that were read from the signalfd from
+the start, and actions added by a reload run in the flagman process even if they are
+isolated.
+
+Reading TOML needs Python 3.11 or the `tomli` package, which is installed with the
+`toml` extra.
+"""
+import json
+import logging
+import os
+import signal
+from types import FrameType, MethodType
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from flagman import core
+from flagman.actions import Action
+from flagman.core import (
+    ACTION_BUNDLES,
+    ActionKey,
+    add_handled_signal,
+    build_dispatch_plans,
+    DEADLINES,
+    KNOWN_ACTIONS,
+    RUN_LISTENERS,
+    share_action,
+    SIGNAL_FLAGS,
+)
+from flagman.deadlines import Deadlines, parse_timeout_policy
+from flagman.exceptions import ConfigError
+from flagman.loop import ReaderCallback
+from flagman.pending import parse_policy, SignalPolicy
+from flagman.signals import parse_signal, signal_name
+from flagman.timers import parse_timer, set_timers, Timer, timers_of
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+
+#: The keys of a signal's table that set its time limits
+_DEADLINE_KEYS = ('timeout', 'deadline', 'on_timeout')
+
+
+class SignalConfig(NamedTuple):
+    """The configuration of a single signal."""
+
+    #: The class, arguments and ordering group of each action, in the order they are
+    #: taken
+    actions: List[ActionKey]
+    #: The delivery policy and its debounce window, or None to not change it
+    policy: Optional[Tuple[SignalPolicy, float]]
+    #: The dispatch priority, or None to not change it
+    priority: Optional[int] = None
+    #: The time limits of the bundle, or None to not change them
+    deadlines: Optional[Deadlines] = None
+    #: The timers that trigger the bundle, or None to not change them
+    timers: Optional[List[Timer]] = None
+
+
+def read_config(path: str) -> Dict[SignalNumber, SignalConfig]:
+    """Read and check a config file.
+
+    :param path: the path of the file; `.json` files are read as JSON, others as TOML
+    :returns: the configuration of each signal in the file
+    :raises ConfigError: if the file can't be read or is not a valid configuration
+    """
+    document = _load(path)
+    if not isinstance(document, dict):
+        raise ConfigError('{} must contain a table of signals'.format(path))
+
+    config: Dict[SignalNumber, SignalConfig] = {}
+    for name, table in document.items():
+        try:
+            num = parse_signal(name)
+        except ValueError as e:
+            raise ConfigError(str(e)) from None
+        if num == signal.SIGTERM:
+            raise ConfigError('SIGTERM is reserved for stopping flagman')
+        if num in config:
+            raise ConfigError('{} is configured twice'.format(signal_name(num)))
+        config[num] = _signal_config(name, table)
+    return config
+
+
+def _load(path: str) -> object:
+    """Read and parse a config file.
+
+    :param path: the path of the file
+    :returns: the parsed document
+    :raises ConfigError: if the file can't be read or parsed
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise ConfigError('cannot read {}: {}'.format(path, e)) from None
+    if not path.endswith('.json'):
+        return _load_toml(path, data)
+    try:
+        document: object = json.loads(data)
+    except ValueError as e:
+        raise ConfigError('invalid JSON in {}: {}'.format(path, e)) from None
+    return document
+
+
+def _load_toml(path: str, data: bytes) -> object:
+    """Parse a TOML document.
+
+    :param path: the path the document was read from, for error messages
+    :param data: the document
+    :returns: the parsed document
+    :raises ConfigError: if the document is invalid or no TOML parser is installed
+    """
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib  # type: ignore
+        except ImportError:
+            raise ConfigError(
+                'reading {} needs the `tomli` package; '
+                'install flagman[toml] or use JSON'.format(path)
+            ) from None
+    try:
+        document: object = tomllib.loads(data.decode())
+    except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+        raise ConfigError('invalid TOML in {}: {}'.format(path, e)) from None
+    return document
+
+
+def _signal_config(name: str, table: object) -> SignalConfig:
+    """Check the configuration of a single signal.
+
+    :param name: the signal name as written in the file
+    :param table: the signal's table
+    :returns: the signal's configuration
+    :raises ConfigError: if the table is not a valid configuration
+    """
+    if not isinstance(table, dict):
+        raise ConfigError('`{}` must be a table'.format(name))
+    unknown = set(table) - {'actions', 'policy', 'priority', 'timer', *_DEADLINE_KEYS}
+    if unknown:
+        raise ConfigError('unknown keys for `{}`: {}'.format(name, sorted(unknown)))
+    calls = table.get('actions', [])
+    if not isinstance(calls, list):
+        raise ConfigError('`{}.actions` must be a list'.format(name))
+    actions = [_action_config(name, call) for call in calls]
+
+    priority = table.get('priority')
+    # bool is a subclass of int, but `priority = true` is a mistake
+    if priority is not None and type(priority) is not int:
+        raise ConfigError('`{}.priority` must be an integer'.format(name))
+    deadlines = _deadlines_config(name, table)
+    timers = _timers_config(name, table)
+    policy = table.get('policy')
+    if policy is None:
+        return SignalConfig(actions, None, priority, deadlines, timers)
+    if not isinstance(policy, str):
+        raise ConfigError('`{}.policy` must be a string'.format(name))
+    try:
+        return SignalConfig(actions, parse_policy(policy), priority, deadlines, timers)
+    except ValueError as e:
+        raise ConfigError('`{}.policy`: {}'.format(name, e)) from None
+
+
+def _deadlines_config(name: str, table: Dict[str, object]) -> Optional[Deadlines]:
+    """Check the time limits of a single signal.
+
+    :param name: the signal name as written in the file
+    :param table: the signal's table
+    :returns: the time limits, or None if the table has none
+    :raises ConfigError: if a time limit is not a positive number or the timeout
+        policy is invalid
+    """
+    if not any(key in table for key in _DEADLINE_KEYS):
+        return None
+    limits: Dict[str, Optional[float]] = {}
+    for key in ('timeout', 'deadline'):
+        seconds = table.get(key)
+        # bool is a subclass of int, but `timeout = true` is a mistake
+        if isinstance(seconds, (int, float)) and not isinstance(seconds, bool):
+            if seconds > 0:
+                limits[key] = float(seconds)
+                continue
+        elif seconds is None:
+            limits[key] = None
+            continue
+        raise ConfigError('`{}.{}` must be a positive number'.format(name, key))
+    policy = table.get('on_timeout', 'skip')
+    if not isinstance(policy, str):
+        raise ConfigError('`{}.on_timeout` must be a string'.format(name))
+    try:
+        on_timeout, retries = parse_timeout_policy(policy)
+    except ValueError as e:
+        raise ConfigError('`{}.on_timeout`: {}'.format(name, e)) from None
+    return Deadlines(limits['timeout'], limits['deadline'], on_timeout, retries)
+
+
+def _timers_config(name: str, table: Dict[str, object]) -> Optional[List[Timer]]:
+    """Check the timers of a single signal.
+
+    :param name: the signal name as written in the file
+    :param table: the signal's table
+    :returns: the timers, or None if the table has none
+    :raises ConfigError: if a timer is not a valid timer string
+    """
+    specs = table.get('timer')
+    if specs is None:
+        return None
+    if isinstance(specs, str):
+        specs = [specs]
+    if not isinstance(specs, list) or not all(isinstance(s, str) for s in specs):
+        raise ConfigError('`{}.timer` must be a string or a list of them'.format(name))
+    try:
+        return [parse_timer(spec) for spec in specs]
+    except ValueError as e:
+        raise ConfigError('`{}.timer`: {}'.format(name, e)) from None
+
+
+def _action_config(name: str, call: object) -> ActionKey:
+    """Check the configuration of a single action.
+
+    :param name: the name of the action's signal as written in the file
+    :param call: the action's name and arguments
+    :returns: the action's configuration
+    :raises ConfigError: if the action is unknown or the call is not a list of strings
+    """
+    if not isinstance(call, list) or not call:
+        raise ConfigError('an action of `{}` is not a list: {!r}'.format(name, call))
+    if not all(isinstance(arg, str) for arg in call):
+        raise ConfigError('an action of `{}` has a non-string: {!r}'.format(name, call))
+    action_name, _, group = call[0].partition('@')
+    try:
+        action_class = KNOWN_ACTIONS[action_name]
+    except KeyError:
+        raise ConfigError('unknown action `{}`'.format(action_name)) from None
+    return action_class, tuple(call[1:]), group
+
+
+class ConfigFile:
+    """Action bundles configured by a file, reloaded on request."""
+
+    def __init__(self, path: str) -> None:
+        """Remember the file; nothing is read until it is loaded.
+
+        :param path: the path of the config file
+        """
+        self._path = path
+        self._loaded = False
+        self._actions: Dict[SignalNumber, List[Tuple[ActionKey, Action]]] = {}
+        self._base_policies: Dict[SignalNumber, Tuple[SignalPolicy, float]] = {}
+        self._base_priorities: Dict[SignalNumber, int] = {}
+        self._base_deadlines: Dict[SignalNumber, Optional[Deadlines]] = {}
+        self._base_timers: Dict[SignalNumber, List[Timer]] = {}
+        self._retired: Dict[SignalNumber, List[Action]] = {}
+        self._pipe: Optional[Tuple[int, int]] = None
+        self._next_handler: Optional[Callable[[int, Optional[FrameType]], None]] = None
+
+    def load(self) -> int:
+        """Read the file and add its actions to the action bundles.
+
+        Call this once, after the actions from the command line are created and before
+        the signal handlers are set, so every signal in the file gets a handler.
+
+        :returns: the number of actions in the file
+        :raises ConfigError: if the file is not a valid configuration or an action
+            fails to set up
+        """
+        config = self._read()
+        for num in config:
+            add_handled_signal(num)
+        self._apply(config)
+        self._loaded = True
+        return sum(len(actions) for actions in self._actions.values())
+
+    def reload(self) -> bool:
+        """Read the file again and bring the action bundles in line with it.
+
+        Call this from the event loop thread between dispatches, like from a reader.
+
+        :returns: whether the new configuration is in effect
+        """
+        logger.info('Reloading `%s`', self._path)
+        try:
+            config = self._read()
+            missing = [num for num in config if num not in core._handler_signals]
+            if missing:
+                raise ConfigError(
+                    'adding {} needs a restart'.format(
+                        ', '.join(signal_name(num) for num in missing)
+                    )
+                )
+            self._apply(config)
+        except ConfigError as e:
+            logger.error('Keeping the running actions: %s', e)
+            return False
+        build_dispatch_plans()
+        return True
+
+    def watch_signal(self, num: SignalNumber) -> None:
+        """Reload the file whenever a signal is delivered.
+
+        The signal handler only wakes the event loop, which reloads from
+        :meth:`readers`, so a reload never interrupts a dispatch. If another config file
+        already watches the signal, both are reloaded.
+
+        :param num: the signal number; it must not be a handled signal
+        """
+        read_fd, write_fd = os.pipe()
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        self._pipe = (read_fd, write_fd)
+        previous = signal.getsignal(num)
+        if isinstance(previous, MethodType) and isinstance(
+            previous.__self__, ConfigFile
+        ):
+            self._next_handler = previous.__self__._request_reload
+        signal.signal(num, self._request_reload)
+        logger.info('Reloading `%s` on %s', self._path, signal_name(num))
+
+    def readers(self) -> List[Tuple[int, ReaderCallback]]:
+        """Get the file descriptors to watch and the callbacks to run when readable.
+
+        :returns: a list of file descriptors and callbacks
+        """
+        if self._pipe is None:
+            return []
+        return [(self._pipe[0], self._reload_requested)]
+
+    def run_finished(
+        self, num: SignalNumber, _covered: int, _outcomes: Sequence[object]
+    ) -> None:
+        """Release the actions a reload removed once their bundle is done running.
+
+        :param num: the signal number
+        """
+        for action in self._retired.pop(num, ()):
+            action._release()
+        if not self._retired and self.run_finished in RUN_LISTENERS:
+            RUN_LISTENERS.remove(self.run_finished)
+
+    def close(self) -> None:
+        """Stop watching for reload requests."""
+        if self._pipe is not None:
+            for fd in self._pipe:
+                os.close(fd)
+            self._pipe = None
+
+    def _request_reload(self, num: int, frame: Optional[FrameType]) -> None:
+        """Wake the event loop to reload; called as a signal handler."""
+        if self._pipe is not None:
+            try:
+                os.write(self._pipe[1], b'\0')
+            except BlockingIOError:
+                pass
+        if self._next_handler is not None:
+            self._next_handler(num, frame)
+
+    def _read(self) -> Dict[SignalNumber, SignalConfig]:
+        """Read and check the file.
+
+        :returns: the configuration of each signal in the file
+        :raises ConfigError: if the file can't be read or is not a valid configuration
+        """
+        return read_config(self._path)
+
+    def _reload_requested(self) -> None:
+        """Reload once for any number of requests."""
+        if self._pipe is not None:
+            try:
+                while os.read(self._pipe[0], 64):
+                    pass
+            except BlockingIOError:
+                pass
+        self.reload()
+
+    def _apply(self, config: Dict[SignalNumber, SignalConfig]) -> None:
+        """Replace the actions from the file with the ones in a new configuration.
+
+        Every new action is set up before any bundle is changed, so a failing
+        set up leaves the bundles as they were.
+
+        :param config: the new configuration
+        :raises ConfigError: if an action fails to set up
+        """
+        added: List[Action] = []
+        new_actions: Dict[SignalNumber, List[Tuple[ActionKey, Action]]] = {}
+        unused: Dict[SignalNumber, List[Action]] = {}
+        try:
+            for num in set(config) | set(self._actions):
+                signal_config = config.get(num, SignalConfig([], None))
+                new_actions[num], unused[num] = self._diff(
+                    num, signal_config.actions, added
+                )
+        except Exception as e:
+            for action in added:
+                action._release()
+            raise ConfigError('an action failed to set up: {!r}'.format(e)) from e
+
+        for num, actions in new_actions.items():
+            old = [action for _, action in self._actions.get(num, [])]
+            bundle = _without(ACTION_BUNDLES[num], old)
+            ACTION_BUNDLES[num][:] = bundle + [action for _, action in actions]
+            self._actions[num] = actions
+            self._set_policy(num, config.get(num))
+            self._set_priority(num, config.get(num))
+            self._set_deadlines(num, config.get(num))
+            self._set_timers(num, config.get(num))
+            self._retire(num, unused[num])
+
+        if self._loaded:
+            logger.info(
+                'Reloaded `%s`: %d actions kept, %d added, %d removed',
+                self._path,
+                sum(len(actions) for actions in new_actions.values()) - len(added),
+                len(added),
+                sum(len(actions) for actions in unused.values()),
+            )
+
+    def _diff(
+        self, num: SignalNumber, keys: List[ActionKey], added: List[Action]
+    ) -> Tuple[List[Tuple[ActionKey, Action]], List[Action]]:
+        """Match the configured actions of a signal to its live actions.
+
+        :param num: the signal number
+        :param keys: the class, arguments and ordering group of each configured action
+        :param added: a list the actions that are not live yet are appended to
+        :returns: the signal's actions from the file and the live actions that are no
+            longer configured
+        """
+        live = {id(action) for action in ACTION_BUNDLES.get(num, [])}
+        reusable: Dict[ActionKey, List[Action]] = {}
+        for key, action in self._actions.get(num, []):
+            if id(action) in live:
+                reusable.setdefault(key, []).append(action)
+
+        actions: List[Tuple[ActionKey, Action]] = []
+        for key in keys:
+            candidates = reusable.get(key)
+            if candidates:
+                action = candidates.pop(0)
+            else:
+                action = share_action(*key)
+                added.append(action)
+            actions.append((key, action))
+        return actions, [action for rest in reusable.values() for action in rest]
+
+    def _set_policy(
+        self, num: SignalNumber, signal_config: Optional[SignalConfig]
+    ) -> None:
+        """Set the delivery policy of a signal from the file.
+
+        A signal whose policy is not in the file gets back the policy it had before.
+
+        :param num: the signal number
+        :param signal_config: the signal's configuration, if it is in the file
+        """
+        base = self._base_policies.setdefault(num, SIGNAL_FLAGS.policy(num))
+        if signal_config is not None and signal_config.policy is not None:
+            SIGNAL_FLAGS.set_policy(num, *signal_config.policy)
+        else:
+            SIGNAL_FLAGS.set_policy(num, *base)
+
+    def _set_priority(
+        self, num: SignalNumber, signal_config: Optional[SignalConfig]
+    ) -> None:
+        """Set the priority of a signal from the file.
+
+        A signal whose priority is not in the file gets back the priority it had before.
+
+        :param num: the signal number
+        :param signal_config: the signal's configuration, if it is in the file
+        """
+        base = self._base_priorities.setdefault(num, SIGNAL_FLAGS.priority(num))
+        if signal_config is not None and signal_config.priority is not None:
+            SIGNAL_FLAGS.set_priority(num, signal_config.priority)
+        else:
+            SIGNAL_FLAGS.set_priority(num, base)
+
+    def _set_deadlines(
+        self, num: SignalNumber, signal_config: Optional[SignalConfig]
+    ) -> None:
+        """Set the time limits of a signal from the file.
+
+        A signal without time limits in the file gets back the ones it had before.
+
+        :param num: the signal number
+        :param signal_config: the signal's configuration, if it is in the file
+        """
+        base = self._base_deadlines.setdefault(num, DEADLINES.get(num))
+        if signal_config is not None and signal_config.deadlines is not None:
+            DEADLINES[num] = signal_config.deadlines
+        elif base is not None:
+            DEADLINES[num] = base
+        else:
+            DEADLINES.pop(num, None)
+
+    def _set_timers(
+        self, num: SignalNumber, signal_config: Optional[SignalConfig]
+    ) -> None:
+        """Set the timers of a signal from the file.
+
+        A signal without timers in the file gets back the ones it had before. Timers
+        that did not change keep their schedule.
+
+        :param num: the signal number
+        :param signal_config: the signal's configuration, if it is in the file
+        """
+        base = self._base_timers.setdefault(num, timers_of(num))
+        if signal_config is not None and signal_config.timers is not None:
+            set_timers(num, signal_config.timers)
+        else:
+            set_timers(num, base)
+
+    def _retire(self, num: SignalNumber, actions: List[Action]) -> None:
+        """Release actions that were removed, or once their bundle is done running.
+
+        :param num: the number of the signal the actions were taken for
+        :param actions: the actions
+        """
+        if not actions:
+            return None
+        if not SIGNAL_FLAGS.running(num):
+            for action in actions:
+                action._release()
+            return None
+        self._retired.setdefault(num, []).extend(actions)
+        if self.run_finished not in RUN_LISTENERS:
+            RUN_LISTENERS.append(self.run_finished)
+
+
+def _without(bundle: List[Action], actions: List[Action]) -> List[Action]:
+    """Remove one occurrence of each of some actions from a bundle.
+
+    The last occurrence is removed, since a shared action from the file comes after any
+    occurrence from the command line.
+
+    :param bundle: the bundle
+    :param actions: the actions to remove
+    :returns: a new list with the rest of the bundle, in order
+    """
+    rest = list(bundle)
+    for action in actions:
+        for idx in reversed(range(len(rest))):
+            if rest[idx] is action:
+                del rest[idx]
+                break
+    return rest
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""A local control socket for triggering action bundles without sending signals.
+
+A :class:`ControlServer` listens on a Unix stream socket. Each line a client sends is a
+JSON object with a batch of triggers, and each line it gets back is a JSON object with
+the results of that batch::
+
+    > {"id": 1, "trigger": ["usr1", {"signal": "rtmin+3", "value": 7}, "hup"]}
+    < {"id": 1, "results": [
+        {"signal": "SIGUSR1", "status": "ran",
+         "actions": [{"action": "PrintAction", "outcome": "ok", "seconds": 4e-05}]},
+        {"signal": "SIGRTMIN+3", "status": "ran", "actions": [...]},
+        {"signal": "SIGHUP", "status": "dropped"}]}
+
+A trigger counts as a delivery of its signal, so it is subject to the signal's delivery
+policy like any other delivery. Its status is `ran` with the outcome of each action of
+the bundle run that covered it, `dropped` if the coalesce policy dropped it while the
+bundle was running, or `error` if it could not be made, like for an unknown signal or a
+signal without actions. An action's outcome is `ok`, `error`, `timeout` or `closed`. A
+line that is not a valid request gets a response with an `error` instead of `results`.
+
+Clients may pipeline: any number of batches can be sent without waiting, and results
+come back in the order the batches were sent once every trigger in a batch is done.
+The optional `value` of a trigger is passed to actions as
+:attr:`flagman.signals.SigInfo.value`, along with the client's process and user ID,
+for signals that are read from the signalfd.
+
+Only the owner of flagman's process can connect, since the socket is created with mode
+`0600`. The sockets are multiplexed on a selector of their own, which is watched by the
+event loop as a single file descriptor.
+"""
+import collections
+import json
+import logging
+import os
+import selectors
+import socket
+import struct
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    TYPE_CHECKING,
+    Union,
+)
+
+from flagman import core
+from flagman.core import ACTION_BUNDLES, RUN_LISTENERS, SIGNAL_FLAGS
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.loop import ReaderCallback
+from flagman.signals import parse_signal, SigInfo, signal_name
+from flagman.types import SignalNumber
+
+if TYPE_CHECKING:  # pragma: no cover
+    from flagman.executors import ActionOutcome  # noqa: F401 (unused import)
+
+logger = logging.getLogger(__name__)
+
+#: The `si_code` of deliveries triggered through the control socket, which is the one
+#: of sigqueue(3)
+SI_QUEUE = -1
+
+#: The most a client may send without ending a line, in bytes
+MAX_LINE = 1 << 20
+
+#: Type alias for the JSON object describing the result of a trigger
+TriggerResult = Dict[str, object]
+
+
+class _Batch:
+    """The triggers of one request line and their results."""
+
+    def __init__(
+        self, request_id: object, size: int, error: Optional[str] = None
+    ) -> None:
+        """Create a batch whose results are all still missing.
+
+        :param request_id: the `id` of the request, echoed in the response
+        :param size: the number of triggers
+        :param error: why the request line is invalid, if it is
+        """
+        self.request_id = request_id
+        self.results: List[Optional[TriggerResult]] = [None] * size
+        self.missing = size
+        self.error = error
+
+    def resolve(self, idx: int, result: TriggerResult) -> None:
+        """Set the result of a trigger.
+
+        :param idx: the position of the trigger in the batch
+        :param result: the result
+        """
+        self.results[idx] = result
+        self.missing -= 1
+
+    def response(self) -> bytes:
+        """Format the response line.
+
+        :returns: the line, with its newline
+        """
+        body: Dict[str, object] = {'id': self.request_id}
+        if self.error is not None:
+            body['error'] = self.error
+        else:
+            body['results'] = self.results
+        return json.dumps(body).encode() + b'\n'
+
+
+class _Client:
+    """A connection to the control socket."""
+
+    def __init__(self, conn: socket.socket) -> None:
+        """Wrap an accepted connection.
+
+        :param conn: the connection
+        """
+        self.conn = conn
+        self.buffer = bytearray()
+        self.batches: Deque[_Batch] = collections.deque()
+        self.pid, self.uid = _peer_credentials(conn)
+
+
+#: A trigger waiting for its run: its position among the signal's deliveries, the
+#: client, the batch, and its position in the batch
+_Ticket = Tuple[int, _Client, _Batch, int]
+
+
+class ControlServer:
+    """Trigger action bundles from the lines sent to a Unix socket."""
+
+    def __init__(
+        self, path: str, signals: Optional[Mapping[SignalNumber, SignalNumber]] = None
+    ) -> None:
+        """Bind the socket and start listening for the results of bundle runs.
+
+        :param path: the path to bind the socket to; a stale socket is replaced
+        :param signals: if given, the signals clients may trigger, by the name they use
+            for them, like the signals of a tenant; the results name them the same way
+        :raises OSError: if the socket can't be bound
+        """
+        self._path = path
+        self._signals = signals
+        self._names: Dict[SignalNumber, str] = {}
+        if signals is not None:
+            self._names = {num: signal_name(name) for name, num in signals.items()}
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            self._socket.bind(path)
+        finally:
+            os.umask(old_umask)
+        self._socket.listen(64)
+        self._socket.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._socket, selectors.EVENT_READ, self._accept)
+        self._tickets: Dict[SignalNumber, Deque[_Ticket]] = {}
+        RUN_LISTENERS.append(self.run_finished)
+        logger.info('Accepting triggers on `%s`', path)
+
+    def readers(self) -> List[Tuple[int, ReaderCallback]]:
+        """Get the file descriptors to watch and the callbacks to run when readable.
+
+        :returns: a list of file descriptors and callbacks
+        """
+        return [(self._selector.fileno(), self.poll)]
+
+    def poll(self) -> None:
+        """Accept new clients and handle the lines sent by connected ones."""
+        for key, _events in self._selector.select(0):
+            callback: Callable[[], None] = key.data
+            callback()
+
+    def run_finished(
+        self, num: SignalNumber, covered: int, outcomes: Sequence['ActionOutcome']
+    ) -> None:
+        """Resolve the triggers a finished run covered or dropped.
+
+        :param num: the signal number
+        :param covered: how many of the signal's deliveries the run covered
+        :param outcomes: the outcome of each action that was taken
+        """
+        tickets = self._tickets.get(num)
+        if not tickets:
+            return None
+        name = self._names.get(num) or signal_name(num)
+        ran: TriggerResult = {
+            'signal': name,
+            'status': 'ran',
+            'actions': [_outcome_json(outcome) for outcome in outcomes],
+        }
+        dropped: TriggerResult = {'signal': name, 'status': 'dropped'}
+        consumed = SIGNAL_FLAGS.consumed(num)
+        clients = []
+        while tickets and tickets[0][0] <= consumed:
+            position, client, batch, idx = tickets.popleft()
+            batch.resolve(idx, ran if position <= covered else dropped)
+            clients.append(client)
+        for client in set(clients):
+            self._flush(client)
+
+    def close(self) -> None:
+        """Disconnect every client and stop listening."""
+        if self.run_finished in RUN_LISTENERS:
+            RUN_LISTENERS.remove(self.run_finished)
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.fileobj, socket.socket):
+                key.fileobj.close()
+        self._selector.close()
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    def _accept(self) -> None:
+        """Accept the waiting connections."""
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except BlockingIOError:
+                return None
+            # replies are small, so a client that does not read them is disconnected
+            # instead of holding up the event loop
+            conn.settimeout(1.0)
+            client = _Client(conn)
+            self._selector.register(
+                conn, selectors.EVENT_READ, lambda: self._read(client)
+            )
+            logger.debug('Control client connected (PID %s)', client.pid)
+
+    def _read(self, client: _Client) -> None:
+        """Read from a client and handle each complete line.
+
+        :param client: the client
+        """
+        try:
+            data = client.conn.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self._disconnect(client)
+            return None
+        client.buffer += data
+        *lines, rest = client.buffer.split(b'\n')
+        if len(rest) > MAX_LINE:
+            logger.warning('Disconnecting control client that sent a too long line')
+            self._disconnect(client)
+            return None
+        client.buffer = rest
+        for line in lines:
+            if line.strip():
+                self._handle(client, bytes(line))
+        self._flush(client)
+
+    def _handle(self, client: _Client, line: bytes) -> None:
+        """Make the triggers of a request line.
+
+        :param client: the client that sent the line
+        :param line: the line
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise TypeError('a request must be an object')
+            triggers = request['trigger']
+            if not isinstance(triggers, list):
+                raise TypeError('`trigger` must be a list')
+        except (ValueError, KeyError, TypeError) as e:
+            message = 'bad request: {}'.format(e)
+            client.batches.append(_Batch(None, 0, message))
+            return None
+
+        batch = _Batch(request.get('id'), len(triggers))
+        client.batches.append(batch)
+        for idx, trigger in enumerate(triggers):
+            try:
+                num, name, value = self._parse_trigger(trigger)
+            except (ValueError, TypeError) as e:
+                batch.resolve(idx, _error_result(trigger, str(e)))
+                continue
+            if not ACTION_BUNDLES.get(num):
+                error = 'no actions for this signal'
+                batch.resolve(idx, _error_result(name, error))
+                continue
+            info = None
+            signal_fd = core._signal_fd
+            if signal_fd is not None and num in signal_fd.signals:
+                info = SigInfo(num, SI_QUEUE, client.pid, client.uid, value)
+            position = SIGNAL_FLAGS.trigger(num, info)
+            self._tickets.setdefault(num, collections.deque()).append(
+                (position, client, batch, idx)
+            )
+
+    def _parse_trigger(
+        self, trigger: Union[str, Dict[str, object]]
+    ) -> Tuple[SignalNumber, str, int]:
+        """Read the signal and the value of a trigger, by the names of this socket.
+
+        :param trigger: a signal name, or an object with `signal` and optional `value`
+        :returns: the signal number, the signal name the results use, and the value
+        :raises ValueError: if the signal is unknown or can't be triggered here
+        :raises TypeError: if the trigger is malformed
+        """
+        num, value = _parse_trigger(trigger)
+        name = signal_name(num)
+        if self._signals is None:
+            return num, name, value
+        try:
+            return self._signals[num], name, value
+        except KeyError:
+            raise ValueError('not a signal of this socket: {}'.format(name)) from None
+
+    def _flush(self, client: _Client) -> None:
+        """Send the responses of the finished batches at the head of a client's queue.
+
+        :param client: the client
+        """
+        data = bytearray()
+        while client.batches and client.batches[0].missing == 0:
+            data += client.batches.popleft().response()
+        if not data:
+            return None
+        try:
+            client.conn.sendall(data)
+        except OSError as e:
+            logger.warning('Disconnecting control client: %s', e)
+            self._disconnect(client)
+
+    def _disconnect(self, client: _Client) -> None:
+        """Close a client's connection; its pending triggers still run.
+
+        :param client: the client
+        """
+        try:
+            self._selector.unregister(client.conn)
+        except (KeyError, ValueError):
+            return None
+        client.conn.close()
+        client.batches.clear()
+        logger.debug('Control client disconnected (PID %s)', client.pid)
+
+
+def _parse_trigger(trigger: Union[str, Dict[str, object]]) -> Tuple[SignalNumber, int]:
+    """Read the signal and the value of a trigger.
+
+    :param trigger: a signal name, or an object with `signal` and optional `value`
+    :returns: the signal number and the value
+    :raises ValueError: if the signal is unknown
+    :raises TypeError: if the trigger is malformed
+    """
+    if isinstance(trigger, str):
+        return parse_signal(trigger), 0
+    if not isinstance(trigger, dict) or not isinstance(trigger.get('signal'), str):
+        raise TypeError('a trigger is a signal name or an object with a `signal`')
+    value = trigger.get('value', 0)
+    if not isinstance(value, int):
+        raise TypeError('`value` must be an integer')
+    return parse_signal(str(trigger['signal'])), value
+
+
+def _error_result(trigger: object, error: str) -> TriggerResult:
+    """Describe a trigger that could not be made.
+
+    :param trigger: the signal name or the trigger as it was sent
+    :param error: why it could not be made
+    :returns: the result
+    """
+    return {'signal': trigger, 'status': 'error', 'error': error}
+
+
+def _outcome_json(outcome: 'ActionOutcome') -> Dict[str, object]:
+    """Describe the outcome of an action.
+
+    :param outcome: the outcome
+    :returns: a JSON object
+    """
+    action, exc, seconds = outcome
+    result: Dict[str, object] = {
+        'action': action.__class__.__name__,
+        'outcome': 'ok',
+        'seconds': seconds,
+    }
+    if isinstance(exc, ActionClosed):
+        result['outcome'] = 'closed'
+    elif isinstance(exc, ActionTimeout):
+        result['outcome'] = 'timeout'
+        result['error'] = str(exc)
+    elif exc is not None:
+        result['outcome'] = 'error'
+        result['error'] = '{}: {}'.format(exc.__class__.__name__, exc)
+    return result
+
+
+def _peer_credentials(conn: socket.socket) -> Tuple[int, int]:
+    """Get the process and user ID of the other end of a Unix socket.
+
+    :param conn: the connection
+    :returns: the process and user ID, or zeros if they are not available
+    """
+    peercred = getattr(socket, 'SO_PEERCRED', None)
+    if peercred is None:
+        return 0, 0
+    creds = struct.Struct('3i')
+    pid, uid, _gid = creds.unpack(
+        conn.getsockopt(socket.SOL_SOCKET, peercred, creds.size)
+    )
+    return pid, uid
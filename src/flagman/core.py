@@ -5,45 +5,172 @@ Contains the logic to implement signal handlers and dispatch to user-defined fun
 """
 import logging
 import signal
-from operator import attrgetter
+import time
+import weakref
 from types import FrameType
-from typing import Iterable, List, Mapping, MutableSet, Sequence, Type, Union
-
-import pkg_resources
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TYPE_CHECKING,
+    Union,
+)
 
 from flagman.actions import Action
-from flagman.exceptions import ActionClosed
+from flagman.deadlines import bundle_end, Deadlines, is_limited, take_action
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.loop import EventLoop
+from flagman.pending import PendingSignals
+from flagman.registry import ActionRegistry
+from flagman.signals import (
+    is_realtime,
+    open_signal_fd,
+    SigInfo,
+    signal_name,
+    SignalFD,
+)
+from flagman.throttle import due_at, due_runs, throttle_of, throttle_stats
+from flagman.timers import due_ticks, next_tick_at, restart_timers, timer_stats
 from flagman.types import ActionArgument, ActionName, SignalNumber
 
+if TYPE_CHECKING:  # pragma: no cover
+    from flagman.executors import (  # noqa: F401 (unused import)
+        ActionOutcome,
+        ThreadPoolBundleExecutor,
+    )
+    from flagman.journal import Journal  # noqa: F401 (unused import)
+    from flagman.metrics import Metrics  # noqa: F401 (unused import)
+
 logger = logging.getLogger(__name__)
 
-_value_getter = attrgetter('value')
+#: Type alias for the compiled actions of a bundle: each action with its bound `_run`
+DispatchPlan = Tuple[Tuple[Action, Callable[[Optional[SigInfo]], None]], ...]
 
 #: Signals in this list are handled by flagman.
-#: The CLI module auto-generates the appropriate CLI option for each signal.
-HANDLED_SIGNALS: List[signal.Signals] = sorted(
-    {signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2}, key=_value_getter
+#: The CLI module auto-generates the appropriate CLI option for each of the default
+#: signals; more signals are added with `add_handled_signal`.
+HANDLED_SIGNALS: List[SignalNumber] = sorted(
+    {signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2}
 )
 
-#: The global flag set for raised signals.
-#: A signal that has been delivered to a handler will have its number in the set.
-#: The number is removed after the actions for the signal have been executed.
-SIGNAL_FLAGS: MutableSet[SignalNumber] = set()
+#: The global pending-signal bookkeeping for raised signals.
+#: A signal that has been delivered to a handler is counted here until its actions
+#: have been executed, according to the signal's delivery policy.
+SIGNAL_FLAGS = PendingSignals()
 
 #: Mapping of action entry point names to Action classes.
-#: Populated from the pkg_resources `flagman.action` entry point group.
-KNOWN_ACTIONS: Mapping[ActionName, Type[Action]] = {
-    action.name: action.load()
-    for action in pkg_resources.iter_entry_points('flagman.action')
-}
+#: Populated lazily from the `flagman.action` entry point group: an action's module is
+#: only imported when the action is first looked up.
+KNOWN_ACTIONS = ActionRegistry('flagman.action')
+
+#: Type alias for what makes actions identical: the Action class, the arguments, and the
+#: ordering group, empty for the class's default
+ActionKey = Tuple[Type[Action], Tuple[ActionArgument, ...], str]
+
+#: Mapping of ActionKeys to the one live instance that identical shareable actions in
+#: the bundles share. Filled by `share_action`.
+_shared_actions: 'weakref.WeakValueDictionary[ActionKey, Action]' = (
+    weakref.WeakValueDictionary()
+)
 
 #: Mapping of SignalNumbers to sequences of instantiated Actions ("action bundles")
 #: that will be executed for that signal.
 #: Populated by `create_action_bundles`.
-ACTION_BUNDLES: Mapping[SignalNumber, List[Action]] = {
-    signum.value: [] for signum in HANDLED_SIGNALS
+#: Call `build_dispatch_plans` after changing a bundle while flagman is running.
+ACTION_BUNDLES: Dict[SignalNumber, List[Action]] = {
+    signum: [] for signum in HANDLED_SIGNALS
 }
 
+#: Mapping of SignalNumbers to the immutable dispatch plans of their action bundles.
+#: Built by `build_dispatch_plans` when flagman starts running, and rebuilt for a
+#: signal whenever one of its actions closes.
+DISPATCH_PLANS: Dict[SignalNumber, DispatchPlan] = {}
+
+#: Mapping of SignalNumbers to the time limits of their action bundles.
+#: Set by the CLI and the config file; call `build_dispatch_plans` after changing it
+#: while flagman is running.
+DEADLINES: Dict[SignalNumber, Deadlines] = {}
+
+#: The signals with an action that has a time limit, from `build_dispatch_plans`
+_limited_signals: Set[SignalNumber] = set()
+
+#: The signals with an action that has a throttle, from `build_dispatch_plans`
+_throttled_signals: Set[SignalNumber] = set()
+
+#: The signals whose bundle in the executor is made of deferred runs of throttled
+#: actions, which do not lower the signal's flag
+_deferred_bundles: Set[SignalNumber] = set()
+
+#: The name of the tenant each signal of a tenant namespace belongs to.
+#: Set by `flagman.tenants`; signals of flagman itself are not in it.
+SIGNAL_TENANTS: Dict[SignalNumber, str] = {}
+
+#: The metrics recorded by the dispatchers, or None to not record any.
+#: Set by the CLI when metrics are exported.
+METRICS: Optional['Metrics'] = None
+
+#: The journal the dispatchers write signals and action outcomes to, or None to not
+#: write one. Set by the CLI with `--journal`.
+JOURNAL: Optional['Journal'] = None
+
+#: Type alias for a callback told about each finished run of an action bundle: the
+#: signal number, how many of the signal's deliveries the run covered, and the outcome
+#: of each action that was taken
+RunListener = Callable[[SignalNumber, int, Sequence['ActionOutcome']], None]
+
+#: Callbacks told about each finished run of an action bundle, like the control socket.
+#: Called from the event loop thread after the signal's flag is lowered.
+RUN_LISTENERS: List[RunListener] = []
+
+#: The signalfd that signals with actions that want siginfo are read from.
+#: Opened by `set_handlers`.
+_signal_fd: Optional[SignalFD] = None
+
+#: The signals `set_handlers` registered handlers for.
+_handler_signals: Set[SignalNumber] = set()
+
+
+def add_handled_signal(num: SignalNumber) -> None:
+    """Handle another signal, giving it an empty action bundle.
+
+    :param num: the signal number, like `signal.SIGRTMIN + 3`
+    """
+    if num not in ACTION_BUNDLES:
+        HANDLED_SIGNALS.append(num)
+        HANDLED_SIGNALS.sort()
+        ACTION_BUNDLES[num] = []
+
+
+def remove_handled_signal(num: SignalNumber) -> None:
+    """Stop handling a signal, so it can be used for something else.
+
+    :param num: the signal number
+    :raises ValueError: if the signal's action bundle is not empty
+    """
+    if ACTION_BUNDLES.get(num):
+        raise ValueError('{} has actions'.format(signal_name(num)))
+    if num in ACTION_BUNDLES:
+        HANDLED_SIGNALS.remove(num)
+        del ACTION_BUNDLES[num]
+
+
+def option_key(num: SignalNumber) -> str:
+    """Get the key for a signal's actions in the input to `create_action_bundles`.
+
+    :param num: the signal number
+    :returns: the lowercase signal name without the `SIG` prefix, like `usr1` or
+        `rtmin+3`
+    """
+    return signal_name(num)[3:].lower()
+
 
 def create_action_bundles(
     args_dict: Mapping[str, Iterable[Sequence[Union[ActionName, ActionArgument]]]]
@@ -53,26 +180,33 @@ def create_action_bundles(
     The input dictionary should be like::
 
         {'usr1': [['action1', 'arg1a', 'arg2a'], ['action2', 'arg2a']],
-         'usr2': [['action3'], ['action4', 'arg4a', 'arg4b']]}
+         'usr2': [['action3'], ['action4', 'arg4a', 'arg4b']],
+         'rtmin+3': [['action5']]}
 
+    The keys are given by `option_key`; only signals in HANDLED_SIGNALS are read.
+
+    An action name may be suffixed with `@GROUP` to set the action's
+    :attr:`~flagman.Action.ordering_group`. Identical shareable actions are set up once
+    and share an instance, see `share_action`.
 
     :param args_dict: a mapping of strings to an Iterable of Action names
     :returns: The number of configured actions
     """
     logger.debug('Creating action bundles')
     for signum in HANDLED_SIGNALS:
-        logger.debug('Creating action bundle for %s', signum.name)
-        action_calls = args_dict.get(signum.name[3:].lower(), [])
+        logger.debug('Creating action bundle for %s', signal_name(signum))
+        action_calls = args_dict.get(option_key(signum), [])
         actions = []
         for action_call in action_calls:
+            name, _, group = action_call[0].partition('@')
             try:
-                actions.append((KNOWN_ACTIONS[action_call[0]], action_call[1:]))
+                actions.append((KNOWN_ACTIONS[name], action_call[1:], group))
             except KeyError:
-                logger.warning('Unknown action `%s`; skipping', action_call[0])
-        action_generators = [
-            prime_action_generator(action[0], action[1]) for action in actions
-        ]
-        ACTION_BUNDLES[signum.value].extend(action_generators)
+                logger.warning('Unknown action `%s`; skipping', name)
+        ACTION_BUNDLES[signum].extend(
+            share_action(action_class, tuple(action_args), group)
+            for action_class, action_args, group in actions
+        )
 
     return sum(len(bundle) for bundle in ACTION_BUNDLES.values())
 
@@ -101,87 +235,555 @@ def prime_action_generator(
     return action_generator
 
 
-def set_handlers() -> None:
+def share_action(
+    action: Type[Action], args: Tuple[ActionArgument, ...], group: str = ''
+) -> Action:
+    """Get the shared instance of an Action, instantiating it if there is none.
+
+    Every call takes a reference to the instance, to be dropped with
+    :meth:`~flagman.Action._release` when the action is removed from a bundle; the
+    instance is torn down when its last reference is dropped. An Action class that is
+    not :attr:`~flagman.Action.shareable`, or a closed instance, is never shared.
+
+    :param action: the Action
+    :param args: the arguments to the Action
+    :param group: the ordering group of the Action; empty for the class's default
+
+    :returns: the primed Action
+    """
+    key = (action, args, group)
+    shared = _shared_actions.get(key)
+    if shared is not None and not shared._closed:
+        logger.debug('Sharing the instance of action class `%s`', action.__qualname__)
+        shared._references += 1
+        return shared
+
+    action_generator = prime_action_generator(action, args)
+    if group:
+        action_generator.ordering_group = group
+    if action.shareable:
+        _shared_actions[key] = action_generator
+    return action_generator
+
+
+def set_handlers(
+    keep_empty: bool = False, forward: Optional[Callable[[SignalNumber], None]] = None
+) -> None:
     """Register handlers for the signals we're interested in.
 
     Uses the global HANDLED_SIGNALS to decide what signals to register for.
+    Signals without actions are skipped unless `keep_empty` is set, which lets actions
+    be added to them later, like by a config reload.
+
+    The handlers record each delivery in SIGNAL_FLAGS, unless `forward` is given: then
+    they pass the signal number to it instead, so a dispatcher that does not run on the
+    main thread can record the delivery on its own thread.
+
+    Real-time signals and signals with an action that wants siginfo are also blocked
+    and read from a signalfd instead: Python runs a handler once for any number of
+    deliveries that arrive together, which would merge queued real-time signals.
+    Call this from the main thread before starting any threads.
 
     Danger starts here!
     """
+    global _signal_fd
     logger.info('Registering signal handlers for actions')
+    _handler_signals.clear()
+    record: Callable[[SignalNumber], None] = (
+        SIGNAL_FLAGS.add if forward is None else forward
+    )
     for signum in HANDLED_SIGNALS:
-        if len(ACTION_BUNDLES[signum]) > 0:
+        if len(ACTION_BUNDLES[signum]) > 0 or keep_empty:
 
             def handler(
                 num: int, _frame: FrameType
             ) -> None:  # noqa: D403 (capitalization)
-                """flagman handler for {}.""".format(signum.name)
-                SIGNAL_FLAGS.add(num)
+                """flagman handler for {}.""".format(signal_name(signum))
+                record(num)
 
-            logger.debug('Registering signal handler for signal `%s`', signum.name)
+            logger.debug(
+                'Registering signal handler for signal `%s`', signal_name(signum)
+            )
             signal.signal(signum, handler)
+            _handler_signals.add(signum)
         else:
             logger.debug(
                 'No actions registered for signal `%s`; skipping handler registration',
-                signum.name,
+                signal_name(signum),
             )
+
+    if _signal_fd is not None:
+        _signal_fd.close()
+        _signal_fd = None
+    siginfo_signals = [
+        signum for signum in HANDLED_SIGNALS if _needs_signal_fd(signum, keep_empty)
+    ]
+    if siginfo_signals:
+        logger.debug(
+            'Reading signals `%s` from a signalfd',
+            [signal_name(signum) for signum in siginfo_signals],
+        )
+        _signal_fd = open_signal_fd(siginfo_signals)
     logger.info('Done registering signal handlers for actions')
 
 
-def run() -> None:
+def build_dispatch_plans() -> None:
+    """Compile each action bundle into a dispatch plan.
+
+    A plan holds the bound `_run` of each action, so a dispatch neither copies the
+    bundle nor looks up the method of each action.
+    """
+    for num in ACTION_BUNDLES:
+        _build_dispatch_plan(num)
+
+
+def _build_dispatch_plan(num: SignalNumber) -> None:
+    """Compile the action bundle of a signal into its dispatch plan.
+
+    :param num: the signal number
+    """
+    DISPATCH_PLANS[num] = tuple((action, action._run) for action in ACTION_BUNDLES[num])
+    deadlines = DEADLINES.get(num)
+    if any(is_limited(action, deadlines) for action in ACTION_BUNDLES[num]):
+        _limited_signals.add(num)
+    else:
+        _limited_signals.discard(num)
+    if any(action.throttle is not None for action in ACTION_BUNDLES[num]):
+        _throttled_signals.add(num)
+    else:
+        _throttled_signals.discard(num)
+
+
+def _needs_signal_fd(num: SignalNumber, keep_empty: bool = False) -> bool:
+    """Check if a signal must be read from the signalfd.
+
+    :param num: the signal number
+    :param keep_empty: whether a signal without actions is handled anyway
+    :returns: whether the signal has actions and is real-time or has an action that
+        wants siginfo
+    """
+    bundle = ACTION_BUNDLES[num]
+    if not bundle and not keep_empty:
+        return False
+    return is_realtime(num) or any(action.wants_siginfo for action in bundle)
+
+
+def _read_signal_fd() -> None:
+    """Record the deliveries waiting in the signalfd, along with their siginfo."""
+    if _signal_fd is not None:
+        for info in _signal_fd.read():
+            SIGNAL_FLAGS.add(info.signo, info)
+
+
+def run(loop: Optional[EventLoop] = None, max_workers: int = 0) -> None:
     """Run the flagman "event loop".
 
     Waits for a signal to be raised and dispatches to the user-defined handlers
     as appropriate.
+
+    The loop sleeps in select/epoll on a signal wakeup fd rather than in
+    :func:`signal.pause`, so a signal that arrives while the flags are being drained
+    still wakes the loop immediately.
+
+    With `max_workers`, bundles are taken on a
+    :class:`~flagman.executors.ThreadPoolBundleExecutor`: actions in different ordering
+    groups run concurrently and different signals no longer wait on each other.
+
+    :param loop: the event loop to use; a new one is created if not given
+    :param max_workers: the size of the thread pool; 0 to take actions on the loop
     """
+    if loop is None:
+        loop = EventLoop()
+    executor = None
+    if max_workers > 0:
+        # concurrent.futures is slow to import, so only pay for it when it is used
+        from flagman.executors import ThreadPoolBundleExecutor
+
+        executor = ThreadPoolBundleExecutor(max_workers, loop.wake)
+    if _signal_fd is not None:
+        loop.add_reader(_signal_fd.fileno(), _read_signal_fd)
+    build_dispatch_plans()
     logger.info('Starting event loop')
+    try:
+        with loop:
+            if executor is None:
+                _loop_forever(loop)
+            else:
+                _loop_with_executor(loop, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        _log_signal_stats()
+
+
+def _loop_forever(loop: EventLoop) -> None:
+    """Dispatch raised signals and wait for more until no actions remain.
+
+    :param loop: the event loop to wait in
+    """
     while True:
-        logger.debug('Pausing for signal')
-        signal.pause()
-        logger.debug('Woke for signal')
+        _fire_timers()
+        _take_deferred_runs()
         while SIGNAL_FLAGS:
             try:
-                num = SIGNAL_FLAGS.pop()
+                num = _pop_signal()
                 logger.debug('Found raised flag for signal number `%d`', num)
             except KeyError:
                 continue
 
-            logger.debug(
-                'Taking actions `%s` for signal number `%d`',
-                [action.__class__.__name__ for action in ACTION_BUNDLES[num]],
-                num,
-            )
-
-            # make a copy since we might want to remove an element while iterating
-            actions_to_take = enumerate(ACTION_BUNDLES[num].copy())
-
-            idx_adjust = 0
-            for idx, action in actions_to_take:
-                try:
-                    logger.debug(
-                        'Taking action `%s` for signal number `%d`',
-                        action.__class__.__name__,
-                        num,
-                    )
-                    action._run()
-                    logger.debug(
-                        'Done taking action `%s` for signal number `%d`',
-                        action.__class__.__name__,
-                        num,
-                    )
-                except ActionClosed:
-                    logger.warning(
-                        'Received `ActionClosed`; removing action `%s`',
-                        action.__class__.__name__,
-                        exc_info=True,
-                    )
-                    ACTION_BUNDLES[num].pop(idx - idx_adjust)
-                    idx_adjust += 1
-
-            logger.debug('Lowering flag for signal number `%d`', num)
-            SIGNAL_FLAGS.discard(num)
+            _dispatch(num)
 
             # check if there are any actions left in our bundles
             if not any(ACTION_BUNDLES.values()):
                 logger.warning('No actions remain active; exiting event loop')
                 return None
+
+        logger.debug('Waiting for signal')
+        loop.wait(_timeout())
+        logger.debug('Woke for signal')
+
+
+def _loop_with_executor(
+    loop: EventLoop, executor: 'ThreadPoolBundleExecutor'
+) -> None:
+    """Hand raised signals to an executor until no actions remain.
+
+    :param loop: the event loop to wait in
+    :param executor: the executor to take the actions of each bundle
+    """
+    while True:
+        for num, outcomes in executor.completed():
+            _finish_bundle(num, outcomes)
+        _fire_timers()
+        _take_deferred_runs(executor)
+
+        while True:
+            try:
+                num = _pop_signal(busy=executor.running)
+            except KeyError:
+                break
+            logger.debug('Found raised flag for signal number `%d`', num)
+            plan = DISPATCH_PLANS[num]
+            if num in _throttled_signals:
+                plan = _admit(num, plan, SIGNAL_FLAGS.siginfo(num))
+            if plan:
+                executor.submit(
+                    num,
+                    [action for action, _ in plan],
+                    SIGNAL_FLAGS.siginfo(num),
+                    DEADLINES.get(num),
+                )
+            else:
+                _lower_flag(num)
+
+        if not executor.running and not any(ACTION_BUNDLES.values()):
+            logger.warning('No actions remain active; exiting event loop')
+            return None
+
+        logger.debug('Waiting for signal')
+        loop.wait(_timeout(executor.running))
+        logger.debug('Woke for signal')
+
+
+def _finish_bundle(num: SignalNumber, outcomes: Sequence['ActionOutcome']) -> None:
+    """Remove the closed actions of a bundle taken by an executor and lower its flag.
+
+    :param num: the number of the raised signal
+    :param outcomes: the outcome of each action that was taken
+    :raises Exception: the first exception other than `ActionClosed` or `ActionTimeout`
+        that was raised
+    """
+    error = None
+    for action, exc, seconds in outcomes:
+        _record_action(num, action, exc, seconds)
+        if isinstance(exc, ActionClosed):
+            _remove_closed_action(num, action, exc)
+        elif isinstance(exc, ActionTimeout):
+            continue
+        elif exc is not None and error is None:
+            error = exc
+
+    if num in _deferred_bundles:
+        _deferred_bundles.discard(num)
+    else:
+        _lower_flag(num, outcomes)
+    if error is not None:
+        raise error
+
+
+def _timeout(busy: Container[SignalNumber] = ()) -> Optional[float]:
+    """Get the time until a debounced signal is ready, a deferred run or a tick is due.
+
+    :param busy: signals whose deferred runs wait, because their actions are running
+    :returns: the time in seconds, or None if nothing is waiting for a time
+    """
+    timeout = SIGNAL_FLAGS.timeout()
+    times = [at for at in (due_at(busy), next_tick_at()) if at is not None]
+    if not times:
+        return timeout
+    left = max(min(times) - time.monotonic(), 0.0)
+    return left if timeout is None else min(timeout, left)
+
+
+def _fire_timers() -> None:
+    """Raise the flags of the signals whose timers ticked.
+
+    A tick for a signal whose bundle is running or waiting to run is merged into that
+    run, unless the timer does not merge, and a tick for a signal without actions is
+    ignored.
+    """
+    for num, timer in due_ticks(time.monotonic()):
+        if not ACTION_BUNDLES.get(num):
+            continue
+        busy = SIGNAL_FLAGS.running(num) or SIGNAL_FLAGS.pending(num) > 0
+        if timer.merges and busy:
+            logger.debug('Merged timer tick for signal number `%d`', num)
+            timer.merged += 1
+        else:
+            logger.debug('Timer ticked for signal number `%d`', num)
+            timer.fired += 1
+            SIGNAL_FLAGS.trigger(num)
+
+
+def _admit(
+    num: SignalNumber, plan: DispatchPlan, siginfo: Optional[SigInfo]
+) -> DispatchPlan:
+    """Leave out the actions of a dispatch plan that their throttles hold back.
+
+    :param num: the number of the raised signal
+    :param plan: the dispatch plan of the signal
+    :param siginfo: the details of the delivery the bundle is run for
+    :returns: the actions of the plan that run now
+    """
+    now = time.monotonic()
+    admitted = []
+    for action, run_action in plan:
+        throttle = throttle_of(action)
+        if throttle is None or throttle.admit(num, siginfo, now):
+            admitted.append((action, run_action))
+        else:
+            logger.debug(
+                'Throttled action `%s` for signal number `%d`',
+                action.__class__.__name__,
+                num,
+            )
+    return tuple(admitted)
+
+
+def _take_deferred_runs(executor: Optional['ThreadPoolBundleExecutor'] = None) -> None:
+    """Take the deferred runs of throttled actions that are due.
+
+    The runs due for one signal are taken together, in bundle order. With an executor,
+    they are submitted as a bundle once the signal's actions are no longer running.
+
+    :param executor: the executor to take the runs, if not taken right away
+    """
+    busy = executor.running if executor is not None else ()
+    runs: Dict[SignalNumber, Dict[Action, Optional[SigInfo]]] = {}
+    for num, action, siginfo in due_runs(time.monotonic(), busy):
+        runs.setdefault(num, {})[action] = siginfo
+    for num, due in runs.items():
+        # the actions may have been closed or removed by a reload in the meantime
+        actions = [action for action in ACTION_BUNDLES.get(num, ()) if action in due]
+        if not actions:
+            continue
+        logger.debug(
+            'Taking deferred runs of actions `%s` for signal number `%d`',
+            [action.__class__.__name__ for action in actions],
+            num,
+        )
+        siginfo = due[actions[-1]]
+        if executor is None:
+            plan = tuple((action, action._run) for action in actions)
+            _dispatch_instrumented(num, plan, siginfo)
+        else:
+            _deferred_bundles.add(num)
+            executor.submit(num, actions, siginfo, DEADLINES.get(num))
+
+
+def _pop_signal(
+    busy: Container[SignalNumber] = (), above: Optional[int] = None
+) -> SignalNumber:
+    """Take a signal that is ready to be dispatched and record its dispatch latency.
+
+    :param busy: signals whose bundles are still running
+    :param above: if given, only take a signal whose priority is higher than this
+    :returns: the signal number
+    :raises KeyError: if no signal is ready
+    """
+    num = SIGNAL_FLAGS.pop(busy, above)
+    if METRICS is not None:
+        METRICS.record_dispatch(num, SIGNAL_FLAGS.latency(num))
+    if JOURNAL is not None:
+        JOURNAL.record_dispatch(
+            num, SIGNAL_FLAGS.latency(num), SIGNAL_FLAGS.siginfo(num)
+        )
+    return num
+
+
+def _record_action(
+    num: SignalNumber, action: Action, exc: Optional[BaseException], seconds: float
+) -> None:
+    """Record a run of an action if metrics or the journal are enabled.
+
+    :param num: the number of the signal the action was taken for
+    :param action: the action
+    :param exc: the exception the action raised, if any
+    :param seconds: how long the action ran
+    """
+    if METRICS is not None:
+        METRICS.record_action(num, action, exc, seconds)
+    if JOURNAL is not None:
+        JOURNAL.record_action(num, action, exc, seconds)
+
+
+def _log_signal_stats() -> None:
+    """Log how many deliveries of each signal were dispatched, merged, or dropped."""
+    for signum in HANDLED_SIGNALS:
+        stats = SIGNAL_FLAGS.stats(signum)
+        if stats.delivered:
+            logger.info('Delivery counts for `%s`: %r', signal_name(signum), stats)
+    for action, throttle in throttle_stats().items():
+        logger.info(
+            'Throttle counts for `%s`: %r', action.__class__.__name__, throttle
+        )
+    for num, timers in timer_stats().items():
+        logger.info('Timer counts for `%s`: %r', signal_name(num), timers)
+
+
+def _dispatch(num: SignalNumber) -> None:
+    """Take the actions in the bundle for a signal, removing closed actions.
+
+    Actions held back by their throttle are left out.
+
+    :param num: the number of the raised signal
+    """
+    plan = DISPATCH_PLANS[num]
+    siginfo = SIGNAL_FLAGS.siginfo(num)
+    if num in _throttled_signals:
+        plan = _admit(num, plan, siginfo)
+    instrumented = METRICS is not None or JOURNAL is not None or bool(RUN_LISTENERS)
+    instrumented = instrumented or logger.isEnabledFor(logging.DEBUG)
+    if instrumented or num in _limited_signals or SIGNAL_FLAGS.outranked(num):
+        _lower_flag(num, _dispatch_instrumented(num, plan, siginfo))
+        return None
+
+    # removing a closed action replaces the plan, so this one can be iterated
+    for action, run_action in plan:
+        try:
+            run_action(siginfo)
+        except ActionClosed as e:
+            _remove_closed_action(num, action, e)
+    _lower_flag(num)
+
+
+def _lower_flag(num: SignalNumber, outcomes: Sequence['ActionOutcome'] = ()) -> None:
+    """Finish a run of a signal's action bundle and tell the run listeners.
+
+    :param num: the number of the raised signal
+    :param outcomes: the outcome of each action that was taken
+    """
+    logger.debug('Lowering flag for signal number `%d`', num)
+    covered = SIGNAL_FLAGS.consumed(num)
+    SIGNAL_FLAGS.discard(num)
+    restart_timers(num)
+    if JOURNAL is not None:
+        JOURNAL.record_done(num, covered)
+    for listener in RUN_LISTENERS:
+        listener(num, covered, outcomes)
+
+
+def _dispatch_instrumented(
+    num: SignalNumber, plan: DispatchPlan, siginfo: Optional[SigInfo]
+) -> List['ActionOutcome']:
+    """Take the actions of a dispatch plan, logging and recording metrics for each.
+
+    If another signal has a higher priority, the bundle can be preempted: the ready
+    signals that outrank it are dispatched between two of its actions. Actions with a
+    time limit are taken by :func:`flagman.deadlines.take_action`.
+
+    :param num: the number of the raised signal
+    :param plan: the dispatch plan of the signal
+    :param siginfo: the details of the delivery the actions are taken for
+    :returns: the outcome of each action
+    """
+    outcomes: List['ActionOutcome'] = []
+    logger.debug(
+        'Taking actions `%s` for signal number `%d`',
+        [action.__class__.__name__ for action, _ in plan],
+        num,
+    )
+    preempt = SIGNAL_FLAGS.outranked(num)
+    limited = num in _limited_signals
+    deadlines = DEADLINES.get(num)
+    ends = bundle_end(deadlines)
+    for idx, (action, run_action) in enumerate(plan):
+        if preempt and idx:
+            _preempt(num)
+        logger.debug(
+            'Taking action `%s` for signal number `%d`', action.__class__.__name__, num
+        )
+        start = time.perf_counter()
+        try:
+            if limited:
+                take_action(action, siginfo, deadlines, ends)
+            else:
+                run_action(siginfo)
+        except (ActionClosed, ActionTimeout) as e:
+            seconds = time.perf_counter() - start
+            _record_action(num, action, e, seconds)
+            outcomes.append((action, e, seconds))
+            if isinstance(e, ActionClosed):
+                _remove_closed_action(num, action, e)
+            continue
+        except Exception as e:
+            _record_action(num, action, e, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        _record_action(num, action, None, seconds)
+        outcomes.append((action, None, seconds))
+        logger.debug(
+            'Done taking action `%s` for signal number `%d`',
+            action.__class__.__name__,
+            num,
+        )
+    return outcomes
+
+
+def _preempt(num: SignalNumber) -> None:
+    """Dispatch the ready signals that outrank a signal whose bundle is running.
+
+    Each of them is dispatched at most once per call, so a steady stream of deliveries
+    of a higher priority signal delays the running bundle without starving it.
+
+    :param num: the number of the signal whose bundle is running
+    """
+    _read_signal_fd()
+    priority = SIGNAL_FLAGS.priority(num)
+    done: Set[SignalNumber] = set()
+    while True:
+        try:
+            other = _pop_signal(busy=done, above=priority)
+        except KeyError:
+            return None
+        logger.debug('Signal number `%d` preempts signal number `%d`', other, num)
+        done.add(other)
+        _dispatch(other)
+
+
+def _remove_closed_action(
+    num: SignalNumber, action: Action, exc: ActionClosed
+) -> None:
+    """Remove an action that raised `ActionClosed` from a signal's bundle.
+
+    :param num: the number of the signal whose bundle holds the action
+    :param action: the closed action
+    :param exc: the raised exception, logged with its traceback
+    """
+    logger.warning(
+        'Received `ActionClosed`; removing action `%s`',
+        action.__class__.__name__,
+        exc_info=exc,
+    )
+    ACTION_BUNDLES[num].remove(action)
+    _build_dispatch_plan(num)
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""Time limits for actions and action bundles.
+
+A signal can have a timeout for each action of its bundle and a deadline for the whole
+bundle, and an action class can set its own :attr:`~flagman.Action.timeout`. A run of
+an action may take the shortest of the limits that apply to it. Once the deadline of a
+bundle has passed, the actions of the bundle that have not started are skipped.
+
+An action that runs out of time is stopped as far as that is possible:
+
+- a coroutine :meth:`~flagman.Action.run` is cancelled,
+- the worker process of an isolated action is killed and forked again,
+- any other action runs on a thread of its own, which is abandoned. Python can't stop
+  a thread, so the run goes on in the background and the action is skipped until it
+  returns. A retry waits for it to return, within the retry's own time limit, so two
+  runs of the action never overlap.
+
+Then the signal's :class:`TimeoutPolicy` decides what happens to the action. Unlike
+other exceptions, an action running out of time never stops flagman.
+"""
+import enum
+import logging
+import threading
+import time
+import weakref
+from typing import NamedTuple, Optional, Tuple
+
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.signals import SigInfo
+
+# asyncio and inspect are slow to import and only needed for actions with a time limit,
+# so they are imported where they are used
+
+logger = logging.getLogger(__name__)
+
+
+class TimeoutPolicy(enum.Enum):
+    """What happens to an action that runs out of time."""
+
+    #: The run is given up and the bundle goes on with its next action
+    SKIP = 'skip'
+    #: The action is run again, up to the number of retries, then skipped
+    RETRY = 'retry'
+    #: The action is closed, as if it had raised `ActionClosed`
+    CLOSE = 'close'
+
+
+class Deadlines(NamedTuple):
+    """The time limits of a signal's action bundle."""
+
+    #: The time in seconds each action may run, or None for no limit
+    timeout: Optional[float] = None
+    #: The time in seconds the whole bundle may run, or None for no limit
+    deadline: Optional[float] = None
+    #: What happens to an action that runs out of time
+    policy: TimeoutPolicy = TimeoutPolicy.SKIP
+    #: How many more times the retry policy runs an action that ran out of time
+    retries: int = 1
+
+
+class _TimedRun:
+    """A run of an action on a thread of its own."""
+
+    def __init__(self, action: Action, siginfo: Optional[SigInfo]) -> None:
+        """Start the run.
+
+        :param action: the action
+        :param siginfo: the details of the delivery the action is taken for
+        """
+        self.action = action
+        self.exc: Optional[Exception] = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self._close_when_done = False
+        thread = threading.Thread(
+            target=self._run, args=(siginfo,), name='flagman-timed-run', daemon=True
+        )
+        thread.start()
+
+    def _run(self, siginfo: Optional[SigInfo]) -> None:
+        """Run the action on the run's thread.
+
+        :param siginfo: the details of the delivery the action is taken for
+        """
+        try:
+            self.action._run(siginfo)
+        except Exception as e:
+            self.exc = e
+        with self._lock:
+            self.done.set()
+            abandoned, close = self._abandoned, self._close_when_done
+        if abandoned:
+            logger.info(
+                'Action `%s` that ran out of time has returned',
+                self.action.__class__.__name__,
+                exc_info=self.exc,
+            )
+        if close:
+            self.action._close()
+
+    def abandon(self) -> None:
+        """Stop waiting for the run; it goes on in the background."""
+        with self._lock:
+            self._abandoned = True
+
+    @property
+    def closing(self) -> bool:
+        """Whether the action is closed once the run returns."""
+        return self._close_when_done
+
+    def close_when_done(self) -> bool:
+        """Close the action once the run returns.
+
+        :returns: False if the run has already returned and nothing will close it
+        """
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self._close_when_done = True
+            return True
+
+
+#: The abandoned runs of actions that ran out of time, until they return
+_overruns: 'weakref.WeakKeyDictionary[Action, _TimedRun]' = weakref.WeakKeyDictionary()
+
+
+def parse_timeout_policy(value: str) -> Tuple[TimeoutPolicy, int]:
+    """Parse a timeout policy like `skip`, `close`, `retry`, or `retry:3`.
+
+    :param value: the policy string
+    :returns: the policy and the number of retries
+    :raises ValueError: if the policy is unknown or the retries are not a count
+    """
+    name, sep, retries = value.partition(':')
+    try:
+        policy = TimeoutPolicy(name)
+        count = int(retries) if sep else 1
+    except ValueError:
+        raise ValueError('invalid timeout policy: {!r}'.format(value)) from None
+    if count < 0 or (sep and policy is not TimeoutPolicy.RETRY):
+        raise ValueError('invalid timeout policy: {!r}'.format(value))
+    return policy, count
+
+
+def is_limited(action: Action, deadlines: Optional[Deadlines]) -> bool:
+    """Check if runs of an action in a bundle have a time limit.
+
+    :param action: the action
+    :param deadlines: the time limits of the bundle, if it has any
+    :returns: whether a run of the action can run out of time
+    """
+    if action.timeout is not None:
+        return True
+    if deadlines is None:
+        return False
+    return deadlines.timeout is not None or deadlines.deadline is not None
+
+
+def bundle_end(deadlines: Optional[Deadlines]) -> Optional[float]:
+    """Get the time by which a bundle that starts now must be done.
+
+    :param deadlines: the time limits of the bundle, if it has any
+    :returns: the :func:`time.monotonic` time, or None if the bundle has no deadline
+    """
+    if deadlines is None or deadlines.deadline is None:
+        return None
+    return time.monotonic() + deadlines.deadline
+
+
+def time_limit(
+    action: Action, deadlines: Optional[Deadlines], ends: Optional[float]
+) -> Optional[float]:
+    """Get how long a run of an action that starts now may take.
+
+    :param action: the action
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :param ends: the time by which the bundle must be done, from :func:`bundle_end`
+    :returns: the time in seconds, or None for no limit
+    :raises ActionTimeout: if the deadline of the bundle has passed
+    """
+    limit = action.timeout
+    if deadlines is not None and deadlines.timeout is not None:
+        limit = deadlines.timeout if limit is None else min(limit, deadlines.timeout)
+    if ends is not None:
+        left = ends - time.monotonic()
+        if left <= 0:
+            raise ActionTimeout('The deadline of the bundle has passed')
+        limit = left if limit is None else min(limit, left)
+    return limit
+
+
+def take_action(
+    action: Action,
+    siginfo: Optional[SigInfo] = None,
+    deadlines: Optional[Deadlines] = None,
+    ends: Optional[float] = None,
+) -> None:
+    """Take an action within its time limit, applying the timeout policy if it runs out.
+
+    :param action: the action
+    :param siginfo: the details of the delivery the action is taken for
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :param ends: the time by which the bundle must be done, from :func:`bundle_end`
+    :raises ActionTimeout: if the action ran out of time and was skipped
+    :raises ActionClosed: if the action is closed, also by the close policy
+    """
+    _check_overrun(action)
+    limit = time_limit(action, deadlines, ends)
+    if limit is None:
+        action._run(siginfo)
+        return None
+    for retry in range(_retries(deadlines) + 1):
+        if retry:
+            limit = _retry_limit(action, deadlines, ends)
+            if limit is None:
+                break
+        try:
+            run_with_timeout(action, siginfo, limit)
+            return None
+        except ActionTimeout as e:
+            timeout = e
+    _give_up(action, deadlines, timeout)
+
+
+async def atake_action(
+    action: Action,
+    siginfo: Optional[SigInfo] = None,
+    deadlines: Optional[Deadlines] = None,
+    ends: Optional[float] = None,
+) -> None:
+    """Take an action on the running event loop, like :func:`take_action`.
+
+    :param action: the action
+    :param siginfo: the details of the delivery the action is taken for
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :param ends: the time by which the bundle must be done, from :func:`bundle_end`
+    :raises ActionTimeout: if the action ran out of time and was skipped
+    :raises ActionClosed: if the action is closed, also by the close policy
+    """
+    _check_overrun(action)
+    limit = time_limit(action, deadlines, ends)
+    if limit is None:
+        await action._arun(siginfo)
+        return None
+    for retry in range(_retries(deadlines) + 1):
+        if retry:
+            limit = _retry_limit(action, deadlines, ends)
+            if limit is None:
+                break
+        try:
+            await arun_with_timeout(action, siginfo, limit)
+            return None
+        except ActionTimeout as e:
+            timeout = e
+    _give_up(action, deadlines, timeout)
+
+
+def run_with_timeout(
+    action: Action, siginfo: Optional[SigInfo], timeout: float
+) -> None:
+    """Run an action once and stop it if it runs out of time.
+
+    :param action: the action
+    :param siginfo: the details of the delivery the action is taken for
+    :param timeout: the time in seconds the run may take, including the wait for an
+        earlier run that ran out of time
+    :raises ActionTimeout: if the run took too long
+    """
+    if action._worker is not None:
+        action._worker.run(action, siginfo, timeout)
+    elif _is_coroutine_action(action):
+        import asyncio
+
+        from flagman.actions.action import _run_sync
+
+        try:
+            _run_sync(asyncio.wait_for(action._arun(siginfo), timeout))
+        except asyncio.TimeoutError:
+            raise ActionTimeout('Cancelled after {:.3g}s'.format(timeout)) from None
+    else:
+        overrun = _overruns.get(action)
+        if overrun is not None:
+            # only a retry finds the run that ran out of time, and waits for it first
+            started = time.monotonic()
+            if not overrun.done.wait(timeout):
+                raise ActionTimeout('Still running after {:.3g}s'.format(timeout))
+            _overruns.pop(action, None)
+            timeout = max(timeout - (time.monotonic() - started), 0.0)
+        run = _TimedRun(action, siginfo)
+        if not run.done.wait(timeout):
+            run.abandon()
+            _overruns[action] = run
+            raise ActionTimeout('Abandoned after {:.3g}s'.format(timeout))
+        if run.exc is not None:
+            raise run.exc
+
+
+async def arun_with_timeout(
+    action: Action, siginfo: Optional[SigInfo], timeout: float
+) -> None:
+    """Run an action once on the running event loop and stop it if it runs out of time.
+
+    A coroutine :meth:`~flagman.Action.run` is awaited with a timeout; any other action
+    is run by :func:`run_with_timeout` on the event loop's default executor.
+
+    :param action: the action
+    :param siginfo: the details of the delivery the action is taken for
+    :param timeout: the time in seconds the run may take
+    :raises ActionTimeout: if the run took too long
+    """
+    import asyncio
+
+    if action._worker is None and _is_coroutine_action(action):
+        try:
+            await asyncio.wait_for(action._arun(siginfo), timeout)
+        except asyncio.TimeoutError:
+            raise ActionTimeout('Cancelled after {:.3g}s'.format(timeout)) from None
+        return None
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, run_with_timeout, action, siginfo, timeout)
+
+
+def _is_coroutine_action(action: Action) -> bool:
+    """Check if an action's :meth:`~flagman.Action.run` is a coroutine function.
+
+    :param action: the action
+    :returns: whether its runs can be cancelled
+    """
+    import inspect
+
+    return inspect.iscoroutinefunction(type(action).run)
+
+
+def _check_overrun(action: Action) -> None:
+    """Skip an action whose run that ran out of time has not returned yet.
+
+    :param action: the action
+    :raises ActionTimeout: if the run is still going
+    :raises ActionClosed: if the close policy is waiting for the run to close it
+    """
+    run = _overruns.get(action)
+    if run is None:
+        return None
+    if run.done.is_set():
+        del _overruns[action]
+        return None
+    if run.closing:
+        raise ActionClosed('Closing once the run that ran out of time returns')
+    logger.warning(
+        'Skipping action `%s`: still running from a run that ran out of time',
+        action.__class__.__name__,
+    )
+    raise ActionTimeout('Still running from a run that ran out of time')
+
+
+def _retries(deadlines: Optional[Deadlines]) -> int:
+    """Get how many more times an action that ran out of time is run.
+
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :returns: the number of retries
+    """
+    if deadlines is None or deadlines.policy is not TimeoutPolicy.RETRY:
+        return 0
+    return deadlines.retries
+
+
+def _retry_limit(
+    action: Action, deadlines: Optional[Deadlines], ends: Optional[float]
+) -> Optional[float]:
+    """Get the time limit of a retry, if the action can be retried.
+
+    :param action: the action
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :param ends: the time by which the bundle must be done
+    :returns: the time in seconds, or None if the action must not be run again
+    """
+    # a retry would run past the bundle's deadline
+    try:
+        limit = time_limit(action, deadlines, ends)
+    except ActionTimeout:
+        return None
+    logger.info('Retrying action `%s`', action.__class__.__name__)
+    return limit
+
+
+def _give_up(
+    action: Action, deadlines: Optional[Deadlines], timeout: ActionTimeout
+) -> None:
+    """Apply the timeout policy to an action that ran out of time.
+
+    :param action: the action
+    :param deadlines: the time limits of the action's bundle, if it has any
+    :param timeout: the exception raised by its last run
+    :raises ActionClosed: for the close policy
+    :raises ActionTimeout: otherwise
+    """
+    policy = TimeoutPolicy.SKIP if deadlines is None else deadlines.policy
+    logger.warning(
+        'Action `%s` ran out of time: %s; policy `%s`',
+        action.__class__.__name__,
+        timeout,
+        policy.value,
+    )
+    if policy is not TimeoutPolicy.CLOSE:
+        raise timeout
+    run = _overruns.get(action)
+    # a run that is still going would race the tear down, so it closes the action
+    if run is None or not run.close_when_done():
+        action._close()
+    raise ActionClosed('Closed after running out of time') from timeout
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Running flagman on a thread of a host application.
+
+:func:`flagman.run` takes over the main thread until no actions remain, so it can't be
+used inside a service that has a main loop of its own. A :class:`Dispatcher` takes the
+action bundles on a thread of its own instead::
+
+    create_action_bundles({'usr1': [['print', 'reloading']]})
+    dispatcher = Dispatcher()
+    dispatcher.start()
+    ...
+    dispatcher.trigger('usr1')
+    ...
+    dispatcher.stop()
+
+Python runs signal handlers on the main thread, so the handlers installed by
+:meth:`Dispatcher.start` do nothing but write the signal number to a pipe that the
+dispatcher thread watches; the delivery is recorded and its bundle taken there. A
+delivery is forwarded as soon as the main thread runs Python code again, and
+:meth:`Dispatcher.trigger` writes to the same pipe from any thread. Signals read from a
+signalfd are read on the dispatcher thread directly, but only blocked in the main
+thread and the threads it starts afterwards, so start the dispatcher before the host
+starts its other threads to receive them with their payloads.
+
+The wakeup fd of the process is left alone, so it stays with the host, like an asyncio
+event loop running on the main thread.
+"""
+import logging
+import os
+import signal
+import threading
+from types import FrameType
+from typing import Callable, Dict, Optional, Union
+
+from flagman import core
+from flagman.core import (
+    ACTION_BUNDLES,
+    build_dispatch_plans,
+    HANDLED_SIGNALS,
+    set_handlers,
+    _log_signal_stats,
+)
+from flagman.loop import EventLoop
+from flagman.signals import parse_signal, signal_name
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+#: The byte written to the pipe to stop the dispatcher, since no signal has number 0
+_STOP = 0
+
+#: Type alias for a signal handler as returned by :func:`signal.getsignal`
+_Handler = Union[Callable[[int, Optional[FrameType]], object], int, None]
+
+
+class _Stopped(Exception):
+    """Raised on the dispatcher thread to leave the event loop."""
+
+
+class Dispatcher:
+    """Take the action bundles on a dedicated thread.
+
+    Can be used as a context manager that starts and stops the dispatcher.
+    """
+
+    def __init__(self, max_workers: int = 0) -> None:
+        """Create a dispatcher that is not started yet.
+
+        :param max_workers: the size of a thread pool to take actions on, like
+            :func:`flagman.run`; 0 to take them on the dispatcher thread
+        """
+        self._max_workers = max_workers
+        self._thread: Optional[threading.Thread] = None
+        self._read_fd = -1
+        self._write_fd = -1
+        self._old_handlers: Dict[SignalNumber, _Handler] = {}
+        self._error: Optional[BaseException] = None
+
+    def __enter__(self) -> 'Dispatcher':
+        """Start the dispatcher.
+
+        :returns: the dispatcher
+        """
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Stop the dispatcher."""
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        """Whether the dispatcher thread is taking actions."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Install the signal handlers and start the dispatcher thread.
+
+        Call this from the main thread once the action bundles are created.
+
+        :raises RuntimeError: if the dispatcher is already started
+        """
+        if self._thread is not None:
+            raise RuntimeError('dispatcher is already started')
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._write_fd, False)
+        self._old_handlers = {
+            signum: signal.getsignal(signum) for signum in HANDLED_SIGNALS
+        }
+        set_handlers(forward=self._forward)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._dispatch, name='flagman-dispatcher', daemon=True
+        )
+        self._thread.start()
+
+    def trigger(self, num: Union[SignalNumber, str]) -> None:
+        """Record a delivery of a signal, as if it was sent to the process.
+
+        May be called from any thread.
+
+        :param num: the signal number, or a name like `usr1` or `RTMIN+3`
+        :raises ValueError: if the signal is unknown or not handled
+        :raises RuntimeError: if the dispatcher is not running
+        """
+        if isinstance(num, str):
+            num = parse_signal(num)
+        if num not in HANDLED_SIGNALS:
+            raise ValueError('signal is not handled: {}'.format(signal_name(num)))
+        if not self.running:
+            raise RuntimeError('dispatcher is not running')
+        self._forward(num)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the dispatcher, close every action, and restore the signal handlers.
+
+        Bundles that are running are finished first; deliveries that are still waiting
+        are dropped. Every action is torn down on the dispatcher thread and removed from
+        its bundle. Call this from the main thread.
+
+        :param timeout: the longest time to wait for the dispatcher thread in seconds,
+            or None to wait until it is done
+        :raises Exception: the exception that stopped the dispatcher thread, if any
+        """
+        if self._thread is None:
+            return None
+        try:
+            os.write(self._write_fd, bytes((_STOP,)))
+        except BlockingIOError:
+            # the pipe is full, so the dispatcher has no time to wait; try again
+            os.set_blocking(self._write_fd, True)
+            os.write(self._write_fd, bytes((_STOP,)))
+        self._thread.join(timeout)
+        for signum, handler in self._old_handlers.items():
+            # None is a handler that was not installed from Python
+            signal.signal(signum, signal.SIG_DFL if handler is None else handler)
+        self._old_handlers = {}
+        if self._thread.is_alive():
+            logger.warning('Dispatcher thread did not stop in time; leaving it')
+        else:
+            os.close(self._read_fd)
+        os.close(self._write_fd)
+        self._thread = None
+        if core._signal_fd is not None:
+            core._signal_fd.close()
+            core._signal_fd = None
+        if self._error is not None:
+            raise self._error
+
+    def _forward(self, num: SignalNumber) -> None:
+        """Pass a delivery to the dispatcher thread.
+
+        :param num: the signal number
+        """
+        try:
+            os.write(self._write_fd, bytes((num,)))
+        except BlockingIOError:
+            logger.warning('Too many deliveries waiting; dropping %s', signal_name(num))
+
+    def _read_forwarded(self) -> None:
+        """Record the deliveries passed from other threads.
+
+        :raises _Stopped: once the dispatcher is asked to stop
+        """
+        for num in os.read(self._read_fd, 4096):
+            if num == _STOP:
+                raise _Stopped()
+            core.SIGNAL_FLAGS.add(num)
+
+    def _dispatch(self) -> None:
+        """Take the action bundles until stopped, then close the actions."""
+        loop = EventLoop()
+        executor = None
+        if self._max_workers > 0:
+            # concurrent.futures is slow to import, so only pay for it when it is used
+            from flagman.executors import ThreadPoolBundleExecutor
+
+            executor = ThreadPoolBundleExecutor(self._max_workers, loop.wake)
+        loop.add_reader(self._read_fd, self._read_forwarded)
+        if core._signal_fd is not None:
+            loop.add_reader(core._signal_fd.fileno(), core._read_signal_fd)
+        build_dispatch_plans()
+        logger.info('Starting dispatcher thread')
+        try:
+            if executor is None:
+                core._loop_forever(loop)
+            else:
+                core._loop_with_executor(loop, executor)
+        except _Stopped:
+            logger.info('Stopping dispatcher thread')
+        except BaseException as e:
+            logger.exception('Dispatcher thread failed')
+            self._error = e
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            _close_actions()
+            _log_signal_stats()
+            loop.close()
+
+
+def _close_actions() -> None:
+    """Tear down every action in the bundles and empty the bundles."""
+    closed = set()
+    for num, bundle in ACTION_BUNDLES.items():
+        for action in bundle:
+            if id(action) not in closed:
+                closed.add(id(action))
+                try:
+                    action._close()
+                except Exception:
+                    logger.exception(
+                        'Tear down of action `%s` failed', action.__class__.__name__
+                    )
+        ACTION_BUNDLES[num] = []
+    build_dispatch_plans()
@@ -5,3 +5,15 @@
 
 class ActionClosed(Exception):
     """The Action is closed and no longer will do anything on a call to `run()`."""
+
+
+class ConfigError(Exception):
+    """A config file can't be read or is not a valid configuration."""
+
+
+class ActionTimeout(Exception):
+    """The Action ran out of time and its run was given up."""
+
+
+class JournalError(Exception):
+    """A journal file can't be opened or read."""
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Executors that take the actions of a bundle off the event loop.
+
+By default :func:`flagman.run` takes every action itself, one after another.
+With an executor, the event loop hands each raised signal's bundle to the executor and
+goes back to waiting for signals, so different signals no longer wait on each other.
+The executor reports the outcome of every action back to the event loop, which removes
+closed actions and re-raises any other exception just like it does for its own runs.
+"""
+import functools
+import logging
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, KeysView, List, Optional, Sequence, Tuple, Union
+
+from flagman.actions import Action
+from flagman.deadlines import bundle_end, Deadlines, take_action
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.signals import SigInfo
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+#: The result of taking an action: the action, the exception it raised, if any, and
+#: how long it ran in seconds
+ActionOutcome = Tuple[Action, Optional[Exception], float]
+#: A finished bundle: the signal number and the outcome of each action that was taken
+BundleOutcome = Tuple[SignalNumber, List[ActionOutcome]]
+
+
+def ordering_chains(actions: Sequence[Action]) -> List[List[Action]]:
+    """Split a bundle into chains of actions that must be taken one after another.
+
+    Actions that share an :attr:`~flagman.Action.ordering_group` form one chain in their
+    bundle order. Every action without a group is a chain of its own.
+
+    :param actions: the actions of a bundle, in order
+    :returns: the chains
+    """
+    chains: Dict[Union[str, int], List[Action]] = {}
+    for action in actions:
+        key = action.ordering_group if action.ordering_group is not None else id(action)
+        chains.setdefault(key, []).append(action)
+    return list(chains.values())
+
+
+def take_chain(
+    chain: Sequence[Action],
+    siginfo: Optional[SigInfo] = None,
+    deadlines: Optional[Deadlines] = None,
+    ends: Optional[float] = None,
+) -> List[ActionOutcome]:
+    """Take the actions of a chain in order.
+
+    A closed action or one that ran out of time does not stop the chain, but any other
+    exception does.
+
+    :param chain: the actions
+    :param siginfo: the details of the delivery the actions are taken for
+    :param deadlines: the time limits of the bundle, if it has any
+    :param ends: the time by which the bundle must be done, from
+        :func:`~flagman.deadlines.bundle_end`
+    :returns: the outcome of each action that was taken
+    """
+    outcomes: List[ActionOutcome] = []
+    for action in chain:
+        start = time.perf_counter()
+        try:
+            take_action(action, siginfo, deadlines, ends)
+        except (ActionClosed, ActionTimeout) as e:
+            outcomes.append((action, e, time.perf_counter() - start))
+        except Exception as e:
+            outcomes.append((action, e, time.perf_counter() - start))
+            break
+        else:
+            outcomes.append((action, None, time.perf_counter() - start))
+    return outcomes
+
+
+class ThreadPoolBundleExecutor:
+    """Take the chains of each bundle concurrently on a bounded pool of threads."""
+
+    def __init__(self, max_workers: int, wake: Callable[[], None]) -> None:
+        """Create the thread pool.
+
+        :param max_workers: the maximum number of actions to take at once
+        :param wake: called from a worker thread when a bundle finishes;
+            should wake the event loop so it calls :meth:`completed`
+        """
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='flagman')
+        self._wake = wake
+        self._done: 'queue.SimpleQueue[BundleOutcome]' = queue.SimpleQueue()
+        self._remaining: Dict[SignalNumber, int] = {}
+        self._outcomes: Dict[SignalNumber, List[ActionOutcome]] = {}
+
+    @property
+    def running(self) -> KeysView[SignalNumber]:
+        """The signals whose bundles are being taken."""
+        return self._remaining.keys()
+
+    def submit(
+        self,
+        num: SignalNumber,
+        actions: Sequence[Action],
+        siginfo: Optional[SigInfo] = None,
+        deadlines: Optional[Deadlines] = None,
+    ) -> None:
+        """Start taking the actions of a bundle.
+
+        :param num: the signal number
+        :param actions: the actions of the signal's bundle, in order
+        :param siginfo: the details of the delivery the bundle is taken for
+        :param deadlines: the time limits of the bundle, if it has any
+        """
+        chains = ordering_chains(actions)
+        logger.debug(
+            'Submitting %d chains for signal number `%d` to the thread pool',
+            len(chains),
+            num,
+        )
+        self._remaining[num] = len(chains)
+        self._outcomes[num] = []
+        ends = bundle_end(deadlines)
+        for chain in chains:
+            future = self._pool.submit(take_chain, chain, siginfo, deadlines, ends)
+            future.add_done_callback(functools.partial(self._chain_done, num))
+
+    def completed(self) -> List[BundleOutcome]:
+        """Collect the bundles that finished since the last call.
+
+        Must be called from the event loop thread.
+
+        :returns: the finished bundles
+        """
+        finished: List[BundleOutcome] = []
+        while True:
+            try:
+                num, outcomes = self._done.get_nowait()
+            except queue.Empty:
+                return finished
+            self._outcomes[num].extend(outcomes)
+            self._remaining[num] -= 1
+            if self._remaining[num] == 0:
+                del self._remaining[num]
+                finished.append((num, self._outcomes.pop(num)))
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Stop accepting bundles.
+
+        :param wait: whether to wait for the running actions to finish
+        """
+        self._pool.shutdown(wait=wait)
+
+    def _chain_done(
+        self, num: SignalNumber, future: 'Future[List[ActionOutcome]]'
+    ) -> None:
+        """Pass a finished chain's outcomes to the event loop thread.
+
+        :param num: the signal number
+        :param future: the finished future
+        """
+        self._done.put((num, future.result()))
+        self._wake()
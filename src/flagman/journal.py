@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""A persistent journal of dispatched signals and action outcomes.
+
+While :data:`flagman.core.JOURNAL` is set, the dispatchers write a fixed-width record
+to a ring buffer for every event below. The ring buffer is a file mapped into memory,
+so a record costs one :meth:`struct.Struct.pack_into` and no system call, and records
+that were written survive a crash of flagman, since they are in the page cache. Once
+the ring buffer is full, the oldest records are overwritten.
+
+Each record has a sequence number, the wall clock time, and a kind:
+
+- `start`: flagman started; `pid` is its process ID.
+- `dispatch`: a signal's bundle was dispatched; `pid` is the sender of the latest
+  delivery if it is known, and `seconds` is how long the earliest delivery waited.
+- `action`: an action was taken; `name` is its class, `outcome` is `ok`, `error`,
+  `timeout` or `closed`, and `seconds` is how long it ran.
+- `done`: a signal's bundle finished; `handled` is how many of the signal's
+  deliveries were handled so far, so the difference to the previous `done` is how
+  many the run covered.
+
+Records are written from the event loop thread only. :func:`read_journal` decodes a
+journal file, whether it is in use, left behind by a crash, or closed; the records are
+ordered by their sequence numbers, so no state besides the records themselves is needed.
+Reopening an existing journal of the same size appends to it.
+"""
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed, ActionTimeout, JournalError
+from flagman.signals import SigInfo, signal_name
+from flagman.types import SignalNumber
+
+#: The default number of records a journal holds
+DEFAULT_CAPACITY = 16384
+
+#: The kinds of records, by their code in the journal
+KINDS = ('', 'start', 'dispatch', 'action', 'done')
+
+#: The outcomes of action records, by their code in the journal
+OUTCOMES = ('', 'ok', 'error', 'timeout', 'closed')
+
+_MAGIC = b'FLGJ'
+_VERSION = 1
+# magic, version, record size, capacity
+_HEADER = struct.Struct('<4sHHI')
+_HEADER_SIZE = 64
+# sequence number, time, kind, outcome, signal, pid, handled, seconds, name
+_RECORD = struct.Struct('<QdBBHIIf16s')
+
+_START, _DISPATCH, _ACTION, _DONE = range(1, 5)
+_OK, _ERROR, _TIMEOUT, _CLOSED = range(1, 5)
+
+
+class JournalRecord(NamedTuple):
+    """A decoded journal record."""
+
+    #: The sequence number, starting at 1 for the first record of the journal
+    seq: int
+    #: The wall clock time of the event, in seconds since the epoch
+    time: float
+    #: The kind of event: `start`, `dispatch`, `action` or `done`
+    kind: str
+    #: The signal number, or 0 for `start`
+    signal: SignalNumber
+    #: The outcome of an `action`, or an empty string
+    outcome: str
+    #: The process ID of flagman for `start`, or of the sender for `dispatch`
+    pid: int
+    #: The number of deliveries of the signal handled so far, for `done`
+    handled: int
+    #: The wait of a `dispatch` or run time of an `action`, in seconds
+    seconds: float
+    #: The class name of the action of an `action`, truncated to 16 bytes
+    name: str
+
+
+class Journal:
+    """A ring buffer of fixed-width records in a memory-mapped file."""
+
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY) -> None:
+        """Open a journal file, creating it or starting it over if it does not fit.
+
+        :param path: the path of the journal file
+        :param capacity: the number of records the journal holds
+        :raises JournalError: if the capacity is not positive or the file can't be
+            opened or mapped
+        """
+        if capacity < 1:
+            raise JournalError('journal capacity must be positive: {}'.format(capacity))
+        size = _HEADER_SIZE + capacity * _RECORD.size
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if not _fits(fd, size, capacity):
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, size)
+                    os.pwrite(
+                        fd, _HEADER.pack(_MAGIC, _VERSION, _RECORD.size, capacity), 0
+                    )
+                self._map = mmap.mmap(fd, size)
+            finally:
+                os.close(fd)
+        except (OSError, ValueError) as e:
+            raise JournalError('cannot open journal {}: {}'.format(path, e)) from e
+        self._capacity = capacity
+        written = _decode(self._map[:])
+        self._next = max((record.seq for record in written), default=0) + 1
+        self._names: Dict[type, bytes] = {}
+        self._write(_START, 0, 0, os.getpid(), 0, 0.0, b'')
+
+    def record_dispatch(
+        self, num: SignalNumber, latency: Optional[float], siginfo: Optional[SigInfo]
+    ) -> None:
+        """Record that a signal's bundle was dispatched.
+
+        :param num: the signal number
+        :param latency: the time between the delivery and the dispatch in seconds
+        :param siginfo: the details of the latest delivery, if known
+        """
+        pid = siginfo.pid if siginfo is not None else 0
+        self._write(_DISPATCH, num, 0, pid, 0, latency or 0.0, b'')
+
+    def record_action(
+        self,
+        num: SignalNumber,
+        action: Action,
+        exc: Optional[BaseException],
+        seconds: float,
+    ) -> None:
+        """Record a run of an action.
+
+        :param num: the number of the signal the action was taken for
+        :param action: the action
+        :param exc: the exception the action raised, if any
+        :param seconds: how long the action ran
+        """
+        if exc is None:
+            outcome = _OK
+        elif isinstance(exc, ActionClosed):
+            outcome = _CLOSED
+        elif isinstance(exc, ActionTimeout):
+            outcome = _TIMEOUT
+        else:
+            outcome = _ERROR
+        action_class = type(action)
+        try:
+            name = self._names[action_class]
+        except KeyError:
+            name = self._names[action_class] = action_class.__name__.encode()[:16]
+        self._write(_ACTION, num, outcome, 0, 0, seconds, name)
+
+    def record_done(self, num: SignalNumber, handled: int) -> None:
+        """Record that a signal's bundle finished.
+
+        :param num: the signal number
+        :param handled: how many of the signal's deliveries were handled so far
+        """
+        self._write(_DONE, num, 0, 0, handled, 0.0, b'')
+
+    def close(self) -> None:
+        """Write the journal back to its file and unmap it."""
+        self._map.flush()
+        self._map.close()
+
+    def _write(
+        self,
+        kind: int,
+        num: SignalNumber,
+        outcome: int,
+        pid: int,
+        handled: int,
+        seconds: float,
+        name: bytes,
+    ) -> None:
+        """Write a record over the oldest one once the journal is full.
+
+        :param kind: the code of the kind of record
+        :param num: the signal number
+        :param outcome: the code of the outcome
+        :param pid: the process ID
+        :param handled: the number of deliveries
+        :param seconds: the wait or run time in seconds
+        :param name: the encoded class name of the action
+        """
+        seq = self._next
+        self._next = seq + 1
+        offset = _HEADER_SIZE + (seq - 1) % self._capacity * _RECORD.size
+        _RECORD.pack_into(
+            self._map,
+            offset,
+            seq,
+            time.time(),
+            kind,
+            outcome,
+            num,
+            pid,
+            handled,
+            seconds,
+            name,
+        )
+
+
+def read_journal(path: str) -> List[JournalRecord]:
+    """Decode the records of a journal file, oldest first.
+
+    :param path: the path of the journal file
+    :returns: the records
+    :raises JournalError: if the file can't be read or is not a journal
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        raise JournalError('cannot read journal {}: {}'.format(path, e)) from e
+    if len(data) < _HEADER_SIZE:
+        raise JournalError('not a journal: {}'.format(path))
+    magic, version, record_size, capacity = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or record_size != _RECORD.size:
+        raise JournalError('not a journal of this version: {}'.format(path))
+    return sorted(_decode(data[: _HEADER_SIZE + capacity * _RECORD.size]))
+
+
+def format_record(record: JournalRecord) -> str:
+    """Format a record as a line of text.
+
+    :param record: the record
+    :returns: the line
+    """
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.time))
+    prefix = '{} {}.{:06d} {:<8}'.format(
+        record.seq, stamp, int(record.time % 1 * 1e6), record.kind
+    )
+    if record.kind == 'start':
+        return '{} pid={}'.format(prefix, record.pid)
+    name = signal_name(record.signal)
+    if record.kind == 'dispatch':
+        return '{} {} sender={} waited={:.6f}s'.format(
+            prefix, name, record.pid, record.seconds
+        )
+    if record.kind == 'action':
+        return '{} {} {} {} ran={:.6f}s'.format(
+            prefix, name, record.name, record.outcome, record.seconds
+        )
+    return '{} {} handled={}'.format(prefix, name, record.handled)
+
+
+def _fits(fd: int, size: int, capacity: int) -> bool:
+    """Check if an existing file is a journal that can be appended to.
+
+    :param fd: the open file
+    :param size: the size the journal should have
+    :param capacity: the number of records the journal should hold
+    :returns: whether the file is a journal of this version, size and capacity
+    """
+    if os.fstat(fd).st_size != size:
+        return False
+    header = os.pread(fd, _HEADER.size, 0)
+    return header == _HEADER.pack(_MAGIC, _VERSION, _RECORD.size, capacity)
+
+
+def _decode(data: bytes) -> List[JournalRecord]:
+    """Decode the records that were written in the ring buffer of a journal.
+
+    :param data: the journal, from the header to the end of the ring buffer
+    :returns: the records, in the order of the ring buffer
+    """
+    records = []
+    for fields in _RECORD.iter_unpack(data[_HEADER_SIZE:]):
+        seq, stamp, kind, outcome, num, pid, handled, seconds, name = fields
+        # slots that were never written are all zeros
+        if seq == 0 or not 0 < kind < len(KINDS) or outcome >= len(OUTCOMES):
+            continue
+        records.append(
+            JournalRecord(
+                seq,
+                stamp,
+                KINDS[kind],
+                num,
+                OUTCOMES[outcome],
+                pid,
+                handled,
+                seconds,
+                name.rstrip(b'\0').decode(errors='replace'),
+            )
+        )
+    return records
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""The flagman event loop.
+
+A small selector-based loop that is woken through :func:`signal.set_wakeup_fd`.
+
+The C-level signal handler writes a byte to the wakeup fd for every delivered signal,
+so a signal that arrives at any point--even between checking the flags and going back
+to sleep--makes the next call to :meth:`EventLoop.wait` return immediately.
+"""
+import logging
+import os
+import selectors
+import signal
+import time
+from types import TracebackType
+from typing import Callable, List, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+#: Type alias for a callback run by the event loop when a file descriptor is readable
+ReaderCallback = Callable[[], None]
+#: Type alias for a callback run by the event loop at a fixed interval
+PeriodicCallback = Callable[[], None]
+
+
+class EventLoop:
+    """An event loop that blocks in select/epoll until a signal or other event arrives.
+
+    Use the loop as a context manager to install and uninstall its wakeup fd.
+    Installation must happen from the main thread.
+    """
+
+    def __init__(self) -> None:
+        """Create the selector and the self-pipe used as the signal wakeup fd."""
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._old_wakeup_fd: Optional[int] = None
+        self._periodic: List[PeriodicCallback] = []
+        self._intervals: List[float] = []
+        self._deadlines: List[float] = []
+        self.add_reader(self._wakeup_read, self._drain_wakeup)
+
+    def __enter__(self) -> 'EventLoop':
+        """Install the wakeup fd.
+
+        :returns: the event loop
+        """
+        self.install()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        """Uninstall the wakeup fd and release the loop's resources."""
+        self.close()
+
+    def install(self) -> None:
+        """Make the self-pipe the process's signal wakeup fd."""
+        logger.debug('Installing signal wakeup fd %d', self._wakeup_write)
+        self._old_wakeup_fd = signal.set_wakeup_fd(
+            self._wakeup_write, warn_on_full_buffer=False
+        )
+
+    def close(self) -> None:
+        """Restore the previous wakeup fd and close the selector and self-pipe."""
+        if self._old_wakeup_fd is not None:
+            signal.set_wakeup_fd(self._old_wakeup_fd)
+            self._old_wakeup_fd = None
+        self._selector.close()
+        os.close(self._wakeup_read)
+        os.close(self._wakeup_write)
+
+    def wake(self) -> None:
+        """Wake the loop from any thread."""
+        try:
+            os.write(self._wakeup_write, b'\0')
+        except BlockingIOError:
+            # the pipe is full, so the loop is going to wake anyway
+            pass
+
+    def add_reader(self, fd: int, callback: ReaderCallback) -> None:
+        """Run `callback` whenever `fd` becomes readable.
+
+        :param fd: the file descriptor to watch
+        :param callback: a callable taking no arguments
+        """
+        self._selector.register(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd: int) -> None:
+        """Stop watching `fd`.
+
+        :param fd: the file descriptor to stop watching
+        """
+        self._selector.unregister(fd)
+
+    def call_every(self, interval: float, callback: PeriodicCallback) -> None:
+        """Run `callback` every `interval` seconds while the loop is waiting.
+
+        Periodic callbacks only run from :meth:`wait`, so they stop running while the
+        loop is busy taking actions.
+
+        :param interval: the time between calls in seconds
+        :param callback: a callable taking no arguments
+        """
+        self._periodic.append(callback)
+        self._intervals.append(interval)
+        self._deadlines.append(time.monotonic() + interval)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Block until a signal arrives or a watched fd is readable, then run callbacks.
+
+        :param timeout: the maximum time to wait in seconds, or None to wait forever
+        """
+        if self._deadlines:
+            until_periodic = max(min(self._deadlines) - time.monotonic(), 0.0)
+            if timeout is None or until_periodic < timeout:
+                timeout = until_periodic
+        for key, _events in self._selector.select(timeout):
+            callback: ReaderCallback = key.data
+            callback()
+        self._run_periodic()
+
+    def _run_periodic(self) -> None:
+        """Run the periodic callbacks that are due and schedule their next calls."""
+        now = time.monotonic()
+        for idx, deadline in enumerate(self._deadlines):
+            if deadline <= now:
+                interval = self._intervals[idx]
+                # skip missed calls instead of running them in a burst
+                self._deadlines[idx] = deadline + interval
+                if self._deadlines[idx] <= now:
+                    self._deadlines[idx] = now + interval
+                self._periodic[idx]()
+
+    def _drain_wakeup(self) -> None:
+        """Empty the self-pipe so the next select blocks again."""
+        try:
+            while os.read(self._wakeup_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
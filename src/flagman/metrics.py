@@ -0,0 +1,543 @@
+# -*- coding: utf-8 -*-
+"""Latency histograms and dispatch counters in the Prometheus text format.
+
+While :data:`flagman.core.METRICS` is set, the dispatchers record how long each signal
+waited between delivery and dispatch, how long each action ran, and whether the run
+succeeded, raised an exception, ran out of time, or closed the action. Recording happens
+on the event loop thread and costs around a microsecond per action, so metrics can stay
+on in production.
+
+A :class:`MetricsExporter` makes the metrics available in the Prometheus text
+exposition format, either by answering HTTP requests on a Unix socket or by atomically
+rewriting a file for the node exporter's textfile collector. The current pending depth,
+delivery counts and bundle sizes of each signal, the trigger counts of each
+throttled action, and the tick counts of each timer are read when the metrics are
+rendered.
+
+When flagman hosts tenants, the series of each signal also have a `tenant` label, which
+is empty for the signals of flagman itself; see :mod:`flagman.tenants`.
+"""
+import bisect
+import functools
+import logging
+import os
+import socket
+import weakref
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from flagman.actions import Action
+from flagman.core import (
+    ACTION_BUNDLES,
+    HANDLED_SIGNALS,
+    SIGNAL_FLAGS,
+    SIGNAL_TENANTS,
+)
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.loop import EventLoop, PeriodicCallback, ReaderCallback
+from flagman.signals import signal_name
+from flagman.throttle import throttle_stats
+from flagman.timers import timer_stats
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+#: The default upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+#: The outcomes of an action run that are counted
+OUTCOMES = ('ok', 'error', 'timeout', 'closed')
+
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: Type alias for the label names and values of a time series
+Labels = Sequence[Tuple[str, str]]
+
+
+class Histogram:
+    """A histogram with fixed buckets, like a Prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Create an empty histogram.
+
+        :param buckets: the sorted upper bounds of the buckets, without `+Inf`
+        """
+        self.buckets = tuple(buckets)
+        #: The number of observations in each bucket, not cumulative; the last is `+Inf`
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record an observation.
+
+        :param value: the observed value
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def render(self, name: str, labels: Labels) -> List[str]:
+        """Format the histogram as sample lines.
+
+        :param name: the metric name
+        :param labels: the labels of the histogram's time series
+        :returns: the lines, without the metric's `HELP` and `TYPE`
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(
+                _sample(name + '_bucket', [*labels, ('le', le)], cumulative)
+            )
+        lines.append(_sample(name + '_sum', labels, self.sum))
+        lines.append(_sample(name + '_count', labels, self.count))
+        return lines
+
+
+class ActionMetrics:
+    """The run time histogram and outcome counts of one action in one bundle."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        """Create the metrics with nothing recorded.
+
+        :param buckets: the bucket bounds of the run time histogram
+        """
+        self.run_time = Histogram(buckets)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+
+
+class Metrics:
+    """The metrics of a running flagman, recorded by the dispatchers."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Create the metrics with nothing recorded.
+
+        :param buckets: the bucket bounds of the histograms in seconds
+        """
+        self._buckets = buckets
+        self._latency: Dict[SignalNumber, Histogram] = {}
+        # keyed by the actions themselves, so the metrics of a removed action go away
+        # with it instead of being inherited by a new action that reuses its id
+        self._actions: Dict[
+            SignalNumber, 'weakref.WeakKeyDictionary[Action, ActionMetrics]'
+        ] = {}
+
+    def record_dispatch(self, num: SignalNumber, latency: Optional[float]) -> None:
+        """Record that a signal's bundle was dispatched.
+
+        :param num: the signal number
+        :param latency: the time between the delivery and the dispatch in seconds
+        """
+        if latency is None:
+            return None
+        try:
+            histogram = self._latency[num]
+        except KeyError:
+            histogram = self._latency[num] = Histogram(self._buckets)
+        histogram.observe(latency)
+
+    def record_action(
+        self,
+        num: SignalNumber,
+        action: Action,
+        exc: Optional[BaseException],
+        seconds: float,
+    ) -> None:
+        """Record a run of an action.
+
+        :param num: the number of the signal the action was taken for
+        :param action: the action
+        :param exc: the exception the action raised, if any
+        :param seconds: how long the action ran
+        """
+        try:
+            by_action = self._actions[num]
+        except KeyError:
+            by_action = self._actions[num] = weakref.WeakKeyDictionary()
+        try:
+            metrics = by_action[action]
+        except KeyError:
+            metrics = by_action[action] = ActionMetrics(self._buckets)
+        metrics.run_time.observe(seconds)
+        if exc is None:
+            metrics.outcomes['ok'] += 1
+        elif isinstance(exc, ActionClosed):
+            metrics.outcomes['closed'] += 1
+        elif isinstance(exc, ActionTimeout):
+            metrics.outcomes['timeout'] += 1
+        else:
+            metrics.outcomes['error'] += 1
+
+    def render(self) -> str:
+        """Format the metrics in the Prometheus text exposition format.
+
+        :returns: the text
+        """
+        lines = _header(
+            'flagman_dispatch_latency_seconds',
+            'histogram',
+            'Time between the delivery of a signal and the dispatch of its bundle.',
+        )
+        for num, histogram in sorted(self._latency.items()):
+            lines.extend(
+                histogram.render(
+                    'flagman_dispatch_latency_seconds', _signal_labels(num)
+                )
+            )
+
+        lines.extend(
+            _header(
+                'flagman_action_run_seconds', 'histogram', 'Run time of each action.'
+            )
+        )
+        actions = self._bundled_actions()
+        for labels, metrics in actions:
+            lines.extend(metrics.run_time.render('flagman_action_run_seconds', labels))
+
+        lines.extend(
+            _header(
+                'flagman_action_runs_total',
+                'counter',
+                'Runs of each action by outcome: ok, error, timeout, or closed.',
+            )
+        )
+        for labels, metrics in actions:
+            for outcome, count in metrics.outcomes.items():
+                lines.append(
+                    _sample(
+                        'flagman_action_runs_total',
+                        [*labels, ('outcome', outcome)],
+                        count,
+                    )
+                )
+
+        lines.extend(_render_set_up_times())
+        lines.extend(_render_throttles())
+        lines.extend(_render_timers())
+        lines.extend(_render_signal_state())
+        return '\n'.join(lines) + '\n'
+
+    def _bundled_actions(self) -> List[Tuple[Labels, ActionMetrics]]:
+        """Get the metrics of the actions that are in a bundle.
+
+        The labels are taken from the current bundles, so an action keeps its series
+        only while it is in the bundle and its position stays unique after reloads.
+
+        :returns: the labels and metrics of each action with recorded runs
+        """
+        actions = []
+        for num, by_action in sorted(self._actions.items()):
+            # an action shared within a bundle has one series, at its first position
+            for action in dict.fromkeys(ACTION_BUNDLES.get(num, ())):
+                metrics = by_action.get(action)
+                if metrics is not None:
+                    actions.append((_action_labels(num, action), metrics))
+        return actions
+
+
+def _action_labels(num: SignalNumber, action: Action) -> Labels:
+    """Get the labels identifying an action in a bundle.
+
+    :param num: the signal number
+    :param action: the action
+    :returns: the signal, the action class, and the action's position in its bundle
+    """
+    try:
+        position = str(ACTION_BUNDLES[num].index(action))
+    except (KeyError, ValueError):
+        position = ''
+    return [
+        *_signal_labels(num),
+        ('action', action.__class__.__name__),
+        ('position', position),
+    ]
+
+
+def _signal_labels(num: SignalNumber) -> Labels:
+    """Get the labels identifying a signal.
+
+    :param num: the signal number
+    :returns: the signal, and its tenant if flagman hosts tenants
+    """
+    if not SIGNAL_TENANTS:
+        return [('signal', signal_name(num))]
+    return [('signal', signal_name(num)), ('tenant', SIGNAL_TENANTS.get(num, ''))]
+
+
+def _render_set_up_times() -> List[str]:
+    """Format how long each action in the bundles took to set up.
+
+    :returns: the lines
+    """
+    name = 'flagman_action_set_up_seconds'
+    lines = _header(name, 'gauge', 'Time each action took to set up.')
+    for num in HANDLED_SIGNALS:
+        for action in ACTION_BUNDLES.get(num, ()):
+            seconds: Optional[float] = action._set_up_seconds
+            if seconds is not None:
+                lines.append(_sample(name, _action_labels(num, action), seconds))
+    return lines
+
+
+def _render_throttles() -> List[str]:
+    """Format how many triggers of each throttled action were held back.
+
+    An action shared between bundles is labelled with the first bundle it is in.
+
+    :returns: the lines
+    """
+    name = 'flagman_action_throttled_total'
+    lines = _header(
+        name,
+        'counter',
+        'Triggers of each throttled action by outcome: allowed, dropped, or deferred.',
+    )
+    throttles = throttle_stats()
+    for num in HANDLED_SIGNALS:
+        for action in ACTION_BUNDLES.get(num, ()):
+            throttle = throttles.pop(action, None)
+            if throttle is None:
+                continue
+            labels = _action_labels(num, action)
+            for outcome in ('allowed', 'dropped', 'deferred'):
+                count: int = getattr(throttle, outcome)
+                lines.append(_sample(name, [*labels, ('outcome', outcome)], count))
+    return lines
+
+
+def _render_timers() -> List[str]:
+    """Format how many ticks of each timer raised its signal's flag or were merged.
+
+    :returns: the lines
+    """
+    name = 'flagman_timer_ticks_total'
+    lines = _header(
+        name, 'counter', 'Ticks of each timer by outcome: fired, or merged into a run.'
+    )
+    for num, timers in sorted(timer_stats().items()):
+        for timer in timers:
+            labels = [*_signal_labels(num), ('timer', timer.spec)]
+            lines.append(_sample(name, [*labels, ('outcome', 'fired')], timer.fired))
+            lines.append(_sample(name, [*labels, ('outcome', 'merged')], timer.merged))
+    return lines
+
+
+def _render_signal_state() -> List[str]:
+    """Format the gauges and counters kept outside of :class:`Metrics`.
+
+    :returns: the lines
+    """
+    series: List[Tuple[str, str, str, Callable[[SignalNumber], int]]] = [
+        (
+            'flagman_signals_pending',
+            'gauge',
+            'Deliveries waiting to be dispatched.',
+            SIGNAL_FLAGS.pending,
+        ),
+        (
+            'flagman_bundle_actions',
+            'gauge',
+            'Open actions in the bundle of each signal.',
+            lambda num: len(ACTION_BUNDLES.get(num, ())),
+        ),
+    ]
+    for counter in ('delivered', 'dispatched', 'merged', 'dropped'):
+        series.append(
+            (
+                'flagman_signals_{}_total'.format(counter),
+                'counter',
+                'Deliveries of each signal that were {}.'.format(counter),
+                functools.partial(_stats_counter, counter),
+            )
+        )
+
+    lines = []
+    for name, metric_type, help_text, value in series:
+        lines.extend(_header(name, metric_type, help_text))
+        for num in HANDLED_SIGNALS:
+            lines.append(_sample(name, _signal_labels(num), value(num)))
+    return lines
+
+
+def _stats_counter(counter: str, num: SignalNumber) -> int:
+    """Read a delivery counter of a signal.
+
+    :param counter: the name of the counter, like `merged`
+    :param num: the signal number
+    :returns: the count
+    """
+    count: int = getattr(SIGNAL_FLAGS.stats(num), counter)
+    return count
+
+
+def _header(name: str, metric_type: str, help_text: str) -> List[str]:
+    """Format the `HELP` and `TYPE` lines of a metric.
+
+    :param name: the metric name
+    :param metric_type: the metric type, like `counter`
+    :param help_text: the description of the metric
+    :returns: the lines
+    """
+    return [
+        '# HELP {} {}'.format(name, help_text),
+        '# TYPE {} {}'.format(name, metric_type),
+    ]
+
+
+def _sample(name: str, labels: Labels, value: float) -> str:
+    """Format a sample line.
+
+    :param name: the metric name
+    :param labels: the label names and values
+    :param value: the sample value
+    :returns: the line
+    """
+    label_text = ','.join(
+        '{}="{}"'.format(
+            label,
+            text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'),
+        )
+        for label, text in labels
+    )
+    return '{}{{{}}} {}'.format(name, label_text, value)
+
+
+class MetricsExporter:
+    """Serve metrics on a Unix socket and write them to a textfile from the loop."""
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        socket_path: Optional[str] = None,
+        textfile: Optional[str] = None,
+        interval: float = 15.0,
+    ) -> None:
+        """Bind the socket, if any; nothing is served until the exporter is scheduled.
+
+        :param metrics: the metrics to export
+        :param socket_path: the path to serve metrics over HTTP on, if any; a stale
+            socket at the path is replaced
+        :param textfile: the path of a file to write the metrics to, if any
+        :param interval: the time between writes of the textfile in seconds
+        :raises OSError: if the socket can't be bound
+        """
+        self._metrics = metrics
+        self._textfile = textfile
+        self._interval = interval
+        self._socket: Optional[socket.socket] = None
+        self._socket_path = socket_path
+        if socket_path is not None:
+            try:
+                os.unlink(socket_path)
+            except FileNotFoundError:
+                pass
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.bind(socket_path)
+            self._socket.listen(8)
+            self._socket.setblocking(False)
+            logger.info('Serving metrics on `%s`', socket_path)
+
+    def periodic(self) -> List[Tuple[float, PeriodicCallback]]:
+        """Get the callbacks to run periodically and their intervals.
+
+        :returns: a list of intervals in seconds and callbacks
+        """
+        if self._textfile is None:
+            return []
+        return [(self._interval, self.write_textfile)]
+
+    def readers(self) -> List[Tuple[int, ReaderCallback]]:
+        """Get the file descriptors to watch and the callbacks to run when readable.
+
+        :returns: a list of file descriptors and callbacks
+        """
+        if self._socket is None:
+            return []
+        return [(self._socket.fileno(), self.accept)]
+
+    def schedule(self, loop: EventLoop) -> None:
+        """Serve and write the metrics from a flagman event loop.
+
+        :param loop: the event loop
+        """
+        for interval, callback in self.periodic():
+            loop.call_every(interval, callback)
+        for fd, reader in self.readers():
+            loop.add_reader(fd, reader)
+
+    def accept(self) -> None:
+        """Answer the waiting connections on the socket with the current metrics."""
+        if self._socket is None:
+            return None
+        body = None
+        while True:
+            try:
+                conn, _ = self._socket.accept()
+            except BlockingIOError:
+                return None
+            if body is None:
+                body = self._metrics.render().encode()
+            with conn:
+                self._respond(conn, body)
+
+    def _respond(self, conn: socket.socket, body: bytes) -> None:
+        """Send an HTTP response with the metrics, whatever the request was.
+
+        :param conn: the accepted connection
+        :param body: the rendered metrics
+        """
+        # the request is not needed, but a client should not have its request refused
+        conn.setblocking(False)
+        try:
+            conn.recv(4096)
+        except (BlockingIOError, ConnectionError):
+            pass
+        # don't let a client that does not read hold up the event loop
+        conn.settimeout(1.0)
+        head = 'HTTP/1.0 200 OK\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n'
+        try:
+            conn.sendall(head.format(_CONTENT_TYPE, len(body)).encode() + body)
+        except OSError as e:
+            logger.debug('Could not send metrics: %s', e)
+
+    def write_textfile(self) -> None:
+        """Atomically replace the textfile with the current metrics."""
+        if self._textfile is None:
+            return None
+        tmp_path = '{}.{}.tmp'.format(self._textfile, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(self._metrics.render())
+            os.replace(tmp_path, self._textfile)
+        except OSError:
+            logger.warning('Could not write metrics to `%s`', self._textfile)
+
+    def close(self) -> None:
+        """Write the textfile a last time and stop serving on the socket."""
+        self.write_textfile()
+        if self._socket is not None and self._socket_path is not None:
+            self._socket.close()
+            self._socket = None
+            try:
+                os.unlink(self._socket_path)
+            except OSError:
+                pass
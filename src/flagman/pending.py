@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""Bookkeeping for signals that have been delivered but not yet handled.
+
+Each handled signal has a delivery policy that decides how a burst of deliveries
+turns into runs of the signal's action bundle:
+
+- :attr:`SignalPolicy.COALESCE` runs the bundle once for any number of pending
+  deliveries and drops deliveries that arrive while the bundle is running.
+  This is flagman's original behavior.
+- :attr:`SignalPolicy.EVERY` runs the bundle once per delivery.
+- :attr:`SignalPolicy.DEBOUNCE` waits until no delivery has arrived for a time window,
+  then runs the bundle once for the whole burst.
+
+Real-time signals default to :attr:`SignalPolicy.EVERY`, since the kernel queues them
+instead of merging them; all other signals default to :attr:`SignalPolicy.COALESCE`.
+
+When several signals are ready at once, the one with the highest priority is
+dispatched first. Signals start at priority 0, and a ready signal gains one level of
+priority for every :attr:`PendingSignals.aging` seconds it has waited, so a signal with
+a low priority is only delayed, never starved, by a busy signal with a higher one.
+Among signals with the same priority, the one that has waited longest goes first.
+"""
+import collections
+import enum
+import time
+from typing import Container, Deque, Dict, Iterator, Optional, Tuple
+
+from flagman.signals import is_realtime, SigInfo
+from flagman.types import SignalNumber
+
+
+class SignalPolicy(enum.Enum):
+    """How deliveries of a signal are turned into runs of its action bundle."""
+
+    COALESCE = 'coalesce'
+    EVERY = 'every'
+    DEBOUNCE = 'debounce'
+
+
+def parse_policy(value: str) -> Tuple[SignalPolicy, float]:
+    """Parse a delivery policy like `coalesce`, `every`, or `debounce:1.5`.
+
+    :param value: the policy string
+    :returns: the policy and its debounce window in seconds
+    :raises ValueError: if the policy is unknown or the window is not a number
+    """
+    name, _, window = value.partition(':')
+    try:
+        return SignalPolicy(name), float(window) if window else 0.0
+    except ValueError:
+        raise ValueError('invalid policy: {!r}'.format(value)) from None
+
+
+class SignalStats:
+    """Delivery counters for a single signal."""
+
+    def __init__(self) -> None:
+        """Start all counters at zero."""
+        #: The number of times the signal was delivered
+        self.delivered = 0
+        #: The number of times the signal's action bundle was run
+        self.dispatched = 0
+        #: The number of deliveries that were folded into a run for another delivery
+        self.merged = 0
+        #: The number of deliveries discarded because they arrived during a run
+        self.dropped = 0
+        #: The number of runs of the signal's action bundle that have finished
+        self.finished = 0
+        #: The total time in seconds of the finished runs
+        self.run_time = 0.0
+        #: The time in seconds of the longest finished run
+        self.max_run_time = 0.0
+
+    def __repr__(self) -> str:
+        """Show the counters."""
+        return (
+            '{}(delivered={}, dispatched={}, merged={}, dropped={}, finished={}, '
+            'run_time={:.3f})'.format(
+                self.__class__.__name__,
+                self.delivered,
+                self.dispatched,
+                self.merged,
+                self.dropped,
+                self.finished,
+                self.run_time,
+            )
+        )
+
+
+class PendingSignals:
+    """Counted pending signals with a delivery policy for each signal.
+
+    :meth:`add` is called from signal handlers and is the only writer of the delivery
+    counts; everything else is only called from the event loop and is the only writer
+    of the consumed counts. This keeps the handler from racing the loop without locks.
+    Deliveries made from the event loop itself, like triggers from the control socket,
+    are counted separately by :meth:`trigger` for the same reason.
+
+    Deliveries read from a :class:`~flagman.signals.SignalFD` come with a
+    :class:`~flagman.signals.SigInfo`. The info of the delivery a run was popped for is
+    available from :meth:`siginfo` until the run is discarded.
+    """
+
+    def __init__(self) -> None:
+        """Create empty bookkeeping; every signal starts with the coalesce policy."""
+        self._delivered: Dict[SignalNumber, int] = {}
+        self._triggered: Dict[SignalNumber, int] = {}
+        self._last_delivery: Dict[SignalNumber, float] = {}
+        self._consumed: Dict[SignalNumber, int] = {}
+        self._policies: Dict[SignalNumber, Tuple[SignalPolicy, float]] = {}
+        self._stats: Dict[SignalNumber, SignalStats] = {}
+        self._running_since: Dict[SignalNumber, float] = {}
+        self._infos: Dict[SignalNumber, Deque[SigInfo]] = {}
+        self._current_info: Dict[SignalNumber, SigInfo] = {}
+        self._arrivals: Dict[SignalNumber, Deque[float]] = {}
+        self._latency: Dict[SignalNumber, float] = {}
+        self._priorities: Dict[SignalNumber, int] = {}
+        #: The time in seconds a ready signal has to wait to gain one level of priority,
+        #: or 0 to only break ties by waiting time
+        self.aging = 1.0
+
+    def set_policy(
+        self, num: SignalNumber, policy: SignalPolicy, window: float = 0.0
+    ) -> None:
+        """Set the delivery policy for a signal.
+
+        :param num: the signal number
+        :param policy: the policy
+        :param window: for the debounce policy, the quiet time in seconds to wait for
+        """
+        self._policies[num] = (policy, window)
+
+    def policy(self, num: SignalNumber) -> Tuple[SignalPolicy, float]:
+        """Get the delivery policy for a signal.
+
+        :param num: the signal number
+        :returns: the policy and its debounce window
+        """
+        try:
+            return self._policies[num]
+        except KeyError:
+            pass
+        if is_realtime(num):
+            return SignalPolicy.EVERY, 0.0
+        return SignalPolicy.COALESCE, 0.0
+
+    def set_priority(self, num: SignalNumber, priority: int) -> None:
+        """Set the priority of a signal; higher priorities are dispatched first.
+
+        :param num: the signal number
+        :param priority: the priority
+        """
+        if priority:
+            self._priorities[num] = priority
+        else:
+            self._priorities.pop(num, None)
+
+    def priority(self, num: SignalNumber) -> int:
+        """Get the priority of a signal.
+
+        :param num: the signal number
+        :returns: the priority
+        """
+        return self._priorities.get(num, 0)
+
+    def outranked(self, num: SignalNumber) -> bool:
+        """Check if any signal has a higher priority than a signal.
+
+        :param num: the signal number
+        :returns: whether a run of the signal's bundle could be preempted
+        """
+        priority = self.priority(num)
+        return any(other > priority for other in self._priorities.values())
+
+    def add(self, num: SignalNumber, info: Optional[SigInfo] = None) -> None:
+        """Record a delivery of a signal. Safe to call from a signal handler.
+
+        :param num: the signal number
+        :param info: the details of the delivery, if they are known
+        """
+        if info is not None:
+            self._infos.setdefault(num, collections.deque()).append(info)
+        now = self._last_delivery[num] = time.monotonic()
+        self._arrivals.setdefault(num, collections.deque()).append(now)
+        self._delivered[num] = self._delivered.get(num, 0) + 1
+
+    def trigger(self, num: SignalNumber, info: Optional[SigInfo] = None) -> int:
+        """Record a delivery of a signal made from the event loop, not by the kernel.
+
+        :param num: the signal number
+        :param info: the details of the delivery, if the signal's deliveries have them
+        :returns: the position of the delivery among all deliveries of the signal; the
+            delivery is handled once :meth:`consumed` reaches it
+        """
+        if info is not None:
+            self._infos.setdefault(num, collections.deque()).append(info)
+        now = self._last_delivery[num] = time.monotonic()
+        self._arrivals.setdefault(num, collections.deque()).append(now)
+        self._triggered[num] = self._triggered.get(num, 0) + 1
+        return self._delivered.get(num, 0) + self._triggered[num]
+
+    def pending(self, num: SignalNumber) -> int:
+        """Count the deliveries of a signal that have not been handled.
+
+        :param num: the signal number
+        :returns: the number of pending deliveries
+        """
+        delivered = self._delivered.get(num, 0) + self._triggered.get(num, 0)
+        return delivered - self._consumed.get(num, 0)
+
+    def consumed(self, num: SignalNumber) -> int:
+        """Count the deliveries of a signal that were dispatched, merged, or dropped.
+
+        :param num: the signal number
+        :returns: the number of handled deliveries
+        """
+        return self._consumed.get(num, 0)
+
+    def __bool__(self) -> bool:
+        """Check if any signal is ready to be dispatched."""
+        return next(self._ready(), None) is not None
+
+    def pop(
+        self, busy: Container[SignalNumber] = (), above: Optional[int] = None
+    ) -> SignalNumber:
+        """Take the ready signal that goes first by priority and waiting time.
+
+        :param busy: signals to skip, for example because their actions are running
+        :param above: if given, only take a signal whose priority is higher than this
+        :returns: the signal number
+        :raises KeyError: if no signal is ready
+        """
+        num = self._first(busy, above)
+        if num is None:
+            raise KeyError('pop from empty PendingSignals')
+
+        pending = self.pending(num)
+        stats = self.stats(num)
+        policy, _window = self.policy(num)
+        consumed = 1 if policy is SignalPolicy.EVERY else pending
+        self._consumed[num] = self._consumed.get(num, 0) + consumed
+        stats.merged += consumed - 1
+        self._take_infos(num, consumed)
+        stats.dispatched += 1
+        now = self._running_since[num] = time.monotonic()
+        oldest = self._take_arrivals(num, consumed)
+        if oldest is not None:
+            self._latency[num] = now - oldest
+        return num
+
+    def discard(self, num: SignalNumber) -> None:
+        """Finish a run of a signal's action bundle.
+
+        Under the coalesce policy, deliveries that arrived during the run are dropped.
+
+        :param num: the signal number
+        """
+        started = self._running_since.pop(num, None)
+        if started is not None:
+            stats = self.stats(num)
+            run_time = time.monotonic() - started
+            stats.finished += 1
+            stats.run_time += run_time
+            stats.max_run_time = max(stats.max_run_time, run_time)
+
+        policy, _window = self.policy(num)
+        if policy is SignalPolicy.COALESCE:
+            pending = self.pending(num)
+            self._consumed[num] = self._consumed.get(num, 0) + pending
+            self.stats(num).dropped += pending
+            self._take_infos(num, pending)
+            self._take_arrivals(num, pending)
+        self._current_info.pop(num, None)
+        self._latency.pop(num, None)
+
+    def clear(self) -> None:
+        """Forget all pending deliveries without counting them as dropped."""
+        for num in list(self._last_delivery):
+            self._consumed[num] = self._consumed.get(num, 0) + self.pending(num)
+        for infos in self._infos.values():
+            infos.clear()
+        for arrivals in self._arrivals.values():
+            arrivals.clear()
+
+    def siginfo(self, num: SignalNumber) -> Optional[SigInfo]:
+        """Get the details of the delivery the running bundle of a signal is for.
+
+        When deliveries were merged into one run, this is the latest of them.
+
+        :param num: the signal number
+        :returns: the details, or None if they are not known
+        """
+        return self._current_info.get(num)
+
+    def timeout(self) -> Optional[float]:
+        """Get the time until a debounced signal becomes ready.
+
+        :returns: the time in seconds, or None if no debounced signal is waiting
+        """
+        now = time.monotonic()
+        timeouts = []
+        for num in list(self._last_delivery):
+            policy, window = self.policy(num)
+            if policy is SignalPolicy.DEBOUNCE and self.pending(num) > 0:
+                timeouts.append(max(self._last_delivery[num] + window - now, 0.0))
+        return min(timeouts, default=None)
+
+    def latency(self, num: SignalNumber) -> Optional[float]:
+        """Get how long the running bundle of a signal waited to be dispatched.
+
+        When deliveries were merged into one run, this is measured from the earliest.
+
+        :param num: the signal number
+        :returns: the delay in seconds, or None if the bundle is not running
+        """
+        return self._latency.get(num)
+
+    def running(self, num: SignalNumber) -> bool:
+        """Check if the action bundle of a signal is running.
+
+        :param num: the signal number
+        :returns: whether a run was popped and has not been discarded yet
+        """
+        return num in self._running_since
+
+    def oldest_run(self) -> Optional[float]:
+        """Get the start time of the longest-running bundle that has not finished.
+
+        :returns: the :func:`time.monotonic` time the bundle was popped, or None if no
+            bundle is running
+        """
+        return min(self._running_since.values(), default=None)
+
+    def stats(self, num: SignalNumber) -> SignalStats:
+        """Get the delivery counters for a signal.
+
+        :param num: the signal number
+        :returns: the counters
+        """
+        # delivered is derived from the handler-owned count on every access
+        stats = self._stats.setdefault(num, SignalStats())
+        stats.delivered = self._delivered.get(num, 0) + self._triggered.get(num, 0)
+        return stats
+
+    def _take_infos(self, num: SignalNumber, count: int) -> None:
+        """Consume the details of deliveries, keeping the latest as the current one.
+
+        :param num: the signal number
+        :param count: the number of deliveries consumed
+        """
+        infos = self._infos.get(num)
+        if not infos:
+            return None
+        for _ in range(min(count, len(infos))):
+            self._current_info[num] = infos.popleft()
+
+    def _take_arrivals(self, num: SignalNumber, count: int) -> Optional[float]:
+        """Consume the arrival times of deliveries.
+
+        :param num: the signal number
+        :param count: the number of deliveries consumed
+        :returns: the earliest arrival time consumed, or None if none were
+        """
+        arrivals = self._arrivals.get(num)
+        if not arrivals:
+            return None
+        oldest = arrivals[0]
+        for _ in range(min(count, len(arrivals))):
+            arrivals.popleft()
+        return oldest
+
+    def _first(
+        self, busy: Container[SignalNumber], above: Optional[int]
+    ) -> Optional[SignalNumber]:
+        """Find the ready signal with the highest aged priority.
+
+        :param busy: signals to skip
+        :param above: if given, skip signals whose priority is not higher than this
+        :returns: the signal number, or None if no signal is ready
+        """
+        now = time.monotonic()
+        first = None
+        first_rank = (0.0, 0.0)
+        for num in self._ready():
+            if num in busy:
+                continue
+            priority = self.priority(num)
+            if above is not None and priority <= above:
+                continue
+            arrivals = self._arrivals.get(num)
+            waited = now - arrivals[0] if arrivals else 0.0
+            aged = waited / self.aging if self.aging > 0 else 0.0
+            rank = (priority + aged, waited)
+            if first is None or rank > first_rank:
+                first, first_rank = num, rank
+        return first
+
+    def _ready(self) -> Iterator[SignalNumber]:
+        """Yield the signals that are ready to be dispatched."""
+        now = time.monotonic()
+        for num in list(self._last_delivery):
+            if self.pending(num) <= 0:
+                continue
+            policy, window = self.policy(num)
+            quiet = now - self._last_delivery[num]
+            if policy is SignalPolicy.DEBOUNCE and quiet < window:
+                continue
+            yield num
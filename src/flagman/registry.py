@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""The lazy registry of installed actions.
+
+Action names are read from the `flagman.action` entry point group without importing
+anything, and an action's module is only imported the first time the action is looked
+up. This keeps startup fast in environments with many installed action plugins.
+
+Scanning the installed distributions for entry points can itself be slow in large
+environments. Setting the :envvar:`FLAGMAN_ACTION_CACHE` environment variable to a file
+path keeps an index of the entry points in that file. The index is rebuilt whenever the
+modification time of a directory on :data:`sys.path` changes, as it does when a package
+is installed or removed. The index also keeps the descriptions of the actions once they
+have been read, so `flagman --list` does not import every action on each call.
+"""
+import importlib
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Type
+
+from flagman.actions import Action
+from flagman.types import ActionName
+
+logger = logging.getLogger(__name__)
+
+#: The environment variable holding the path of the on-disk entry point index
+CACHE_ENV_VAR = 'FLAGMAN_ACTION_CACHE'
+
+#: Type alias for the modification times of the directories on sys.path
+Fingerprint = List[Tuple[str, int]]
+
+
+def load_entry_point(value: str) -> Type[Action]:
+    """Import the object an entry point refers to.
+
+    :param value: the entry point value, like `package.module:Class`
+    :returns: the object
+    """
+    module_name, _, attrs = value.partition(':')
+    obj = importlib.import_module(module_name.strip())
+    for attr in attrs.split('[')[0].strip().split('.'):
+        if attr:
+            obj = getattr(obj, attr)
+    action: Type[Action] = obj  # type: ignore
+    return action
+
+
+def scan_entry_points(group: str) -> Dict[ActionName, str]:
+    """Read the names and values of the entry points in a group without loading them.
+
+    :param group: the entry point group
+    :returns: a mapping of entry point names to values
+    """
+    # importing importlib.metadata is slow, and not needed when the index is fresh
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        from importlib_metadata import entry_points  # type: ignore
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        selected = eps.select(group=group)
+    else:  # Python < 3.10
+        selected = eps.get(group, [])  # type: ignore
+    return {ep.name: ep.value for ep in selected}
+
+
+def sys_path_fingerprint() -> Fingerprint:
+    """Get the modification times of the directories on sys.path.
+
+    :returns: a list of paths and modification times in nanoseconds
+    """
+    fingerprint = []
+    for path in sys.path:
+        try:
+            fingerprint.append((path, os.stat(path or '.').st_mtime_ns))
+        except OSError:
+            continue
+    return fingerprint
+
+
+class ActionRegistry(Mapping[ActionName, Type[Action]]):
+    """A read-only mapping of action names to Action classes, loaded on first lookup."""
+
+    def __init__(self, group: str, cache_path: Optional[str] = None) -> None:
+        """Create the registry; nothing is scanned or imported yet.
+
+        :param group: the entry point group to read actions from
+        :param cache_path: the path of the on-disk index; defaults to the value of the
+            :envvar:`FLAGMAN_ACTION_CACHE` environment variable, if set
+        """
+        self._group = group
+        self._cache_path = cache_path
+        self._entry_points: Optional[Dict[ActionName, str]] = None
+        self._descriptions: Optional[Dict[ActionName, str]] = None
+        self._fingerprint: Fingerprint = []
+        self._loaded: Dict[ActionName, Type[Action]] = {}
+
+    @property
+    def entry_points(self) -> Dict[ActionName, str]:
+        """The names and values of the entry points, scanned on first access."""
+        if self._entry_points is None:
+            self._entry_points = self._read_index()
+        return self._entry_points
+
+    @property
+    def descriptions(self) -> Dict[ActionName, str]:
+        """The docstrings of the actions, from the index if possible.
+
+        Without a fresh index, every action is imported to read its docstring, and the
+        docstrings are added to the index for the next time.
+        """
+        entry_points = self.entry_points
+        if self._descriptions is None:
+            self._descriptions = {
+                name: ' '.join(str(self[name].__doc__).split())
+                for name in entry_points
+            }
+            cache_path = self._cache_path_or_env()
+            if cache_path:
+                self._write_index(cache_path)
+        return self._descriptions
+
+    def __getitem__(self, name: ActionName) -> Type[Action]:
+        """Get an Action class, importing its module if needed.
+
+        :param name: the action name
+        :returns: the Action class
+        :raises KeyError: if no action has the name
+        """
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        value = self.entry_points[name]
+        logger.debug('Loading action `%s` from `%s`', name, value)
+        action = self._loaded[name] = load_entry_point(value)
+        return action
+
+    def __iter__(self) -> Iterator[ActionName]:
+        """Iterate over the action names without importing anything."""
+        return iter(self.entry_points)
+
+    def __len__(self) -> int:
+        """Count the actions without importing anything."""
+        return len(self.entry_points)
+
+    def __contains__(self, name: object) -> bool:
+        """Check for an action name without importing anything."""
+        return name in self.entry_points
+
+    def _cache_path_or_env(self) -> Optional[str]:
+        """Get the path of the on-disk index, if there is one.
+
+        :returns: the path, or None to not keep an index
+        """
+        return self._cache_path or os.environ.get(CACHE_ENV_VAR) or None
+
+    def _read_index(self) -> Dict[ActionName, str]:
+        """Read the entry points from the on-disk index, rebuilding it if it is stale.
+
+        :returns: a mapping of entry point names to values
+        """
+        cache_path = self._cache_path_or_env()
+        if not cache_path:
+            return scan_entry_points(self._group)
+
+        self._fingerprint = sys_path_fingerprint()
+        try:
+            with open(cache_path) as f:
+                index = json.load(f)
+            if index['group'] == self._group and [
+                tuple(entry) for entry in index['fingerprint']
+            ] == self._fingerprint:
+                cached: Dict[ActionName, str] = index['entry_points']
+                self._descriptions = index.get('descriptions')
+                return cached
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.debug('Action index `%s` is missing or unreadable', cache_path)
+
+        logger.debug('Rebuilding action index `%s`', cache_path)
+        scanned = self._entry_points = scan_entry_points(self._group)
+        self._write_index(cache_path)
+        return scanned
+
+    def _write_index(self, cache_path: str) -> None:
+        """Atomically replace the on-disk index with the current entry points.
+
+        :param cache_path: the path of the on-disk index
+        """
+        index = {
+            'group': self._group,
+            'fingerprint': self._fingerprint,
+            'entry_points': self._entry_points,
+            'descriptions': self._descriptions,
+        }
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            logger.warning('Could not write action index `%s`', cache_path)
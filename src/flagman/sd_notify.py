@@ -24,10 +24,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import array
 import os
 import socket
 import sys
-from typing import Optional
+from typing import Dict, List, Mapping, MutableMapping, Optional, Sequence
 
 __version__ = '0.3.2'
 
@@ -46,13 +47,71 @@ else:
         return x.encode('latin-1')
 
 
+#: The first file descriptor passed by systemd, see sd_listen_fds(3)
+SD_LISTEN_FDS_START = 3
+
+
+def watchdog_usec(environ: Mapping[str, str] = os.environ) -> Optional[int]:
+    """Get the watchdog timeout systemd expects keepalives within.
+
+    See sd_watchdog_enabled(3).
+
+    :param environ: the environment to read `WATCHDOG_USEC` and `WATCHDOG_PID` from
+    :returns: the timeout in microseconds, or None if the watchdog is not enabled for
+        this process
+    """
+    try:
+        usec = int(environ['WATCHDOG_USEC'])
+        if 'WATCHDOG_PID' in environ and int(environ['WATCHDOG_PID']) != os.getpid():
+            return None
+    except (KeyError, ValueError):
+        return None
+    return usec if usec > 0 else None
+
+
+def listen_fds(
+    unset_environment: bool = True, environ: MutableMapping[str, str] = os.environ
+) -> Dict[str, List[int]]:
+    """Get the file descriptors systemd passed to this process, grouped by name.
+
+    These are the sockets from socket activation and the file descriptors that were
+    kept in the service's file descriptor store. See sd_listen_fds_with_names(3).
+    The file descriptors are marked close-on-exec.
+
+    :param unset_environment: remove the `LISTEN_*` variables so that child processes
+        don't also try to use the file descriptors
+    :param environ: the environment to read the `LISTEN_*` variables from
+    :returns: a mapping of names to lists of file descriptors; unnamed file
+        descriptors are named `unknown`
+    """
+    names = environ.get('LISTEN_FDNAMES', '').split(':')
+    try:
+        if int(environ['LISTEN_PID']) != os.getpid():
+            return {}
+        count = int(environ['LISTEN_FDS'])
+    except (KeyError, ValueError):
+        return {}
+    finally:
+        if unset_environment:
+            for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+                environ.pop(name, None)
+
+    fds: Dict[str, List[int]] = {}
+    for idx in range(count):
+        fd = SD_LISTEN_FDS_START + idx
+        os.set_inheritable(fd, False)
+        name = names[idx] if idx < len(names) and names[idx] else 'unknown'
+        fds.setdefault(name, []).append(fd)
+    return fds
+
+
 class SystemdNotifier:
     """This class holds a connection to the systemd notification socket.
 
     It can be used to send messages to systemd using its notify method.
     """
 
-    def __init__(self, debug: bool = False) -> None:
+    def __init__(self, debug: bool = False, address: Optional[str] = None) -> None:
         """Instantiate a new notifier object.
 
         This will initiate a connection to the systemd notification socket.
@@ -62,6 +121,9 @@ class SystemdNotifier:
         function on non-systemd based systems. However, setting debug=True will
         cause this method to raise any exceptions generated to the caller, to
         aid in debugging.
+
+        The socket address is read from the `NOTIFY_SOCKET` environment variable unless
+        `address` is given, for example to talk to a stand-in socket in tests.
         """
         self.debug = debug
 
@@ -69,12 +131,12 @@ class SystemdNotifier:
             self.socket: Optional[socket.socket] = socket.socket(
                 socket.AF_UNIX, socket.SOCK_DGRAM
             )
-            addr = os.getenv('NOTIFY_SOCKET')
+            addr = address or os.getenv('NOTIFY_SOCKET')
             assert addr is not None  # noqa: S101 (assert)
             if addr[0] == '@':
                 addr = '\0' + addr[1:]
             self.socket.connect(addr)
-        except:  # noqa: E722 (bare except)
+        except Exception:
             self.socket = None
             if self.debug:
                 raise
@@ -95,6 +157,22 @@ class SystemdNotifier:
         try:
             assert self.socket is not None  # noqa: S101 (assert)
             self.socket.sendall(_b(state))
-        except:  # noqa: E722
+        except Exception:
+            if self.debug:
+                raise
+
+    def notify_with_fds(self, state: str, fds: Sequence[int]) -> None:
+        """Send a notification to systemd along with file descriptors.
+
+        This is how file descriptors are handed to the service's file descriptor
+        store with `FDSTORE=1`.
+
+        Exceptions are ignored unless debug=True, just like for :meth:`notify`.
+        """
+        try:
+            assert self.socket is not None  # noqa: S101 (assert)
+            ancillary = (socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))
+            self.socket.sendmsg([_b(state)], [ancillary])
+        except Exception:
             if self.debug:
                 raise
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Signal names, real-time signals and siginfo payloads.
+
+Any catchable signal can be handled, including the real-time signals `SIGRTMIN+n` and
+`SIGRTMAX-n`. Real-time signals are queued by the kernel instead of being merged, so
+they default to the :attr:`~flagman.pending.SignalPolicy.EVERY` delivery policy.
+
+A signal sent with :func:`sigqueue` carries an integer payload. Python's signal handlers
+cannot see it, and they run once for deliveries of a signal that arrive together. So
+real-time signals and signals whose actions want the payload are blocked and read from
+a :class:`SignalFD` instead, which yields a :class:`SigInfo` for every delivery.
+:class:`SignalFD` uses the Linux `signalfd(2)` system call through :mod:`ctypes`.
+"""
+import logging
+import os
+import signal
+import struct
+from typing import Iterable, List, NamedTuple, Optional, Set, TYPE_CHECKING
+
+from flagman.types import SignalNumber
+
+if TYPE_CHECKING:  # pragma: no cover
+    import ctypes  # noqa: F401 (unused import)
+
+# ctypes is slow to import and only needed for signal payloads, so it is imported where
+# it is used
+
+logger = logging.getLogger(__name__)
+
+#: Signals that can't be caught
+UNCATCHABLE_SIGNALS = {signal.SIGKILL, signal.SIGSTOP}
+
+# struct signalfd_siginfo, see signalfd(2); only the fields flagman uses are unpacked
+_SIGNALFD_SIGINFO = struct.Struct('IiiII')
+_SIGNALFD_SIGINFO_INT = struct.Struct('i')
+_SIGNALFD_SIGINFO_INT_OFFSET = 44
+_SIGNALFD_SIGINFO_SIZE = 128
+
+
+class SigInfo(NamedTuple):
+    """The details of a single delivery of a signal."""
+
+    #: The signal number
+    signo: SignalNumber
+    #: Why the signal was sent, like `SI_USER` for kill(2) or `SI_QUEUE` for sigqueue(3)
+    code: int
+    #: The process ID of the sender
+    pid: int
+    #: The real user ID of the sender
+    uid: int
+    #: The integer payload passed to sigqueue(3); 0 for other senders
+    value: int
+
+
+def is_realtime(num: SignalNumber) -> bool:
+    """Check if a signal is a real-time signal.
+
+    :param num: the signal number
+    :returns: whether the signal is between `SIGRTMIN` and `SIGRTMAX`
+    """
+    rtmin = getattr(signal, 'SIGRTMIN', None)
+    rtmax = getattr(signal, 'SIGRTMAX', None)
+    return rtmin is not None and rtmax is not None and rtmin <= num <= rtmax
+
+
+def signal_name(num: SignalNumber) -> str:
+    """Get the name of a signal, like `SIGUSR1` or `SIGRTMIN+3`.
+
+    :param num: the signal number
+    :returns: the name
+    """
+    if is_realtime(num) and num != signal.SIGRTMIN and num != signal.SIGRTMAX:
+        return 'SIGRTMIN+{}'.format(num - signal.SIGRTMIN)
+    try:
+        return signal.Signals(num).name
+    except ValueError:
+        return 'SIG{}'.format(num)
+
+
+def parse_signal(name: str) -> SignalNumber:
+    """Get the number of a catchable signal from its name or number.
+
+    Names are case-insensitive and the `SIG` prefix is optional, so `usr1`, `SIGUSR1`,
+    `RTMIN+3`, `SIGRTMAX-1`, and `10` are all accepted.
+
+    :param name: the name or number
+    :returns: the signal number
+    :raises ValueError: if there is no such signal or it can't be caught
+    """
+    upper = name.strip().upper()
+    if upper.isdigit():
+        num = int(upper)
+    else:
+        if not upper.startswith('SIG'):
+            upper = 'SIG' + upper
+        base, sign, offset = upper.partition('+')
+        if not sign:
+            base, sign, offset = upper.partition('-')
+        try:
+            num = getattr(signal, base)
+            if sign:
+                num = num + int(offset) if sign == '+' else num - int(offset)
+        except (AttributeError, ValueError):
+            raise ValueError('unknown signal: {!r}'.format(name)) from None
+        if sign and not is_realtime(num):
+            raise ValueError('not a real-time signal: {!r}'.format(name))
+    if num in UNCATCHABLE_SIGNALS or num not in signal.valid_signals():
+        raise ValueError('not a catchable signal: {!r}'.format(name))
+    return num
+
+
+def sigqueue(pid: int, num: SignalNumber, value: int) -> None:
+    """Send a signal with an integer payload to a process.
+
+    This is the C library function of the same name; see its man page.
+
+    :param pid: the process to signal
+    :param num: the signal number
+    :param value: the payload, passed to actions as :attr:`SigInfo.value`
+    :raises OSError: if the signal could not be sent
+    """
+    import ctypes
+
+    class _SigVal(ctypes.Union):
+        """union sigval, see sigqueue(3)."""
+
+        _fields_ = [('sival_int', ctypes.c_int), ('sival_ptr', ctypes.c_void_p)]
+
+    libc = _libc()
+    libc.sigqueue.argtypes = [ctypes.c_int, ctypes.c_int, _SigVal]
+    if libc.sigqueue(pid, num, _SigVal(sival_int=value)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _libc() -> 'ctypes.CDLL':
+    """Load the C library.
+
+    :returns: the C library, with errno saved after every call
+    """
+    import ctypes
+    import ctypes.util
+
+    return ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+
+class SignalFD:
+    """A `signalfd(2)` for a set of signals, which are blocked while it is open."""
+
+    def __init__(self, signals: Iterable[SignalNumber]) -> None:
+        """Block the signals in the calling thread and open the file descriptor.
+
+        Threads started afterwards inherit the blocked signals, so create this in the
+        main thread before starting any others.
+
+        :param signals: the signals to read
+        :raises OSError: if `signalfd(2)` is not available or fails
+        """
+        import ctypes
+
+        self.signals: Set[SignalNumber] = set(signals)
+        libc = _libc()
+        # glibc's sigset_t is 1024 bits; the kernel only reads the first 64
+        mask = (ctypes.c_ulong * (1024 // (8 * ctypes.sizeof(ctypes.c_ulong))))()
+        libc.sigemptyset(ctypes.byref(mask))
+        for num in self.signals:
+            libc.sigaddset(ctypes.byref(mask), num)
+        try:
+            signalfd = libc.signalfd
+        except AttributeError:
+            raise OSError('signalfd is not available on this platform') from None
+
+        signal.pthread_sigmask(signal.SIG_BLOCK, self.signals)
+        self._fd: int = signalfd(-1, ctypes.byref(mask), os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, self.signals)
+            raise OSError(errno, os.strerror(errno))
+
+    def fileno(self) -> int:
+        """Get the file descriptor, which is readable while a signal is pending.
+
+        :returns: the file descriptor
+        """
+        return self._fd
+
+    def read(self) -> List[SigInfo]:
+        """Read the pending deliveries without blocking.
+
+        :returns: the details of each delivery, in order
+        """
+        infos: List[SigInfo] = []
+        while True:
+            try:
+                data = os.read(self._fd, _SIGNALFD_SIGINFO_SIZE * 16)
+            except BlockingIOError:
+                return infos
+            for offset in range(0, len(data), _SIGNALFD_SIGINFO_SIZE):
+                signo, _errno, code, pid, uid = _SIGNALFD_SIGINFO.unpack_from(
+                    data, offset
+                )
+                (value,) = _SIGNALFD_SIGINFO_INT.unpack_from(
+                    data, offset + _SIGNALFD_SIGINFO_INT_OFFSET
+                )
+                infos.append(SigInfo(signo, code, pid, uid, value))
+
+    def close(self) -> None:
+        """Close the file descriptor and unblock the signals in the calling thread."""
+        os.close(self._fd)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, self.signals)
+
+
+def open_signal_fd(signals: Iterable[SignalNumber]) -> Optional[SignalFD]:
+    """Open a :class:`SignalFD`, or log why it is not possible.
+
+    :param signals: the signals to read
+    :returns: the signalfd, or None if it could not be opened
+    """
+    try:
+        return SignalFD(signals)
+    except OSError as e:
+        logger.warning('Signal payloads will not be available: %s', e)
+        return None
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""Setting actions up in parallel or lazily, and reporting how long it took.
+
+By default every action is set up as it is created, one after another, so flagman is
+not ready until the sum of all set up times has passed. Actions created inside
+:func:`~flagman.actions.action.deferred_set_up` are not set up yet, which allows two
+other modes:
+
+- :attr:`SetUpMode.PARALLEL` sets them up on a thread pool before flagman is ready, so
+  the slowest set up bounds the start up instead of the sum of them.
+- :attr:`SetUpMode.LAZY` makes flagman ready right away and sets them up on a thread
+  pool in the background. An action that is dispatched before its set up has run is
+  set up first. An action whose set up fails, on either thread, is closed and removed
+  from its bundles the next time it is dispatched.
+
+Only set up code that is not a coroutine function runs on the thread pool. Coroutine
+set ups are awaited on the event loop as before: by :func:`flagman.aio.run_async` in
+parallel mode and before the first run of the action in lazy mode.
+"""
+import enum
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flagman.actions import Action
+from flagman.core import ACTION_BUNDLES
+
+# inspect and concurrent.futures are slow to import and only needed when set ups are
+# deferred, so they are imported where they are used
+
+logger = logging.getLogger(__name__)
+
+#: The number of slowest actions named in the set up report
+REPORT_SLOWEST = 5
+
+
+class SetUpMode(enum.Enum):
+    """When actions are set up."""
+
+    SERIAL = 'serial'
+    PARALLEL = 'parallel'
+    LAZY = 'lazy'
+
+
+def deferred_actions() -> List[Action]:
+    """Get the actions in the bundles whose set up has not started.
+
+    :returns: each such action once, in bundle order
+    """
+    actions: Dict[int, Action] = {}
+    for bundle in ACTION_BUNDLES.values():
+        for action in bundle:
+            if action._set_up_args is not None:
+                actions.setdefault(id(action), action)
+    return list(actions.values())
+
+
+def set_up_parallel(actions: Iterable[Action], threads: int) -> None:
+    """Set up deferred actions concurrently and wait for all of them.
+
+    Call this from the main thread before the signal handlers are set, since the
+    threads are gone by the time this returns.
+
+    :param actions: the actions
+    :param threads: the size of the thread pool
+    :raises Exception: the first exception raised by a set up, once all are done
+    """
+    started = time.perf_counter()
+    failures = _set_up_all(actions, threads, in_background=False)
+    if failures:
+        raise failures[0][1]
+    report_set_up(time.perf_counter() - started)
+
+
+def set_up_in_background(actions: Iterable[Action], threads: int) -> threading.Thread:
+    """Start setting up deferred actions on a thread pool and return at once.
+
+    Call this after the signal handlers are set, so the threads inherit the blocked
+    signals of the main thread. A set up that raises an exception is logged and closes
+    its action.
+
+    :param actions: the actions
+    :param threads: the size of the thread pool
+    :returns: the thread that runs the pool
+    """
+    actions = list(actions)
+
+    def set_up() -> None:
+        started = time.perf_counter()
+        for action, exc in _set_up_all(actions, threads, in_background=True):
+            logger.error(
+                'Set up of action `%s` failed; closing it',
+                action.__class__.__name__,
+                exc_info=exc,
+            )
+        report_set_up(time.perf_counter() - started)
+
+    thread = threading.Thread(target=set_up, name='flagman-set-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def report_set_up(elapsed: float) -> None:
+    """Log how long the actions in the bundles took to set up.
+
+    :param elapsed: the time set up took overall in seconds
+    """
+    times: List[Tuple[float, Action]] = []
+    seen = set()
+    for bundle in ACTION_BUNDLES.values():
+        for action in bundle:
+            seconds: Optional[float] = action._set_up_seconds
+            if seconds is not None and id(action) not in seen:
+                seen.add(id(action))
+                times.append((seconds, action))
+    times.sort(key=lambda item: item[0], reverse=True)
+    for seconds, action in times:
+        logger.debug(
+            'Set up action `%s` in %.1fms', action.__class__.__name__, seconds * 1e3
+        )
+    slowest = ', '.join(
+        '{} {:.1f}ms'.format(action.__class__.__name__, seconds * 1e3)
+        for seconds, action in times[:REPORT_SLOWEST]
+    )
+    logger.info(
+        'Set up %d actions in %.1fms (%.1fms of set up code); slowest: %s',
+        len(times),
+        elapsed * 1e3,
+        sum(seconds for seconds, _ in times) * 1e3,
+        slowest or 'none',
+    )
+
+
+def _set_up_all(
+    actions: Iterable[Action], threads: int, in_background: bool
+) -> List[Tuple[Action, Exception]]:
+    """Set up deferred actions on a thread pool.
+
+    Coroutine set ups are left to the event loop: in the background they are left
+    deferred until the first run, otherwise they are started like undeferred ones.
+
+    :param actions: the actions
+    :param threads: the size of the thread pool
+    :param in_background: whether flagman is already dispatching
+    :returns: the actions whose set up raised an exception, with the exception
+    """
+    import inspect
+    from concurrent.futures import ThreadPoolExecutor
+
+    on_threads = []
+    for action in actions:
+        if action._worker is not None:
+            continue
+        if not inspect.iscoroutinefunction(type(action).set_up):
+            on_threads.append(action)
+        elif not in_background:
+            action._set_up_now()
+
+    failures: List[Tuple[Action, Exception]] = []
+    if not on_threads:
+        return failures
+    with ThreadPoolExecutor(threads, thread_name_prefix='flagman-set-up') as pool:
+        futures = [(action, pool.submit(action._set_up_now)) for action in on_threads]
+        for action, future in futures:
+            exc = future.exception()
+            if isinstance(exc, Exception):
+                failures.append((action, exc))
+    return failures
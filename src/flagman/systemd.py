@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Keep systemd informed about a running flagman.
+
+A :class:`ServiceMonitor` is driven by the event loop. It sends `WATCHDOG=1`
+keepalives at half the service's `WatchdogSec=` and `STATUS=` lines with throughput and
+run time statistics. Keepalives stop when the event loop is stuck in an action, or when
+a bundle taken off the loop has been running for longer than the watchdog timeout, so
+systemd can restart a hung flagman.
+
+Actions can keep long-lived file descriptors, like listening sockets, in the service's
+file descriptor store with :func:`store_fds` and get them back after a restart with
+:func:`stored_fds`. The unit needs `FileDescriptorStoreMax=` for this to work.
+"""
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flagman.core import HANDLED_SIGNALS, SIGNAL_FLAGS
+from flagman.loop import EventLoop, PeriodicCallback
+from flagman.sd_notify import listen_fds, SystemdNotifier
+
+logger = logging.getLogger(__name__)
+
+#: The notifier flagman and its actions talk to systemd with.
+#: Set by the CLI unless `--no-systemd` is passed; None otherwise.
+NOTIFIER: Optional[SystemdNotifier] = None
+
+#: File descriptors passed by systemd, read on first use by `stored_fds`
+_passed_fds: Optional[Dict[str, List[int]]] = None
+
+
+def store_fds(name: str, fds: Sequence[int]) -> bool:
+    """Keep file descriptors in the service's file descriptor store.
+
+    systemd holds duplicates of the file descriptors and passes them to the next run of
+    the service, where they can be retrieved with :func:`stored_fds`.
+
+    :param name: the name to store the file descriptors under; at most 255 characters
+        and no colons
+    :param fds: the file descriptors
+    :returns: whether the file descriptors were sent to systemd
+    """
+    if NOTIFIER is None:
+        return False
+    logger.debug('Storing %d file descriptors as `%s`', len(fds), name)
+    NOTIFIER.notify_with_fds('FDSTORE=1\nFDNAME={}'.format(name), fds)
+    return True
+
+
+def remove_stored_fds(name: str) -> None:
+    """Close and forget the file descriptors kept in the store under a name.
+
+    :param name: the name the file descriptors were stored under
+    """
+    if NOTIFIER is not None:
+        NOTIFIER.notify('FDSTOREREMOVE=1\nFDNAME={}'.format(name))
+
+
+def stored_fds(name: str) -> List[int]:
+    """Get the file descriptors a previous run of the service stored under a name.
+
+    The file descriptors belong to the caller from then on.
+
+    :param name: the name the file descriptors were stored under
+    :returns: the file descriptors; empty if none were passed to this run
+    """
+    global _passed_fds
+    if _passed_fds is None:
+        _passed_fds = listen_fds()
+    return _passed_fds.pop(name, [])
+
+
+class ServiceMonitor:
+    """Send watchdog keepalives and status lines from the event loop."""
+
+    def __init__(
+        self,
+        notifier: SystemdNotifier,
+        watchdog_timeout: Optional[float] = None,
+        status_interval: Optional[float] = None,
+    ) -> None:
+        """Create the monitor; nothing is sent until it is scheduled.
+
+        :param notifier: the notifier to send with
+        :param watchdog_timeout: the service's watchdog timeout in seconds, or None if
+            the watchdog is not enabled
+        :param status_interval: the time between status lines in seconds, or None to
+            not send status lines
+        """
+        self._notifier = notifier
+        self._watchdog_timeout = watchdog_timeout
+        self._status_interval = status_interval
+        self._last_report = (time.monotonic(), 0, 0.0)
+
+    def notify(self, state: str) -> None:
+        """Send a notification to systemd.
+
+        :param state: the notification, like `READY=1`
+        """
+        self._notifier.notify(state)
+
+    def periodic(self) -> List[Tuple[float, PeriodicCallback]]:
+        """Get the callbacks to run periodically and their intervals.
+
+        :returns: a list of intervals in seconds and callbacks
+        """
+        callbacks: List[Tuple[float, PeriodicCallback]] = []
+        if self._watchdog_timeout is not None:
+            callbacks.append((self._watchdog_timeout / 2, self.keepalive))
+        if self._status_interval is not None:
+            callbacks.append((self._status_interval, self.report_status))
+        return callbacks
+
+    def schedule(self, loop: EventLoop) -> None:
+        """Run the periodic callbacks on a flagman event loop.
+
+        :param loop: the event loop
+        """
+        for interval, callback in self.periodic():
+            loop.call_every(interval, callback)
+
+    def keepalive(self) -> None:
+        """Send `WATCHDOG=1` unless a bundle has been running for too long."""
+        oldest = SIGNAL_FLAGS.oldest_run()
+        if oldest is not None and self._watchdog_timeout is not None:
+            running_for = time.monotonic() - oldest
+            if running_for > self._watchdog_timeout:
+                logger.error(
+                    'An action bundle has been running for %.1f seconds; '
+                    'withholding the watchdog keepalive',
+                    running_for,
+                )
+                return None
+        self._notifier.notify('WATCHDOG=1')
+
+    def report_status(self) -> None:
+        """Send a `STATUS=` line with statistics since the previous line."""
+        self._notifier.notify('STATUS={}'.format(self.status()))
+
+    def status(self) -> str:
+        """Describe the throughput and run times since the previous call.
+
+        :returns: a single line of text
+        """
+        now = time.monotonic()
+        all_stats = [SIGNAL_FLAGS.stats(signum) for signum in HANDLED_SIGNALS]
+        finished = sum(stats.finished for stats in all_stats)
+        run_time = sum(stats.run_time for stats in all_stats)
+        max_run_time = max((stats.max_run_time for stats in all_stats), default=0.0)
+
+        then, then_finished, then_run_time = self._last_report
+        self._last_report = (now, finished, run_time)
+        handled = finished - then_finished
+        rate = handled / (now - then) if now > then else 0.0
+        mean = (run_time - then_run_time) / handled if handled else 0.0
+        return (
+            'Handled {} signals in {:.1f}s ({:.2f}/s); mean run {:.1f}ms; '
+            'longest run {:.1f}ms'.format(
+                handled, now - then, rate, mean * 1e3, max_run_time * 1e3
+            )
+        )
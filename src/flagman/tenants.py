@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Hosting the action bundles of many services in one flagman process.
+
+Every flagman is an interpreter of its own with the same action plugins imported, so a
+host that runs one for each of its services pays for all of them again and again. A
+:class:`Tenant` is a namespace for the actions of one service inside a shared flagman:
+it has a config file of its own, written like any other (see :mod:`flagman.config`),
+and optionally a control socket of its own (see :mod:`flagman.control`).
+
+The signals of a tenant's config file are names within its namespace. Each of them is
+given a free real-time signal of the process, so the bundles of different tenants never
+mix, even if all of them use `usr1`. A tenant is triggered either through its control
+socket, with the names from its config file, or by sending the real-time signal it was
+given, which is logged when it is loaded. Signals get the delivery policy their name
+has by default, so a tenant's `usr1` is still coalesced.
+
+There are about 30 real-time signals, minus the ones flagman uses for itself, and every
+signal of every tenant takes one. Reloading reloads every tenant's config file, but
+adding a signal to a tenant needs a restart. The metrics label the series of each
+signal with its tenant.
+"""
+import logging
+import signal
+from typing import Collection, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from flagman.config import ConfigFile, SignalConfig
+from flagman.core import (
+    add_handled_signal,
+    HANDLED_SIGNALS,
+    SIGNAL_FLAGS,
+    SIGNAL_TENANTS,
+)
+from flagman.exceptions import ConfigError
+from flagman.loop import ReaderCallback
+from flagman.signals import signal_name
+from flagman.types import SignalNumber
+
+if TYPE_CHECKING:  # pragma: no cover
+    from flagman.control import ControlServer  # noqa: F401 (unused import)
+
+logger = logging.getLogger(__name__)
+
+#: The loaded tenants, by name
+TENANTS: Dict[str, 'Tenant'] = {}
+
+
+class Tenant:
+    """The action bundles of one service in a shared flagman."""
+
+    def __init__(self, name: str, config_path: str) -> None:
+        """Remember the config file; nothing is read until the tenant is loaded.
+
+        :param name: the name of the tenant, used in logs and metrics
+        :param config_path: the path of the tenant's config file
+        """
+        self.name = name
+        #: The signal of the process each signal of the tenant was given
+        self.signals: Dict[SignalNumber, SignalNumber] = {}
+        #: The tenant's config file
+        self.config = TenantConfig(self, config_path)
+        #: The tenant's control socket, once it is started
+        self.control: Optional['ControlServer'] = None
+        self._reserved: Collection[SignalNumber] = ()
+
+    def load(self, reserved: Collection[SignalNumber] = ()) -> int:
+        """Give the tenant's signals free real-time signals and add its actions.
+
+        Call this after the actions of flagman itself are created, like a config file.
+
+        :param reserved: signals that must not be given to the tenant, like the reload
+            signal
+        :returns: the number of actions of the tenant
+        :raises ConfigError: if the config file is not a valid configuration, an action
+            fails to set up, or there are not enough free real-time signals
+        """
+        self._reserved = reserved
+        count = self.config.load()
+        for name, num in sorted(self.signals.items()):
+            logger.info(
+                'Tenant `%s` %s is %s', self.name, signal_name(name), signal_name(num)
+            )
+        return count
+
+    def start_control(self, path: str) -> None:
+        """Accept triggers for the tenant's signals on a control socket.
+
+        :param path: the path to bind the socket to
+        :raises OSError: if the socket can't be bound
+        """
+        from flagman.control import ControlServer
+
+        self.control = ControlServer(path, self.signals)
+
+    def readers(self) -> List[Tuple[int, ReaderCallback]]:
+        """Get the file descriptors to watch and the callbacks to run when readable.
+
+        :returns: a list of file descriptors and callbacks
+        """
+        readers = self.config.readers()
+        if self.control is not None:
+            readers.extend(self.control.readers())
+        return readers
+
+    def close(self) -> None:
+        """Stop watching for reload requests and close the control socket."""
+        self.config.close()
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+
+    def signal_for(self, name: SignalNumber, allocate: bool = False) -> SignalNumber:
+        """Get the signal of the process a signal of the tenant was given.
+
+        :param name: the signal as the tenant names it
+        :param allocate: whether to give it a free real-time signal if it has none
+        :returns: the signal number
+        :raises ConfigError: if the signal has none and can't be given one
+        """
+        try:
+            return self.signals[name]
+        except KeyError:
+            if not allocate:
+                raise ConfigError(
+                    'adding {} to tenant `{}` needs a restart'.format(
+                        signal_name(name), self.name
+                    )
+                ) from None
+        num = free_signal(self._reserved)
+        add_handled_signal(num)
+        self.signals[name] = num
+        SIGNAL_TENANTS[num] = self.name
+        SIGNAL_FLAGS.set_policy(num, *SIGNAL_FLAGS.policy(name))
+        return num
+
+
+class TenantConfig(ConfigFile):
+    """The config file of a tenant, whose signals are names within the tenant."""
+
+    def __init__(self, tenant: Tenant, path: str) -> None:
+        """Remember the tenant and the file.
+
+        :param tenant: the tenant
+        :param path: the path of the config file
+        """
+        super().__init__(path)
+        self._tenant = tenant
+
+    def _read(self) -> Dict[SignalNumber, SignalConfig]:
+        """Read the file and translate its signals to the ones of the tenant."""
+        config = super()._read()
+        return {
+            self._tenant.signal_for(name, allocate=not self._loaded): signal_config
+            for name, signal_config in config.items()
+        }
+
+
+def free_signal(reserved: Collection[SignalNumber] = ()) -> SignalNumber:
+    """Find the lowest real-time signal that flagman does not handle.
+
+    :param reserved: signals that must not be returned
+    :returns: the signal number
+    :raises ConfigError: if every real-time signal is taken
+    """
+    for num in range(signal.SIGRTMIN, signal.SIGRTMAX + 1):
+        if num not in HANDLED_SIGNALS and num not in reserved:
+            return num
+    raise ConfigError('no free real-time signal is left for tenants')
+
+
+def add_tenant(
+    name: str, config_path: str, reserved: Collection[SignalNumber] = ()
+) -> Tenant:
+    """Load a tenant and add it to :data:`TENANTS`.
+
+    :param name: the name of the tenant
+    :param config_path: the path of the tenant's config file
+    :param reserved: signals that must not be given to the tenant
+    :returns: the tenant
+    :raises ConfigError: if the name is taken or the tenant can't be loaded
+    """
+    if not name or name in TENANTS:
+        raise ConfigError('tenant name is empty or taken: {!r}'.format(name))
+    tenant = Tenant(name, config_path)
+    count = tenant.load(reserved)
+    logger.info('Loaded %d actions for tenant `%s`', count, name)
+    TENANTS[name] = tenant
+    return tenant
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Throttles that limit how often expensive actions run.
+
+An action with a :attr:`~flagman.Action.throttle` is only run when its throttle allows
+it, however often its signals are delivered. A throttle is written like the delivery
+policy of a signal:
+
+- `bucket:N/SECONDS` is a token bucket: up to N runs in a burst, refilled at N runs
+  per SECONDS.
+- `interval:SECONDS` allows one run per SECONDS.
+- `debounce:SECONDS` runs the action on the trailing edge of a burst of triggers, once
+  no trigger has arrived for SECONDS.
+
+A trigger the throttle does not allow is dropped, or, if `:defer` is appended to a
+bucket or interval throttle, deferred: the action then runs once as soon as the
+throttle allows it, for all the triggers deferred until then, with the
+:class:`~flagman.signals.SigInfo` of the latest. Debounced triggers are always deferred.
+Each throttle counts the triggers it allowed, dropped, and deferred.
+
+Throttles are checked by the dispatchers before a bundle is run, so a throttled action
+costs neither a call nor a thread, and actions without a throttle are not checked at
+all. Deferred runs are timed by the event loop like debounced signals and taken on the
+event loop thread.
+"""
+import math
+import weakref
+from abc import ABCMeta, abstractmethod
+from typing import Container, Dict, List, Optional, Tuple
+
+from flagman.actions import Action
+from flagman.signals import SigInfo
+from flagman.types import SignalNumber
+
+#: Type alias for a deferred run that is due: the signal it was triggered for, the
+#: action, and the details of the latest trigger
+DeferredRun = Tuple[SignalNumber, Action, Optional[SigInfo]]
+
+
+class Throttle(metaclass=ABCMeta):
+    """Decides when the triggers of an action may run it."""
+
+    def __init__(self, defer: bool = False) -> None:
+        """Start with nothing counted.
+
+        :param defer: whether triggers that are not allowed are deferred instead of
+            dropped
+        """
+        #: Whether triggers that are not allowed are deferred instead of dropped
+        self.defer = defer
+        #: The number of triggers that ran the action right away
+        self.allowed = 0
+        #: The number of triggers that were dropped
+        self.dropped = 0
+        #: The number of triggers that were folded into a deferred run
+        self.deferred = 0
+        #: The number of deferred runs that were taken
+        self.deferred_runs = 0
+        self._pending: Optional[Tuple[SignalNumber, Optional[SigInfo]]] = None
+
+    def __repr__(self) -> str:
+        """Show the counters."""
+        return '{}(allowed={}, dropped={}, deferred={}, deferred_runs={})'.format(
+            self.__class__.__name__,
+            self.allowed,
+            self.dropped,
+            self.deferred,
+            self.deferred_runs,
+        )
+
+    def admit(self, num: SignalNumber, siginfo: Optional[SigInfo], now: float) -> bool:
+        """Decide whether a trigger runs the action now, or defer or drop it.
+
+        :param num: the signal the action is triggered for
+        :param siginfo: the details of the delivery the trigger is for
+        :param now: the :func:`time.monotonic` time of the trigger
+        :returns: whether the action runs now
+        """
+        self.note(now)
+        # a waiting deferred run goes first, so triggers never overtake it
+        if self._pending is None and self.take(now):
+            self.allowed += 1
+            return True
+        if self.defer:
+            self._pending = (num, siginfo)
+            self.deferred += 1
+        else:
+            self.dropped += 1
+        return False
+
+    def due(
+        self, now: float, busy: Container[SignalNumber] = ()
+    ) -> Optional[Tuple[SignalNumber, Optional[SigInfo]]]:
+        """Take the deferred run if there is one and the throttle allows it now.
+
+        :param now: the current :func:`time.monotonic` time
+        :param busy: signals whose deferred runs wait, because their actions are running
+        :returns: the signal and the details of the latest trigger of the run, or None
+        """
+        if self._pending is None or self._pending[0] in busy or not self.take(now):
+            return None
+        pending, self._pending = self._pending, None
+        self.deferred_runs += 1
+        return pending
+
+    def due_at(self, busy: Container[SignalNumber] = ()) -> Optional[float]:
+        """Get the time the deferred run may be taken.
+
+        :param busy: signals whose deferred runs wait, because their actions are running
+        :returns: the :func:`time.monotonic` time, or None if no run is deferred
+        """
+        if self._pending is None or self._pending[0] in busy:
+            return None
+        return self.allowed_at()
+
+    def note(self, now: float) -> None:
+        """Record a trigger before it is checked.
+
+        :param now: the :func:`time.monotonic` time of the trigger
+        """
+        pass
+
+    @abstractmethod
+    def take(self, now: float) -> bool:
+        """Use up a run if the throttle allows one now.
+
+        :param now: the current :func:`time.monotonic` time
+        :returns: whether a run is allowed
+        """
+        pass
+
+    @abstractmethod
+    def allowed_at(self) -> float:
+        """Get the earliest time the throttle allows another run.
+
+        :returns: the :func:`time.monotonic` time
+        """
+        pass
+
+
+class TokenBucket(Throttle):
+    """Allow bursts of runs up to a capacity, refilled at a steady rate."""
+
+    def __init__(self, capacity: int, seconds: float, defer: bool = False) -> None:
+        """Start with a full bucket.
+
+        :param capacity: the largest number of runs in a burst
+        :param seconds: the time in seconds it takes to refill the whole bucket
+        :param defer: whether triggers that are not allowed are deferred
+        """
+        super().__init__(defer)
+        self._capacity = capacity
+        self._rate = capacity / seconds
+        self._tokens = float(capacity)
+        self._filled = -math.inf
+
+    def take(self, now: float) -> bool:
+        """Use up a token if there is one."""
+        elapsed = now - self._filled
+        self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+        self._filled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def allowed_at(self) -> float:
+        """Get the time the next token is refilled."""
+        return self._filled + max(1 - self._tokens, 0.0) / self._rate
+
+
+class MinInterval(Throttle):
+    """Allow one run per interval."""
+
+    def __init__(self, seconds: float, defer: bool = False) -> None:
+        """Allow the first run right away.
+
+        :param seconds: the shortest time in seconds between two runs
+        :param defer: whether triggers that are not allowed are deferred
+        """
+        super().__init__(defer)
+        self._seconds = seconds
+        self._last = -math.inf
+
+    def take(self, now: float) -> bool:
+        """Use up the run of the current interval if it is still available."""
+        if now - self._last < self._seconds:
+            return False
+        self._last = now
+        return True
+
+    def allowed_at(self) -> float:
+        """Get the time the current interval ends."""
+        return self._last + self._seconds
+
+
+class Debounce(Throttle):
+    """Run once a burst of triggers has been quiet for a time window."""
+
+    def __init__(self, seconds: float) -> None:
+        """Defer every trigger.
+
+        :param seconds: the quiet time in seconds to wait for
+        """
+        super().__init__(defer=True)
+        self._seconds = seconds
+        self._last = -math.inf
+
+    def note(self, now: float) -> None:
+        """Start the quiet time over."""
+        self._last = now
+
+    def take(self, now: float) -> bool:
+        """Allow a run once the quiet time has passed."""
+        return now - self._last >= self._seconds
+
+    def allowed_at(self) -> float:
+        """Get the time the quiet time ends."""
+        return self._last + self._seconds
+
+
+#: The throttle of each action whose runs have been checked
+_throttles: 'weakref.WeakKeyDictionary[Action, Throttle]' = weakref.WeakKeyDictionary()
+
+
+def parse_throttle(value: str) -> Throttle:
+    """Create a throttle from a string like `bucket:5/60` or `interval:10:defer`.
+
+    :param value: the throttle string
+    :returns: a new throttle
+    :raises ValueError: if the throttle is unknown or its numbers are not positive
+    """
+    kind, _, rest = value.partition(':')
+    limit, sep, mode = rest.partition(':')
+    defer = mode == 'defer'
+    if (sep and not defer) or (defer and kind == 'debounce'):
+        raise ValueError('invalid throttle: {!r}'.format(value))
+    try:
+        if kind == 'bucket':
+            capacity, _, seconds = limit.partition('/')
+            if int(capacity) > 0 and float(seconds) > 0:
+                return TokenBucket(int(capacity), float(seconds), defer)
+        elif kind == 'interval' and float(limit) > 0:
+            return MinInterval(float(limit), defer)
+        elif kind == 'debounce' and float(limit) > 0:
+            return Debounce(float(limit))
+    except ValueError:
+        pass
+    raise ValueError('invalid throttle: {!r}'.format(value))
+
+
+def throttle_of(action: Action) -> Optional[Throttle]:
+    """Get the throttle of an action, created from its throttle string when first used.
+
+    :param action: the action
+    :returns: the throttle, or None if the action is not throttled
+    """
+    if action.throttle is None:
+        return None
+    try:
+        return _throttles[action]
+    except KeyError:
+        throttle = _throttles[action] = parse_throttle(action.throttle)
+        return throttle
+
+
+def due_at(busy: Container[SignalNumber] = ()) -> Optional[float]:
+    """Get the time the earliest deferred run may be taken.
+
+    :param busy: signals whose deferred runs wait, because their actions are running
+    :returns: the :func:`time.monotonic` time, or None if no run is deferred
+    """
+    times = (throttle.due_at(busy) for throttle in list(_throttles.values()))
+    return min((at for at in times if at is not None), default=None)
+
+
+def due_runs(now: float, busy: Container[SignalNumber] = ()) -> List[DeferredRun]:
+    """Take the deferred runs that the throttles allow now.
+
+    :param now: the current :func:`time.monotonic` time
+    :param busy: signals whose deferred runs wait, because their actions are running
+    :returns: the runs, to be taken by the caller
+    """
+    runs: List[DeferredRun] = []
+    for action, throttle in list(_throttles.items()):
+        run = throttle.due(now, busy)
+        if run is not None:
+            runs.append((run[0], action, run[1]))
+    return runs
+
+
+def throttle_stats() -> Dict[Action, Throttle]:
+    """Get the throttles of the actions whose runs have been checked.
+
+    :returns: the throttle of each action
+    """
+    return dict(_throttles.items())
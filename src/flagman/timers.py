@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""Timers that trigger action bundles periodically, as well as on their signals.
+
+A timer raises its signal's flag on a schedule, as if the signal had been delivered, so
+actions like flushing buffers or heartbeat checks need no cron job or systemd timer
+that forks `kill`. A timer is written like the delivery policy of a signal:
+
+- `every:SECONDS` ticks once per SECONDS.
+- `cron:SPEC` ticks at the wall clock times of a crontab schedule like `*/5 * * * *`,
+  with the fields minute, hour, day of month, month and day of week, each a `*`, a
+  number, a range like `1-5`, or a list of those, optionally with a step like `/2`.
+  The shorthands `@hourly`, `@daily`, `@weekly`, `@monthly` and `@yearly` work too.
+
+Ticks are coalesced with the signal's other runs: a tick while the bundle is running or
+already waiting to run is merged into that run instead of running the bundle again
+right after it. An `every` timer also starts over whenever the bundle finishes a run
+for any reason, so the time between two runs is never shorter than its SECONDS. Each
+timer counts the ticks it fired and merged.
+
+The timers of all signals are kept in one heap ordered by their next tick in
+:func:`time.monotonic` time, which the dispatchers wait on along with the signals, so
+an idle flagman with timers costs one wakeup per tick. A cron timer checks the wall
+clock at least once a minute, so it follows changes to the system clock.
+"""
+import datetime
+import heapq
+import itertools
+import time
+from abc import ABCMeta, abstractmethod
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from flagman.types import SignalNumber
+
+#: The longest time in seconds a cron timer waits before checking the wall clock again
+_RECHECK = 60.0
+
+#: The schedules of the cron shorthands
+_CRON_SHORTHANDS = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+
+#: The lowest and highest value of each field of a cron schedule; 7 is also Sunday
+_CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+class Timer(metaclass=ABCMeta):
+    """Decides when the next tick of a signal's timer is."""
+
+    #: Whether the timer starts over when the signal's bundle finishes a run
+    restarts_on_run = False
+    #: Whether a tick is merged into a run of the bundle that is running or waiting,
+    #: instead of counting as a delivery of the signal like any other
+    merges = True
+
+    def __init__(self, spec: str) -> None:
+        """Start with nothing counted.
+
+        :param spec: the timer string the timer was created from
+        """
+        #: The timer string the timer was created from
+        self.spec = spec
+        #: The number of ticks that raised the signal's flag
+        self.fired = 0
+        #: The number of ticks that were merged into a run of the bundle
+        self.merged = 0
+
+    def __repr__(self) -> str:
+        """Show the spec and the counters."""
+        return '{}({!r}, fired={}, merged={})'.format(
+            self.__class__.__name__, self.spec, self.fired, self.merged
+        )
+
+    def ready(self) -> bool:
+        """Check whether a tick that came up is due, or only a time to check again.
+
+        :returns: whether the timer ticks
+        """
+        return True
+
+    @abstractmethod
+    def next_at(self, now: float) -> Optional[float]:
+        """Get the time to tick next, or to check whether the timer is ready.
+
+        :param now: the current :func:`time.monotonic` time
+        :returns: the :func:`time.monotonic` time, or None to not tick again until the
+            timer is scheduled with :func:`schedule_tick`
+        """
+        pass
+
+
+class Interval(Timer):
+    """Tick once per interval, counted from the latest tick or run of the bundle."""
+
+    restarts_on_run = True
+
+    def __init__(self, spec: str, seconds: float) -> None:
+        """Tick first after one interval.
+
+        :param spec: the timer string the timer was created from
+        :param seconds: the time in seconds between two ticks
+        """
+        super().__init__(spec)
+        self._seconds = seconds
+
+    def next_at(self, now: float) -> float:
+        """Get the time the interval ends."""
+        return now + self._seconds
+
+
+class Cron(Timer):
+    """Tick at the wall clock times of a crontab schedule."""
+
+    def __init__(self, spec: str, schedule: str) -> None:
+        """Parse the schedule.
+
+        :param spec: the timer string the timer was created from
+        :param schedule: the five fields of the schedule, or a shorthand like `@daily`
+        :raises ValueError: if the schedule is invalid or never matches
+        """
+        super().__init__(spec)
+        fields = _CRON_SHORTHANDS.get(schedule, schedule).split()
+        if len(fields) != len(_CRON_FIELDS):
+            raise ValueError('expected five fields: {!r}'.format(schedule))
+        minutes, hours, days, months, weekdays = (
+            _parse_field(field, low, high)
+            for field, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        self._minutes = minutes
+        self._hours = hours
+        self._days = days
+        self._months = months
+        self._weekdays = frozenset(day % 7 for day in weekdays)
+        # like cron, a day matches either field if both are restricted
+        self._either_day = fields[2] != '*' and fields[4] != '*'
+        self._wall = self.next_wall(time.time())
+
+    def ready(self) -> bool:
+        """Check whether the wall clock reached the scheduled time."""
+        return time.time() >= self._wall
+
+    def next_at(self, now: float) -> float:
+        """Get the time of the next tick, or of the next wall clock check."""
+        wall = time.time()
+        if wall >= self._wall:
+            self._wall = self.next_wall(wall)
+        return now + min(self._wall - wall, _RECHECK)
+
+    def next_wall(self, after: float) -> float:
+        """Get the first time the schedule matches after a given time.
+
+        :param after: the wall clock time to start from, as a Unix timestamp
+        :returns: the Unix timestamp of the start of the matching minute
+        :raises ValueError: if the schedule does not match within five years
+        """
+        start = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0)
+        moment = start + datetime.timedelta(minutes=1)
+        while moment - start < datetime.timedelta(days=5 * 366):
+            if moment.month not in self._months:
+                moment = _first_of_next_month(moment)
+            elif not self._matches_day(moment):
+                moment = (moment + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self._hours:
+                moment = (moment + datetime.timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self._minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError('cron schedule never matches: {!r}'.format(self.spec))
+
+    def _matches_day(self, moment: datetime.datetime) -> bool:
+        """Check whether the day of month and day of week fields match a day.
+
+        :param moment: the day
+        :returns: whether the day matches
+        """
+        day = moment.day in self._days
+        # cron counts the days of the week from Sunday, Python from Monday
+        weekday = (moment.weekday() + 1) % 7 in self._weekdays
+        return day or weekday if self._either_day else day and weekday
+
+
+def _parse_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    """Parse a field of a cron schedule like `*/15` or `1-5,10`.
+
+    :param field: the field
+    :param low: the lowest value the field may have
+    :param high: the highest value the field may have
+    :returns: the values the field matches
+    :raises ValueError: if the field is invalid or out of range
+    """
+    values: Set[int] = set()
+    for part in field.split(','):
+        span, sep, step = part.partition('/')
+        if span == '*':
+            first, last = low, high
+        elif '-' in span:
+            start, _, end = span.partition('-')
+            first, last = int(start), int(end)
+        else:
+            # like cron, `5/10` counts from 5 up to the highest value
+            first = int(span)
+            last = high if sep else first
+        every = int(step) if sep else 1
+        if not low <= first <= last <= high or every < 1:
+            raise ValueError('invalid cron field: {!r}'.format(field))
+        values.update(range(first, last + 1, every))
+    return frozenset(values)
+
+
+def _first_of_next_month(moment: datetime.datetime) -> datetime.datetime:
+    """Get the start of the month after a time.
+
+    :param moment: the time
+    :returns: midnight of the first day of the next month
+    """
+    if moment.month == 12:
+        return moment.replace(year=moment.year + 1, month=1, day=1, hour=0, minute=0)
+    return moment.replace(month=moment.month + 1, day=1, hour=0, minute=0)
+
+
+#: The timers of each signal
+_timers: Dict[SignalNumber, List[Timer]] = {}
+
+#: The time each timer is scheduled at; heap entries with another time are stale
+_scheduled: Dict[Timer, float] = {}
+
+#: The scheduled ticks: time, sequence number, signal and timer
+_heap: List[Tuple[float, int, SignalNumber, Timer]] = []
+
+#: Breaks ties between ticks at the same time, since timers are not ordered
+_sequence = itertools.count()
+
+
+def parse_timer(value: str) -> Timer:
+    """Create a timer from a string like `every:60` or `cron:*/5 * * * *`.
+
+    :param value: the timer string
+    :returns: a new timer
+    :raises ValueError: if the timer is unknown, its interval is not positive, or its
+        cron schedule is invalid
+    """
+    kind, _, rest = value.partition(':')
+    try:
+        if kind == 'every' and float(rest) > 0:
+            return Interval(value, float(rest))
+        elif kind == 'cron':
+            return Cron(value, rest.strip())
+    except ValueError:
+        pass
+    raise ValueError('invalid timer: {!r}'.format(value))
+
+
+def set_timers(num: SignalNumber, timers: Iterable[Timer]) -> None:
+    """Replace the timers of a signal and schedule their first ticks.
+
+    A new timer with the same spec as one the signal already has is dropped in favor of
+    the old one, which keeps its schedule and counters.
+
+    :param num: the signal number
+    :param timers: the new timers
+    """
+    old = {timer.spec: timer for timer in _timers.pop(num, ())}
+    now = time.monotonic()
+    kept: List[Timer] = []
+    for timer in timers:
+        timer = old.pop(timer.spec, timer)
+        kept.append(timer)
+        if timer not in _scheduled:
+            _schedule(num, timer, timer.next_at(now))
+    for timer in old.values():
+        _schedule(num, timer, None)
+    if kept:
+        _timers[num] = kept
+
+
+def timers_of(num: SignalNumber) -> List[Timer]:
+    """Get the timers of a signal.
+
+    :param num: the signal number
+    :returns: the timers
+    """
+    return list(_timers.get(num, ()))
+
+
+def next_tick_at() -> Optional[float]:
+    """Get the time of the earliest scheduled tick.
+
+    :returns: the :func:`time.monotonic` time, or None if there are no timers
+    """
+    while _heap and _scheduled.get(_heap[0][3]) != _heap[0][0]:
+        heapq.heappop(_heap)
+    return _heap[0][0] if _heap else None
+
+
+def due_ticks(now: float) -> List[Tuple[SignalNumber, Timer]]:
+    """Take the ticks that are due and schedule the next ones.
+
+    :param now: the current :func:`time.monotonic` time
+    :returns: the signal and timer of each tick, to be fired by the caller
+    """
+    ticks: List[Tuple[SignalNumber, Timer]] = []
+    while _heap and _heap[0][0] <= now:
+        at, _, num, timer = heapq.heappop(_heap)
+        if _scheduled.get(timer) != at:
+            continue
+        if timer.ready():
+            ticks.append((num, timer))
+        _schedule(num, timer, timer.next_at(now))
+    return ticks
+
+
+def schedule_tick(num: SignalNumber, timer: Timer, at: float) -> None:
+    """Schedule a tick of a timer that is not one of the timers of a signal.
+
+    This is for event sources that raise a signal's flag a while after their events,
+    like the file watches of :mod:`flagman.watch`. The timer is not listed by
+    :func:`timers_of` or :func:`timer_stats`, and it replaces the tick it has, so it
+    can be postponed by scheduling it again.
+
+    :param num: the signal number
+    :param timer: the timer
+    :param at: the :func:`time.monotonic` time of the tick
+    """
+    _schedule(num, timer, at)
+
+
+def restart_timers(num: SignalNumber) -> None:
+    """Start the interval timers of a signal over after a run of its bundle.
+
+    :param num: the signal number
+    """
+    timers: Sequence[Timer] = _timers.get(num, ())
+    if timers:
+        now = time.monotonic()
+        for timer in timers:
+            if timer.restarts_on_run:
+                _schedule(num, timer, timer.next_at(now))
+
+
+def timer_stats() -> Dict[SignalNumber, List[Timer]]:
+    """Get the timers of every signal that has any.
+
+    :returns: the timers of each signal
+    """
+    return {num: list(timers) for num, timers in _timers.items()}
+
+
+def _schedule(num: SignalNumber, timer: Timer, at: Optional[float]) -> None:
+    """Schedule the next tick of a timer, replacing the one it has.
+
+    :param num: the signal number
+    :param timer: the timer
+    :param at: the :func:`time.monotonic` time of the tick, or None for no tick
+    """
+    if at is None:
+        _scheduled.pop(timer, None)
+        return None
+    _scheduled[timer] = at
+    heapq.heappush(_heap, (at, next(_sequence), num, timer))
+    # a busy signal restarts its timers on every run, so drop the stale ticks in bulk
+    if len(_heap) > 2 * len(_scheduled) + 16:
+        _heap[:] = [tick for tick in _heap if _scheduled.get(tick[3]) == tick[0]]
+        heapq.heapify(_heap)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""File watches that trigger action bundles when files change.
+
+A :class:`FileWatcher` raises a signal's flag when a watched file changes, as if the
+signal had been delivered, so no process has to watch the file and send the signal.
+It uses the Linux `inotify(7)` system calls through :mod:`ctypes`, so the kernel
+reports each change and nothing is polled.
+
+A file is watched through its directory, which catches every way of changing it:
+writing it in place, replacing it atomically by renaming another file over it, and
+creating or deleting it. Watching a directory itself triggers on changes to any file
+in it. Files in the same directory share one kernel watch, and each event is looked
+up by its directory and file name, so a watcher costs the same per event however
+many paths it watches.
+
+A burst of events, like an editor writing a file in several steps, triggers the
+signal once, after no event for it has arrived for the watcher's debounce window.
+The trigger is a delivery of the signal like any other, so it is subject to the
+signal's delivery policy. If the kernel's event queue overflows, every watched signal
+is triggered, since any of the files may have changed.
+"""
+import logging
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from flagman.core import ACTION_BUNDLES, SIGNAL_FLAGS
+from flagman.loop import ReaderCallback
+from flagman.signals import _libc, signal_name
+from flagman.timers import schedule_tick, Timer
+from flagman.types import SignalNumber
+
+logger = logging.getLogger(__name__)
+
+# inotify flags and event masks, see inotify(7)
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+
+#: The events of a directory that change the files in it
+_CHANGES = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+_CHANGES |= _IN_CREATE | _IN_DELETE
+
+# struct inotify_event without its name, which follows it padded to `len` bytes
+_EVENT = struct.Struct('iIII')
+
+#: The number of bytes read from the inotify file descriptor at once
+_READ_SIZE = 64 * 1024
+
+
+class _Settle(Timer):
+    """Triggers a signal once the events for it have settled."""
+
+    merges = False
+
+    def next_at(self, now: float) -> Optional[float]:
+        """Do not tick again until the next event."""
+        return None
+
+
+class FileWatcher:
+    """Raise the flags of signals when the files watched for them change."""
+
+    def __init__(self, debounce: float = 0.2) -> None:
+        """Open an inotify file descriptor without any watches.
+
+        :param debounce: the time in seconds without events for a signal to wait for
+            before triggering it; 0 to trigger it on the first event
+        :raises OSError: if inotify is not available or fails
+        """
+        libc = _libc()
+        try:
+            self._add_watch = libc.inotify_add_watch
+            inotify_init1 = libc.inotify_init1
+        except AttributeError:
+            raise OSError('inotify is not available on this platform') from None
+        self._fd: int = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise _last_error()
+        self._debounce = debounce
+        #: The watched directories by path, with their watch descriptors
+        self._dirs: Dict[str, int] = {}
+        #: The signals of each watch by file name; None for the whole directory
+        self._names: Dict[int, Dict[Optional[bytes], Set[SignalNumber]]] = {}
+        self._settle: Dict[SignalNumber, _Settle] = {}
+        self._immediate = 0
+        #: The number of events read
+        self.events = 0
+
+    @property
+    def triggers(self) -> int:
+        """The number of times a signal was triggered."""
+        return self._immediate + sum(timer.fired for timer in self._settle.values())
+
+    def add(self, path: str, num: SignalNumber) -> None:
+        """Trigger a signal when a file, or any file in a directory, changes.
+
+        The file does not have to exist yet, but its directory does.
+
+        :param path: the path of the file or directory
+        :param num: the signal number
+        :raises OSError: if the directory can't be watched
+        """
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            directory, name = path, None
+        else:
+            directory, filename = os.path.split(path)
+            name = os.fsencode(filename)
+        wd = self._dirs.get(directory)
+        if wd is None:
+            wd = self._add_watch(
+                self._fd, os.fsencode(directory), _CHANGES | _IN_ONLYDIR
+            )
+            if wd < 0:
+                raise _last_error(directory)
+            self._dirs[directory] = wd
+        self._names.setdefault(wd, {}).setdefault(name, set()).add(num)
+        self._settle.setdefault(num, _Settle('watch'))
+        logger.info('Watching `%s` for %s', path, signal_name(num))
+
+    def readers(self) -> List[Tuple[int, ReaderCallback]]:
+        """Get the file descriptors to watch and the callbacks to run when readable.
+
+        :returns: a list of file descriptors and callbacks
+        """
+        return [(self._fd, self._read_events)]
+
+    def close(self) -> None:
+        """Close the inotify file descriptor, which removes every watch."""
+        if self._fd < 0:
+            return None
+        os.close(self._fd)
+        self._fd = -1
+        logger.info('Watch counts: %d events, %d triggers', self.events, self.triggers)
+
+    def _read_events(self) -> None:
+        """Read the waiting events and trigger or postpone the signals they are for."""
+        changed: Set[SignalNumber] = set()
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            changed.update(self._parse(data))
+        now = time.monotonic()
+        for num in changed:
+            # like a timer tick, a change for a signal without actions is ignored
+            if not ACTION_BUNDLES.get(num):
+                continue
+            if self._debounce > 0:
+                schedule_tick(num, self._settle[num], now + self._debounce)
+            else:
+                SIGNAL_FLAGS.trigger(num)
+                self._immediate += 1
+
+    def _parse(self, data: bytes) -> Set[SignalNumber]:
+        """Find the signals a buffer of events is for.
+
+        :param data: the events as read from the file descriptor
+        :returns: the signal numbers
+        """
+        changed: Set[SignalNumber] = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            start = offset + _EVENT.size
+            offset = start + length
+            name = data[start:offset].rstrip(b'\0')
+            self.events += 1
+            if mask & _IN_Q_OVERFLOW:
+                logger.warning('File watch events were lost; triggering every watch')
+                changed.update(self._settle)
+                continue
+            names = self._names.get(wd)
+            if names is None:
+                continue
+            if mask & _IN_IGNORED:
+                self._forget(wd)
+                continue
+            changed.update(names.get(name, ()))
+            changed.update(names.get(None, ()))
+        return changed
+
+    def _forget(self, wd: int) -> None:
+        """Drop a watch the kernel removed, because its directory is gone.
+
+        :param wd: the watch descriptor
+        """
+        for directory, dir_wd in list(self._dirs.items()):
+            if dir_wd == wd:
+                logger.warning('Watched directory `%s` is gone', directory)
+                del self._dirs[directory]
+        del self._names[wd]
+
+
+def _last_error(path: Optional[str] = None) -> OSError:
+    """Create an exception for the error of the latest C library call.
+
+    :param path: the path the call was for, if any
+    :returns: the exception
+    """
+    import ctypes
+
+    errno = ctypes.get_errno()
+    if path is None:
+        return OSError(errno, os.strerror(errno))
+    return OSError(errno, os.strerror(errno), path)
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""Pre-forked worker processes for isolated actions.
+
+An action whose :attr:`~flagman.Action.isolated` attribute is true can be handed to a
+:class:`WorkerPool`. The pool forks its workers once, after the actions have been set
+up, so each worker holds its own copy of its actions with all of their state and a
+signal never pays for a fork or an import.
+
+From then on, running the action in the flagman process sends a request to the action's
+worker and waits for the reply. CPU-heavy actions on different workers can use different
+cores when they are taken by a thread pool, and an exception, a crash or a leak in an
+isolated action stays in its worker. A crashed worker, or one that is killed because an
+action ran out of time, is forked again from the state its actions had after set up.
+
+The workers are not forked from the flagman process itself, which runs threads by the
+time a worker has to be replaced: a child forked from a process with threads may find a
+lock held by a thread that does not exist in the child. Instead the pool forks a zygote
+process while flagman is still single-threaded, and the zygote forks every worker and
+hands the flagman process its end of the worker's pipe.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import traceback
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed, ActionTimeout
+from flagman.signals import SigInfo
+
+logger = logging.getLogger(__name__)
+
+_context = multiprocessing.get_context('fork')
+
+#: A request to a worker: the command, the id of the action and the siginfo of a run
+Request = Tuple[str, int, Optional[SigInfo]]
+
+#: A reply from a worker: the result and a formatted traceback, if there is one
+Reply = Tuple[str, Optional[str]]
+
+#: A request to the zygote: the command and the index of a worker's actions or a PID
+ZygoteRequest = Tuple[str, int]
+
+# Connection is only generic in the stubs, so the annotations are strings
+#: The flagman process's ends of the pipes to its workers, closed in every worker so
+#: that a worker sees end-of-file when the flagman process exits
+_parent_conns: 'List[Connection[Request, Reply]]' = []
+
+#: The flagman process's ends of the pipes to its zygotes, closed in every zygote
+_zygote_conns: 'List[Connection[ZygoteRequest, int]]' = []
+
+
+def _zygote_main(
+    conn: 'Connection[int, ZygoteRequest]', assigned: List[List[Action]]
+) -> None:
+    """Fork and reap workers for the flagman process until it goes away.
+
+    :param conn: the zygote's end of the pipe to the flagman process
+    :param assigned: the actions of each worker
+    """
+    _detach_from_parent()
+
+    while True:
+        try:
+            command, arg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if command == 'stop':
+            break
+        elif command == 'spawn':
+            parent_conn, child_conn = _context.Pipe()
+            pid = os.fork()
+            if pid == 0:
+                conn.close()
+                parent_conn.close()
+                try:
+                    _worker_main(child_conn, assigned[arg])
+                finally:
+                    os._exit(1)
+            child_conn.close()
+            conn.send(pid)
+            reduction.send_handle(conn, parent_conn.fileno(), 0)
+            parent_conn.close()
+        else:
+            if command == 'kill':
+                os.kill(arg, signal.SIGKILL)
+            _, status = os.waitpid(arg, 0)
+            conn.send(
+                -os.WTERMSIG(status)
+                if os.WIFSIGNALED(status)
+                else os.WEXITSTATUS(status)
+            )
+    os._exit(0)
+
+
+def _worker_main(conn: 'Connection[Reply, Request]', actions: List[Action]) -> None:
+    """Serve requests for actions until the flagman process goes away.
+
+    :param conn: the worker's end of the pipe to the flagman process
+    :param actions: the actions this worker runs
+    """
+    _detach_from_parent()
+
+    by_id: Dict[int, Action] = {}
+    for action in actions:
+        if not action._closed:
+            # the copy in this process does the work, so it must not be forwarded
+            action._worker = None
+            by_id[id(action)] = action
+
+    while True:
+        try:
+            command, action_id, siginfo = conn.recv()
+        except (EOFError, OSError):
+            break
+        if command == 'stop':
+            break
+        conn.send(_serve(command, action_id, by_id, siginfo))
+
+    for action in by_id.values():
+        action._close()
+    os._exit(0)
+
+
+def _detach_from_parent() -> None:
+    """Drop the flagman process state that must not leak into a worker."""
+    # signals are handled by the flagman process, so the whole process group can be
+    # signalled without the workers dying or writing to the parent's wakeup fd
+    signal.set_wakeup_fd(-1)
+    for signum in signal.valid_signals():
+        if signal.getsignal(signum) not in (None, signal.SIG_DFL, signal.SIG_IGN):
+            signal.signal(signum, signal.SIG_IGN)
+    for parent_conn in _parent_conns:
+        parent_conn.close()
+    for zygote_conn in _zygote_conns:
+        zygote_conn.close()
+
+
+def _serve(
+    command: str,
+    action_id: int,
+    by_id: Dict[int, Action],
+    siginfo: Optional[SigInfo] = None,
+) -> Reply:
+    """Run or close an action in the worker.
+
+    :param command: 'run' or 'close'
+    :param action_id: the id of the action in the flagman process and in the worker
+    :param by_id: the worker's open actions by id; a closed action is removed
+    :param siginfo: the details of the delivery a run is for
+    :returns: the reply for the flagman process
+    """
+    action = by_id.pop(action_id, None) if command == 'close' else by_id.get(action_id)
+    try:
+        if action is None:
+            raise ActionClosed('Action was already closed in this worker')
+        elif command == 'close':
+            action._close()
+        else:
+            action._run(siginfo)
+    except ActionClosed:
+        by_id.pop(action_id, None)
+        return 'closed', traceback.format_exc()
+    except Exception:
+        return 'error', traceback.format_exc()
+    return 'ok', None
+
+
+class _Zygote:
+    """A single-threaded process that forks and reaps the workers of a pool."""
+
+    def __init__(self, assigned: List[List[Action]]) -> None:
+        """Fork the zygote process.
+
+        :param assigned: the actions of each worker
+        """
+        self._lock = threading.Lock()
+        self._conn, child_conn = _context.Pipe()
+        _zygote_conns.append(self._conn)
+        self._process = _context.Process(
+            target=_zygote_main,
+            args=(child_conn, assigned),
+            name='flagman-zygote',
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+    def spawn(self, index: int) -> 'Tuple[int, Connection[Request, Reply]]':
+        """Fork a worker.
+
+        :param index: the index of the worker's actions
+        :returns: the PID of the worker and the flagman process's end of its pipe
+        """
+        with self._lock:
+            self._conn.send(('spawn', index))
+            pid: int = self._conn.recv()
+            fd = reduction.recv_handle(self._conn)
+        return pid, Connection(fd)
+
+    def wait(self, pid: int, kill: bool = False) -> int:
+        """Wait for a worker to exit.
+
+        :param pid: the PID of the worker
+        :param kill: whether to kill the worker first
+        :returns: the exit code of the worker, negative if a signal ended it
+        """
+        with self._lock:
+            self._conn.send(('kill' if kill else 'wait', pid))
+            exitcode: int = self._conn.recv()
+        return exitcode
+
+    def stop(self) -> None:
+        """Ask the zygote to exit, then wait for it."""
+        with self._lock:
+            try:
+                self._conn.send(('stop', 0))
+            except OSError:
+                pass
+            self._process.join()
+            _zygote_conns.remove(self._conn)
+            self._conn.close()
+
+
+class Worker:
+    """A worker process and the actions it runs."""
+
+    def __init__(self, zygote: _Zygote, index: int, actions: List[Action]) -> None:
+        """Fork the worker process.
+
+        :param zygote: the zygote that forks the worker
+        :param index: the index of the worker's actions in the zygote
+        :param actions: the actions this worker runs
+        """
+        self._zygote = zygote
+        self._index = index
+        self._actions = actions
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._spawn()
+
+    def _spawn(self) -> None:
+        """Fork the worker process with its actions as they were after set up."""
+        self._pid, self._conn = self._zygote.spawn(self._index)
+        _parent_conns.append(self._conn)
+        logger.debug(
+            'Forked worker %d for actions `%s`',
+            self._pid,
+            [action.__class__.__name__ for action in self._actions],
+        )
+
+    def run(
+        self,
+        action: Action,
+        siginfo: Optional[SigInfo] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """Run an action in the worker and wait for it to finish.
+
+        Exceptions other than `ActionClosed` are logged instead of raised.
+
+        :param action: the action
+        :param siginfo: the details of the delivery the action is taken for
+        :param timeout: the time in seconds to wait before the worker is killed and
+            forked again, or None to wait for as long as it takes
+        :raises ActionClosed: if the action is closed
+        :raises ActionTimeout: if the worker was killed because of the timeout
+        """
+        pid = self._pid
+        result, details = self.request('run', action, siginfo, timeout)
+        if result == 'timeout':
+            raise ActionTimeout(details)
+        elif result == 'closed':
+            action._closed = True
+            action._worker = None
+            raise ActionClosed('Closed in worker {}:\n{}'.format(pid, details))
+        elif result == 'error':
+            logger.error(
+                'Isolated action `%s` failed in worker %d:\n%s',
+                action.__class__.__name__,
+                pid,
+                details,
+            )
+
+    def close(self, action: Action) -> None:
+        """Close an action in the worker, running its tear down logic there.
+
+        :param action: the action
+        """
+        action._closed = True
+        result, details = self.request('close', action)
+        if result == 'error':
+            logger.error(
+                'Tear down of isolated action `%s` failed:\n%s',
+                action.__class__.__name__,
+                details,
+            )
+
+    def request(
+        self,
+        command: str,
+        action: Action,
+        siginfo: Optional[SigInfo] = None,
+        timeout: Optional[float] = None,
+    ) -> Reply:
+        """Send a request about an action and wait for the reply.
+
+        If the worker has crashed, it is forked again and the reply is an error. If the
+        reply takes longer than the timeout, the worker is killed and forked again and
+        the reply is a timeout.
+
+        :param command: 'run' or 'close'
+        :param action: the action
+        :param siginfo: the details of the delivery a run is for
+        :param timeout: the time in seconds to wait for the reply, or None for no limit
+        :returns: the reply
+        """
+        with self._lock:
+            if self._stopped:
+                return 'closed', None
+            try:
+                self._conn.send((command, id(action), siginfo))
+                if timeout is not None and not self._conn.poll(timeout):
+                    return 'timeout', self._kill(timeout)
+                reply: Reply = self._conn.recv()
+                return reply
+            except (EOFError, OSError):
+                message = 'worker {} exited with code {}'.format(
+                    self._pid, self._zygote.wait(self._pid)
+                )
+                self._close_conn()
+                self._spawn()
+                return 'error', message
+
+    def _kill(self, timeout: float) -> str:
+        """Kill the worker process and fork it again.
+
+        :param timeout: the time in seconds the worker had to reply
+        :returns: a message saying why the worker was killed
+        """
+        self._zygote.wait(self._pid, kill=True)
+        message = 'Killed worker {} after {:.3g}s'.format(self._pid, timeout)
+        self._close_conn()
+        self._spawn()
+        return message
+
+    def _close_conn(self) -> None:
+        """Close this end of the pipe to the worker process."""
+        _parent_conns.remove(self._conn)
+        self._conn.close()
+
+    def stop(self) -> None:
+        """Ask the worker to tear down its actions and exit, then wait for it."""
+        with self._lock:
+            self._stopped = True
+            try:
+                self._conn.send(('stop', 0, None))
+            except OSError:
+                pass
+            self._zygote.wait(self._pid)
+            self._close_conn()
+        for action in self._actions:
+            action._closed = True
+            action._worker = None
+
+
+class WorkerPool:
+    """A pool of pre-forked worker processes for isolated actions."""
+
+    def __init__(self, processes: int) -> None:
+        """Create an empty pool.
+
+        :param processes: the number of worker processes to fork
+        """
+        self._processes = processes
+        self._workers: List[Worker] = []
+        self._zygote: Optional[_Zygote] = None
+
+    def start(self, actions: Iterable[Action]) -> int:
+        """Fork the workers and hand them the isolated actions.
+
+        Isolated actions are spread over the workers round-robin. Call this after the
+        actions are set up and before any threads are started, since the zygote that
+        forks the workers, then and later, is forked here.
+
+        :param actions: all configured actions; only isolated ones are handed over
+        :returns: the number of actions handed to workers
+        """
+        isolated: Dict[int, Action] = {}
+        for action in actions:
+            if action.isolated and not action._closed:
+                isolated.setdefault(id(action), action)
+        if not isolated:
+            return 0
+
+        assigned: List[List[Action]] = [[] for _ in range(self._processes)]
+        for idx, action in enumerate(isolated.values()):
+            assigned[idx % self._processes].append(action)
+
+        logger.info(
+            'Forking %d workers for %d isolated actions', self._processes, len(isolated)
+        )
+        assigned = [worker_actions for worker_actions in assigned if worker_actions]
+        self._zygote = _Zygote(assigned)
+        for index, worker_actions in enumerate(assigned):
+            worker = Worker(self._zygote, index, worker_actions)
+            self._workers.append(worker)
+            for action in worker_actions:
+                action._worker = worker
+        return len(isolated)
+
+    def shutdown(self) -> None:
+        """Stop all workers, tearing down their actions."""
+        for worker in self._workers:
+            worker.stop()
+        self._workers.clear()
+        if self._zygote is not None:
+            self._zygote.stop()
+            self._zygote = None
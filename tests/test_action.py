@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Tests for running the coroutine methods of actions from synchronous code."""
+import asyncio
+import threading
+import unittest
+from typing import List
+
+from flagman.actions import Action
+
+
+class LoopAction(Action):
+    """An Action with a coroutine run that records the event loop it runs on."""
+
+    def set_up(self) -> None:  # type: ignore
+        """Start with no recorded loops."""
+        self.loops: List[asyncio.AbstractEventLoop] = []
+
+    async def run(self) -> None:  # type: ignore
+        """Record the running event loop."""
+        self.loops.append(asyncio.get_running_loop())
+
+
+class TestRunSync(unittest.TestCase):
+    """Tests for driving coroutine methods without a running event loop."""
+
+    def test_loop_kept(self) -> None:
+        """Test that a thread runs every coroutine on the same event loop."""
+        action = LoopAction()
+        action._run()
+        action._run()
+        first, second = action.loops
+        self.assertIs(first, second)
+        self.assertFalse(first.is_closed())
+
+    def test_loop_closed_with_thread(self) -> None:
+        """Test that the event loop of a thread is closed when the thread exits."""
+        action = LoopAction()
+        thread = threading.Thread(target=action._run)
+        thread.start()
+        thread.join()
+        loop, = action.loops
+        self.assertTrue(loop.is_closed())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Tests for the asyncio runtime."""
+import asyncio
+import os
+import signal
+import unittest
+from typing import List, Tuple
+
+from flagman.actions import Action
+from flagman.aio import run_async
+from flagman.core import ACTION_BUNDLES, SIGNAL_FLAGS
+from flagman.exceptions import ActionClosed
+from flagman.pending import SignalPolicy
+
+FIRST = signal.SIGUSR1
+SECOND = signal.SIGUSR2
+
+#: Type alias for the records of the actions: the action's name and what happened
+Events = List[Tuple[str, str]]
+
+
+class AsyncAction(Action):
+    """An Action with coroutine methods that records what it does and closes itself."""
+
+    def set_up(  # type: ignore
+        self, name: str, events: Events, delay: float = 0, runs: int = 1
+    ) -> None:
+        """Store what to record and when to close.
+
+        :param name: the name to record events with
+        :param events: the list to record events in
+        :param delay: how long each run takes in seconds
+        :param runs: the number of runs after which the action closes itself
+        """
+        self.name = name
+        self.events = events
+        self.delay = delay
+        self.runs = runs
+
+    async def run(self) -> None:  # type: ignore
+        """Record the start and the end of the run, then close if it was the last.
+
+        :raises ActionClosed: after the last run
+        """
+        self.events.append((self.name, 'start'))
+        await asyncio.sleep(self.delay)
+        self.events.append((self.name, 'end'))
+        self.runs -= 1
+        if self.runs <= 0:
+            self._close()
+            raise ActionClosed('Done running')
+
+
+class SetUpAction(AsyncAction):
+    """An AsyncAction whose set up is a coroutine."""
+
+    async def set_up(self, name: str, events: Events) -> None:  # type: ignore
+        """Record the set up after giving way to the event loop.
+
+        :param name: the name to record events with
+        :param events: the list to record events in
+        """
+        await asyncio.sleep(0)
+        super().set_up(name, events)
+        events.append((name, 'set up'))
+
+
+class TestRunAsync(unittest.TestCase):
+    """Tests for :func:`flagman.aio.run_async`."""
+
+    def setUp(self) -> None:
+        """Restore the handlers and the bundles of the signals after the test."""
+        self.events: Events = []
+        for num in (FIRST, SECOND):
+            self.addCleanup(signal.signal, num, signal.getsignal(num))
+            self.addCleanup(ACTION_BUNDLES[num].clear)
+        self.addCleanup(SIGNAL_FLAGS.clear)
+
+    def run_async(self) -> None:
+        """Dispatch until every action has closed itself."""
+        asyncio.run(asyncio.wait_for(run_async(), 5))
+
+    def test_set_up(self) -> None:
+        """Test that coroutine set ups are awaited before the first dispatch."""
+        ACTION_BUNDLES[FIRST].append(SetUpAction('a', self.events))
+        ACTION_BUNDLES[SECOND].append(SetUpAction('b', self.events))
+        SIGNAL_FLAGS.add(FIRST)
+        SIGNAL_FLAGS.add(SECOND)
+        self.run_async()
+        self.assertEqual(sorted(self.events[:2]), [('a', 'set up'), ('b', 'set up')])
+        self.assertEqual(len(self.events), 6)
+
+    def test_bundles_concurrent(self) -> None:
+        """Test that a slow bundle does not hold up the bundle of another signal."""
+        ACTION_BUNDLES[FIRST].append(AsyncAction('slow', self.events, 0.2))
+        ACTION_BUNDLES[SECOND].append(AsyncAction('fast', self.events))
+        SIGNAL_FLAGS.add(FIRST)
+        SIGNAL_FLAGS.add(SECOND)
+        self.run_async()
+        self.assertEqual(
+            self.events,
+            [('slow', 'start'), ('fast', 'start'), ('fast', 'end'), ('slow', 'end')],
+        )
+
+    def test_bundle_in_order(self) -> None:
+        """Test that a bundle's actions are taken in order and never run twice at once.
+
+        The second delivery arrives while the bundle is running, so its run starts once
+        the first is done.
+        """
+        self.addCleanup(SIGNAL_FLAGS.set_policy, FIRST, *SIGNAL_FLAGS.policy(FIRST))
+        SIGNAL_FLAGS.set_policy(FIRST, SignalPolicy.EVERY)
+        first = AsyncAction('first', self.events, 0.1, 2)
+        second = AsyncAction('second', self.events, 0, 2)
+        ACTION_BUNDLES[FIRST].extend((first, second))
+
+        async def deliver_later() -> None:
+            await asyncio.sleep(0.05)
+            os.kill(os.getpid(), FIRST)
+
+        async def run() -> None:
+            asyncio.ensure_future(deliver_later())
+            await run_async()
+
+        SIGNAL_FLAGS.add(FIRST)
+        asyncio.run(asyncio.wait_for(run(), 5))
+        taken = [('first', 'start'), ('first', 'end'), ('second', 'start')]
+        self.assertEqual(self.events, (taken + [('second', 'end')]) * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests for parsing the command line of flagman."""
+import contextlib
+import io
+import unittest
+
+from flagman.cli import parse_args
+
+
+class TestParseArgs(unittest.TestCase):
+    """Tests for :func:`flagman.cli.parse_args`."""
+
+    def assertRejected(self, *argv: str) -> None:
+        """Assert that a command line is rejected with a usage error.
+
+        :param argv: the arguments after the program name
+        """
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), self.assertRaises(SystemExit) as cm:
+            parse_args(['flagman', '--usr1', 'print', 'a', *argv])
+        self.assertEqual(cm.exception.code, 2)
+
+    def test_isolate(self) -> None:
+        """Test that `--isolate` needs `--processes` and a known action."""
+        args = parse_args(['flagman', '--processes', '1', '--isolate', 'print'])
+        self.assertEqual(args.isolate, ['print'])
+        self.assertRejected('--isolate', 'print')
+        self.assertRejected('--processes', '1', '--isolate', 'nosuchaction')
+
+    def test_throttle(self) -> None:
+        """Test that `--throttle` needs a known action and a valid throttle."""
+        args = parse_args(['flagman', '--throttle', 'print=interval:1'])
+        self.assertEqual(args.throttle, [('print', 'interval:1')])
+        self.assertRejected('--throttle', 'nosuchaction=interval:1')
+        self.assertRejected('--throttle', 'print=interval:0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Tests for reloading action bundles from a config file."""
+import json
+import os
+import signal
+import tempfile
+import unittest
+from typing import Dict, List
+
+from flagman import core
+from flagman.actions import DelayedPrintAction, PrintAction
+from flagman.config import ConfigFile, read_config
+from flagman.core import (
+    ACTION_BUNDLES,
+    DISPATCH_PLANS,
+    remove_handled_signal,
+    SIGNAL_FLAGS,
+)
+from flagman.exceptions import ConfigError
+from flagman.pending import SignalPolicy
+from flagman.timers import _scheduled, set_timers, timers_of
+
+FIRST = signal.SIGRTMIN + 12
+SECOND = signal.SIGRTMIN + 13
+
+#: Type alias for the tables of a config file
+Document = Dict[str, Dict[str, object]]
+
+
+class TestConfigFile(unittest.TestCase):
+    """Tests for :class:`flagman.config.ConfigFile`."""
+
+    def setUp(self) -> None:
+        """Create a directory for the config file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'flagman.json')
+
+    def tearDown(self) -> None:
+        """Close the actions from the file and stop handling its signals."""
+        for num in (FIRST, SECOND):
+            for action in ACTION_BUNDLES.get(num, []):
+                action._release()
+            ACTION_BUNDLES.get(num, []).clear()
+            remove_handled_signal(num)
+            DISPATCH_PLANS.pop(num, None)
+            core._handler_signals.discard(num)
+            set_timers(num, [])
+            SIGNAL_FLAGS.set_priority(num, 0)
+
+    def write(self, document: Document) -> None:
+        """Write the config file.
+
+        :param document: the tables of the file
+        """
+        with open(self.path, 'w') as f:
+            json.dump(document, f)
+
+    def load(self, document: Document) -> ConfigFile:
+        """Write and load the config file, as if flagman had started with it.
+
+        :param document: the tables of the file
+        :returns: the loaded config file
+        """
+        self.write(document)
+        config = ConfigFile(self.path)
+        config.load()
+        core._handler_signals.update((FIRST, SECOND))
+        return config
+
+    def bundle(self, num: int) -> List[str]:
+        """Get the messages of the print actions for a signal.
+
+        :param num: the signal number
+        :returns: the messages
+        """
+        return [getattr(action, '_msg') for action in ACTION_BUNDLES[num]]
+
+    def test_load(self) -> None:
+        """Test that loading the file adds its actions, policies and priorities."""
+        self.load(
+            {
+                'rtmin+12': {
+                    'actions': [['print', 'one'], ['print', 'two']],
+                    'policy': 'every',
+                    'priority': 5,
+                }
+            }
+        )
+        self.assertEqual(self.bundle(FIRST), ['one', 'two'])
+        self.assertEqual(SIGNAL_FLAGS.policy(FIRST)[0], SignalPolicy.EVERY)
+        self.assertEqual(SIGNAL_FLAGS.priority(FIRST), 5)
+
+    def test_reload_keeps_unchanged_actions(self) -> None:
+        """Test that a reload keeps unchanged actions and replaces changed ones."""
+        config = self.load({'rtmin+12': {'actions': [['print', 'a'], ['print', 'b']]}})
+        kept, changed = ACTION_BUNDLES[FIRST]
+        self.write({'rtmin+12': {'actions': [['print', 'a'], ['print', 'c']]}})
+        self.assertTrue(config.reload())
+        self.assertIs(ACTION_BUNDLES[FIRST][0], kept)
+        self.assertEqual(self.bundle(FIRST), ['a', 'c'])
+        self.assertTrue(changed._closed)
+        self.assertFalse(kept._closed)
+        self.assertEqual(
+            DISPATCH_PLANS[FIRST],
+            tuple((action, action._run) for action in ACTION_BUNDLES[FIRST]),
+        )
+
+    def test_reload_reorders(self) -> None:
+        """Test that reordered actions keep their instances in the new order."""
+        config = self.load({'rtmin+12': {'actions': [['print', 'a'], ['print', 'b']]}})
+        first, second = ACTION_BUNDLES[FIRST]
+        self.write({'rtmin+12': {'actions': [['print', 'b'], ['print', 'a']]}})
+        self.assertTrue(config.reload())
+        self.assertEqual(ACTION_BUNDLES[FIRST], [second, first])
+
+    def test_reload_removes_signal(self) -> None:
+        """Test that a signal left out of the file loses its actions and priority."""
+        config = self.load(
+            {
+                'rtmin+12': {'actions': [['print', 'a']]},
+                'rtmin+13': {'actions': [['print', 'b']], 'priority': 3},
+            }
+        )
+        removed = ACTION_BUNDLES[SECOND][0]
+        self.write({'rtmin+12': {'actions': [['print', 'a']]}})
+        self.assertTrue(config.reload())
+        self.assertEqual(ACTION_BUNDLES[SECOND], [])
+        self.assertTrue(removed._closed)
+        self.assertEqual(SIGNAL_FLAGS.priority(SECOND), 0)
+
+    def test_reload_keeps_command_line_actions(self) -> None:
+        """Test that actions from the command line are left alone."""
+        core.add_handled_signal(FIRST)
+        cli_action = PrintAction('cli')
+        ACTION_BUNDLES[FIRST].append(cli_action)
+        config = self.load({'rtmin+12': {'actions': [['print', 'a']]}})
+        self.write({'rtmin+12': {'actions': []}})
+        self.assertTrue(config.reload())
+        self.assertEqual(ACTION_BUNDLES[FIRST], [cli_action])
+
+    def test_failed_reload(self) -> None:
+        """Test that an action failing to set up leaves the running actions as is."""
+        config = self.load({'rtmin+12': {'actions': [['print', 'a']]}})
+        before = list(ACTION_BUNDLES[FIRST])
+        self.write(
+            {'rtmin+12': {'actions': [['print', 'b'], ['delay_print', 'c', 'soon']]}}
+        )
+        with self.assertLogs('flagman.config', 'ERROR'):
+            self.assertFalse(config.reload())
+        self.assertEqual(ACTION_BUNDLES[FIRST], before)
+        self.assertFalse(before[0]._closed)
+        self.assertFalse(
+            any(isinstance(a, DelayedPrintAction) for a in ACTION_BUNDLES[FIRST])
+        )
+
+    def test_reload_keeps_timer_schedule(self) -> None:
+        """Test that a reload keeps the schedule of a timer that did not change."""
+        config = self.load(
+            {'rtmin+12': {'actions': [['print', 'a']], 'timer': 'every:60'}}
+        )
+        timer, = timers_of(FIRST)
+        scheduled = _scheduled[timer]
+        self.assertTrue(config.reload())
+        self.assertEqual(timers_of(FIRST), [timer])
+        self.assertEqual(_scheduled[timer], scheduled)
+
+
+class TestReadConfig(unittest.TestCase):
+    """Tests for :func:`flagman.config.read_config`."""
+
+    def read(self, document: object) -> None:
+        """Write a config file and read it.
+
+        :param document: the content of the file
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'flagman.json')
+            with open(path, 'w') as f:
+                json.dump(document, f)
+            read_config(path)
+
+    def test_invalid(self) -> None:
+        """Test that invalid files are rejected."""
+        for document in (
+            [],
+            {'nosuchsignal': {'actions': []}},
+            {'term': {'actions': []}},
+            {'usr1': {'actions': [['nosuchaction']]}},
+            {'usr1': {'actions': [], 'policy': 'sometimes'}},
+            {'usr1': {'actions': [], 'timer': 'every:0'}},
+            {'usr1': {'actions': [], 'unknown': 1}},
+        ):
+            with self.subTest(document=document), self.assertRaises(ConfigError):
+                self.read(document)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Tests for triggering action bundles through the control socket."""
+import json
+import os
+import select
+import signal
+import socket
+import tempfile
+import unittest
+from typing import Dict, List
+
+from flagman import core
+from flagman.actions import Action
+from flagman.control import ControlServer
+from flagman.core import (
+    ACTION_BUNDLES,
+    add_handled_signal,
+    DISPATCH_PLANS,
+    HANDLED_SIGNALS,
+    SIGNAL_FLAGS,
+)
+
+SIGNAL = signal.SIGRTMIN + 16
+
+
+class CountAction(Action):
+    """An Action that counts its runs."""
+
+    def set_up(self) -> None:  # type: ignore
+        """Start with no runs."""
+        self.runs = 0
+
+    def run(self) -> None:
+        """Count the run."""
+        self.runs += 1
+
+
+class TestControlServer(unittest.TestCase):
+    """Tests for :class:`flagman.control.ControlServer`."""
+
+    def setUp(self) -> None:
+        """Give a signal an action, and connect to a control socket."""
+        add_handled_signal(SIGNAL)
+        self.addCleanup(HANDLED_SIGNALS.remove, SIGNAL)
+        self.addCleanup(ACTION_BUNDLES.pop, SIGNAL)
+        self.action = CountAction()
+        ACTION_BUNDLES[SIGNAL].append(self.action)
+        core._build_dispatch_plan(SIGNAL)
+        self.addCleanup(DISPATCH_PLANS.pop, SIGNAL, None)
+        self.addCleanup(SIGNAL_FLAGS.clear)
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'control.sock')
+        self.server = ControlServer(path)
+        self.addCleanup(self.server.close)
+        self.client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(self.client.close)
+        self.client.settimeout(5)
+        self.client.connect(path)
+        self.buffer = b''
+
+    def send(self, *lines: str) -> None:
+        """Send request lines and let the server handle them.
+
+        :param lines: the lines, without their newlines
+        """
+        self.client.sendall(''.join(line + '\n' for line in lines).encode())
+        # the first poll accepts the client, the second reads its lines
+        self.server.poll()
+        self.server.poll()
+
+    def dispatch(self) -> None:
+        """Run the bundles of the triggered signals."""
+        while SIGNAL_FLAGS:
+            core._dispatch(core._pop_signal())
+
+    def receive(self, count: int) -> List[Dict[str, object]]:
+        """Read response lines.
+
+        :param count: the number of lines to read
+        :returns: the responses
+        """
+        while self.buffer.count(b'\n') < count:
+            data = self.client.recv(65536)
+            self.assertTrue(data, 'the server disconnected')
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n', count)
+        return [json.loads(line) for line in lines]
+
+    def test_trigger(self) -> None:
+        """Test that a trigger runs the bundle and gets the outcome of its actions."""
+        self.send(json.dumps({'id': 1, 'trigger': ['rtmin+16']}))
+        self.dispatch()
+        response, = self.receive(1)
+        self.assertEqual(self.action.runs, 1)
+        self.assertEqual(response['id'], 1)
+        result, = response['results']  # type: ignore
+        self.assertEqual(result['signal'], 'SIGRTMIN+16')
+        self.assertEqual(result['status'], 'ran')
+        action, = result['actions']
+        self.assertEqual(action['action'], 'CountAction')
+        self.assertEqual(action['outcome'], 'ok')
+        self.assertIsInstance(action['seconds'], float)
+
+    def test_trigger_errors(self) -> None:
+        """Test that triggers that can't be made get an error and are not delivered."""
+        self.send(
+            json.dumps(
+                {
+                    'id': 'errors',
+                    'trigger': ['nosuchsignal', 'usr2', {'value': 1}, 'rtmin+16'],
+                }
+            )
+        )
+        self.dispatch()
+        response, = self.receive(1)
+        results = response['results']
+        self.assertEqual(
+            [result['status'] for result in results],  # type: ignore
+            ['error', 'error', 'error', 'ran'],
+        )
+        self.assertEqual(
+            results[1],  # type: ignore
+            {
+                'signal': 'SIGUSR2',
+                'status': 'error',
+                'error': 'no actions for this signal',
+            },
+        )
+        self.assertEqual(self.action.runs, 1)
+
+    def test_bad_request(self) -> None:
+        """Test that a line that is not a valid request gets an error response."""
+        for line in ('not json', '[]', '{"id": 1}', '{"trigger": "usr1"}'):
+            with self.subTest(line=line):
+                self.send(line)
+                response, = self.receive(1)
+                self.assertIsNone(response['id'])
+                self.assertTrue(str(response['error']).startswith('bad request: '))
+                self.assertNotIn('results', response)
+
+    def test_pipelined(self) -> None:
+        """Test that pipelined batches are answered in the order they were sent."""
+        self.send(
+            json.dumps({'id': 1, 'trigger': ['rtmin+16']}),
+            'not json',
+            json.dumps({'id': 2, 'trigger': []}),
+        )
+        # the later batches are done, but wait for the first one
+        self.assertEqual(select.select([self.client], [], [], 0)[0], [])
+        self.dispatch()
+        self.assertEqual([response['id'] for response in self.receive(3)], [1, None, 2])
+        self.assertEqual(self.action.runs, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
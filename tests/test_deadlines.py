@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""Tests for the time limits of actions and action bundles."""
+import asyncio
+import threading
+import time
+import unittest
+from typing import List
+
+from flagman.actions import Action
+from flagman.deadlines import (
+    atake_action,
+    bundle_end,
+    Deadlines,
+    parse_timeout_policy,
+    take_action,
+    time_limit,
+    TimeoutPolicy,
+)
+from flagman.exceptions import ActionClosed, ActionTimeout
+
+
+class SlowAction(Action):
+    """An Action whose runs take given times."""
+
+    def set_up(self, *seconds: str) -> None:  # type: ignore
+        """Store the times of the runs.
+
+        :param seconds: the time each run takes; later runs take no time
+        """
+        self.seconds = [float(s) for s in seconds]
+        self.runs: List[float] = []
+        self.returned = threading.Event()
+        self.torn_down = False
+
+    def run(self) -> None:
+        """Take the time of this run."""
+        self.runs.append(time.monotonic())
+        seconds = self.seconds.pop(0) if self.seconds else 0.0
+        time.sleep(seconds)
+        self.returned.set()
+
+    def tear_down(self) -> None:
+        """Record the tear down."""
+        self.torn_down = True
+
+
+class SlowAsyncAction(SlowAction):
+    """An Action with a coroutine run that takes given times."""
+
+    async def run(self) -> None:  # type: ignore
+        """Take the time of this run."""
+        self.runs.append(time.monotonic())
+        await asyncio.sleep(self.seconds.pop(0) if self.seconds else 0.0)
+
+
+class TestParseTimeoutPolicy(unittest.TestCase):
+    """Tests for :func:`flagman.deadlines.parse_timeout_policy`."""
+
+    def test_policies(self) -> None:
+        """Test that policies are parsed with their retries."""
+        self.assertEqual(parse_timeout_policy('skip'), (TimeoutPolicy.SKIP, 1))
+        self.assertEqual(parse_timeout_policy('retry'), (TimeoutPolicy.RETRY, 1))
+        self.assertEqual(parse_timeout_policy('retry:3'), (TimeoutPolicy.RETRY, 3))
+        for value in ('sometimes', 'retry:-1', 'retry:x', 'close:2'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_timeout_policy(value)
+
+
+class TestTimeLimit(unittest.TestCase):
+    """Tests for :func:`flagman.deadlines.time_limit`."""
+
+    def test_shortest(self) -> None:
+        """Test that the shortest limit applies."""
+        action = SlowAction()
+        self.assertIsNone(time_limit(action, None, None))
+        self.assertEqual(time_limit(action, Deadlines(timeout=5), None), 5)
+        action.timeout = 2
+        self.assertEqual(time_limit(action, Deadlines(timeout=5), None), 2)
+        deadlines = Deadlines(deadline=1)
+        limit = time_limit(action, deadlines, bundle_end(deadlines))
+        assert limit is not None  # noqa: S101 (assert)
+        self.assertLessEqual(limit, 1)
+
+    def test_deadline_passed(self) -> None:
+        """Test that no time is left once the deadline of the bundle has passed."""
+        with self.assertRaises(ActionTimeout):
+            time_limit(SlowAction(), Deadlines(deadline=1), time.monotonic() - 1)
+
+
+class TestTakeAction(unittest.TestCase):
+    """Tests for :func:`flagman.deadlines.take_action` and its timeout policies."""
+
+    def take(self, action: SlowAction, deadlines: Deadlines) -> None:
+        """Take an action that runs out of time, which logs what its policy does.
+
+        :param action: the action
+        :param deadlines: the time limits of its bundle
+        """
+        with self.assertLogs('flagman.deadlines', 'INFO'):
+            take_action(action, None, deadlines)
+
+    def test_in_time(self) -> None:
+        """Test that a run within its time limit is taken as usual."""
+        action = SlowAction()
+        take_action(action, None, Deadlines(timeout=5))
+        self.assertEqual(len(action.runs), 1)
+
+    def test_skip(self) -> None:
+        """Test that a run that ran out of time is skipped, also while it goes on."""
+        action = SlowAction('0.3')
+        with self.assertRaises(ActionTimeout):
+            self.take(action, Deadlines(timeout=0.05))
+        # the abandoned run is still going, so the next run is skipped
+        with self.assertRaises(ActionTimeout):
+            self.take(action, Deadlines(timeout=0.05))
+        self.assertEqual(len(action.runs), 1)
+        self.assertTrue(action.returned.wait(5))
+        take_action(action, None, Deadlines(timeout=0.05))
+        self.assertEqual(len(action.runs), 2)
+
+    def test_retry_after_overrun(self) -> None:
+        """Test that a retry waits for the run that ran out of time, then runs."""
+        action = SlowAction('0.15')
+        self.take(action, Deadlines(timeout=0.1, policy=TimeoutPolicy.RETRY))
+        first, retry = action.runs
+        self.assertGreaterEqual(retry - first, 0.15)
+
+    def test_retries_run_out(self) -> None:
+        """Test that retries never overlap a run that is still going."""
+        action = SlowAction('0.5')
+        deadlines = Deadlines(timeout=0.05, policy=TimeoutPolicy.RETRY, retries=2)
+        with self.assertRaises(ActionTimeout):
+            self.take(action, deadlines)
+        self.assertEqual(len(action.runs), 1)
+        self.assertTrue(action.returned.wait(5))
+
+    def test_retry_coroutine(self) -> None:
+        """Test that a cancelled coroutine run is retried."""
+        action = SlowAsyncAction('5')
+        self.take(action, Deadlines(timeout=0.05, policy=TimeoutPolicy.RETRY))
+        self.assertEqual(len(action.runs), 2)
+
+    def test_retry_on_loop(self) -> None:
+        """Test that a retry on the event loop also waits for the run."""
+        action = SlowAction('0.15')
+        deadlines = Deadlines(timeout=0.1, policy=TimeoutPolicy.RETRY)
+        with self.assertLogs('flagman.deadlines', 'INFO'):
+            asyncio.run(atake_action(action, None, deadlines))
+        self.assertEqual(len(action.runs), 2)
+
+    def test_close(self) -> None:
+        """Test that the close policy closes the action once its run returns."""
+        action = SlowAction('0.2')
+        with self.assertRaises(ActionClosed):
+            self.take(action, Deadlines(timeout=0.05, policy=TimeoutPolicy.CLOSE))
+        self.assertFalse(action.torn_down)
+        with self.assertRaises(ActionClosed):
+            take_action(action, None, Deadlines(timeout=0.05))
+        self.assertTrue(action.returned.wait(5))
+        for _ in range(100):
+            if action.torn_down:
+                break
+            time.sleep(0.01)
+        self.assertTrue(action.torn_down)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""Tests for taking action bundles on a thread of a host application."""
+import os
+import signal
+import threading
+import unittest
+from typing import List, Optional
+
+from flagman.actions import Action
+from flagman.core import ACTION_BUNDLES, add_handled_signal, HANDLED_SIGNALS
+from flagman.embed import Dispatcher
+from flagman.signals import SigInfo
+
+SIGNAL = signal.SIGRTMIN + 17
+
+
+class RecordAction(Action):
+    """An Action that records the thread and the siginfo of its runs."""
+
+    wants_siginfo = True
+
+    def set_up(self, fail: bool = False) -> None:  # type: ignore
+        """Start with no runs.
+
+        :param fail: whether runs raise an exception
+        """
+        self.fail = fail
+        self.threads: List[str] = []
+        self.infos: List[Optional[SigInfo]] = []
+        self.ran = threading.Event()
+        self.closed = False
+
+    def run(self, siginfo: Optional[SigInfo] = None) -> None:  # type: ignore
+        """Record the run.
+
+        :param siginfo: the details of the delivery
+        :raises RuntimeError: if the action was made to fail
+        """
+        self.threads.append(threading.current_thread().name)
+        self.infos.append(siginfo)
+        self.ran.set()
+        if self.fail:
+            raise RuntimeError('failed')
+
+    def tear_down(self) -> None:
+        """Record the tear down."""
+        self.closed = True
+
+
+class TestDispatcher(unittest.TestCase):
+    """Tests for :class:`flagman.embed.Dispatcher`."""
+
+    def start(self, action: RecordAction, max_workers: int = 0) -> Dispatcher:
+        """Give a signal an action and start a dispatcher for it.
+
+        :param action: the action
+        :param max_workers: the size of the dispatcher's thread pool
+        :returns: the started dispatcher
+        """
+        add_handled_signal(SIGNAL)
+        self.addCleanup(HANDLED_SIGNALS.remove, SIGNAL)
+        self.addCleanup(ACTION_BUNDLES.pop, SIGNAL)
+        ACTION_BUNDLES[SIGNAL].append(action)
+        dispatcher = Dispatcher(max_workers)
+        dispatcher.start()
+        self.addCleanup(dispatcher.stop)
+        self.assertTrue(dispatcher.running)
+        return dispatcher
+
+    def test_trigger(self) -> None:
+        """Test that a trigger takes the bundle on the dispatcher thread."""
+        for max_workers in (0, 2):
+            with self.subTest(max_workers=max_workers):
+                action = RecordAction()
+                dispatcher = self.start(action, max_workers)
+                dispatcher.trigger('rtmin+17')
+                self.assertTrue(action.ran.wait(5))
+                dispatcher.stop()
+                self.assertFalse(dispatcher.running)
+                self.assertNotEqual(action.threads[0], 'MainThread')
+                self.assertEqual(action.infos, [None])
+                self.doCleanups()
+
+    def test_signal(self) -> None:
+        """Test that a delivery of the signal is read on the dispatcher thread."""
+        action = RecordAction()
+        self.start(action)
+        os.kill(os.getpid(), SIGNAL)
+        self.assertTrue(action.ran.wait(5))
+        info, = action.infos
+        assert info is not None  # noqa: S101 (assert)
+        self.assertEqual((info.signo, info.pid), (SIGNAL, os.getpid()))
+
+    def test_trigger_rejected(self) -> None:
+        """Test that a trigger for an unhandled signal or a stopped dispatcher fails."""
+        dispatcher = self.start(RecordAction())
+        with self.assertRaises(ValueError):
+            dispatcher.trigger(signal.SIGRTMIN + 18)
+        dispatcher.stop()
+        with self.assertRaises(RuntimeError):
+            dispatcher.trigger(SIGNAL)
+
+    def test_stop(self) -> None:
+        """Test that stopping closes the actions and restores the signal handlers."""
+        before = signal.getsignal(SIGNAL)
+        action = RecordAction()
+        dispatcher = self.start(action)
+        self.assertNotEqual(signal.getsignal(SIGNAL), before)
+        dispatcher.stop()
+        self.assertTrue(action.closed)
+        self.assertEqual(ACTION_BUNDLES[SIGNAL], [])
+        self.assertEqual(signal.getsignal(SIGNAL), before)
+        dispatcher.stop()
+
+    def test_failed(self) -> None:
+        """Test that an exception that stopped the dispatcher is raised by `stop`."""
+        action = RecordAction(True)
+        dispatcher = self.start(action)
+        with self.assertLogs('flagman.embed', 'ERROR'):
+            dispatcher.trigger(SIGNAL)
+            self.assertTrue(action.ran.wait(5))
+            with self.assertRaises(RuntimeError):
+                dispatcher.stop()
+        self.assertFalse(dispatcher.running)
+        self.assertTrue(action.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
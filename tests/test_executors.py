@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Tests for taking action bundles on a thread pool."""
+import signal
+import threading
+import unittest
+from typing import List, Optional
+
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed
+from flagman.executors import ordering_chains, take_chain, ThreadPoolBundleExecutor
+
+SIGNAL = signal.SIGUSR1
+
+
+class RecordAction(Action):
+    """An Action that records its runs, optionally waiting at a barrier first."""
+
+    def set_up(  # type: ignore
+        self,
+        name: str,
+        runs: List[str],
+        group: Optional[str] = None,
+        barrier: Optional[threading.Barrier] = None,
+    ) -> None:
+        """Store what to record and how to run.
+
+        :param name: the name to record runs with
+        :param runs: the list to record runs in
+        :param group: the ordering group of the action
+        :param barrier: a barrier to wait at before each run
+        """
+        self.name = name
+        self.runs = runs
+        self.ordering_group = group
+        self.barrier = barrier
+        #: An exception to raise from each run
+        self.exc: Optional[Exception] = None
+
+    def run(self) -> None:
+        """Wait at the barrier, record the run, and raise the exception, if any."""
+        if self.barrier is not None:
+            self.barrier.wait(5)
+        self.runs.append(self.name)
+        if self.exc is not None:
+            raise self.exc
+
+
+class TestOrderingChains(unittest.TestCase):
+    """Tests for :func:`flagman.executors.ordering_chains`."""
+
+    def test_chains(self) -> None:
+        """Test that actions of a group form one chain and others one chain each."""
+        runs: List[str] = []
+        a, b, c, d = (
+            RecordAction('a', runs, 'x'),
+            RecordAction('b', runs),
+            RecordAction('c', runs, 'x'),
+            RecordAction('d', runs),
+        )
+        self.assertEqual(ordering_chains([a, b, c, d]), [[a, c], [b], [d]])
+        self.assertEqual(ordering_chains([]), [])
+
+
+class TestTakeChain(unittest.TestCase):
+    """Tests for :func:`flagman.executors.take_chain`."""
+
+    def test_closed_continues(self) -> None:
+        """Test that a closed action does not stop the chain."""
+        runs: List[str] = []
+        closed = ActionClosed()
+        chain = [RecordAction('a', runs), RecordAction('b', runs)]
+        chain[0].exc = closed
+        outcomes = take_chain(chain)
+        self.assertEqual(runs, ['a', 'b'])
+        self.assertEqual(
+            [outcome[:2] for outcome in outcomes],
+            [(chain[0], closed), (chain[1], None)],
+        )
+
+    def test_error_stops(self) -> None:
+        """Test that an action raising another exception stops the chain."""
+        runs: List[str] = []
+        error = RuntimeError('failed')
+        chain = [RecordAction('a', runs), RecordAction('b', runs)]
+        chain[0].exc = error
+        outcomes = take_chain(chain)
+        self.assertEqual(runs, ['a'])
+        self.assertEqual([outcome[:2] for outcome in outcomes], [(chain[0], error)])
+
+
+class TestThreadPoolBundleExecutor(unittest.TestCase):
+    """Tests for :class:`flagman.executors.ThreadPoolBundleExecutor`."""
+
+    def setUp(self) -> None:
+        """Start an executor that sets an event when a chain finishes."""
+        self.woken = threading.Event()
+        self.executor = ThreadPoolBundleExecutor(4, self.woken.set)
+        self.addCleanup(self.executor.shutdown)
+
+    def wait_completed(self) -> List[List[Action]]:
+        """Wait for the submitted bundle to finish.
+
+        :returns: the actions of each finished bundle, in the order they were taken
+        """
+        while True:
+            self.assertTrue(self.woken.wait(5))
+            self.woken.clear()
+            finished = self.executor.completed()
+            if finished:
+                nums = [num for num, _outcomes in finished]
+                self.assertEqual(nums, [SIGNAL])
+                return [[o[0] for o in outcomes] for _num, outcomes in finished]
+
+    def test_chains_concurrent(self) -> None:
+        """Test that the chains of a bundle are taken at once, and groups in order."""
+        runs: List[str] = []
+        barrier = threading.Barrier(2)
+        actions = [
+            RecordAction('a', runs, 'x', barrier),
+            RecordAction('b', runs, 'x'),
+            RecordAction('c', runs, None, barrier),
+        ]
+        self.executor.submit(SIGNAL, actions)
+        self.assertEqual(list(self.executor.running), [SIGNAL])
+        taken, = self.wait_completed()
+        self.assertEqual(sorted(taken, key=actions.index), actions)
+        self.assertLess(runs.index('a'), runs.index('b'))
+        self.assertFalse(barrier.broken)
+        self.assertEqual(list(self.executor.running), [])
+        self.assertEqual(self.executor.completed(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
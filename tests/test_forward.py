@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Tests for the signal-forwarding action."""
+import errno
+import os
+import subprocess
+import tempfile
+import unittest
+from typing import List
+
+from flagman.actions import ForwardSignalAction
+from flagman.actions.forward import _Source
+
+
+class TestSource(unittest.TestCase):
+    """Tests for reading the targets of a pidfile."""
+
+    def setUp(self) -> None:
+        """Create a directory for the pidfile."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'service.pid')
+        self.opened: List[int] = []
+        self.source = _Source(self.path)
+        self.addCleanup(self.source.close)
+
+    def pidfd_open(self, pid: int) -> int:
+        """Stand in for :func:`os.pidfd_open`, opening a file to close later.
+
+        :param pid: the PID; 300 can't be opened
+        :returns: a file descriptor
+        :raises OSError: for PID 300
+        """
+        self.opened.append(pid)
+        if pid == 300:
+            raise OSError(errno.EPERM, os.strerror(errno.EPERM))
+        return os.open(os.devnull, os.O_RDONLY)
+
+    def write(self, content: str) -> None:
+        """Rewrite the pidfile in place, keeping its modification time.
+
+        :param content: the new content
+        """
+        stat = os.stat(self.path) if os.path.exists(self.path) else None
+        with open(self.path, 'w') as f:
+            f.write(content)
+        if stat is not None:
+            os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def test_unchanged(self) -> None:
+        """Test that an unchanged pidfile is not read again."""
+        self.write('100\n200\n')
+        self.source.refresh(self.pidfd_open)
+        self.source.refresh(self.pidfd_open)
+        self.assertEqual(sorted(self.opened), [100, 200])
+        self.assertEqual(sorted(self.source.targets), [100, 200])
+
+    def test_rewritten_with_same_pid(self) -> None:
+        """Test that a rewritten pidfile opens the pidfds of every PID again."""
+        self.write('100\n')
+        self.source.refresh(self.pidfd_open)
+        os.utime(self.path, ns=(0, 0))
+        self.source.refresh(self.pidfd_open)
+        self.assertEqual(self.opened, [100, 100])
+        self.assertEqual(list(self.source.targets), [100])
+
+    def test_caught_mid_write(self) -> None:
+        """Test that a pidfile that is not a list of PIDs is read again next time."""
+        self.write('10x\n')
+        with self.assertLogs('flagman.actions.forward', 'WARNING'):
+            self.source.refresh(self.pidfd_open)
+        self.assertEqual(self.source.targets, {})
+        # same inode, size and modification time as the broken content
+        self.write('100\n')
+        self.source.refresh(self.pidfd_open)
+        self.assertEqual(list(self.source.targets), [100])
+
+    def test_not_positive(self) -> None:
+        """Test that PIDs that would signal a process group are skipped."""
+        self.write('0\n-1\n100\n')
+        for pidfd_open in (self.pidfd_open, None):
+            with self.subTest(pidfds=pidfd_open is not None):
+                self.source.close()
+                with self.assertLogs('flagman.actions.forward', 'WARNING'):
+                    self.source.refresh(pidfd_open)
+                self.assertEqual(list(self.source.targets), [100])
+
+    def test_open_fails(self) -> None:
+        """Test that a process that can't be opened leaves the others targeted."""
+        self.write('300\n100\n')
+        with self.assertLogs('flagman.actions.forward', 'WARNING'):
+            self.source.refresh(self.pidfd_open)
+        self.assertEqual(list(self.source.targets), [100])
+        self.source.refresh(self.pidfd_open)
+        self.assertEqual(sorted(self.opened), [100, 300])
+
+    def test_missing(self) -> None:
+        """Test that a missing pidfile lists no processes."""
+        self.write('100\n')
+        self.source.refresh(self.pidfd_open)
+        os.unlink(self.path)
+        self.source.refresh(self.pidfd_open)
+        self.assertEqual(self.source.targets, {})
+
+
+class TestForwardSignalAction(unittest.TestCase):
+    """Tests for :class:`flagman.actions.ForwardSignalAction`."""
+
+    def test_forward(self) -> None:
+        """Test that the signal reaches the listed processes that are still running."""
+        processes = [subprocess.Popen(['sleep', '60']) for _ in range(3)]
+        for process in processes:
+            self.addCleanup(process.wait)
+            self.addCleanup(process.kill)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pidfile = os.path.join(tmpdir, 'service.pid')
+            with open(pidfile, 'w') as f:
+                f.write('\n'.join(str(process.pid) for process in processes))
+            action = ForwardSignalAction('term', pidfile)
+            processes[0].kill()
+            processes[0].wait()
+            action.run()
+            self.assertEqual(
+                sorted(action._sources[0].targets),
+                sorted(process.pid for process in processes[1:]),
+            )
+            for process in processes[1:]:
+                self.assertEqual(process.wait(timeout=5), -15)
+            action._close()
+
+    def test_no_source(self) -> None:
+        """Test that a pidfile or cgroup is required."""
+        with self.assertRaises(ValueError):
+            ForwardSignalAction('term')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Tests for the ring buffer journal of dispatches and action outcomes."""
+import os
+import signal
+import tempfile
+import unittest
+
+from flagman.actions import Action
+from flagman.exceptions import ActionClosed, ActionTimeout, JournalError
+from flagman.journal import format_record, Journal, read_journal
+from flagman.signals import SigInfo
+
+
+class NoopAction(Action):
+    """An Action that does nothing."""
+
+    def run(self) -> None:
+        """Do nothing."""
+        pass
+
+
+class TestJournal(unittest.TestCase):
+    """Tests for writing a :class:`flagman.journal.Journal` and reading it back."""
+
+    def setUp(self) -> None:
+        """Create a directory for the journal file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'journal')
+
+    def test_round_trip(self) -> None:
+        """Test that every kind of record is read back as it was written."""
+        journal = Journal(self.path, capacity=16)
+        siginfo = SigInfo(signal.SIGUSR1, 0, 4321, 0, 0)
+        journal.record_dispatch(signal.SIGUSR1, 0.25, siginfo)
+        action = NoopAction()
+        for exc in (None, RuntimeError(), ActionTimeout(), ActionClosed()):
+            journal.record_action(signal.SIGUSR1, action, exc, 0.5)
+        journal.record_done(signal.SIGUSR1, 3)
+        journal.close()
+
+        records = read_journal(self.path)
+        self.assertEqual([record.seq for record in records], list(range(1, 8)))
+        start, dispatch, *actions, done = records
+        self.assertEqual((start.kind, start.pid), ('start', os.getpid()))
+        self.assertEqual(
+            (dispatch.kind, dispatch.signal, dispatch.pid),
+            ('dispatch', signal.SIGUSR1, 4321),
+        )
+        self.assertAlmostEqual(dispatch.seconds, 0.25)
+        self.assertEqual(
+            [(record.kind, record.name, record.outcome) for record in actions],
+            [
+                ('action', 'NoopAction', 'ok'),
+                ('action', 'NoopAction', 'error'),
+                ('action', 'NoopAction', 'timeout'),
+                ('action', 'NoopAction', 'closed'),
+            ],
+        )
+        self.assertEqual((done.kind, done.handled), ('done', 3))
+
+    def test_wraps_around(self) -> None:
+        """Test that a full journal overwrites its oldest records."""
+        journal = Journal(self.path, capacity=4)
+        for handled in range(1, 10):
+            journal.record_done(signal.SIGUSR2, handled)
+        journal.close()
+        records = read_journal(self.path)
+        self.assertEqual([record.seq for record in records], [7, 8, 9, 10])
+        self.assertEqual([record.handled for record in records], [6, 7, 8, 9])
+
+    def test_reopen_appends(self) -> None:
+        """Test that reopening a journal of the same size continues its records."""
+        journal = Journal(self.path, capacity=8)
+        journal.record_done(signal.SIGUSR1, 1)
+        journal.close()
+        Journal(self.path, capacity=8).close()
+        records = read_journal(self.path)
+        self.assertEqual(
+            [(record.seq, record.kind) for record in records],
+            [(1, 'start'), (2, 'done'), (3, 'start')],
+        )
+
+    def test_reopen_other_size(self) -> None:
+        """Test that a journal of another size is started over."""
+        journal = Journal(self.path, capacity=8)
+        journal.record_done(signal.SIGUSR1, 1)
+        journal.close()
+        Journal(self.path, capacity=4).close()
+        records = read_journal(self.path)
+        self.assertEqual(
+            [(record.seq, record.kind) for record in records], [(1, 'start')]
+        )
+
+    def test_not_a_journal(self) -> None:
+        """Test that reading a file that is not a journal fails."""
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 128)
+        with self.assertRaises(JournalError):
+            read_journal(self.path)
+        with self.assertRaises(JournalError):
+            read_journal(os.path.join(self.tmpdir.name, 'missing'))
+
+    def test_capacity(self) -> None:
+        """Test that a journal must hold at least one record."""
+        for capacity in (0, -5):
+            with self.subTest(capacity=capacity), self.assertRaises(JournalError):
+                Journal(self.path, capacity=capacity)
+        journal = Journal(self.path, capacity=1)
+        journal.record_done(signal.SIGUSR1, 1)
+        journal.close()
+        self.assertEqual(
+            [(record.seq, record.kind) for record in read_journal(self.path)],
+            [(2, 'done')],
+        )
+
+    def test_format_record(self) -> None:
+        """Test that records are formatted with the fields of their kind."""
+        journal = Journal(self.path, capacity=4)
+        journal.record_action(signal.SIGHUP, NoopAction(), None, 0.125)
+        journal.close()
+        start, action = read_journal(self.path)
+        self.assertTrue(format_record(start).endswith('pid={}'.format(os.getpid())))
+        self.assertTrue(
+            format_record(action).endswith('SIGHUP NoopAction ok ran=0.125000s')
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests for the event loop woken through the signal wakeup fd."""
+import os
+import signal
+import threading
+import time
+import unittest
+from typing import List
+
+from flagman.loop import EventLoop
+
+
+class TestEventLoop(unittest.TestCase):
+    """Tests for :class:`flagman.loop.EventLoop`."""
+
+    def setUp(self) -> None:
+        """Create the loop."""
+        self.loop = EventLoop()
+
+    def assertWakes(self) -> None:
+        """Assert that the loop wakes well before its timeout."""
+        started = time.monotonic()
+        self.loop.wait(5)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_timeout(self) -> None:
+        """Test that waiting ends after the timeout without any events."""
+        with self.loop:
+            started = time.monotonic()
+            self.loop.wait(0.05)
+            self.assertGreaterEqual(time.monotonic() - started, 0.04)
+
+    def test_signal(self) -> None:
+        """Test that a signal wakes the loop, also one delivered before waiting."""
+        previous = signal.signal(signal.SIGUSR1, lambda signum, frame: None)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+        with self.loop:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            self.assertWakes()
+
+    def test_wake(self) -> None:
+        """Test that another thread can wake the loop."""
+        with self.loop:
+            timer = threading.Timer(0.05, self.loop.wake)
+            timer.start()
+            self.assertWakes()
+            timer.join()
+
+    def test_reader(self) -> None:
+        """Test that a readable fd wakes the loop and runs its callback."""
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        read: List[bytes] = []
+        with self.loop:
+            self.loop.add_reader(read_fd, lambda: read.append(os.read(read_fd, 16)))
+            os.write(write_fd, b'data')
+            self.assertWakes()
+            self.assertEqual(read, [b'data'])
+            self.loop.remove_reader(read_fd)
+            os.write(write_fd, b'more')
+            self.loop.wait(0.05)
+            self.assertEqual(read, [b'data'])
+
+    def test_close(self) -> None:
+        """Test that closing the loop restores the previous wakeup fd."""
+        previous = signal.set_wakeup_fd(-1)
+        self.addCleanup(signal.set_wakeup_fd, previous)
+        with self.loop:
+            self.assertNotEqual(signal.set_wakeup_fd(-1), -1)
+            self.loop.install()
+        self.assertEqual(signal.set_wakeup_fd(-1), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()
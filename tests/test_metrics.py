@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Tests for the metrics in the Prometheus text format."""
+import os
+import signal
+import socket
+import tempfile
+import unittest
+from typing import List
+
+from flagman.actions import Action
+from flagman.core import ACTION_BUNDLES, add_handled_signal, HANDLED_SIGNALS
+from flagman.exceptions import ActionClosed
+from flagman.metrics import Histogram, Metrics, MetricsExporter
+
+SIGNAL = signal.SIGRTMIN + 15
+
+
+class NoopAction(Action):
+    """An Action that does nothing."""
+
+    def run(self) -> None:
+        """Do nothing."""
+        pass
+
+
+class TestHistogram(unittest.TestCase):
+    """Tests for :class:`flagman.metrics.Histogram`."""
+
+    def test_render(self) -> None:
+        """Test that the buckets are cumulative and end with `+Inf`."""
+        histogram = Histogram([0.1, 1.0])
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+        self.assertEqual(
+            histogram.render('latency', [('signal', 'SIGHUP')]),
+            [
+                'latency_bucket{signal="SIGHUP",le="0.1"} 2',
+                'latency_bucket{signal="SIGHUP",le="1.0"} 3',
+                'latency_bucket{signal="SIGHUP",le="+Inf"} 4',
+                'latency_sum{signal="SIGHUP"} 5.65',
+                'latency_count{signal="SIGHUP"} 4',
+            ],
+        )
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for :class:`flagman.metrics.Metrics` and its exporter."""
+
+    def setUp(self) -> None:
+        """Put an action in a bundle and record a dispatch of it."""
+        add_handled_signal(SIGNAL)
+        self.addCleanup(HANDLED_SIGNALS.remove, SIGNAL)
+        self.addCleanup(ACTION_BUNDLES.pop, SIGNAL)
+        self.action = NoopAction()
+        ACTION_BUNDLES[SIGNAL].append(self.action)
+        self.metrics = Metrics(buckets=[0.5])
+        self.metrics.record_dispatch(SIGNAL, 0.25)
+        self.metrics.record_dispatch(SIGNAL, None)
+        for exc in (None, None, RuntimeError(), ActionClosed()):
+            self.metrics.record_action(SIGNAL, self.action, exc, 1.0)
+
+    def lines(self) -> List[str]:
+        """Render the metrics.
+
+        :returns: the lines of the text
+        """
+        text = self.metrics.render()
+        self.assertTrue(text.endswith('\n'))
+        return text.splitlines()
+
+    def test_render(self) -> None:
+        """Test that dispatches and action runs are rendered with their labels."""
+        lines = self.lines()
+        labels = 'signal="SIGRTMIN+15"'
+        action = labels + ',action="NoopAction",position="0"'
+        for line in (
+            '# TYPE flagman_dispatch_latency_seconds histogram',
+            'flagman_dispatch_latency_seconds_bucket{' + labels + ',le="0.5"} 1',
+            'flagman_dispatch_latency_seconds_count{' + labels + '} 1',
+            'flagman_action_run_seconds_bucket{' + action + ',le="+Inf"} 4',
+            'flagman_action_run_seconds_sum{' + action + '} 4.0',
+            'flagman_action_runs_total{' + action + ',outcome="ok"} 2',
+            'flagman_action_runs_total{' + action + ',outcome="error"} 1',
+            'flagman_action_runs_total{' + action + ',outcome="closed"} 1',
+            '# TYPE flagman_signals_pending gauge',
+            'flagman_bundle_actions{' + labels + '} 1',
+        ):
+            with self.subTest(line=line):
+                self.assertIn(line, lines)
+
+    def test_removed_action(self) -> None:
+        """Test that an action that left its bundle has no series."""
+        ACTION_BUNDLES[SIGNAL].remove(self.action)
+        self.assertFalse(
+            [line for line in self.lines() if 'action="NoopAction"' in line]
+        )
+
+    def test_socket(self) -> None:
+        """Test that the socket answers any request with the metrics over HTTP."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'metrics.sock')
+            exporter = MetricsExporter(self.metrics, socket_path=path)
+            self.addCleanup(exporter.close)
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.addCleanup(client.close)
+            client.connect(path)
+            client.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+            exporter.accept()
+            response = b''
+            while True:
+                data = client.recv(65536)
+                if not data:
+                    break
+                response += data
+        head, _, body = response.decode().partition('\r\n\r\n')
+        self.assertTrue(head.startswith('HTTP/1.0 200 OK\r\n'))
+        self.assertIn('Content-Type: text/plain; version=0.0.4', head)
+        self.assertIn('flagman_bundle_actions{signal="SIGRTMIN+15"} 1', body)
+
+    def test_textfile(self) -> None:
+        """Test that the textfile is written with the metrics."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'flagman.prom')
+            exporter = MetricsExporter(self.metrics, textfile=path)
+            exporter.write_textfile()
+            with open(path) as f:
+                self.assertEqual(f.read().splitlines(), self.lines())
+            self.assertEqual(os.listdir(tmpdir), ['flagman.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Tests for the bookkeeping of pending signals and their delivery policies."""
+import signal
+import time
+import unittest
+
+from flagman.pending import PendingSignals, SignalPolicy
+
+
+class TestPolicies(unittest.TestCase):
+    """Tests for the delivery policies of :class:`flagman.pending.PendingSignals`."""
+
+    def setUp(self) -> None:
+        """Create empty bookkeeping."""
+        self.pending = PendingSignals()
+
+    def deliver(self, num: int, times: int) -> None:
+        """Record deliveries of a signal.
+
+        :param num: the signal number
+        :param times: the number of deliveries
+        """
+        for _ in range(times):
+            self.pending.add(num)
+
+    def test_coalesce(self) -> None:
+        """Test that a burst runs once and deliveries during the run are dropped."""
+        self.assertFalse(self.pending)
+        self.deliver(signal.SIGUSR1, 3)
+        self.assertEqual(self.pending.pop(), signal.SIGUSR1)
+        self.assertEqual(self.pending.pending(signal.SIGUSR1), 0)
+        self.deliver(signal.SIGUSR1, 2)
+        self.pending.discard(signal.SIGUSR1)
+        self.assertFalse(self.pending)
+        stats = self.pending.stats(signal.SIGUSR1)
+        self.assertEqual(
+            (stats.delivered, stats.dispatched, stats.merged, stats.dropped),
+            (5, 1, 2, 2),
+        )
+
+    def test_every(self) -> None:
+        """Test that every delivery runs the bundle, also those during a run."""
+        self.pending.set_policy(signal.SIGUSR2, SignalPolicy.EVERY)
+        self.deliver(signal.SIGUSR2, 2)
+        self.assertEqual(self.pending.pop(), signal.SIGUSR2)
+        self.deliver(signal.SIGUSR2, 1)
+        self.pending.discard(signal.SIGUSR2)
+        self.assertEqual(self.pending.pending(signal.SIGUSR2), 2)
+        for _ in range(2):
+            self.assertEqual(self.pending.pop(), signal.SIGUSR2)
+            self.pending.discard(signal.SIGUSR2)
+        self.assertFalse(self.pending)
+        stats = self.pending.stats(signal.SIGUSR2)
+        self.assertEqual((stats.dispatched, stats.merged, stats.dropped), (3, 0, 0))
+
+    def test_debounce(self) -> None:
+        """Test that a burst runs once after no delivery arrived for the window."""
+        self.pending.set_policy(signal.SIGHUP, SignalPolicy.DEBOUNCE, 0.1)
+        self.assertIsNone(self.pending.timeout())
+        self.deliver(signal.SIGHUP, 3)
+        self.assertFalse(self.pending)
+        timeout = self.pending.timeout()
+        assert timeout is not None  # noqa: S101 (assert)
+        self.assertGreater(timeout, 0.05)
+        with self.assertRaises(KeyError):
+            self.pending.pop()
+        time.sleep(timeout)
+        self.assertEqual(self.pending.timeout(), 0.0)
+        self.assertEqual(self.pending.pop(), signal.SIGHUP)
+        self.assertEqual(self.pending.stats(signal.SIGHUP).merged, 2)
+        self.assertIsNone(self.pending.timeout())
+
+    def test_clear(self) -> None:
+        """Test that cleared deliveries are not counted as dropped."""
+        self.deliver(signal.SIGUSR1, 2)
+        self.pending.clear()
+        self.assertFalse(self.pending)
+        self.assertEqual(self.pending.stats(signal.SIGUSR1).dropped, 0)
+
+
+class TestPriority(unittest.TestCase):
+    """Tests for the order in which ready signals are taken."""
+
+    def setUp(self) -> None:
+        """Create bookkeeping where SIGUSR2 has a higher priority."""
+        self.pending = PendingSignals()
+        self.pending.set_priority(signal.SIGUSR2, 2)
+
+    def test_priority_first(self) -> None:
+        """Test that the higher priority goes first, then the longest waiting."""
+        self.pending.aging = 0
+        for num in (signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2):
+            self.pending.add(num)
+            time.sleep(0.01)
+        self.assertEqual(self.pending.pop(), signal.SIGUSR2)
+        self.assertEqual(self.pending.pop(), signal.SIGHUP)
+        self.assertEqual(self.pending.pop(), signal.SIGUSR1)
+
+    def test_aging(self) -> None:
+        """Test that a waiting signal gains priority until it goes first."""
+        self.pending.aging = 0.05
+        self.pending.add(signal.SIGUSR1)
+        time.sleep(0.2)
+        self.pending.add(signal.SIGUSR2)
+        self.assertEqual(self.pending.pop(), signal.SIGUSR1)
+
+    def test_busy_and_above(self) -> None:
+        """Test that busy signals and signals that don't outrank a run are skipped."""
+        self.pending.add(signal.SIGUSR1)
+        self.pending.add(signal.SIGUSR2)
+        self.assertTrue(self.pending.outranked(signal.SIGUSR1))
+        self.assertFalse(self.pending.outranked(signal.SIGUSR2))
+        with self.assertRaises(KeyError):
+            self.pending.pop(above=2)
+        self.assertEqual(self.pending.pop(busy={signal.SIGUSR2}), signal.SIGUSR1)
+        self.assertEqual(self.pending.pop(above=0), signal.SIGUSR2)
+
+    def test_reset(self) -> None:
+        """Test that a priority of 0 is the default."""
+        self.pending.set_priority(signal.SIGUSR2, 0)
+        self.assertEqual(self.pending.priority(signal.SIGUSR2), 0)
+        self.assertFalse(self.pending.outranked(signal.SIGUSR1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests for the lazy registry of installed actions."""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flagman.actions import PrintAction
+from flagman.registry import (
+    ActionRegistry,
+    CACHE_ENV_VAR,
+    load_entry_point,
+    scan_entry_points,
+    sys_path_fingerprint,
+)
+
+GROUP = 'flagman.action'
+
+
+class TestActionRegistry(unittest.TestCase):
+    """Tests for :class:`flagman.registry.ActionRegistry`."""
+
+    def setUp(self) -> None:
+        """Create a directory for the index."""
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'index', 'actions.json')
+
+    def test_lazy(self) -> None:
+        """Test that names are known without importing and actions load on lookup."""
+        registry = ActionRegistry(GROUP)
+        self.assertIn('print', registry)
+        self.assertNotIn('nosuchaction', registry)
+        self.assertEqual(set(registry), set(scan_entry_points(GROUP)))
+        self.assertEqual(registry._loaded, {})
+        self.assertIs(registry['print'], PrintAction)
+        self.assertEqual(list(registry._loaded), ['print'])
+        with self.assertRaises(KeyError):
+            registry['nosuchaction']
+
+    def test_index(self) -> None:
+        """Test that a fresh index is used instead of scanning the entry points."""
+        ActionRegistry(GROUP, self.path).entry_points
+        with open(self.path) as f:
+            index = json.load(f)
+        self.assertEqual(index['group'], GROUP)
+        self.assertEqual(index['entry_points'], scan_entry_points(GROUP))
+
+        index['entry_points'] = {'print': 'flagman.actions:PrintAction'}
+        with open(self.path, 'w') as f:
+            json.dump(index, f)
+        with mock.patch('flagman.registry.scan_entry_points') as scan:
+            registry = ActionRegistry(GROUP, self.path)
+            self.assertEqual(list(registry), ['print'])
+            self.assertIs(registry['print'], PrintAction)
+        scan.assert_not_called()
+
+    def test_stale_index(self) -> None:
+        """Test that an index is rebuilt once a directory on sys.path changes."""
+        os.makedirs(os.path.dirname(self.path))
+        for index in (
+            {
+                'group': GROUP,
+                'fingerprint': [['/nonexistent', 0]],
+                'entry_points': {},
+            },
+            {'group': 'other', 'fingerprint': sys_path_fingerprint()},
+            'garbage',
+        ):
+            with self.subTest(index=index):
+                with open(self.path, 'w') as f:
+                    json.dump(index, f)
+                registry = ActionRegistry(GROUP, self.path)
+                self.assertIn('print', registry)
+                with open(self.path) as f:
+                    self.assertIn('print', json.load(f)['entry_points'])
+
+    def test_env(self) -> None:
+        """Test that the path of the index can be set in the environment."""
+        with mock.patch.dict(os.environ, {CACHE_ENV_VAR: self.path}):
+            self.assertIn('print', ActionRegistry(GROUP))
+        self.assertTrue(os.path.exists(self.path))
+
+
+class TestLoadEntryPoint(unittest.TestCase):
+    """Tests for :func:`flagman.registry.load_entry_point`."""
+
+    def test_load(self) -> None:
+        """Test that the object an entry point names is imported."""
+        for value in (
+            'flagman.actions:PrintAction',
+            'flagman.actions.print : PrintAction [extra]',
+        ):
+            with self.subTest(value=value):
+                self.assertIs(load_entry_point(value), PrintAction)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Tests for signal names, real-time signals and siginfo payloads."""
+import os
+import signal
+import unittest
+
+from flagman.pending import PendingSignals, SignalPolicy
+from flagman.signals import (
+    is_realtime,
+    parse_signal,
+    SigInfo,
+    signal_name,
+    SignalFD,
+    sigqueue,
+)
+
+QUEUED = signal.SIGRTMIN + 14
+#: The `si_code` of a signal sent with sigqueue(3)
+SI_QUEUE = -1
+
+
+class TestSignalNames(unittest.TestCase):
+    """Tests for parsing and naming signals."""
+
+    def test_parse(self) -> None:
+        """Test that names are parsed without case or prefix, and numbers as is."""
+        for name, num in (
+            ('usr1', signal.SIGUSR1),
+            ('SIGHUP', signal.SIGHUP),
+            ('RTMIN+3', signal.SIGRTMIN + 3),
+            ('sigrtmax-1', signal.SIGRTMAX - 1),
+            (str(int(signal.SIGUSR2)), signal.SIGUSR2),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(parse_signal(name), num)
+
+    def test_invalid(self) -> None:
+        """Test that unknown and uncatchable signals are rejected."""
+        for name in ('nosuchsignal', 'kill', 'SIGSTOP', 'usr1+1', 'rtmax+1', '0'):
+            with self.subTest(name=name), self.assertRaises(ValueError):
+                parse_signal(name)
+
+    def test_names(self) -> None:
+        """Test that names are parsed back to their signals."""
+        for num in (signal.SIGUSR1, signal.SIGRTMIN, signal.SIGRTMIN + 3):
+            with self.subTest(num=num):
+                self.assertEqual(parse_signal(signal_name(num)), num)
+        self.assertEqual(signal_name(signal.SIGRTMIN + 3), 'SIGRTMIN+3')
+
+    def test_realtime(self) -> None:
+        """Test that real-time signals default to the every policy."""
+        self.assertTrue(is_realtime(signal.SIGRTMAX))
+        self.assertFalse(is_realtime(signal.SIGUSR1))
+        pending = PendingSignals()
+        self.assertEqual(pending.policy(signal.SIGRTMIN + 1)[0], SignalPolicy.EVERY)
+        self.assertEqual(pending.policy(signal.SIGUSR1)[0], SignalPolicy.COALESCE)
+
+
+class TestSignalFD(unittest.TestCase):
+    """Tests for reading deliveries with their payloads from a signalfd."""
+
+    def test_payload(self) -> None:
+        """Test that every queued delivery is read with its payload."""
+        # keeps flagman alive should another thread take the signal
+        previous = signal.signal(QUEUED, lambda signum, frame: None)
+        self.addCleanup(signal.signal, QUEUED, previous)
+        signal_fd = SignalFD([QUEUED])
+        self.addCleanup(signal_fd.close)
+        for value in (1, 2):
+            sigqueue(os.getpid(), QUEUED, value)
+        pid, uid = os.getpid(), os.getuid()
+        self.assertEqual(
+            signal_fd.read(),
+            [SigInfo(QUEUED, SI_QUEUE, pid, uid, value) for value in (1, 2)],
+        )
+        self.assertEqual(signal_fd.read(), [])
+
+    def test_current_siginfo(self) -> None:
+        """Test that a run is for the latest of the deliveries merged into it."""
+        pending = PendingSignals()
+        first, last = SigInfo(QUEUED, 0, 1, 0, 1), SigInfo(QUEUED, 0, 1, 0, 2)
+        pending.set_policy(QUEUED, SignalPolicy.COALESCE)
+        pending.add(QUEUED, first)
+        pending.add(QUEUED, last)
+        self.assertEqual(pending.pop(), QUEUED)
+        self.assertEqual(pending.siginfo(QUEUED), last)
+        pending.discard(QUEUED)
+        self.assertIsNone(pending.siginfo(QUEUED))
+
+
+if __name__ == '__main__':
+    unittest.main()
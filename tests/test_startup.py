@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""Tests for setting actions up lazily."""
+import asyncio
+import threading
+import unittest
+from typing import List
+
+from flagman.actions import Action
+from flagman.actions.action import _sync_loops, deferred_set_up
+from flagman.exceptions import ActionClosed
+
+
+class FailingAction(Action):
+    """An Action whose set up fails after being released."""
+
+    def __init__(self) -> None:
+        """Create the events before the set up is deferred."""
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.runs: List[None] = []
+        super().__init__()
+
+    def set_up(self) -> None:
+        """Wait for the test to release the set up, then fail."""
+        self.started.set()
+        self.release.wait(5)
+        raise RuntimeError('set up failed')
+
+    def run(self) -> None:
+        """Record the run."""
+        self.runs.append(None)
+
+
+class LoopCheckAction(Action):
+    """An Action that records whether its thread has made an event loop."""
+
+    def set_up(self) -> None:  # type: ignore
+        """Start with no recorded runs."""
+        self.loops: List[bool] = []
+
+    def run(self) -> None:
+        """Record whether the thread has an event loop."""
+        self.loops.append(hasattr(_sync_loops, 'loop'))
+
+
+class TestLazySetUp(unittest.TestCase):
+    """Tests for running an action whose deferred set up fails."""
+
+    def create(self) -> FailingAction:
+        """Create an action with a deferred set up.
+
+        :returns: the action
+        """
+        with deferred_set_up():
+            action = FailingAction()
+        action.release.set()
+        return action
+
+    def test_first_run(self) -> None:
+        """Test that a failing set up before the first run closes the action."""
+        action = self.create()
+        with self.assertLogs('flagman.actions.action', 'ERROR'):
+            with self.assertRaises(ActionClosed):
+                action._run()
+        self.assertTrue(action._closed)
+        with self.assertRaises(ActionClosed):
+            action._run()
+        self.assertEqual(action.runs, [])
+
+    def test_sync_set_up(self) -> None:
+        """Test that a set up that is not a coroutine runs without an event loop."""
+        with deferred_set_up():
+            action = LoopCheckAction()
+        thread = threading.Thread(target=action._run)
+        thread.start()
+        thread.join()
+        self.assertEqual(action.loops, [False])
+        self.assertIsNotNone(action._set_up_seconds)
+
+    def test_first_async_run(self) -> None:
+        """Test that a failing set up before the first run on the loop closes it."""
+        action = self.create()
+        with self.assertLogs('flagman.actions.action', 'ERROR'):
+            with self.assertRaises(ActionClosed):
+                asyncio.run(action._arun())
+        self.assertTrue(action._closed)
+        self.assertEqual(action.runs, [])
+
+    def test_failed_in_background(self) -> None:
+        """Test that a run waiting on a set up that fails on another thread is not run.
+
+        The run waits for the lock of the background set up, and must find the action
+        closed once that set up has failed.
+        """
+        with deferred_set_up():
+            action = FailingAction()
+
+        def set_up() -> None:
+            try:
+                action._set_up_now()
+            except RuntimeError:
+                pass
+
+        thread = threading.Thread(target=set_up)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.assertTrue(action.started.wait(5))
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            try:
+                action._run()
+            except BaseException as e:
+                errors.append(e)
+
+        runner = threading.Thread(target=run)
+        runner.start()
+        action.release.set()
+        runner.join(5)
+        self.assertEqual([type(e) for e in errors], [ActionClosed])
+        self.assertEqual(action.runs, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Tests for hosting the action bundles of many services as tenants."""
+import json
+import os
+import signal
+import tempfile
+import unittest
+from typing import Dict
+
+from flagman.core import (
+    ACTION_BUNDLES,
+    add_handled_signal,
+    DISPATCH_PLANS,
+    HANDLED_SIGNALS,
+    remove_handled_signal,
+    SIGNAL_TENANTS,
+)
+from flagman.exceptions import ConfigError
+from flagman.tenants import add_tenant, free_signal, Tenant, TENANTS
+
+#: Type alias for the tables of a config file
+Document = Dict[str, Dict[str, object]]
+
+
+class TestFreeSignal(unittest.TestCase):
+    """Tests for :func:`flagman.tenants.free_signal`."""
+
+    def handle(self, num: int) -> None:
+        """Handle a signal until the end of the test.
+
+        :param num: the signal number
+        """
+        if num not in HANDLED_SIGNALS:
+            add_handled_signal(num)
+            self.addCleanup(remove_handled_signal, num)
+
+    def test_lowest(self) -> None:
+        """Test that the lowest real-time signal that is not handled is given."""
+        num = free_signal()
+        self.assertGreaterEqual(num, signal.SIGRTMIN)
+        self.assertNotIn(num, HANDLED_SIGNALS)
+        self.assertTrue(all(n in HANDLED_SIGNALS for n in range(signal.SIGRTMIN, num)))
+        self.handle(num)
+        self.assertGreater(free_signal(), num)
+
+    def test_reserved(self) -> None:
+        """Test that reserved signals are not given."""
+        num = free_signal()
+        self.assertNotEqual(free_signal([num]), num)
+
+    def test_exhausted(self) -> None:
+        """Test that there is no signal to give once every real-time signal is taken."""
+        last = signal.SIGRTMAX
+        for num in range(signal.SIGRTMIN, last):
+            self.handle(num)
+        self.assertEqual(free_signal(), last)
+        with self.assertRaises(ConfigError):
+            free_signal([last])
+        self.handle(last)
+        with self.assertRaises(ConfigError):
+            free_signal()
+
+
+class TestTenant(unittest.TestCase):
+    """Tests for :class:`flagman.tenants.Tenant`."""
+
+    def setUp(self) -> None:
+        """Create a directory for the config files."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name: str, document: Document) -> str:
+        """Write the config file of a tenant.
+
+        :param name: the name of the tenant
+        :param document: the tables of the file
+        :returns: the path of the file
+        """
+        path = os.path.join(self.tmpdir.name, name + '.json')
+        with open(path, 'w') as f:
+            json.dump(document, f)
+        return path
+
+    def add(self, name: str, document: Document) -> Tenant:
+        """Write the config file of a tenant and load the tenant.
+
+        :param name: the name of the tenant
+        :param document: the tables of the file
+        :returns: the tenant
+        """
+        tenant = add_tenant(name, self.write(name, document))
+        self.addCleanup(self.remove, tenant)
+        return tenant
+
+    def remove(self, tenant: Tenant) -> None:
+        """Close a tenant's actions and stop handling its signals.
+
+        :param tenant: the tenant
+        """
+        tenant.close()
+        TENANTS.pop(tenant.name, None)
+        for num in tenant.signals.values():
+            for action in ACTION_BUNDLES[num]:
+                action._release()
+            ACTION_BUNDLES[num].clear()
+            remove_handled_signal(num)
+            DISPATCH_PLANS.pop(num, None)
+            SIGNAL_TENANTS.pop(num, None)
+
+    def test_signals(self) -> None:
+        """Test that the same signal of two tenants is given two real-time signals."""
+        first = self.add('first', {'usr1': {'actions': [['print', 'first']]}})
+        second = self.add('second', {'usr1': {'actions': [['print', 'second']]}})
+        ours = first.signals[signal.SIGUSR1]
+        theirs = second.signals[signal.SIGUSR1]
+        self.assertNotEqual(ours, theirs)
+        for tenant, num in ((first, ours), (second, theirs)):
+            with self.subTest(tenant=tenant.name):
+                self.assertGreaterEqual(num, signal.SIGRTMIN)
+                self.assertIn(num, HANDLED_SIGNALS)
+                self.assertEqual(SIGNAL_TENANTS[num], tenant.name)
+                msg, = [getattr(action, '_msg') for action in ACTION_BUNDLES[num]]
+                self.assertEqual(msg, tenant.name)
+        self.assertEqual(TENANTS, {'first': first, 'second': second})
+
+    def test_name_taken(self) -> None:
+        """Test that two tenants can't have the same name."""
+        self.add('tenant', {})
+        for name in ('tenant', ''):
+            with self.subTest(name=name), self.assertRaises(ConfigError):
+                add_tenant(name, self.write('other', {}))
+
+    def test_reload_new_signal(self) -> None:
+        """Test that a reload can't add a signal to a tenant."""
+        tenant = self.add('tenant', {'usr1': {'actions': [['print', 'a']]}})
+        self.write(
+            'tenant',
+            {
+                'usr1': {'actions': [['print', 'a']]},
+                'usr2': {'actions': [['print', 'b']]},
+            },
+        )
+        with self.assertLogs('flagman.config', 'ERROR'):
+            self.assertFalse(tenant.config.reload())
+        self.assertEqual(list(tenant.signals), [signal.SIGUSR1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Tests for the throttles of expensive actions."""
+import unittest
+from typing import List
+
+from flagman import throttle
+from flagman.actions import Action
+
+SIGNAL = 40
+
+
+class NoopAction(Action):
+    """An Action that does nothing."""
+
+    def run(self) -> None:
+        """Do nothing."""
+        pass
+
+
+def admitted(throttle_: throttle.Throttle, times: List[float]) -> List[bool]:
+    """Trigger a throttle at given times.
+
+    :param throttle_: the throttle
+    :param times: the times of the triggers
+    :returns: whether each trigger ran the action
+    """
+    return [throttle_.admit(SIGNAL, None, now) for now in times]
+
+
+class TestParseThrottle(unittest.TestCase):
+    """Tests for :func:`flagman.throttle.parse_throttle`."""
+
+    def test_kinds(self) -> None:
+        """Test that each kind of throttle is created with its options."""
+        bucket = throttle.parse_throttle('bucket:5/60')
+        self.assertIsInstance(bucket, throttle.TokenBucket)
+        self.assertFalse(bucket.defer)
+        interval = throttle.parse_throttle('interval:10:defer')
+        self.assertIsInstance(interval, throttle.MinInterval)
+        self.assertTrue(interval.defer)
+        debounce = throttle.parse_throttle('debounce:0.5')
+        self.assertIsInstance(debounce, throttle.Debounce)
+        self.assertTrue(debounce.defer)
+
+    def test_invalid(self) -> None:
+        """Test that unknown throttles and limits that are not positive are rejected."""
+        for value in (
+            'bucket:0/60',
+            'bucket:5/0',
+            'bucket:5',
+            'interval:-1',
+            'interval:10:later',
+            'debounce:1:defer',
+            'debounce:0',
+            'sometimes:1',
+        ):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                throttle.parse_throttle(value)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Tests for :class:`flagman.throttle.TokenBucket`."""
+
+    def test_burst_and_refill(self) -> None:
+        """Test that a full bucket allows a burst, then one run per refilled token."""
+        bucket = throttle.TokenBucket(3, 30)
+        self.assertEqual(
+            admitted(bucket, [0, 0, 0, 0, 5, 10, 11]),
+            [True, True, True, False, False, True, False],
+        )
+        self.assertEqual((bucket.allowed, bucket.dropped), (4, 3))
+        self.assertAlmostEqual(bucket.allowed_at(), 20)
+
+    def test_defer(self) -> None:
+        """Test that triggers over the bucket are folded into one deferred run."""
+        bucket = throttle.TokenBucket(1, 10, defer=True)
+        self.assertEqual(admitted(bucket, [0, 1, 2]), [True, False, False])
+        self.assertEqual(bucket.deferred, 2)
+        self.assertEqual(bucket.due_at(), 10)
+        self.assertIsNone(bucket.due(9))
+        self.assertEqual(bucket.due(10), (SIGNAL, None))
+        self.assertIsNone(bucket.due(30))
+        self.assertEqual(bucket.deferred_runs, 1)
+
+    def test_deferred_run_goes_first(self) -> None:
+        """Test that a trigger does not overtake a waiting deferred run."""
+        bucket = throttle.TokenBucket(1, 10, defer=True)
+        admitted(bucket, [0, 1])
+        self.assertEqual(admitted(bucket, [15]), [False])
+        self.assertIsNotNone(bucket.due(15))
+
+    def test_busy(self) -> None:
+        """Test that a deferred run waits while its signal's actions are running."""
+        bucket = throttle.TokenBucket(1, 10, defer=True)
+        admitted(bucket, [0, 1])
+        self.assertIsNone(bucket.due_at(busy={SIGNAL}))
+        self.assertIsNone(bucket.due(20, busy={SIGNAL}))
+        self.assertIsNotNone(bucket.due(20))
+
+
+class TestMinInterval(unittest.TestCase):
+    """Tests for :class:`flagman.throttle.MinInterval`."""
+
+    def test_interval(self) -> None:
+        """Test that one run is allowed per interval."""
+        interval = throttle.MinInterval(10)
+        self.assertEqual(
+            admitted(interval, [0, 5, 9.9, 10, 15, 25]),
+            [True, False, False, True, False, True],
+        )
+        self.assertEqual(interval.allowed_at(), 35)
+
+
+class TestDebounce(unittest.TestCase):
+    """Tests for :class:`flagman.throttle.Debounce`."""
+
+    def test_trailing_edge(self) -> None:
+        """Test that a burst runs once, after it has been quiet for the window."""
+        debounce = throttle.Debounce(1)
+        self.assertEqual(admitted(debounce, [0, 0.5, 1.2]), [False, False, False])
+        self.assertEqual(debounce.due_at(), 2.2)
+        self.assertIsNone(debounce.due(2.1))
+        self.assertEqual(debounce.due(2.2), (SIGNAL, None))
+        self.assertEqual((debounce.deferred, debounce.deferred_runs), (3, 1))
+
+
+class TestDeferredRuns(unittest.TestCase):
+    """Tests for the deferred runs of the throttled actions."""
+
+    def test_due_runs(self) -> None:
+        """Test that the deferred runs of all actions are taken when due."""
+        action = NoopAction()
+        action.throttle = 'interval:10:defer'
+        action_throttle = throttle.throttle_of(action)
+        self.assertIs(throttle.throttle_of(action), action_throttle)
+        assert action_throttle is not None  # noqa: S101 (assert)
+        admitted(action_throttle, [0, 1])
+        self.assertEqual(throttle.due_at(), 10)
+        self.assertEqual(throttle.due_runs(5), [])
+        self.assertEqual(throttle.due_runs(10), [(SIGNAL, action, None)])
+        self.assertIn(action, throttle.throttle_stats())
+
+    def test_unthrottled(self) -> None:
+        """Test that an action without a throttle has none."""
+        self.assertIsNone(throttle.throttle_of(NoopAction()))
+
+
+if __name__ == '__main__':
+    unittest.main()
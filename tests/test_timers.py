@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Tests for the interval and cron timers."""
+import datetime
+import unittest
+from typing import Tuple
+
+from flagman import timers
+
+SIGNAL = 40
+
+#: A local time as its year, month, day, hour and minute
+Minute = Tuple[int, int, int, int, int]
+
+
+class TestParseTimer(unittest.TestCase):
+    """Tests for :func:`flagman.timers.parse_timer`."""
+
+    def test_every(self) -> None:
+        """Test that an interval timer ticks once per interval."""
+        timer = timers.parse_timer('every:2.5')
+        self.assertIsInstance(timer, timers.Interval)
+        self.assertEqual(timer.next_at(100.0), 102.5)
+
+    def test_cron(self) -> None:
+        """Test that a cron timer is created from a schedule or a shorthand."""
+        self.assertIsInstance(timers.parse_timer('cron:*/5 * * * *'), timers.Cron)
+        self.assertIsInstance(timers.parse_timer('cron:@daily'), timers.Cron)
+
+    def test_invalid(self) -> None:
+        """Test that unknown timers, bad intervals and bad schedules are rejected."""
+        for value in (
+            'every:0',
+            'every:-1',
+            'every:soon',
+            'hourly',
+            'cron:* * * *',
+            'cron:60 * * * *',
+            'cron:*/0 * * * *',
+            'cron:5-1 * * * *',
+            'cron:0 0 31 2 *',
+        ):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                timers.parse_timer(value)
+
+
+class TestCron(unittest.TestCase):
+    """Tests for :meth:`flagman.timers.Cron.next_wall`."""
+
+    def assertNextWall(
+        self, schedule: str, after: Minute, expected: Minute
+    ) -> None:
+        """Assert the first time a schedule matches after a given local time.
+
+        :param schedule: the schedule
+        :param after: the year, month, day, hour and minute to start from
+        :param expected: the year, month, day, hour and minute it should match
+        """
+        cron = timers.Cron('cron:' + schedule, schedule)
+        wall = cron.next_wall(datetime.datetime(*after).timestamp())
+        self.assertEqual(
+            datetime.datetime.fromtimestamp(wall), datetime.datetime(*expected)
+        )
+
+    def test_step(self) -> None:
+        """Test that a step matches every nth minute, counted from the top of hour."""
+        self.assertNextWall('*/15 * * * *', (2024, 1, 1, 12, 7), (2024, 1, 1, 12, 15))
+        self.assertNextWall('*/15 * * * *', (2024, 1, 1, 12, 45), (2024, 1, 1, 13, 0))
+
+    def test_strictly_after(self) -> None:
+        """Test that the minute a schedule matches in is not matched again."""
+        self.assertNextWall('30 3 * * *', (2024, 1, 1, 3, 30), (2024, 1, 2, 3, 30))
+
+    def test_range_and_list(self) -> None:
+        """Test ranges and lists of values."""
+        self.assertNextWall('0 9-17 * * *', (2024, 1, 1, 17, 1), (2024, 1, 2, 9, 0))
+        self.assertNextWall('0,30 8 * * *', (2024, 1, 1, 8, 10), (2024, 1, 1, 8, 30))
+
+    def test_month_rollover(self) -> None:
+        """Test that the search moves on to the next month and year."""
+        self.assertNextWall('0 0 1 * *', (2024, 1, 15, 0, 0), (2024, 2, 1, 0, 0))
+        self.assertNextWall('@yearly', (2024, 6, 1, 0, 0), (2025, 1, 1, 0, 0))
+
+    def test_leap_day(self) -> None:
+        """Test that a schedule for February 29 skips to the next leap year."""
+        self.assertNextWall('0 0 29 2 *', (2024, 3, 1, 0, 0), (2028, 2, 29, 0, 0))
+
+    def test_weekday(self) -> None:
+        """Test that days of the week count from Sunday, and 7 is Sunday too."""
+        # January 1, 2024 is a Monday
+        self.assertNextWall('0 0 * * 0', (2024, 1, 1, 0, 0), (2024, 1, 7, 0, 0))
+        self.assertNextWall('0 0 * * 7', (2024, 1, 1, 0, 0), (2024, 1, 7, 0, 0))
+        self.assertNextWall('0 0 * * 1-5', (2024, 1, 5, 12, 0), (2024, 1, 8, 0, 0))
+
+    def test_either_day(self) -> None:
+        """Test that a day matches either day field if both are restricted."""
+        # the 15th or any Friday: January 5, 2024 is a Friday
+        self.assertNextWall('0 0 15 * 5', (2024, 1, 1, 0, 0), (2024, 1, 5, 0, 0))
+        self.assertNextWall('0 0 15 * 5', (2024, 1, 12, 1, 0), (2024, 1, 15, 0, 0))
+
+
+class TestSchedule(unittest.TestCase):
+    """Tests for the heap of scheduled ticks."""
+
+    def tearDown(self) -> None:
+        """Drop the timers of the test."""
+        timers.set_timers(SIGNAL, [])
+        timers.set_timers(SIGNAL + 1, [])
+
+    def test_due_ticks(self) -> None:
+        """Test that ticks come up in order and are scheduled again."""
+        slow = timers.parse_timer('every:20')
+        fast = timers.parse_timer('every:10')
+        timers.set_timers(SIGNAL, [slow])
+        timers.set_timers(SIGNAL + 1, [fast])
+        start = timers._scheduled[fast]
+        self.assertEqual(timers.next_tick_at(), start)
+        self.assertEqual(timers.due_ticks(start - 1), [])
+        self.assertEqual(timers.due_ticks(start + 5), [(SIGNAL + 1, fast)])
+        self.assertEqual(timers.next_tick_at(), timers._scheduled[slow])
+
+    def test_set_timers_keeps_schedule(self) -> None:
+        """Test that a timer with an unchanged spec keeps its schedule and counters."""
+        timer = timers.parse_timer('every:60')
+        timer.fired = 3
+        timers.set_timers(SIGNAL, [timer])
+        scheduled = timers._scheduled[timer]
+        timers.set_timers(
+            SIGNAL, [timers.parse_timer('every:60'), timers.parse_timer('every:5')]
+        )
+        kept, added = timers.timers_of(SIGNAL)
+        self.assertIs(kept, timer)
+        self.assertEqual(kept.fired, 3)
+        self.assertEqual(timers._scheduled[timer], scheduled)
+        self.assertIn(added, timers._scheduled)
+
+    def test_set_timers_drops_removed(self) -> None:
+        """Test that removed timers no longer tick."""
+        timer = timers.parse_timer('every:60')
+        timers.set_timers(SIGNAL, [timer])
+        timers.set_timers(SIGNAL, [])
+        self.assertEqual(timers.timers_of(SIGNAL), [])
+        self.assertNotIn(timer, timers._scheduled)
+        self.assertIsNone(timers.next_tick_at())
+        self.assertEqual(timers.due_ticks(float('inf')), [])
+
+    def test_restart(self) -> None:
+        """Test that a run starts interval timers over."""
+        timer = timers.parse_timer('every:60')
+        timers.set_timers(SIGNAL, [timer])
+        scheduled = timers._scheduled[timer]
+        timers.restart_timers(SIGNAL)
+        self.assertGreaterEqual(timers._scheduled[timer], scheduled)
+        self.assertEqual(timers.next_tick_at(), timers._scheduled[timer])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Tests for triggering action bundles on file changes."""
+import os
+import signal
+import tempfile
+import time
+import unittest
+
+from flagman import core
+from flagman.actions import Action
+from flagman.core import ACTION_BUNDLES, DISPATCH_PLANS, SIGNAL_FLAGS
+from flagman.watch import FileWatcher
+
+WATCHED = signal.SIGRTMIN + 10
+UNHANDLED = signal.SIGRTMIN + 11
+
+
+class CountAction(Action):
+    """An Action that counts its runs."""
+
+    def set_up(self) -> None:  # type: ignore
+        """Start counting."""
+        self.runs = 0
+
+    def run(self) -> None:
+        """Count a run."""
+        self.runs += 1
+
+
+class TestFileWatcher(unittest.TestCase):
+    """Tests for :class:`flagman.watch.FileWatcher`."""
+
+    def setUp(self) -> None:
+        """Give the watched signal an action and create a directory to watch."""
+        self.action = CountAction()
+        ACTION_BUNDLES[WATCHED] = [self.action]
+        core._build_dispatch_plan(WATCHED)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'watched')
+
+    def tearDown(self) -> None:
+        """Drop the action and the directory."""
+        del ACTION_BUNDLES[WATCHED]
+        del DISPATCH_PLANS[WATCHED]
+        SIGNAL_FLAGS.clear()
+        self.tmpdir.cleanup()
+
+    def change(self, watcher: FileWatcher) -> None:
+        """Write the watched file and read the events of the write.
+
+        :param watcher: the watcher
+        """
+        with open(self.path, 'w') as f:
+            f.write('changed')
+        watcher._read_events()
+
+    def dispatch(self) -> None:
+        """Dispatch the raised signals like the serial loop does."""
+        core._fire_timers()
+        while SIGNAL_FLAGS:
+            core._dispatch(core._pop_signal())
+
+    def test_no_debounce(self) -> None:
+        """Test that a change triggers the signal's actions at once."""
+        watcher = FileWatcher(debounce=0)
+        self.addCleanup(watcher.close)
+        watcher.add(self.path, WATCHED)
+        self.change(watcher)
+        self.dispatch()
+        self.assertEqual(self.action.runs, 1)
+        self.assertEqual(watcher.triggers, 1)
+
+    def test_no_debounce_without_actions(self) -> None:
+        """Test that a change for a signal without actions is ignored."""
+        watcher = FileWatcher(debounce=0)
+        self.addCleanup(watcher.close)
+        watcher.add(self.path, UNHANDLED)
+        self.change(watcher)
+        self.assertFalse(SIGNAL_FLAGS)
+        self.dispatch()
+        self.assertEqual(watcher.triggers, 0)
+
+    def test_debounce(self) -> None:
+        """Test that a burst of changes triggers once, after the debounce window."""
+        watcher = FileWatcher(debounce=0.05)
+        self.addCleanup(watcher.close)
+        watcher.add(self.path, WATCHED)
+        for _ in range(3):
+            self.change(watcher)
+        self.dispatch()
+        self.assertEqual(self.action.runs, 0)
+        time.sleep(0.1)
+        self.dispatch()
+        self.assertEqual(self.action.runs, 1)
+
+    def test_unrelated_file(self) -> None:
+        """Test that changes to other files in the directory are ignored."""
+        watcher = FileWatcher(debounce=0)
+        self.addCleanup(watcher.close)
+        watcher.add(self.path, WATCHED)
+        with open(os.path.join(self.tmpdir.name, 'other'), 'w') as f:
+            f.write('changed')
+        watcher._read_events()
+        self.assertFalse(SIGNAL_FLAGS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Tests for the pre-forked worker processes of isolated actions."""
+import os
+import tempfile
+import time
+import unittest
+from typing import List, Tuple
+
+from flagman.actions import Action
+from flagman.exceptions import ActionTimeout
+from flagman.workers import WorkerPool
+
+
+class ReportAction(Action):
+    """An Action that writes the PID of its process and of that process's parent."""
+
+    def set_up(self, path: str) -> None:  # type: ignore
+        """Store the path to write to.
+
+        :param path: the path of the report file
+        """
+        self._path = path
+
+    def run(self) -> None:
+        """Append the PIDs to the report file."""
+        with open(self._path, 'a') as f:
+            f.write('{} {}\n'.format(os.getpid(), os.getppid()))
+
+
+class CrashAction(Action):
+    """An Action that makes its process exit."""
+
+    def run(self) -> None:
+        """Exit with code 3."""
+        os._exit(3)
+
+
+class SleepAction(Action):
+    """An Action that runs for a long time."""
+
+    def run(self) -> None:
+        """Sleep for a minute."""
+        time.sleep(60)
+
+
+class TestWorkerPool(unittest.TestCase):
+    """Tests for :class:`flagman.workers.WorkerPool`."""
+
+    def setUp(self) -> None:
+        """Create a directory for the report file."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, 'report')
+
+    def start(self, processes: int, *actions: Action) -> WorkerPool:
+        """Isolate actions and start a pool for them.
+
+        :param processes: the number of worker processes
+        :param actions: the actions
+        :returns: the started pool
+        """
+        for action in actions:
+            action.isolated = True
+        pool = WorkerPool(processes)
+        self.addCleanup(pool.shutdown)
+        self.assertEqual(pool.start(actions), len(actions))
+        return pool
+
+    def reports(self) -> List[Tuple[int, int]]:
+        """Read the report file.
+
+        :returns: the PID and parent PID of each run of a :class:`ReportAction`
+        """
+        with open(self.path) as f:
+            return [(int(pid), int(ppid)) for pid, ppid in map(str.split, f)]
+
+    def test_spawn(self) -> None:
+        """Test that actions run in workers forked from a zygote, not from flagman."""
+        first, second = ReportAction(self.path), ReportAction(self.path)
+        self.start(2, first, second)
+        first._run()
+        second._run()
+        (first_pid, first_ppid), (second_pid, second_ppid) = self.reports()
+        self.assertNotIn(os.getpid(), (first_pid, second_pid))
+        self.assertNotEqual(first_pid, second_pid)
+        self.assertEqual(first_ppid, second_ppid)
+        self.assertNotEqual(first_ppid, os.getpid())
+
+    def test_crash_respawn(self) -> None:
+        """Test that a crashed worker is forked again from the zygote."""
+        report, crash = ReportAction(self.path), CrashAction()
+        self.start(1, report, crash)
+        report._run()
+        with self.assertLogs('flagman.workers', 'ERROR') as logs:
+            crash._run()
+        self.assertIn('exited with code 3', logs.output[0])
+        report._run()
+        (before, zygote), (after, after_zygote) = self.reports()
+        self.assertNotEqual(before, after)
+        self.assertEqual(zygote, after_zygote)
+
+    def test_timeout(self) -> None:
+        """Test that a worker is killed and forked again once a run times out."""
+        report, sleep = ReportAction(self.path), SleepAction()
+        self.start(1, report, sleep)
+        report._run()
+        worker = sleep._worker
+        assert worker is not None  # noqa: S101 (assert)
+        started = time.monotonic()
+        with self.assertRaises(ActionTimeout):
+            worker.run(sleep, timeout=0.2)
+        self.assertLess(time.monotonic() - started, 5)
+        report._run()
+        (before, zygote), (after, after_zygote) = self.reports()
+        self.assertNotEqual(before, after)
+        self.assertEqual(zygote, after_zygote)
+
+    def test_shutdown(self) -> None:
+        """Test that shutting the pool down closes its actions."""
+        action = ReportAction(self.path)
+        pool = self.start(1, action)
+        pool.shutdown()
+        self.assertTrue(action._closed)
+        self.assertIsNone(action._worker)
+
+    def test_nothing_isolated(self) -> None:
+        """Test that no workers are forked without isolated actions."""
+        pool = WorkerPool(2)
+        self.assertEqual(pool.start([ReportAction(self.path)]), 0)
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,3 +3,13 @@ DelayedPrintAction  # unused import (src/flagman/actions/__init__.py:7)
 PrintOnceAction  # unused import (src/flagman/actions/__init__.py:7)
 DelayedPrintAction  # unused class (src/flagman/actions/print.py:35)
 PrintOnceAction  # unused class (src/flagman/actions/print.py:57)
+remove_reader  # unused method (src/flagman/loop.py:87)
+wake  # unused method (src/flagman/loop.py:71)
+clear  # unused method (src/flagman/pending.py:143)
+_aclose  # unused method (src/flagman/actions/action.py:84)
+store_fds  # unused function (src/flagman/systemd.py:32)
+stored_fds  # unused function (src/flagman/systemd.py:59)
+remove_stored_fds  # unused function (src/flagman/systemd.py:50)
+sigqueue  # unused function (src/flagman/signals.py:112)
+PrintSigInfoAction  # unused class (src/flagman/actions/print.py:79)
+schedule  # unused method (src/flagman/metrics.py:370)